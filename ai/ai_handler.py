@@ -4,6 +4,15 @@ import os
 import asyncio
 from typing import Dict, Optional, List
 from storage.game_evolution_mongodb import GameEvolutionMongoDB
+from core.ownership import Ownership, black_view
+from core.scoring import score_game
+from core.tactics import TacticalReader, describe_tactics
+
+# 缓存中没有终局局面的分析时，判断死子所用的访问次数
+TERRITORY_ANALYSIS_VISITS = 100
+# 讲解提示中本地读棋的节点上限
+TACTICS_NODE_BUDGET = 3000
+
 
 class AIHandler:
     """AI处理器 - 负责处理所有AI相关的请求"""
@@ -13,15 +22,15 @@ class AIHandler:
         self.base_url = "http://localhost:11434/v1"
         self.api_key = "ollama"  # ollama不需要真实的API key
     
-    async def get_ai_move(self, game, strength: int = 1600) -> Optional[Dict]:
-        """获取AI着法"""
+    async def get_ai_move(self, game, strength: float = 3) -> Optional[Dict]:
+        """获取AI着法（strength为思考时间，单位秒）"""
         try:
             if not game:
                 return None
             
-            # 设置AI强度（通过ai_time_limit属性）
+            # 设置AI思考时间（通过ai_time_limit属性，实际访问次数由游戏的算力预算换算）
             if hasattr(game, 'ai_time_limit'):
-                game.ai_time_limit = max(1, min(100, strength / 100))  # 转换为时间限制
+                game.ai_time_limit = max(1, min(100, strength))
             
             # 获取AI着法
             ai_move = await asyncio.to_thread(game.get_katago_move)
@@ -75,11 +84,13 @@ class AIHandler:
         """生成着法解说"""
         try:
             board_desc = self._get_board_description(game)
+            tactics_desc = self._get_tactical_description(game)
             move = move_info.get('move', '')
             player = move_info.get('player', '')
             
             prompt = f"""
 当前局面：{board_desc}
+战术要点：{tactics_desc}
 刚下的棋：{player}在{move}位置落子
 
 请简要分析这手棋的意图和效果，包括：
@@ -100,12 +111,14 @@ class AIHandler:
         """生成用户问题回答"""
         try:
             board_desc = self._get_board_description(game)
+            tactics_desc = self._get_tactical_description(game)
             
             # 获取MongoDB中的最近游戏记录
             recent_game_data = self._get_recent_game_data(game)
             
             prompt = f"""
 当前局面：{board_desc}
+战术要点：{tactics_desc}
 
 最近游戏数据：
 {recent_game_data}
@@ -145,6 +158,16 @@ class AIHandler:
             print(f"获取棋盘描述失败: {e}")
             return "当前局面"
     
+    def _get_tactical_description(self, game) -> str:
+        """本地读棋得到的气紧棋块和征子结果（不占用KataGo），给讲解提供确定的战术事实"""
+        try:
+            go_board = game.rules_board()
+            items = TacticalReader(go_board, TACTICS_NODE_BUDGET).summary(game.current_player)
+            return describe_tactics(items)
+        except Exception as e:
+            print(f"本地读棋失败: {e}")
+            return "暂无"
+    
     def _get_recent_game_data(self, game) -> str:
         """获取MongoDB中的最近游戏记录"""
         try:
@@ -257,15 +280,14 @@ class AIHandler:
             print(f"调用AI模型失败: {e}")
             return "AI服务暂时不可用，请稍后再试。"
     
-    async def set_ai_strength(self, game, strength: int) -> bool:
-        """设置AI强度"""
+    async def set_ai_strength(self, game, strength: float) -> bool:
+        """设置AI强度（思考时间，单位秒）"""
         try:
             if not game:
                 return False
             
-            # 限制强度范围并转换为时间限制
-            strength = max(100, min(10000, strength))
-            time_limit = max(1, min(100, strength / 100))  # 转换为1-100的时间限制
+            # 前端传入的是思考秒数，限制在1-100秒
+            time_limit = max(1, min(100, strength))
             
             if hasattr(game, 'ai_time_limit'):
                 game.ai_time_limit = time_limit
@@ -325,104 +347,61 @@ class AIHandler:
             return []
     
     async def calculate_territory_score(self, game) -> Dict:
-        """计算终局点目"""
+        """计算终局点目
+
+        在本地按规则数子/数目，KataGo只用于判断死子：
+        优先使用分析缓存中终局附近局面的ownership，没有时才发送一次小规模查询。
+        """
         try:
             if not game:
                 return {}
-            
-            # 获取包含ownership信息的分析结果
-            analysis_result = await asyncio.to_thread(game._send_analysis_request, 500)  # 使用更多访问次数获得准确结果
-            
-            if not analysis_result:
-                return {}
-            
-            ownership = analysis_result.get("ownership", [])
-            if not ownership:
-                return {}
-            
-            # 计算领地和点目
-            territory_info = self._analyze_ownership(ownership, game.board_size, game)
-            
-            # 获取当前比分
-            move_infos = analysis_result.get("moveInfos", [])
-            current_score = 0
-            if move_infos:
-                current_score = move_infos[0].get("scoreLead", 0)
-            
-            # 计算最终比分（考虑贴目）
-            black_territory = territory_info["black_territory"]
-            white_territory = territory_info["white_territory"]
-            black_prisoners = territory_info["black_prisoners"]
-            white_prisoners = territory_info["white_prisoners"]
-            
-            # 中国规则：子数 + 活棋围成的空点
-            black_score = black_territory + black_prisoners
-            white_score = white_territory + white_prisoners + game.komi
-            
-            score_difference = black_score - white_score
-            winner = "黑棋" if score_difference > 0 else "白棋"
-            
-            return {
-                "black_territory": black_territory,
-                "white_territory": white_territory,
-                "black_prisoners": black_prisoners,
-                "white_prisoners": white_prisoners,
-                "black_score": round(black_score, 1),
-                "white_score": round(white_score, 1),
-                "score_difference": round(abs(score_difference), 1),
-                "winner": winner,
-                "komi": game.komi,
-                "current_score_lead": round(current_score, 1),
-                "territory_map": territory_info["territory_map"]
-            }
-            
+
+            analysis_result = await asyncio.to_thread(self._get_final_analysis, game)
+            ownership = analysis_result.get("ownership") if analysis_result else None
+
+            rules = getattr(game, "rules", "chinese")
+            result = score_game(
+                game.board, game.komi, rules,
+                getattr(game, "captured_black", 0), getattr(game, "captured_white", 0),
+                ownership
+            )
+            move_infos = analysis_result.get("moveInfos", []) if analysis_result else []
+            result["current_score_lead"] = round(move_infos[0].get("scoreLead", 0), 1) if move_infos else 0
+            result["method"] = "ownership" if ownership else "board"
+            return result
+
         except Exception as e:
             print(f"计算点目失败: {e}")
             return {}
-    
-    def _analyze_ownership(self, ownership: List[float], board_size: int, game=None) -> Dict:
-        """分析ownership数据，计算领地信息"""
-        territory_map = []
-        black_territory = 0
-        white_territory = 0
-        
-        # 从游戏对象获取被提子数
-        black_prisoners = 0
-        white_prisoners = 0
-        if game:
-            black_prisoners = getattr(game, 'captured_black', 0)
-            white_prisoners = getattr(game, 'captured_white', 0)
-        
-        # ownership是一维数组，需要转换为二维
-        for i in range(board_size):
-            row = []
-            for j in range(board_size):
-                idx = i * board_size + j
-                if idx < len(ownership):
-                    ownership_value = ownership[idx]
-                    
-                    # ownership值：正数表示黑棋领地，负数表示白棋领地
-                    # 绝对值越大表示确定性越高
-                    if ownership_value > 0.7:  # 黑棋确定领地
-                        row.append("B")
-                        black_territory += 1
-                    elif ownership_value < -0.7:  # 白棋确定领地
-                        row.append("W")
-                        white_territory += 1
-                    else:  # 争议区域
-                        row.append("?")
-                else:
-                    row.append("?")
-            territory_map.append(row)
-        
-        return {
-            "black_territory": black_territory,
-            "white_territory": white_territory,
-            "black_prisoners": black_prisoners,
-            "white_prisoners": white_prisoners,
-            "territory_map": territory_map
-        }
-    
+
+    @staticmethod
+    def _get_final_analysis(game) -> Optional[Dict]:
+        """获取用于判断死子的分析结果，其中的ownership已转为黑棋视角
+
+        双方连续pass之后局面不变，因此终局前两手的缓存结果同样可用；
+        这些局面的行棋方不同，ownership 按各自的行棋方换算。
+        """
+        moves = [list(move) for move in getattr(game, "moves", [])]
+        cache = getattr(game, "analysis_cache", None)
+        if cache is not None:
+            for cut in range(0, min(2, len(moves)) + 1):
+                candidate = moves[:len(moves) - cut]
+                if cut and any(move != "pass" for _, move in moves[len(moves) - cut:]):
+                    break
+                cached = cache.get(candidate, game.komi)
+                if cached and cached.get("ownership"):
+                    to_move = "W" if candidate and candidate[-1][0] == "B" else "B"
+                    return dict(cached, ownership=black_view(cached, to_move))
+
+        check_alive = getattr(game, "_check_process_alive", None)
+        if check_alive is not None and check_alive():
+            result = game._send_analysis_request(TERRITORY_ANALYSIS_VISITS)
+            if result and result.get("ownership"):
+                to_move = "W" if moves and moves[-1][0] == "B" else "B"
+                result = dict(result, ownership=black_view(result, to_move))
+            return result
+        return None
+
     async def get_available_models(self) -> List[Dict]:
         """获取ollama可用模型列表"""
         try:
@@ -494,23 +473,12 @@ class AIHandler:
                 ownership_1d = analysis_result['ownership']
                 board_size = game.board_size
                 
-                print(f"KataGo返回的ownership数据长度: {len(ownership_1d)}")
-                print(f"期望的数据长度: {board_size * board_size}")
-                
-                # 将一维数组转换为二维数组
-                if len(ownership_1d) == board_size * board_size:
-                    ownership_2d = []
-                    for row in range(board_size):
-                        row_data = []
-                        for col in range(board_size):
-                            index = row * board_size + col
-                            row_data.append(ownership_1d[index])
-                        ownership_2d.append(row_data)
-                    
-                    print(f"成功转换为{len(ownership_2d)}x{len(ownership_2d[0])}的二维数组")
-                    
+                # 转换为黑棋视角、与棋盘方向一致的二维数组
+                ownership = Ownership.from_analysis(analysis_result, board_size, to_move=game.current_player)
+                if ownership is not None:
                     return {
-                        "ownership": ownership_2d,
+                        "ownership": ownership.to_rows(3),
+                        "counts": ownership.counts(),
                         "board_size": board_size,
                         "success": True
                     }
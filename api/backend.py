@@ -2,15 +2,31 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import json
 import asyncio
+import concurrent.futures
 from typing import Dict, List, Optional
 import uuid
-from core.human_vs_katago import WeiQiGame
+from core.human_vs_katago import WeiQiGame, create_engine
 from core.analysis_game import AnalysisGame
+from core.metrics import metrics
+from core.review_worker import ReviewWorkerPool
+from core.session_snapshot import apply_snapshot, snapshot_game
+from core.sgf_utils import parse_sgf
+from api.state_protocol import STATE_PROTOCOLS, StateTracker
+from api.broadcast import BROADCAST_TYPES, Broadcast, Spectator
+from api.suggestion_stream import DEFAULT_SUGGESTION_FPS, SuggestionStream
+from api.session_actor import SessionActor
+from api.session_limits import (MAX_SESSIONS, SESSION_IDLE_TIMEOUT, SESSION_MEMORY_LIMIT, CapacityError,
+                                estimate_session_memory, trim_session_memory)
+from api.wire_codec import WireSocket, available_codecs, encode as encode_message
+from storage.review_jobs import create_review_job_store
+from storage.session_store import create_session_store
+import socket
 import threading
 import time
 from ai.ai_handler import ai_handler
@@ -30,24 +46,128 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 游戏会话管理
-game_sessions: Dict[str, WeiQiGame] = {}
-active_connections: Dict[str, WebSocket] = {}
+# 连接断开后保留游戏和引擎的时间（秒），期间用同一 session_id 重连可以继续对局
+SESSION_GRACE_PERIOD = float(os.environ.get("SESSION_GRACE_PERIOD", 300))
+# 清理超时会话的检查间隔（秒）
+SESSION_REAPER_INTERVAL = 30
+
+# 会话快照（SESSION_STORE 启用时）：命令执行后延迟写入的间隔（秒）、工作进程租约时长、无人使用的快照保留时间
+SESSION_SNAPSHOT_INTERVAL = 1.0
+SESSION_LEASE_SECONDS = 90
+SESSION_SNAPSHOT_TTL = float(os.environ.get("SESSION_SNAPSHOT_TTL", 7 * 24 * 3600))
+
+# 只涉及连接本身、或不读写棋局的消息直接处理，不进入会话的命令邮箱
+DIRECT_MESSAGES = {"set_codec", "set_protocol", "resync", "change_model", "ai_commentary",
+                   "stop_realtime_suggestions", "set_trace"}
+# 只关心最新结果的消息：邮箱中有同键的新消息时旧消息不再执行
+COALESCE_KEYS = {
+    "goto_move": "navigate",
+    "goto_node": "navigate",
+    "get_territory_preview": "get_territory_preview",
+    "calculate_territory_score": "calculate_territory_score",
+    "get_legal_moves": "get_legal_moves",
+    "get_ai_suggestions": "get_ai_suggestions",
+    "get_game_evolution_data": "get_game_evolution_data",
+    "get_key_moments": "get_key_moments",
+    "get_move_evolution_data": "get_move_evolution_data"
+}
 
 class GameManager:
     def __init__(self):
         self.games = {}
         self.connections = {}
         self.session_active = {}  # 跟踪游戏会话是否已开始
+        self.import_tasks = {}  # SGF导入后的后台批量分析：session_id -> (任务, 取消标记)
+        self.state_protocols = {}  # 每个连接协商的 game_state 协议（full/delta）
+        self.state_trackers = {}  # delta 协议下每个连接已发送的状态
+        self.suggestion_streams = {}  # 实时推荐选点：工作线程到事件循环的最新值通道
+        self.detached = {}  # 已断开但仍在保留期内的会话 -> 断开时间
+        self.grace_period = SESSION_GRACE_PERIOD
+        self.last_activity = {}  # 会话 -> 最近一次收到客户端消息的时间
+        self.max_sessions = MAX_SESSIONS
+        self.idle_timeout = SESSION_IDLE_TIMEOUT
+        self.memory_limit = SESSION_MEMORY_LIMIT
+        self.rejected_sessions = 0  # 因服务器已满被拒绝的连接数
+        self.actors = {}  # 会话 -> SessionActor，按顺序执行该会话的命令
+        self.broadcasts = {}  # 会话 -> Broadcast，只读观战连接
+        # 多进程部署：会话快照存储和本进程的租约标识（SESSION_STORE=none 时为单进程模式）
+        self.session_store = create_session_store()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.dirty_sessions = set()
+        self.snapshot_versions = {}  # 会话 -> 本进程最近写入或读取的快照版本
+        self.pending_cleanups = {}  # 会话 -> 工作线程中尚未完成的清理（关闭引擎、释放租约）
+        self._cleanup_lock = threading.Lock()
+        self._cleanup_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4,
+                                                                       thread_name_prefix="session-cleanup")
+        self._flush_task = None
     
-    async def connect(self, websocket: WebSocket, session_id: str):
+    async def connect(self, websocket: WebSocket, session_id: str, codec: str = "json") -> Optional[WireSocket]:
+        """接受连接并返回按协商编码发送消息的 WireSocket
+
+        session_id 对应的游戏仍在保留期内时直接接管（引擎保持运行），并发送完整快照。
+        新会话超出会话上限且无法淘汰旧会话时发送 server_at_capacity 错误并关闭连接，返回None。
+        """
         print(f"WebSocket连接请求: session_id={session_id}")
         await websocket.accept()
         print(f"WebSocket连接已接受: session_id={session_id}")
+        try:
+            websocket = WireSocket(websocket, codec)
+        except ValueError as e:
+            print(f"{e}，使用JSON编码: session_id={session_id}")
+            websocket = WireSocket(websocket)
+        websocket.observer = lambda message: self._relay(session_id, message)
+        await self._wait_cleanup(session_id)
+        if session_id not in self.games:
+            try:
+                await self._admit(session_id)
+            except CapacityError as e:
+                self.rejected_sessions += 1
+                print(f"拒绝新会话: session_id={session_id}, {e}")
+                await websocket.send_message({
+                    "type": "error",
+                    "code": "server_at_capacity",
+                    "message": str(e)
+                })
+                await websocket.close(code=1013)
+                return None
+        restored = False
+        if session_id in self.games and self.session_store is not None \
+                and not await self._local_copy_current(session_id):
+            self.evict_session(session_id)
+            await self._wait_cleanup(session_id)
+        if session_id not in self.games and self.session_store is not None:
+            restored = await self._restore_session(session_id, websocket)
+            if restored is None:
+                return None
+        self.touch(session_id)
+        previous = self.connections.get(session_id)
         self.connections[session_id] = websocket
+        if previous is not None:
+            # 同一会话在别处重连（例如旧连接还没有检测到断开），关闭旧连接
+            try:
+                await previous.close(code=4001)
+            except Exception:
+                pass
         
-        # 创建新游戏会话
-        if session_id not in self.games:
+        if session_id in self.games:
+            # 恢复会话：游戏和引擎都还在（或刚从快照重放），客户端重新获取完整状态
+            detached_at = self.detached.pop(session_id, None)
+            offline = f"{time.monotonic() - detached_at:.1f}s" if detached_at is not None else "未断开"
+            print(f"恢复游戏会话: session_id={session_id}, 离线 {offline}")
+            game = self.games[session_id]
+            await websocket.send_message({
+                "type": "session_resumed",
+                "game_mode": "analysis" if isinstance(game, AnalysisGame) else "human_vs_ai",
+                "session_active": self.is_session_active(session_id),
+                "player_color": game.player_color
+            })
+            await self.send_game_state(session_id, force_full=True)
+            if restored and self.is_session_active(session_id) and not isinstance(game, AnalysisGame) \
+                    and not game.game_over and game.current_player != game.player_color:
+                # 快照保存时轮到AI，在本进程继续
+                self.submit_ai_move(session_id)
+        else:
+            # 创建新游戏会话
             try:
                 print(f"创建新游戏实例: session_id={session_id}")
                 game = WeiQiGame()
@@ -56,10 +176,25 @@ class GameManager:
                 print(f"游戏状态已发送: session_id={session_id}")
             except Exception as e:
                 print(f"游戏初始化失败: session_id={session_id}, error={e}")
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "error",
                     "message": f"游戏初始化失败: {str(e)}"
-                }))
+                })
+        return websocket
+    
+    async def set_codec(self, session_id: str, codec: str):
+        """切换连接的帧编码；确认消息仍按旧编码发送，之后的消息使用新编码"""
+        websocket = self.connections.get(session_id)
+        if not websocket:
+            return
+        if codec not in available_codecs():
+            await self._send_error(session_id, f"不支持的编码: {codec}，可用: {', '.join(available_codecs())}")
+            return
+        await websocket.send_message({
+            "type": "codec_changed",
+            "codec": codec
+        })
+        websocket.set_codec(codec)
     
     async def handle_model_change(self, session_id: str, message: dict):
         """处理AI模型切换请求"""
@@ -70,10 +205,10 @@ class GameManager:
         try:
             new_model = message.get("model", "")
             if not new_model:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "error",
                     "message": "无效的模型参数"
-                }))
+                })
                 return
             
             # 更新AI处理器的模型
@@ -81,33 +216,416 @@ class GameManager:
             print(f"AI模型已切换为: {new_model}")
             
             # 发送确认消息
-            await websocket.send_text(json.dumps({
+            await websocket.send_message({
                 "type": "model_changed",
                 "model": new_model,
                 "message": f"AI模型已切换为 {new_model}"
-            }))
+            })
             
         except Exception as e:
             print(f"模型切换失败: {e}")
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "error",
                     "message": f"模型切换失败: {str(e)}"
-                }))
+                })
     
-    def disconnect(self, session_id: str):
+    def disconnect(self, session_id: str, websocket: Optional[WireSocket] = None):
+        """连接断开：只释放连接相关的资源，游戏和引擎保留 grace_period 秒等待重连
+
+        websocket 不是当前连接（同一会话已在别处重连）时不做任何处理。
+        """
+        if websocket is not None and self.connections.get(session_id) is not websocket:
+            return
         print(f"WebSocket连接断开: session_id={session_id}")
+        self._close_suggestion_stream(session_id)
         if session_id in self.connections:
             del self.connections[session_id]
             print(f"已清理连接: session_id={session_id}")
+        self.state_protocols.pop(session_id, None)
+        self.state_trackers.pop(session_id, None)
         if session_id in self.games:
             game = self.games[session_id]
-            game.cleanup()
-            del self.games[session_id]
-            print(f"已清理游戏实例: session_id={session_id}")
+            try:
+                game.stop_realtime_analysis()
+            except Exception as e:
+                print(f"停止实时推荐失败: {e}")
+            if self.grace_period > 0:
+                self.detached[session_id] = time.monotonic()
+                if self.session_store is not None:
+                    asyncio.get_running_loop().create_task(self._release_detached(session_id))
+                print(f"会话保留 {self.grace_period:.0f}s 等待重连: session_id={session_id}")
+                return
+        self.evict_session(session_id)
+    
+    async def _local_copy_current(self, session_id: str) -> bool:
+        """本地保留的会话副本能否继续使用：重新取得租约，且快照没有在断开期间被其他工作进程更新"""
+        store = self.session_store
+        if not await asyncio.to_thread(store.acquire, session_id, self.worker_id, SESSION_LEASE_SECONDS):
+            print(f"本地会话已被其他工作进程接管，丢弃本地副本: session_id={session_id}")
+            return False
+        version = await asyncio.to_thread(store.version, session_id)
+        if version > self.snapshot_versions.get(session_id, 0):
+            # 租约曾经释放，其他工作进程接管并写入了更新的快照，按快照重新恢复
+            print(f"会话快照已被其他工作进程更新（版本 {version}），丢弃本地副本: session_id={session_id}")
+            return False
+        return True
+    
+    async def _restore_session(self, session_id: str, websocket: WireSocket) -> Optional[bool]:
+        """获取会话租约并从快照恢复游戏（本进程重启或会话原来在其他工作进程上）
+
+        Returns:
+            True 已恢复，False 没有快照（按新会话处理），None 会话由其他工作进程持有（已关闭连接）
+        """
+        store = self.session_store
+        try:
+            acquired = await asyncio.to_thread(store.acquire, session_id, self.worker_id, SESSION_LEASE_SECONDS)
+            snapshot = await asyncio.to_thread(store.load, session_id) if acquired else None
+            version = await asyncio.to_thread(store.version, session_id) if acquired else 0
+        except Exception as e:
+            print(f"读取会话快照失败，按新会话处理: session_id={session_id}, error={e}")
+            return False
+        if not acquired:
+            owner = await asyncio.to_thread(store.owner, session_id)
+            print(f"会话由其他工作进程持有: session_id={session_id}, owner={owner}")
+            await websocket.send_message({
+                "type": "error",
+                "code": "session_owned_elsewhere",
+                "message": "该会话正在其他服务进程上运行，请检查负载均衡的会话保持配置"
+            })
+            await websocket.close(code=4003)
+            return None
+        if not snapshot:
+            return False
+        try:
+            game = AnalysisGame() if snapshot.get("mode") == "analysis" else WeiQiGame()
+            apply_snapshot(game, snapshot)
+        except Exception as e:
+            print(f"会话快照恢复失败，按新会话处理: session_id={session_id}, error={e}")
+            return False
+        self.games[session_id] = game
+        self.snapshot_versions[session_id] = version
+        if snapshot.get("session_active"):
+            self.session_active[session_id] = True
+        print(f"已从快照恢复会话: session_id={session_id}, 手数={len(game.moves)}")
+        return True
+    
+    def _mark_dirty(self, session_id: str):
+        """会话状态有变化，稍后写入快照（同一间隔内的多次变化只写一次）"""
+        if self.session_store is None:
+            return
+        self.dirty_sessions.add(session_id)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_snapshots())
+    
+    async def _flush_snapshots(self, delay: float = SESSION_SNAPSHOT_INTERVAL):
+        await asyncio.sleep(delay)
+        while self.dirty_sessions:
+            await self.save_snapshot(self.dirty_sessions.pop())
+    
+    async def save_snapshot(self, session_id: str):
+        """在事件循环中生成快照（状态一致），在线程中写入存储"""
+        game = self.games.get(session_id)
+        if game is None or self.session_store is None:
+            return
+        snapshot = snapshot_game(game, self.is_session_active(session_id))
+        try:
+            version = await asyncio.to_thread(self.session_store.save, session_id, snapshot)
+        except Exception as e:
+            print(f"保存会话快照失败: session_id={session_id}, error={e}")
+            return
+        if self.games.get(session_id) is game:
+            self.snapshot_versions[session_id] = version
+    
+    async def _release_detached(self, session_id: str):
+        """断开的会话写入快照后释放租约，客户端重连到任何工作进程都可以接管"""
+        self.dirty_sessions.discard(session_id)
+        await self.save_snapshot(session_id)
+        if session_id in self.detached:
+            try:
+                await asyncio.to_thread(self.session_store.release, session_id, self.worker_id)
+            except Exception as e:
+                print(f"释放会话租约失败: {e}")
+    
+    async def renew_leases(self):
+        """续期本进程已连接会话的租约，并删除过期的快照"""
+        if self.session_store is None:
+            return
+        for session_id in list(self.connections):
+            if await asyncio.to_thread(self.session_store.acquire, session_id, self.worker_id,
+                                       SESSION_LEASE_SECONDS):
+                continue
+            # 租约丢失（例如本进程长时间卡住后租约过期被接管），本地副本不能再处理命令
+            print(f"会话租约已被其他工作进程接管，关闭本地会话: session_id={session_id}")
+            websocket = self.connections.pop(session_id, None)
+            self.evict_session(session_id)
+            if websocket:
+                try:
+                    await websocket.send_message({
+                        "type": "error",
+                        "code": "session_owned_elsewhere",
+                        "message": "该会话已由其他服务进程接管，请重新连接"
+                    })
+                    await websocket.close(code=4003)
+                except Exception:
+                    pass
+        await asyncio.to_thread(self.session_store.purge, SESSION_SNAPSHOT_TTL)
+    
+    def evict_session(self, session_id: str):
+        """彻底清理会话：取消后台分析，关闭引擎，删除游戏实例
+
+        关闭引擎（最多等待数秒）和释放租约在工作线程中进行，不阻塞其它会话；
+        同一会话重新连接前通过 _wait_cleanup 等待其完成。
+        """
+        actor = self.actors.pop(session_id, None)
+        if actor:
+            actor.close()
+        self._cancel_sgf_import(session_id)
+        self._close_suggestion_stream(session_id)
+        self.detached.pop(session_id, None)
+        self.last_activity.pop(session_id, None)
+        metrics.disable_trace(session_id)
+        self.connections.pop(session_id, None)
+        self.state_protocols.pop(session_id, None)
+        self.state_trackers.pop(session_id, None)
+        broadcast = self.broadcasts.pop(session_id, None)
+        if broadcast:
+            broadcast.close()
+        game = self.games.pop(session_id, None)
         if session_id in self.session_active:
             del self.session_active[session_id]
             print(f"已清理会话状态: session_id={session_id}")
+        self.dirty_sessions.discard(session_id)
+        self.snapshot_versions.pop(session_id, None)
+        if game is None and self.session_store is None:
+            return
+        with self._cleanup_lock:
+            previous = self.pending_cleanups.get(session_id)
+            future = self._cleanup_executor.submit(self._release_session, session_id, game, previous)
+            self.pending_cleanups[session_id] = future
+        
+        def done(_):
+            with self._cleanup_lock:
+                if self.pending_cleanups.get(session_id) is future:
+                    del self.pending_cleanups[session_id]
+        future.add_done_callback(done)
+    
+    def _release_session(self, session_id: str, game, previous=None):
+        """在工作线程中关闭游戏实例并释放租约（previous 为同一会话更早的清理，先等它完成）"""
+        if previous is not None:
+            concurrent.futures.wait([previous])
+        if game is not None:
+            try:
+                game.cleanup()
+                print(f"已清理游戏实例: session_id={session_id}")
+            except Exception as e:
+                print(f"清理游戏实例失败: {e}")
+        if self.session_store is not None:
+            # 快照保留，其他工作进程或本进程之后可以从快照恢复
+            try:
+                self.session_store.release(session_id, self.worker_id)
+            except Exception as e:
+                print(f"释放会话租约失败: {e}")
+    
+    async def _wait_cleanup(self, session_id: str):
+        """等待该会话正在进行的清理完成，避免延后的租约释放作用到重新取得的租约上"""
+        future = self.pending_cleanups.get(session_id)
+        if future is not None:
+            await asyncio.wrap_future(future)
+    
+    async def watch(self, websocket: WebSocket, session_id: str, codec: str = "json") -> Optional[Spectator]:
+        """接受只读的观战连接：先发送完整快照，之后是状态增量和对局者收到的分析帧
+
+        会话不在本进程（不存在或在其他工作进程上）时发送 session_not_found 错误并关闭连接，返回None。
+        """
+        await websocket.accept()
+        try:
+            spectator = Spectator(websocket, codec)
+        except ValueError as e:
+            print(f"{e}，使用JSON编码: session_id={session_id}")
+            spectator = Spectator(websocket)
+        game = self.games.get(session_id)
+        error = None
+        if game is None:
+            error = {"code": "session_not_found", "message": "对局不存在或不在本服务器上", "close": 4004}
+        else:
+            broadcast = self.broadcasts.setdefault(session_id, Broadcast(session_id))
+            try:
+                broadcast.subscribe(spectator, game)
+            except ValueError as e:
+                error = {"code": "spectators_full", "message": str(e), "close": 1013}
+        if error is not None:
+            await spectator.send(encode_message({"type": "error", "code": error["code"], "message": error["message"]},
+                                                spectator.codec))
+            await websocket.close(code=error["close"])
+            return None
+        print(f"观战连接加入: session_id={session_id}, 观战人数 {len(broadcast.spectators)}")
+        return spectator
+    
+    def unwatch(self, session_id: str, spectator: Spectator):
+        broadcast = self.broadcasts.get(session_id)
+        if broadcast is None:
+            return
+        broadcast.unsubscribe(spectator)
+        print(f"观战连接离开: session_id={session_id}, 观战人数 {len(broadcast.spectators)}")
+        if not broadcast.spectators:
+            del self.broadcasts[session_id]
+    
+    def _relay(self, session_id: str, message: dict):
+        """对局者连接上发送的消息中，观战者也需要的转发给观战广播"""
+        broadcast = self.broadcasts.get(session_id)
+        if broadcast is not None and message.get("type") in BROADCAST_TYPES:
+            broadcast.publish(message)
+    
+    def _actor(self, session_id: str) -> SessionActor:
+        actor = self.actors.get(session_id)
+        if actor is None:
+            async def on_error(kind, error):
+                await self._send_error(session_id, f"操作失败（{kind}）: {error}")
+            actor = SessionActor(session_id, on_error=on_error)
+            actor.start()
+            self.actors[session_id] = actor
+        return actor
+    
+    async def dispatch(self, session_id: str, message: dict, handler):
+        """把客户端消息交给会话的命令邮箱；连接级消息直接执行"""
+        message_type = message.get("type")
+        if message_type in DIRECT_MESSAGES:
+            await handler()
+            return
+        async def run():
+            with metrics.session(session_id):
+                await handler()
+            self._mark_dirty(session_id)
+        
+        if not self._actor(session_id).submit(message_type, run, COALESCE_KEYS.get(message_type)):
+            print(f"命令邮箱已满，丢弃消息: session_id={session_id}, message_type={message_type}")
+            await self._send_error(session_id, "操作过于频繁，请稍后再试")
+    
+    def submit_ai_move(self, session_id: str):
+        """AI落子作为后续命令排在当前命令之后执行，不与玩家的操作并发"""
+        async def run():
+            with metrics.session(session_id):
+                await self._get_ai_move_async(session_id)
+            self._mark_dirty(session_id)
+        
+        self._actor(session_id).submit("ai_move", run, internal=True)
+    
+    def touch(self, session_id: str):
+        """记录会话的最近活动时间（空闲淘汰按该时间排序）"""
+        self.last_activity[session_id] = time.monotonic()
+    
+    async def _expire_session(self, session_id: str, reason: str):
+        """淘汰仍然连接着的会话：通知客户端、关闭连接后清理"""
+        websocket = self.connections.pop(session_id, None)
+        self.evict_session(session_id)
+        if websocket:
+            try:
+                await websocket.send_message({
+                    "type": "session_expired",
+                    "message": reason
+                })
+                await websocket.close(code=1000)
+            except Exception:
+                pass
+    
+    async def _admit(self, session_id: str):
+        """新会话的准入控制：已满时先淘汰断开的会话（最早断开的优先），
+        再淘汰空闲超过 idle_timeout 的已连接会话（最久未活动的优先）
+
+        Raises:
+            CapacityError: 没有可以淘汰的会话
+        """
+        if len(self.games) < self.max_sessions:
+            return
+        for detached_id, _ in sorted(self.detached.items(), key=lambda item: item[1]):
+            print(f"服务器已满，淘汰断开的会话: session_id={detached_id}")
+            self.evict_session(detached_id)
+            if len(self.games) < self.max_sessions:
+                return
+        now = time.monotonic()
+        idle = sorted((self.last_activity.get(sid, 0), sid) for sid in self.connections if sid in self.games)
+        for last_active, idle_id in idle:
+            if now - last_active < self.idle_timeout:
+                break
+            print(f"服务器已满，淘汰空闲会话: session_id={idle_id}")
+            await self._expire_session(idle_id, "会话长时间没有操作，已被释放")
+            if len(self.games) < self.max_sessions:
+                return
+        raise CapacityError(f"服务器已达到会话上限（{self.max_sessions}），请稍后再试")
+    
+    def reap_detached(self, now: Optional[float] = None) -> List[str]:
+        """清理超过保留期仍未重连的会话，返回被清理的 session_id"""
+        now = time.monotonic() if now is None else now
+        expired = [session_id for session_id, detached_at in self.detached.items()
+                   if now - detached_at >= self.grace_period]
+        for session_id in expired:
+            print(f"会话超过保留期未重连: session_id={session_id}")
+            self.evict_session(session_id)
+        return expired
+    
+    async def reap_idle(self, now: Optional[float] = None) -> List[str]:
+        """释放已连接但空闲超过 idle_timeout 的会话，返回被释放的 session_id"""
+        now = time.monotonic() if now is None else now
+        expired = [session_id for session_id in list(self.connections)
+                   if now - self.last_activity.get(session_id, now) >= self.idle_timeout]
+        for session_id in expired:
+            print(f"会话空闲超时: session_id={session_id}")
+            await self._expire_session(session_id, "会话长时间没有操作，已被释放")
+        return expired
+    
+    def trim_memory(self) -> Dict[str, int]:
+        """清空超出内存上限的会话的分析缓存，返回被清理会话清理前的估算值"""
+        trimmed = {}
+        for session_id, game in list(self.games.items()):
+            usage = trim_session_memory(game, self.memory_limit)
+            if usage:
+                print(f"会话内存超出上限，已清空分析缓存: session_id={session_id}, 估算 {usage['total']} 字节")
+                trimmed[session_id] = usage["total"]
+        return trimmed
+    
+    def session_stats(self) -> Dict:
+        """当前会话、引擎和内存占用的统计，用于评估单机容量"""
+        now = time.monotonic()
+        sessions = []
+        for session_id, game in list(self.games.items()):
+            memory = estimate_session_memory(game)
+            sessions.append({
+                "session_id": session_id,
+                "mode": "analysis" if isinstance(game, AnalysisGame) else "human_vs_ai",
+                "connected": session_id in self.connections,
+                "idle_seconds": round(now - self.last_activity.get(session_id, now), 1),
+                "detached_seconds": round(now - self.detached[session_id], 1) if session_id in self.detached else None,
+                "moves": len(game.moves),
+                "engine_running": bool(getattr(game, "katago_initialized", False)),
+                "memory_bytes": memory,
+                "commands": self.actors[session_id].stats() if session_id in self.actors else None,
+                "broadcast": self.broadcasts[session_id].stats() if session_id in self.broadcasts else None
+            })
+        return {
+            "sessions": len(self.games),
+            "connected": sum(1 for item in sessions if item["connected"]),
+            "detached": len(self.detached),
+            "engines_running": sum(1 for item in sessions if item["engine_running"]),
+            "spectators": sum(len(broadcast.spectators) for broadcast in self.broadcasts.values()),
+            "max_sessions": self.max_sessions,
+            "rejected_sessions": self.rejected_sessions,
+            "memory_bytes": sum(item["memory_bytes"]["total"] for item in sessions),
+            "memory_limit_per_session": self.memory_limit,
+            "session_details": sessions
+        }
+    
+    async def run_reaper(self, interval: float = SESSION_REAPER_INTERVAL):
+        """后台定期清理超过保留期的断开会话和空闲会话，并检查每个会话的内存"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.reap_detached()
+                await self.reap_idle()
+                await asyncio.to_thread(self.trim_memory)
+                await self.renew_leases()
+            except Exception as e:
+                print(f"清理会话失败: {e}")
     
     async def start_game_session(self, session_id: str):
         """开始游戏会话"""
@@ -125,10 +643,10 @@ class GameManager:
                 print(f"初始化胜率失败: {e}")
         
         if websocket:
-            await websocket.send_text(json.dumps({
+            await websocket.send_message({
                 "type": "session_started",
                 "message": "游戏会话已开始"
-            }))
+            })
             # 发送当前游戏状态，包括胜率数据
             await self.send_game_state(session_id)
     
@@ -137,41 +655,75 @@ class GameManager:
         self.session_active[session_id] = False
         websocket = self.connections.get(session_id)
         if websocket:
-            await websocket.send_text(json.dumps({
+            await websocket.send_message({
                 "type": "session_stopped",
                 "message": "游戏会话已停止"
-            }))
+            })
     
     def is_session_active(self, session_id: str) -> bool:
         """检查游戏会话是否已开始"""
         return self.session_active.get(session_id, False)
     
-    async def send_game_state(self, session_id: str):
+    @metrics.timed("manager.send_game_state")
+    async def send_game_state(self, session_id: str, force_full: bool = False):
+        """发送游戏状态
+
+        协商了 delta 协议的连接只在连接、换局和 resync 时收到完整快照（带版本号），
+        之后每次只发送变化的交叉点、追加的着法和胜率记录；其他连接仍收到完整的 game_state。
+        """
+        if session_id in self.broadcasts and session_id in self.games:
+            # 观战者的增量与对局者协商的协议无关，对局者断开期间（如AI仍在落子）也照常发送
+            self.broadcasts[session_id].publish_state(self.games[session_id])
         if session_id not in self.games or session_id not in self.connections:
             return
         
         game = self.games[session_id]
         websocket = self.connections[session_id]
         
-        game_state = {
-            "type": "game_state",
-            "data": {
-                "board": game.board,  # 使用真实的棋盘状态
-                "moves": game.moves,
-                "current_player": game.current_player,
-                "game_over": game.game_over,
-                "move_count": getattr(game, 'move_count', len(game.moves)),  # 使用实际的move_count
-                "captured_black": game.captured_black,
-                "captured_white": game.captured_white,
-                "winrate_history": game.winrate_history  # 添加胜率历史数据
+        if self.state_protocols.get(session_id) == "delta":
+            tracker = self.state_trackers.setdefault(session_id, StateTracker())
+            game_state = tracker.encode(game, force_full)
+            if game_state is None:
+                return  # 状态没有变化
+        else:
+            game_state = {
+                "type": "game_state",
+                "data": {
+                    "board": game.board,  # 使用真实的棋盘状态
+                    "moves": game.moves,
+                    "current_player": game.current_player,
+                    "game_over": game.game_over,
+                    "move_count": getattr(game, 'move_count', len(game.moves)),  # 使用实际的move_count
+                    "captured_black": game.captured_black,
+                    "captured_white": game.captured_white,
+                    "winrate_history": game.winrate_history  # 添加胜率历史数据
+                }
             }
-        }
+            if hasattr(game, "get_variation_tree"):
+                # 推演模式：当前变化和分支点
+                game_state["data"]["variation_tree"] = game.get_variation_tree()
         
         try:
-            await websocket.send_text(json.dumps(game_state))
+            await websocket.send_message(game_state)
         except:
             pass
     
+    async def set_state_protocol(self, session_id: str, protocol: str):
+        """客户端协商 game_state 协议，切换后立即发送一次完整快照作为增量基准"""
+        websocket = self.connections.get(session_id)
+        if protocol not in STATE_PROTOCOLS:
+            await self._send_error(session_id, f"不支持的状态协议: {protocol}")
+            return
+        self.state_protocols[session_id] = protocol
+        self.state_trackers.pop(session_id, None)
+        if websocket:
+            await websocket.send_message({
+                "type": "state_protocol",
+                "protocol": protocol
+            })
+        await self.send_game_state(session_id, force_full=True)
+    
+    @metrics.timed("manager.make_move")
     async def make_move(self, session_id: str, move: str, game_mode: str = 'human_vs_ai'):
         if session_id not in self.games:
             return
@@ -188,14 +740,15 @@ class GameManager:
                 await self.send_game_state(session_id)
                 return
             
-            # 执行着法（直接传递原始move字符串）
-            move_result = game.make_move(move)
+            # 执行着法（直接传递原始move字符串）；落子后的胜率探测会等待引擎，放到工作线程执行
+            with metrics.span("manager.make_move.game"):
+                move_result = await asyncio.to_thread(game.make_move, move)
             if move_result is False:
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "error",
                         "message": "无效的着法，该位置不能落子"
-                    }))
+                    })
                 return
             
             await self.send_game_state(session_id)
@@ -208,12 +761,13 @@ class GameManager:
             
             # 推演模式下发送AI分析数据（推荐选点和胜率）
             try:
-                analysis_data = await ai_handler.get_ai_analysis(game)
+                with metrics.span("manager.make_move.ai_analysis"):
+                    analysis_data = await ai_handler.get_ai_analysis(game)
                 if analysis_data and websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "ai_analysis",
                         "data": analysis_data
-                    }))
+                    })
             except Exception as e:
                 print(f"推演模式AI分析失败: {e}")
             
@@ -223,20 +777,20 @@ class GameManager:
             # Human vs AI模式：检查玩家回合
             if game.current_player != game.player_color:
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "error",
                         "message": "现在不是你的回合"
-                    }))
+                    })
                 return
             
             # 验证着法
             parsed_move = game.parse_move(move)
             if parsed_move is None:
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "error",
                         "message": "无效的着法"
-                    }))
+                    })
                 return
             
             if parsed_move == "quit":
@@ -244,14 +798,18 @@ class GameManager:
                 await self.send_game_state(session_id)
                 return
             
-            # 执行人类着法
-            move_result = game.make_move(parsed_move)
+            # 真实着法已到达，取消其它候选的预读（与该着法对应的预读保留继续）
+            game.stop_pondering(keep_move=parsed_move)
+            
+            # 执行人类着法（胜率探测可能等待预读结果，不能阻塞事件循环）
+            with metrics.span("manager.make_move.game"):
+                move_result = await asyncio.to_thread(game.make_move, parsed_move)
             if move_result is False:
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "error",
                         "message": "无效的着法，该位置不能落子"
-                    }))
+                    })
                 return
             
             await self.send_game_state(session_id)
@@ -267,14 +825,15 @@ class GameManager:
             
             # Human vs AI模式下触发AI回合
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "ai_thinking",
                     "message": "KataGo 思考中..."
-                }))
+                })
             
-            # 使用asyncio在后台执行AI着法
-            asyncio.create_task(self._get_ai_move_async(session_id))
+            # AI着法作为后续命令排队执行（SessionActor），期间玩家的操作等待AI落子完成
+            self.submit_ai_move(session_id)
     
+    @metrics.timed("manager.ai_move")
     async def _get_ai_move_async(self, session_id: str):
         """异步获取AI着法"""
         print(f"开始AI异步调用，session_id: {session_id}")
@@ -294,27 +853,29 @@ class GameManager:
             # 检查游戏状态
             if game.game_over:
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "error",
                         "message": "游戏已结束"
-                    }))
+                    })
                 return
             
             # 使用AI处理器获取着法
-            ai_result = await ai_handler.get_ai_move(game, game.ai_time_limit)
+            with metrics.span("manager.ai_move.engine"):
+                ai_result = await ai_handler.get_ai_move(game, game.ai_time_limit)
             
             if ai_result and ai_result.get('move'):
                 ai_move = ai_result['move']
                 
                 # 执行AI着法
-                success = game.make_move(ai_move)
+                with metrics.span("manager.ai_move.game"):
+                    success = await asyncio.to_thread(game.make_move, ai_move)
                 if not success:
                     if websocket:
-                        await websocket.send_text(json.dumps({
+                        await websocket.send_message({
                             "type": "error",
                             "message": "AI着法无效，自动pass"
-                        }))
-                    game.make_move("pass")
+                        })
+                    await asyncio.to_thread(game.make_move, "pass")
                     ai_move = "pass"
                 
                 # 发送AI移动结果
@@ -329,19 +890,27 @@ class GameManager:
                 
                 # 获取AI分析数据
                 try:
-                    analysis_data = await ai_handler.get_ai_analysis(game)
+                    with metrics.span("manager.ai_move.ai_analysis"):
+                        analysis_data = await ai_handler.get_ai_analysis(game)
                     if analysis_data:
                         # 发送AI分析数据
                         if websocket:
-                            await websocket.send_text(json.dumps({
+                            await websocket.send_message({
                                 "type": "ai_analysis",
                                 "data": analysis_data
-                            }))
+                            })
                 except Exception as e:
                     print(f"获取AI分析失败: {e}")
+                
+                # 轮到人类思考，后台预读人类最可能的几手应对
+                if not game.game_over:
+                    try:
+                        await asyncio.to_thread(game.start_pondering)
+                    except Exception as e:
+                        print(f"启动后台预读失败: {e}")
             else:
                 # AI无法生成着法，自动pass
-                game.make_move("pass")
+                await asyncio.to_thread(game.make_move, "pass")
                 await self._send_ai_result(session_id, {
                     "type": "ai_move",
                     "move": "pass"
@@ -354,9 +923,13 @@ class GameManager:
     
     async def _send_ai_result(self, session_id: str, ai_result: dict):
         websocket = self.connections.get(session_id)
+        if websocket is None and session_id in self.broadcasts:
+            # 对局者暂时断开，观战者仍然看到AI落子
+            self._relay(session_id, ai_result)
+            await self.send_game_state(session_id)
         if websocket:
             try:
-                await websocket.send_text(json.dumps(ai_result))
+                await websocket.send_message(ai_result)
                 await self.send_game_state(session_id)
                 
                 # 检查游戏是否结束
@@ -371,10 +944,10 @@ class GameManager:
         websocket = self.connections.get(session_id)
         if websocket:
             try:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "error",
                     "message": message
-                }))
+                })
             except:
                 pass
     
@@ -387,20 +960,23 @@ class GameManager:
         
         # 检查是否可以悔棋
         if len(game.moves) == 0:
-            await websocket.send_text(json.dumps({
+            await websocket.send_message({
                 "type": "error",
                 "message": "没有可以悔棋的着法"
-            }))
+            })
             return
         
         if game.game_over:
-            await websocket.send_text(json.dumps({
+            await websocket.send_message({
                 "type": "error",
                 "message": "游戏已结束，无法悔棋"
-            }))
+            })
             return
         
         try:
+            # 局面即将回退，之前的预读已无意义
+            game.stop_pondering()
+            
             # 悔棋通常需要悔两步（人类和AI的着法）
             undo_count = min(2, len(game.moves))
             for _ in range(undo_count):
@@ -409,10 +985,10 @@ class GameManager:
             
             await self.send_game_state(session_id)
         except Exception as e:
-            await websocket.send_text(json.dumps({
+            await websocket.send_message({
                 "type": "error",
                 "message": f"悔棋失败: {str(e)}"
-            }))
+            })
     
     async def goto_move(self, session_id: str, move_index: int):
         if session_id not in self.games:
@@ -422,22 +998,43 @@ class GameManager:
         websocket = self.connections.get(session_id)
         
         try:
+            game.stop_pondering()
+            
             # 回溯到指定着法
             success = game.goto_move(move_index)
             if success:
                 await self.send_game_state(session_id)
             else:
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "error",
                         "message": "回溯失败"
-                    }))
+                    })
         except Exception as e:
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                         "type": "error",
                         "message": f"回溯操作失败: {str(e)}"
-                    }))
+                    })
+
+    async def goto_node(self, session_id: str, node_id: int):
+        """推演模式：切换到变化树中的任意节点（其他分支）"""
+        if session_id not in self.games:
+            return
+        
+        game = self.games[session_id]
+        websocket = self.connections.get(session_id)
+        
+        if not hasattr(game, "goto_node"):
+            return
+        game.stop_pondering()
+        if game.goto_node(node_id):
+            await self.send_game_state(session_id)
+        elif websocket:
+            await websocket.send_message({
+                "type": "error",
+                "message": "切换变化失败"
+            })
 
     async def change_player_color(self, session_id: str, color: str):
         """更改玩家执子颜色"""
@@ -451,40 +1048,40 @@ class GameManager:
             # 使用游戏对象的方法设置玩家颜色
             if game.change_player_color(color):
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "setting_changed",
                         "setting": "player_color",
                         "value": color,
                         "message": f"玩家执子已设置为{'黑棋' if color == 'B' else '白棋'}"
-                    }))
+                    })
                 
                 # 如果玩家选择白棋且棋盘为空且游戏会话已开始，AI先落子
                 if color == "W" and len(game.moves) == 0 and self.is_session_active(session_id):
                     print(f"玩家选择白棋，棋盘为空，游戏会话已开始，触发AI落子")
                     if websocket:
-                        await websocket.send_text(json.dumps({
+                        await websocket.send_message({
                             "type": "ai_thinking",
                             "message": "KataGo 思考中..."
-                        }))
+                        })
                     
                     # 让AI先落子
-                    asyncio.create_task(self._get_ai_move_async(session_id))
+                    self.submit_ai_move(session_id)
                 else:
                     print(f"不触发AI落子：玩家颜色={color}, 棋盘状态=已有{len(game.moves)}步棋, 会话状态={self.is_session_active(session_id)}")
                 
                 await self.send_game_state(session_id)
             else:
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "error",
                         "message": "无效的玩家颜色设置"
-                    }))
+                    })
         except Exception as e:
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "error",
                     "message": f"设置玩家颜色失败: {str(e)}"
-                }))
+                })
 
     async def change_ai_strength(self, session_id: str, strength: int):
         """更改AI算力"""
@@ -500,24 +1097,24 @@ class GameManager:
             
             if success:
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "setting_changed",
                         "setting": "ai_strength",
                         "value": strength,
                         "message": f"AI算力已设置为{strength}秒"
-                    }))
+                    })
             else:
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "error",
                         "message": "无效的AI算力设置"
-                    }))
+                    })
         except Exception as e:
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "error",
                     "message": f"设置AI算力失败: {str(e)}"
-                }))
+                })
 
     async def change_komi(self, session_id: str, komi: float):
         """更改贴目"""
@@ -531,24 +1128,24 @@ class GameManager:
             # 使用游戏对象的方法设置贴目
             if game.change_komi(komi):
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "setting_changed",
                         "setting": "komi",
                         "value": komi,
                         "message": f"贴目已设置为{komi}目"
-                    }))
+                    })
             else:
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "error",
                         "message": "无效的贴目设置"
-                    }))
+                    })
         except Exception as e:
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "error",
                     "message": f"设置贴目失败: {str(e)}"
-                }))
+                })
 
     async def change_rules(self, session_id: str, rules: str):
         """更改规则"""
@@ -568,24 +1165,24 @@ class GameManager:
                 }.get(rules, rules)
                 
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "setting_changed",
                         "setting": "rules",
                         "value": rules,
                         "message": f"规则已设置为{rules_name}"
-                    }))
+                    })
             else:
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "error",
                         "message": "无效的规则设置"
-                    }))
+                    })
         except Exception as e:
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "error",
                     "message": f"设置规则失败: {str(e)}"
-                }))
+                })
 
     async def change_suggestion_ai_strength(self, session_id: str, strength: int):
         """更改推荐选点AI算力"""
@@ -599,27 +1196,31 @@ class GameManager:
             # 使用游戏对象的方法设置推荐选点AI算力
             if game.change_suggestion_ai_strength(strength):
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "setting_changed",
                         "setting": "suggestion_ai_strength",
                         "value": strength,
                         "message": f"推荐选点AI算力已设置为{strength}秒"
-                    }))
+                    })
             else:
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "error",
                         "message": "无效的推荐选点AI算力设置"
-                    }))
+                    })
         except Exception as e:
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "error",
                     "message": f"设置推荐选点AI算力失败: {str(e)}"
-                }))
+                })
+
+    async def start_realtime_suggestions(self, session_id: str, max_fps: float = DEFAULT_SUGGESTION_FPS):
+        """开始实时推荐选点
 
-    async def start_realtime_suggestions(self, session_id: str):
-        """开始实时推荐选点"""
+        KataGo工作线程通过 SuggestionStream 把报告交给事件循环，只保留最新一份，
+        客户端跟不上时丢弃中间的报告，发送频率不超过 max_fps。
+        """
         if session_id not in self.games:
             return
         
@@ -631,42 +1232,44 @@ class GameManager:
             if not game.katago_initialized:
                 game._start_katago()
             
-            # 定义回调函数，用于发送实时推荐数据
-            async def suggestion_callback(suggestions):
-                if websocket and session_id in self.connections:
-                    try:
-                        await websocket.send_text(json.dumps({
-                            "type": "realtime_suggestions",
-                            "data": suggestions
-                        }))
-                    except Exception as e:
-                        print(f"发送实时推荐失败: {e}")
+            # 发送实时推荐数据（在事件循环中执行，同一时间只有一次发送）
+            async def send_suggestions(suggestions):
+                connection = self.connections.get(session_id)
+                if connection:
+                    await connection.send_message({
+                        "type": "realtime_suggestions",
+                        "data": suggestions
+                    })
             
-            # 使用推荐选点专用的算力设置
-            max_visits = max(1, int(game.suggestion_ai_time_limit * 100))  # 确保为正整数
+            self._close_suggestion_stream(session_id)
+            stream = SuggestionStream(asyncio.get_running_loop(), send_suggestions, max_fps)
+            stream.start()
+            self.suggestion_streams[session_id] = stream
             
-            # 在线程池中启动实时分析
+            # 在线程池中启动实时分析（访问次数由游戏的算力预算按推荐选点思考时间换算）
             loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None, 
-                game.start_realtime_analysis, 
-                lambda suggestions: asyncio.create_task(suggestion_callback(suggestions)),
-                max_visits
-            )
+            await loop.run_in_executor(None, game.start_realtime_analysis, stream.publish)
             
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "realtime_suggestions_started",
                     "message": "实时推荐选点已启动"
-                }))
+                })
                 
         except Exception as e:
             print(f"启动实时推荐失败: {e}")
+            self._close_suggestion_stream(session_id)
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "error",
                     "message": f"启动实时推荐失败: {str(e)}"
-                }))
+                })
+    
+    def _close_suggestion_stream(self, session_id: str):
+        stream = self.suggestion_streams.pop(session_id, None)
+        if stream:
+            stream.close()
+            print(f"实时推荐发送统计: session_id={session_id}, {stream.stats()}")
     
     async def stop_realtime_suggestions(self, session_id: str):
         """停止实时推荐选点"""
@@ -678,20 +1281,21 @@ class GameManager:
         
         try:
             game.stop_realtime_analysis()
+            self._close_suggestion_stream(session_id)
             
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "realtime_suggestions_stopped",
                     "message": "实时推荐选点已停止"
-                }))
+                })
                 
         except Exception as e:
             print(f"停止实时推荐失败: {e}")
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "error",
                     "message": f"停止实时推荐失败: {str(e)}"
-                }))
+                })
 
     async def handle_ai_commentary(self, session_id: str, message: dict):
         """处理AI讲棋请求"""
@@ -701,10 +1305,10 @@ class GameManager:
             
         try:
             if session_id not in self.games:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "ai_commentary_response",
                     "content": "游戏尚未开始，无法进行讲棋分析。"
-                }))
+                })
                 return
                 
             game = self.games[session_id]
@@ -721,18 +1325,18 @@ class GameManager:
             else:
                 commentary = "抱歉，我无法理解您的请求。"
             
-            await websocket.send_text(json.dumps({
+            await websocket.send_message({
                 "type": "ai_commentary_response",
                 "content": commentary
-            }))
+            })
             
         except Exception as e:
             print(f"AI讲棋处理失败: {e}")
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "ai_commentary_response",
                     "content": "抱歉，AI讲棋服务暂时不可用，请稍后再试。"
-                }))
+                })
     
     async def calculate_territory_score(self, session_id: str):
         """计算终局点目"""
@@ -750,32 +1354,32 @@ class GameManager:
             is_finished = await ai_handler.is_game_finished(game)
             
             if not is_finished:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "territory_score_response",
                     "error": "对局尚未结束，无法进行点目计算。请双方都pass后再试。"
-                }))
+                })
                 return
             
             # 计算点目
             territory_result = await ai_handler.calculate_territory_score(game)
             
             if territory_result:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "territory_score_response",
                     "result": territory_result
-                }))
+                })
             else:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "territory_score_response",
                     "error": "点目计算失败，请稍后再试。"
-                }))
+                })
                 
         except Exception as e:
             print(f"点目计算失败: {e}")
-            await websocket.send_text(json.dumps({
+            await websocket.send_message({
                 "type": "error",
                 "message": "点目计算功能暂时不可用，请稍后再试。"
-            }))
+            })
     
     async def get_territory_preview(self, session_id: str):
         """获取领地预览（不要求对局结束）"""
@@ -800,27 +1404,36 @@ class GameManager:
             
             if territory_result.get("success"):
                 print(f"发送成功的领地预览响应")
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "territory_preview_response",
                     "result": territory_result
-                }))
+                })
             else:
                 print(f"发送失败的领地预览响应: {territory_result.get('error')}")
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "territory_preview_response",
                     "error": territory_result.get("error", "领地分析失败，请稍后再试。")
-                }))
+                })
                 
         except Exception as e:
             print(f"领地预览失败: {e}")
-            await websocket.send_text(json.dumps({
+            await websocket.send_message({
                 "type": "error",
                 "message": "领地预览功能暂时不可用，请稍后再试。"
-            }))
+            })
     
-    async def import_sgf(self, session_id: str, sgf_content: str):
-        """导入SGF文件"""
+    async def import_sgf(self, session_id: str, sgf_content: str, options: Optional[dict] = None):
+        """导入SGF文件
+
+        options:
+            mode: "instant"（默认）立即载入整盘棋，随后在后台批量分析并推送进度；
+                  "animated" 逐手落子演示（每手都请求分析）
+            max_fps: instant 模式下进度消息的最大帧率，0 表示不限速（默认10）
+            coalesce: instant 模式下是否把一帧内到达的多个回合合并为一条消息（默认True）
+            animation_delay: animated 模式下每手之间的间隔秒数（默认0.5）
+        """
         print(f"收到SGF导入请求: session_id={session_id}")
+        options = options or {}
         
         if session_id not in self.games:
             print(f"session_id {session_id} 不存在于games中")
@@ -835,42 +1448,185 @@ class GameManager:
         
         # 检查是否为推演模式
         if not isinstance(game, AnalysisGame):
-            await websocket.send_text(json.dumps({
+            await websocket.send_message({
                 "type": "error",
                 "message": "SGF导入功能仅在推演模式下可用"
-            }))
+            })
+            return
+        
+        self._cancel_sgf_import(session_id)
+        if options.get("mode", "instant") == "instant":
+            await self._import_sgf_instant(session_id, game, sgf_content, options)
             return
         
+        animation_delay = float(options.get("animation_delay", 0.5))
         try:
             # 创建动态落子的回调函数
             async def move_callback():
                 # 发送当前棋盘状态
                 await self.send_game_state(session_id)
                 # 添加延迟以展示动态落子效果
-                await asyncio.sleep(0.5)
+                await asyncio.sleep(animation_delay)
             
             # 解析SGF内容并加载到游戏中，传入回调函数
             success = await game.load_from_sgf_async(sgf_content, move_callback)
             
             if success:
                 print(f"SGF文件导入成功")
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "sgf_import_success",
                     "message": "SGF文件导入成功"
-                }))
+                })
             else:
                 print(f"SGF文件解析失败")
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "error",
                     "message": "SGF文件格式错误或解析失败"
-                }))
+                })
                 
         except Exception as e:
             print(f"SGF导入失败: {e}")
-            await websocket.send_text(json.dumps({
+            await websocket.send_message({
                 "type": "error",
                 "message": f"SGF导入失败: {str(e)}"
-            }))
+            })
+    
+    async def _import_sgf_instant(self, session_id: str, game: AnalysisGame, sgf_content: str, options: dict):
+        """立即载入SGF棋盘，批量分析放到后台任务中进行，会话可以继续处理其它命令"""
+        websocket = self.connections.get(session_id)
+        try:
+            success = await asyncio.to_thread(game.replay_sgf, sgf_content)
+        except Exception as e:
+            print(f"SGF导入失败: {e}")
+            success = False
+        
+        if not success:
+            await websocket.send_message({
+                "type": "error",
+                "message": "SGF文件格式错误或解析失败"
+            })
+            return
+        
+        await self.send_game_state(session_id)
+        await websocket.send_message({
+            "type": "sgf_import_success",
+            "message": "SGF文件导入成功，正在后台分析",
+            "analysis_pending": True,
+            "total_turns": len(game.moves) + 1
+        })
+        
+        max_fps = float(options.get("max_fps", 10))
+        coalesce = bool(options.get("coalesce", True))
+        cancel = threading.Event()
+        task = asyncio.create_task(self._stream_sgf_analysis(session_id, game, max_fps, coalesce, cancel))
+        self.import_tasks[session_id] = (task, cancel)
+    
+    async def _stream_sgf_analysis(self, session_id: str, game: AnalysisGame, max_fps: float, coalesce: bool,
+                                   cancel: threading.Event):
+        """在后台批量分析导入的棋局，按客户端要求的帧率推送胜率增量
+
+        引擎查询在工作线程中进行，只产出结果；写入胜率历史和变化树作为会话命令排队执行，
+        不与同一会话的其它命令交错。取消标记属于本次导入，重新导入不会影响新的分析。
+        """
+        loop = asyncio.get_running_loop()
+        results: asyncio.Queue = asyncio.Queue()
+        total_turns = len(game.moves) + 1
+        moves = [list(move) for move in game.moves]
+        completed = 0
+        
+        def run_analysis():
+            for result in game.iter_import_analysis(cancel=cancel):
+                loop.call_soon_threadsafe(results.put_nowait, result)
+        
+        def current():
+            return not cancel.is_set() and self.games.get(session_id) is game
+        
+        def apply(batch):
+            """把一批结果交给会话命令写入并推送"""
+            async def run():
+                nonlocal completed
+                if not current():
+                    return
+                updates = await asyncio.to_thread(game.apply_import_results, moves, batch)
+                completed += len(updates)
+                if not updates:
+                    return
+                # 先推送状态增量，现有界面据此逐批显示已分析的胜率
+                await self.send_game_state(session_id)
+                websocket = self.connections.get(session_id)
+                if websocket:
+                    await websocket.send_message({
+                        "type": "sgf_import_progress",
+                        "data": {
+                            "winrate_updates": updates,
+                            "completed": completed,
+                            "total": total_turns
+                        }
+                    })
+            self._actor(session_id).submit("sgf_import_progress", run, internal=True)
+        
+        async def finish():
+            if not current():
+                return
+            await asyncio.to_thread(game.finish_import_analysis)
+            self._mark_dirty(session_id)
+            await self.send_game_state(session_id)
+            websocket = self.connections.get(session_id)
+            if websocket:
+                await websocket.send_message({
+                    "type": "sgf_analysis_complete",
+                    "completed": completed,
+                    "total": total_turns
+                })
+        
+        analysis = asyncio.ensure_future(asyncio.to_thread(run_analysis))
+        frame_interval = 1.0 / max_fps if max_fps > 0 else 0
+        
+        try:
+            while not (analysis.done() and results.empty()):
+                try:
+                    first = await asyncio.wait_for(results.get(), timeout=0.2)
+                except asyncio.TimeoutError:
+                    continue
+                pending = [first]
+                if coalesce:
+                    # 一帧之内到达的结果合并为一条消息
+                    if frame_interval:
+                        await asyncio.sleep(frame_interval)
+                    while not results.empty():
+                        pending.append(results.get_nowait())
+                    apply(pending)
+                else:
+                    apply(pending)
+                    if frame_interval:
+                        await asyncio.sleep(frame_interval)
+            
+            await analysis
+            self._actor(session_id).submit("sgf_analysis_complete", finish, internal=True)
+        except asyncio.CancelledError:
+            cancel.set()
+            raise
+        except Exception as e:
+            cancel.set()
+            print(f"SGF后台分析失败: {e}")
+            websocket = self.connections.get(session_id)
+            if websocket:
+                await websocket.send_message({
+                    "type": "error",
+                    "message": f"SGF后台分析失败: {str(e)}"
+                })
+        finally:
+            if self.import_tasks.get(session_id, (None,))[0] is asyncio.current_task():
+                del self.import_tasks[session_id]
+    
+    def _cancel_sgf_import(self, session_id: str):
+        """取消该会话正在进行的SGF后台分析"""
+        task, cancel = self.import_tasks.pop(session_id, (None, None))
+        if task is not None:
+            # 先设置取消标记：已经排队的结果写入命令随之跳过
+            cancel.set()
+            if not task.done():
+                task.cancel()
     
     async def get_ai_suggestions(self, session_id: str):
         """获取AI推荐选点"""
@@ -891,22 +1647,22 @@ class GameManager:
             # 获取AI分析数据（包含推荐选点）
             analysis_data = await ai_handler.get_ai_analysis(game)
             if analysis_data and websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "ai_analysis",
                     "data": analysis_data
-                }))
+                })
                 print(f"AI推荐选点发送成功: session_id={session_id}")
             else:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "error",
                     "message": "无法获取AI推荐选点"
-                }))
+                })
         except Exception as e:
             print(f"获取AI推荐选点失败: {e}")
-            await websocket.send_text(json.dumps({
+            await websocket.send_message({
                 "type": "error",
                 "message": f"获取AI推荐选点失败: {str(e)}"
-            }))
+            })
     
     async def get_game_evolution_data(self, session_id: str):
         """获取对局局势演化数据"""
@@ -924,22 +1680,92 @@ class GameManager:
             latest_data = game.evolution_storage.get_latest_data()
             
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "game_evolution_data",
                     "data": {
                         "statistics": evolution_stats,
                         "latest_move_data": latest_data,
                         "total_moves": len(game.evolution_storage.evolution_data) - 1  # 减去初始状态
                     }
-                }))
+                })
                 
         except Exception as e:
             print(f"获取局势演化数据失败: {e}")
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "error",
                     "message": f"获取局势演化数据失败: {str(e)}"
-                }))
+                })
+    
+    async def get_key_moments(self, session_id: str):
+        """获取关键时刻（问题手）索引，复盘时直接跳转到转折点"""
+        if session_id not in self.games:
+            return
+        
+        game = self.games[session_id]
+        websocket = self.connections.get(session_id)
+        if not websocket:
+            return
+        
+        game.key_moments.update(game.winrate_history)
+        await websocket.send_message({
+            "type": "key_moments",
+            "data": game.key_moments.get_index()
+        })
+    
+    async def get_legal_moves(self, session_id: str, include_policy: bool = False):
+        """获取整盘合法着点（可附带策略热力图），前端据此本地判断悬停位置是否可下"""
+        if session_id not in self.games:
+            return
+        
+        game = self.games[session_id]
+        websocket = self.connections.get(session_id)
+        if not websocket:
+            return
+        
+        try:
+            if include_policy:
+                # 可能需要向引擎请求策略网络输出，放到线程中执行
+                data = await asyncio.to_thread(game.get_legal_moves, True)
+            else:
+                data = game.get_legal_moves()
+            await websocket.send_message({
+                "type": "legal_moves",
+                "data": data
+            })
+        except Exception as e:
+            print(f"获取合法着点失败: {e}")
+            await websocket.send_message({
+                "type": "error",
+                "message": f"获取合法着点失败: {str(e)}"
+            })
+    
+    async def read_tactics(self, session_id: str, message: Dict):
+        """本地战术读棋：征子、枷吃、对杀数气和全盘气紧棋块概要"""
+        if session_id not in self.games:
+            return
+        
+        game = self.games[session_id]
+        websocket = self.connections.get(session_id)
+        if not websocket:
+            return
+        
+        try:
+            data = game.read_tactics(
+                kind=message.get("kind", "summary"),
+                point=message.get("point"),
+                point_b=message.get("point_b"),
+                attacker_first=bool(message.get("attacker_first", True))
+            )
+            await websocket.send_message({
+                "type": "tactics_result",
+                "data": data
+            })
+        except ValueError as e:
+            await websocket.send_message({
+                "type": "error",
+                "message": f"读棋失败: {str(e)}"
+            })
     
     async def get_move_evolution_data(self, session_id: str, move_number: int):
         """获取指定手数的局势演化数据"""
@@ -954,155 +1780,378 @@ class GameManager:
             move_data = game.evolution_storage.get_move_data(move_number)
             
             if move_data and websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "move_evolution_data",
                     "data": move_data
-                }))
+                })
             else:
                 if websocket:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_message({
                         "type": "error",
                         "message": f"未找到第{move_number}手的数据"
-                    }))
+                    })
                     
         except Exception as e:
             print(f"获取指定手数局势数据失败: {e}")
             if websocket:
-                await websocket.send_text(json.dumps({
+                await websocket.send_message({
                     "type": "error",
                     "message": f"获取指定手数局势数据失败: {str(e)}"
-                }))
+                })
 
 
 manager = GameManager()
 
+async def handle_message(websocket: WireSocket, session_id: str, message: dict):
+    """执行一条客户端消息（除连接级消息外都在会话的 SessionActor 中按顺序执行）"""
+    if message["type"] == "make_move":
+        game_mode = message.get("game_mode", "human_vs_ai")
+        print(f"make_move消息: session_id={session_id}, move={message['move']}, game_mode={game_mode}")
+        await manager.make_move(session_id, message["move"], game_mode)
+    elif message["type"] == "new_game":
+        # 重新开始游戏
+        game_mode = message.get("game_mode", "human_vs_ai")
+        print(f"new_game消息: session_id={session_id}, game_mode={game_mode}")
+        old_game = None
+        if session_id in manager.games:
+            manager._cancel_sgf_import(session_id)
+            old_game = manager.games[session_id]
+            await asyncio.to_thread(old_game.cleanup)
+        try:
+            # 根据游戏模式创建不同的游戏实例
+            if game_mode == 'analysis':
+                print(f"创建推演模式游戏实例: session_id={session_id}")
+                game = AnalysisGame()
+            else:
+                print(f"创建Human vs AI模式游戏实例: session_id={session_id}")
+                game = WeiQiGame()
+            
+            # 保持之前的游戏设置
+            if old_game:
+                game.player_color = old_game.player_color
+                game.ai_time_limit = old_game.ai_time_limit
+                game.komi = old_game.komi
+                game.rules = old_game.rules
+            
+            manager.games[session_id] = game
+            
+            # 如果游戏会话已开始，初始化胜率数据
+            if manager.is_session_active(session_id):
+                loop = asyncio.get_event_loop()
+                try:
+                    await loop.run_in_executor(None, game._add_initial_winrate)
+                except Exception as e:
+                    print(f"新游戏初始化胜率失败: {e}")
+            
+            await manager.send_game_state(session_id)
+            
+            # 只在Human vs AI模式下，如果玩家选择白棋且游戏会话已开始，AI先落子
+            if game_mode == 'human_vs_ai' and game.player_color == "W" and manager.is_session_active(session_id):
+                print(f"新游戏：Human vs AI模式，玩家选择白棋，当前轮到{game.current_player}，游戏会话已开始，触发AI落子")
+                await websocket.send_message({
+                    "type": "ai_thinking",
+                    "message": "KataGo 思考中..."
+                })
+                # 直接让AI（黑棋）先落子，不需要pass
+                manager.submit_ai_move(session_id)
+            else:
+                print(f"新游戏：模式={game_mode}，玩家选择{game.player_color}，会话状态={manager.is_session_active(session_id)}，不触发AI落子")
+                
+        except Exception as e:
+            await websocket.send_message({
+                "type": "error",
+                "message": f"游戏重新开始失败: {str(e)}"
+            })
+    elif message["type"] == "set_codec":
+        await manager.set_codec(session_id, message.get("codec", "json"))
+    elif message["type"] == "set_protocol":
+        await manager.set_state_protocol(session_id, message.get("protocol", "full"))
+    elif message["type"] == "resync":
+        # 客户端的增量版本对不上时请求完整快照
+        await manager.send_game_state(session_id, force_full=True)
+    elif message["type"] == "set_trace":
+        # 开启后本会话每个阶段的耗时逐条记录；关闭时把记录发回客户端
+        if message.get("enabled", True):
+            metrics.enable_trace(session_id)
+            await websocket.send_message({"type": "trace", "tracing": True})
+        else:
+            await websocket.send_message({"type": "trace", "tracing": False,
+                                          "spans": metrics.disable_trace(session_id)})
+    elif message["type"] == "undo_move":
+        await manager.undo_move(session_id)
+    elif message["type"] == "goto_move":
+        await manager.goto_move(session_id, message["move_index"])
+    elif message["type"] == "goto_node":
+        await manager.goto_node(session_id, int(message["node_id"]))
+    elif message["type"] == "change_player_color":
+        print(f"收到change_player_color消息: session_id={session_id}, color={message['color']}")
+        await manager.change_player_color(session_id, message["color"])
+    elif message["type"] == "change_ai_strength":
+        try:
+            strength = float(message["strength"])
+            await manager.change_ai_strength(session_id, strength)
+        except (ValueError, TypeError):
+            await websocket.send_message({
+                "type": "error",
+                "message": "无效的AI算力值"
+            })
+    elif message["type"] == "change_komi":
+        await manager.change_komi(session_id, message["komi"])
+    elif message["type"] == "change_rules":
+        await manager.change_rules(session_id, message["rules"])
+    elif message["type"] == "change_suggestion_ai_strength":
+        try:
+            strength = int(message["strength"])
+            await manager.change_suggestion_ai_strength(session_id, strength)
+        except (ValueError, TypeError):
+            await websocket.send_message({
+                "type": "error",
+                "message": "无效的AI算力值"
+            })
+    elif message["type"] == "start_game_session":
+        await manager.start_game_session(session_id)
+    elif message["type"] == "stop_game_session":
+        await manager.stop_game_session(session_id)
+    elif message["type"] == "ai_commentary":
+        await manager.handle_ai_commentary(session_id, message)
+    elif message["type"] == "change_model":
+        await manager.handle_model_change(session_id, message)
+    elif message["type"] == "start_realtime_suggestions":
+        try:
+            max_fps = float(message.get("max_fps", DEFAULT_SUGGESTION_FPS))
+        except (ValueError, TypeError):
+            max_fps = DEFAULT_SUGGESTION_FPS
+        await manager.start_realtime_suggestions(session_id, max_fps)
+    elif message["type"] == "stop_realtime_suggestions":
+        await manager.stop_realtime_suggestions(session_id)
+    elif message["type"] == "calculate_territory_score":
+        await manager.calculate_territory_score(session_id)
+    elif message["type"] == "get_territory_preview":
+        await manager.get_territory_preview(session_id)
+    elif message["type"] == "import_sgf":
+        await manager.import_sgf(session_id, message["sgf_content"], message.get("options"))
+    elif message["type"] == "get_ai_suggestions":
+        await manager.get_ai_suggestions(session_id)
+    elif message["type"] == "get_game_evolution_data":
+        await manager.get_game_evolution_data(session_id)
+    elif message["type"] == "get_key_moments":
+        await manager.get_key_moments(session_id)
+    elif message["type"] == "get_legal_moves":
+        await manager.get_legal_moves(session_id, bool(message.get("include_policy", False)))
+    elif message["type"] == "read_tactics":
+        await manager.read_tactics(session_id, message)
+    elif message["type"] == "get_move_evolution_data":
+        move_number = message.get("move_number", 0)
+        await manager.get_move_evolution_data(session_id, move_number)
+
 @app.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
-    await manager.connect(websocket, session_id)
+    # 可以在连接时通过 ?codec=msgpack 直接选择二进制编码，也可以之后发送 set_codec 消息
+    websocket = await manager.connect(websocket, session_id, websocket.query_params.get("codec", "json"))
+    if websocket is None:
+        return  # 服务器已满
     try:
         while True:
             data = await websocket.receive_text()
             message = json.loads(data)
+            manager.touch(session_id)
             print(f"收到WebSocket消息: session_id={session_id}, message_type={message.get('type')}, data={data}")
             
-            if message["type"] == "make_move":
-                game_mode = message.get("game_mode", "human_vs_ai")
-                print(f"make_move消息: session_id={session_id}, move={message['move']}, game_mode={game_mode}")
-                await manager.make_move(session_id, message["move"], game_mode)
-            elif message["type"] == "new_game":
-                # 重新开始游戏
-                game_mode = message.get("game_mode", "human_vs_ai")
-                print(f"new_game消息: session_id={session_id}, game_mode={game_mode}")
-                old_game = None
-                if session_id in manager.games:
-                    old_game = manager.games[session_id]
-                    old_game.cleanup()
-                try:
-                    # 根据游戏模式创建不同的游戏实例
-                    if game_mode == 'analysis':
-                        print(f"创建推演模式游戏实例: session_id={session_id}")
-                        game = AnalysisGame()
-                    else:
-                        print(f"创建Human vs AI模式游戏实例: session_id={session_id}")
-                        game = WeiQiGame()
-                    
-                    # 保持之前的游戏设置
-                    if old_game:
-                        game.player_color = old_game.player_color
-                        game.ai_time_limit = old_game.ai_time_limit
-                        game.komi = old_game.komi
-                        game.rules = old_game.rules
-                    
-                    manager.games[session_id] = game
-                    
-                    # 如果游戏会话已开始，初始化胜率数据
-                    if manager.is_session_active(session_id):
-                        loop = asyncio.get_event_loop()
-                        try:
-                            await loop.run_in_executor(None, game._add_initial_winrate)
-                        except Exception as e:
-                            print(f"新游戏初始化胜率失败: {e}")
-                    
-                    await manager.send_game_state(session_id)
-                    
-                    # 只在Human vs AI模式下，如果玩家选择白棋且游戏会话已开始，AI先落子
-                    if game_mode == 'human_vs_ai' and game.player_color == "W" and manager.is_session_active(session_id):
-                        print(f"新游戏：Human vs AI模式，玩家选择白棋，当前轮到{game.current_player}，游戏会话已开始，触发AI落子")
-                        await websocket.send_text(json.dumps({
-                            "type": "ai_thinking",
-                            "message": "KataGo 思考中..."
-                        }))
-                        # 直接让AI（黑棋）先落子，不需要pass
-                        asyncio.create_task(manager._get_ai_move_async(session_id))
-                    else:
-                        print(f"新游戏：模式={game_mode}，玩家选择{game.player_color}，会话状态={manager.is_session_active(session_id)}，不触发AI落子")
-                        
-                except Exception as e:
-                    await websocket.send_text(json.dumps({
-                        "type": "error",
-                        "message": f"游戏重新开始失败: {str(e)}"
-                    }))
-            elif message["type"] == "undo_move":
-                await manager.undo_move(session_id)
-            elif message["type"] == "goto_move":
-                await manager.goto_move(session_id, message["move_index"])
-            elif message["type"] == "change_player_color":
-                print(f"收到change_player_color消息: session_id={session_id}, color={message['color']}")
-                await manager.change_player_color(session_id, message["color"])
-            elif message["type"] == "change_ai_strength":
-                try:
-                    strength = float(message["strength"])
-                    await manager.change_ai_strength(session_id, strength)
-                except (ValueError, TypeError):
-                    await websocket.send_text(json.dumps({
-                        "type": "error",
-                        "message": "无效的AI算力值"
-                    }))
-            elif message["type"] == "change_komi":
-                await manager.change_komi(session_id, message["komi"])
-            elif message["type"] == "change_rules":
-                await manager.change_rules(session_id, message["rules"])
-            elif message["type"] == "change_suggestion_ai_strength":
-                try:
-                    strength = int(message["strength"])
-                    await manager.change_suggestion_ai_strength(session_id, strength)
-                except (ValueError, TypeError):
-                    await websocket.send_text(json.dumps({
-                        "type": "error",
-                        "message": "无效的AI算力值"
-                    }))
-            elif message["type"] == "start_game_session":
-                await manager.start_game_session(session_id)
-            elif message["type"] == "stop_game_session":
-                await manager.stop_game_session(session_id)
-            elif message["type"] == "ai_commentary":
-                await manager.handle_ai_commentary(session_id, message)
-            elif message["type"] == "change_model":
-                await manager.handle_model_change(session_id, message)
-            elif message["type"] == "start_realtime_suggestions":
-                await manager.start_realtime_suggestions(session_id)
-            elif message["type"] == "stop_realtime_suggestions":
-                await manager.stop_realtime_suggestions(session_id)
-            elif message["type"] == "calculate_territory_score":
-                await manager.calculate_territory_score(session_id)
-            elif message["type"] == "get_territory_preview":
-                await manager.get_territory_preview(session_id)
-            elif message["type"] == "import_sgf":
-                await manager.import_sgf(session_id, message["sgf_content"])
-            elif message["type"] == "get_ai_suggestions":
-                await manager.get_ai_suggestions(session_id)
-            elif message["type"] == "get_game_evolution_data":
-                await manager.get_game_evolution_data(session_id)
-            elif message["type"] == "get_move_evolution_data":
-                move_number = message.get("move_number", 0)
-                await manager.get_move_evolution_data(session_id, move_number)
+            await manager.dispatch(session_id, message, lambda m=message: handle_message(websocket, session_id, m))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(session_id, websocket)
+
+@app.websocket("/ws/{session_id}/watch")
+async def watch_endpoint(websocket: WebSocket, session_id: str):
+    # 只读观战：不创建游戏、不占用引擎，客户端只能发送 resync 请求完整快照
+    spectator = await manager.watch(websocket, session_id, websocket.query_params.get("codec", "json"))
+    if spectator is None:
+        return
+    try:
+        while True:
+            data = await websocket.receive_text()
+            try:
+                message = json.loads(data)
+            except json.JSONDecodeError:
+                continue
+            broadcast = manager.broadcasts.get(session_id)
+            if message.get("type") == "resync" and broadcast is not None:
+                broadcast.resync(spectator)
+            else:
+                spectator.offer({spectator.codec: encode_message(
+                    {"type": "error", "code": "read_only", "message": "观战连接只读"}, spectator.codec)})
     except WebSocketDisconnect:
-        manager.disconnect(session_id)
+        pass
+    except Exception as e:
+        print(f"观战连接异常: session_id={session_id}, error={e}")
+    finally:
+        manager.unwatch(session_id, spectator)
+
+# 离线复盘任务：持久化队列 + 共享同一个KataGo引擎的工作线程池（首次使用时创建）
+review_store = None
+review_pool: Optional[ReviewWorkerPool] = None
+review_lock = threading.Lock()
+
+def get_review_service():
+    global review_store, review_pool
+    with review_lock:
+        if review_store is None:
+            review_store = create_review_job_store()
+            review_pool = ReviewWorkerPool(
+                review_store, create_engine, workers=int(os.getenv("REVIEW_WORKERS", "2"))
+            )
+        return review_store, review_pool
+
+@app.on_event("startup")
+async def resume_review_jobs():
+    """服务启动时继续处理未完成的复盘任务"""
+    def resume():
+        store, pool = get_review_service()
+        pending = store.count_pending()
+        if pending:
+            print(f"发现 {pending} 个未完成的复盘任务，继续处理")
+            pool.start()
+    try:
+        await asyncio.to_thread(resume)
+    except Exception as e:
+        print(f"恢复复盘任务失败: {e}")
+
+@app.on_event("startup")
+async def start_session_reaper():
+    """后台清理断开后超过保留期的会话"""
+    asyncio.create_task(manager.run_reaper())
+
+@app.on_event("shutdown")
+async def save_session_snapshots():
+    """进程退出前写入所有会话的快照，重启后或其他工作进程可以恢复"""
+    for session_id in list(manager.games):
+        await manager.save_snapshot(session_id)
+
+@app.on_event("shutdown")
+async def stop_review_workers():
+    if review_pool is not None:
+        await asyncio.to_thread(review_pool.stop)
+
+@app.post("/api/review/jobs")
+async def submit_review_jobs(request: dict):
+    """提交复盘任务：{"sgf": "..."} 或 {"sgfs": ["...", {"sgf": "...", "name": "..."}]}，可选 max_visits"""
+    items = request.get("sgfs") or ([request] if request.get("sgf") else [])
+    if not items:
+        raise HTTPException(status_code=400, detail="缺少SGF内容")
+    max_visits = int(request.get("max_visits", 200))
+    
+    jobs = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"sgf": item}
+        try:
+            parse_sgf(item.get("sgf", ""))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"第{index + 1}个SGF解析失败: {e}")
+        jobs.append(item)
+    
+    store, pool = await asyncio.to_thread(get_review_service)
+    job_ids = []
+    for item in jobs:
+        job_id = await asyncio.to_thread(
+            store.submit, item["sgf"], item.get("name"), int(item.get("max_visits", max_visits))
+        )
+        job_ids.append(job_id)
+    pool.start()
+    pool.notify()
+    return {"job_ids": job_ids}
+
+@app.get("/api/review/jobs")
+async def list_review_jobs(status: Optional[str] = None, limit: int = 50):
+    store, _ = await asyncio.to_thread(get_review_service)
+    return {"jobs": await asyncio.to_thread(store.list, status, limit)}
+
+@app.get("/api/review/jobs/{job_id}")
+async def get_review_job(job_id: str):
+    store, _ = await asyncio.to_thread(get_review_service)
+    job = await asyncio.to_thread(store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="复盘任务不存在")
+    return job
+
+@app.get("/api/review/jobs/{job_id}/result")
+async def get_review_result(job_id: str, include_ownership: bool = True):
+    store, _ = await asyncio.to_thread(get_review_service)
+    job = await asyncio.to_thread(store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="复盘任务不存在")
+    results = await asyncio.to_thread(store.get_results, job_id)
+    turns = [results[turn] for turn in sorted(results)]
+    if not include_ownership:
+        turns = [{key: value for key, value in record.items() if key != "ownership"} for record in turns]
+    return {"job": job, "turns": turns}
+
+@app.post("/api/review/jobs/{job_id}/retry")
+async def retry_review_job(job_id: str):
+    store, pool = await asyncio.to_thread(get_review_service)
+    if not await asyncio.to_thread(store.retry, job_id):
+        raise HTTPException(status_code=409, detail="只有失败的任务可以重试")
+    pool.start()
+    pool.notify()
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/api/review/jobs/{job_id}/events")
+async def stream_review_job(job_id: str, interval: float = 1.0):
+    """以 Server-Sent Events 推送任务状态，任务结束后关闭"""
+    store, _ = await asyncio.to_thread(get_review_service)
+    if await asyncio.to_thread(store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="复盘任务不存在")
+    
+    async def events():
+        last_payload = None
+        while True:
+            job = await asyncio.to_thread(store.get, job_id)
+            payload = json.dumps(job, ensure_ascii=False)
+            if payload != last_payload:
+                yield f"data: {payload}\n\n"
+                last_payload = payload
+            if job is None or job["status"] in ("done", "failed"):
+                break
+            await asyncio.sleep(max(0.2, interval))
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 @app.get("/")
 async def read_root():
     return {"message": "围棋对弈系统后端API"}
 
+@app.get("/api/sessions/stats")
+async def get_session_stats():
+    """会话数、引擎数和每个会话的内存估算"""
+    return await asyncio.to_thread(manager.session_stats)
+
+@app.get("/api/metrics")
+async def get_metrics(format: str = "json"):
+    """各阶段耗时的直方图汇总；format=prometheus 时输出 Prometheus 文本格式"""
+    if format == "prometheus":
+        return PlainTextResponse(metrics.render_prometheus())
+    return metrics.snapshot()
+
+@app.post("/api/sessions/{session_id}/trace")
+async def set_session_trace(session_id: str, request: dict):
+    """开启或关闭某个会话的逐条耗时追踪（关闭时返回已记录的span）"""
+    if request.get("enabled", True):
+        # 追踪缓冲区随会话清理释放，不存在的会话开启后无人释放
+        if session_id not in manager.games:
+            raise HTTPException(status_code=404, detail="会话不存在")
+        metrics.enable_trace(session_id)
+        return {"session_id": session_id, "tracing": True}
+    return {"session_id": session_id, "tracing": False, "spans": metrics.disable_trace(session_id)}
+
+@app.get("/api/sessions/{session_id}/trace")
+async def get_session_trace(session_id: str):
+    spans = metrics.get_trace(session_id)
+    if spans is None:
+        raise HTTPException(status_code=404, detail="该会话未开启追踪")
+    return {"session_id": session_id, "tracing": True, "spans": spans}
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
@@ -0,0 +1,200 @@
+import asyncio
+import os
+from typing import Dict, List, Optional, Union
+
+from api.state_protocol import StateTracker
+from api.wire_codec import available_codecs, encode
+
+# 每局棋的观战者上限
+MAX_SPECTATORS = int(os.environ.get("MAX_SPECTATORS", 256))
+# 每个观战者最多积压的帧数，超出时丢弃积压，改发一次完整快照
+SPECTATOR_QUEUE_SIZE = 64
+# 单帧发送超时（秒），超时的观战者被断开，不再占用发送协程
+SPECTATOR_SEND_TIMEOUT = 10.0
+
+# 对局者连接上的这些消息同样转发给观战者（棋局状态由观战广播自己的增量跟踪，不在此列）
+BROADCAST_TYPES = {"ai_thinking", "ai_move", "ai_analysis", "realtime_suggestions", "session_started",
+                   "session_stopped", "setting_changed", "sgf_import_success", "sgf_import_progress",
+                   "sgf_analysis_complete"}
+
+Frame = Dict[str, Union[str, bytes]]
+
+_CLOSE = "close"
+
+
+class Spectator:
+    """一个只读的观战连接：独立的有界发送队列和发送协程"""
+
+    def __init__(self, websocket, codec: str = "json", queue_size: int = SPECTATOR_QUEUE_SIZE):
+        if codec not in available_codecs():
+            raise ValueError(f"不支持的编码: {codec}，可用: {', '.join(available_codecs())}")
+        self.websocket = websocket
+        self.codec = codec
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+        self.resyncs = 0
+
+    def offer(self, frame: Frame) -> bool:
+        """放入一帧，队列已满（客户端跟不上）时返回False"""
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def replace(self, frame: Frame):
+        """丢弃积压，只保留这一帧（完整快照）"""
+        self.dropped += self._clear()
+        self.queue.put_nowait(frame)
+
+    def end(self):
+        """会话结束：丢弃积压，通知客户端后关闭连接"""
+        self._clear()
+        self.queue.put_nowait(_CLOSE)
+
+    def _clear(self) -> int:
+        cleared = 0
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            cleared += 1
+        return cleared
+
+    async def send(self, data: Union[str, bytes]):
+        send = self.websocket.send_bytes if isinstance(data, bytes) else self.websocket.send_text
+        await asyncio.wait_for(send(data), SPECTATOR_SEND_TIMEOUT)
+        self.sent += 1
+
+
+class Broadcast:
+    """一局棋的观战广播
+
+    观战者统一使用 delta 协议，由广播自己的 StateTracker 生成增量，与对局者协商的协议无关；
+    每帧按观战者用到的编码各编码一次，同一份数据发给所有观战者。
+    每个观战者有独立的有界队列，慢的观战者只会丢弃自己的积压（随后补发完整快照），
+    不影响对局者和其他观战者。观战者不发送命令，引擎开销与观战人数无关。
+    """
+
+    def __init__(self, session_id: str, max_spectators: int = MAX_SPECTATORS):
+        self.session_id = session_id
+        self.max_spectators = max_spectators
+        self.tracker = StateTracker()
+        self.game = None  # 最近一次广播状态的游戏实例
+        self.spectators: List[Spectator] = []
+        self._snapshot: Optional[tuple] = None  # (版本号, {编码: 数据})
+        self.frames = 0
+        self.encodes = 0
+
+    def _encode(self, message: Dict, codecs) -> Frame:
+        frame = {}
+        for codec in codecs:
+            frame[codec] = encode(message, codec)
+            self.encodes += 1
+        return frame
+
+    def _codecs(self) -> set:
+        return {spectator.codec for spectator in self.spectators}
+
+    def publish(self, message: Dict):
+        """广播一条消息（每种编码只编码一次）"""
+        if not self.spectators:
+            return
+        frame = self._encode(message, self._codecs())
+        self.frames += 1
+        for spectator in self.spectators:
+            if not spectator.offer(frame):
+                # 积压的增量已经丢不起了：清空队列，从当前版本的完整快照重新开始
+                self.resync(spectator)
+
+    def resync(self, spectator: Spectator):
+        """给观战者补发当前版本的完整快照（积压过多，或客户端发现版本不连续时请求）"""
+        frame = self.snapshot_frame(spectator.codec)
+        if frame is not None:
+            spectator.resyncs += 1
+            spectator.replace(frame)
+
+    def publish_state(self, game):
+        """棋局状态变化：生成一条增量（换了游戏实例时为完整快照）广播给所有观战者"""
+        self.game = game
+        if not self.spectators:
+            # 没有观战者时不跟踪，下一个观战者加入时从完整快照开始
+            self.tracker.reset()
+            return
+        message = self.tracker.encode(game)
+        if message is not None:
+            self.publish(message)
+
+    def snapshot_frame(self, codec: str) -> Optional[Frame]:
+        """当前版本的完整快照（同一版本内多个观战者共用编码结果）"""
+        message = self.tracker.current()
+        if message is None:
+            if self.game is None:
+                return None
+            message = self.tracker.snapshot(self.game)
+        version = message["version"]
+        if self._snapshot is None or self._snapshot[0] != version:
+            self._snapshot = (version, {})
+        frames = self._snapshot[1]
+        if codec not in frames:
+            frames.update(self._encode(message, [codec]))
+        return {codec: frames[codec]}
+
+    def subscribe(self, spectator: Spectator, game):
+        """加入观战：先收到当前的完整快照，之后是增量和分析帧
+
+        Raises:
+            ValueError: 观战人数已满
+        """
+        if len(self.spectators) >= self.max_spectators:
+            raise ValueError(f"观战人数已满（{self.max_spectators}）")
+        if self.game is not game:
+            self.game = game
+            self.tracker.reset()
+        frame = self.snapshot_frame(spectator.codec)
+        self.spectators.append(spectator)
+        spectator.offer(frame)
+        spectator.task = asyncio.get_running_loop().create_task(self._run(spectator))
+
+    def unsubscribe(self, spectator: Spectator):
+        if spectator in self.spectators:
+            self.spectators.remove(spectator)
+        if spectator.task is not None and spectator.task is not asyncio.current_task():
+            spectator.task.cancel()
+
+    async def _run(self, spectator: Spectator):
+        try:
+            while True:
+                frame = await spectator.queue.get()
+                if frame == _CLOSE:
+                    await spectator.send(encode({"type": "session_ended", "session_id": self.session_id},
+                                                spectator.codec))
+                    await spectator.websocket.close(code=4000)
+                    break
+                await spectator.send(frame[spectator.codec])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"观战连接发送失败，断开: session_id={self.session_id}, error={e}")
+            try:
+                await spectator.websocket.close(code=1011)
+            except Exception:
+                pass
+        finally:
+            if spectator in self.spectators:
+                self.spectators.remove(spectator)
+
+    def close(self):
+        """会话结束，通知并断开所有观战者"""
+        for spectator in list(self.spectators):
+            spectator.end()
+        self.spectators.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "spectators": len(self.spectators),
+            "frames": self.frames,
+            "encodes": self.encodes,
+            "dropped": sum(spectator.dropped for spectator in self.spectators),
+            "resyncs": sum(spectator.resyncs for spectator in self.spectators)
+        }
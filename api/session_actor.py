@@ -0,0 +1,97 @@
+import asyncio
+import itertools
+from typing import Awaitable, Callable, Dict, Optional
+
+# 客户端命令的邮箱容量，超出时拒绝新命令（服务器内部提交的命令如AI落子不受限制）
+MAILBOX_SIZE = 32
+
+Handler = Callable[[], Awaitable[None]]
+
+
+class SessionActor:
+    """每个会话一个的命令执行器：邮箱中的命令按提交顺序逐个执行
+
+    落子、悔棋、跳转、分析请求都经过同一个邮箱，同一局棋上不会有两个命令交错执行，
+    AI落子也作为命令排队，而不是另起任务与玩家的操作并发。
+    带 coalesce_key 的命令（跳转、形势判断等只关心最新结果的请求）在执行前如果已有同键的新命令，
+    旧命令直接跳过，连续点击时只执行最后一次，省掉多余的引擎计算。
+    """
+
+    def __init__(self, session_id: str, mailbox_size: int = MAILBOX_SIZE,
+                 on_error: Optional[Callable[[str, Exception], Awaitable[None]]] = None):
+        self.session_id = session_id
+        self.mailbox_size = mailbox_size
+        self.on_error = on_error
+        self._mailbox: asyncio.Queue = asyncio.Queue()
+        self._latest: Dict[str, int] = {}
+        self._sequence = itertools.count(1)
+        self._task: Optional[asyncio.Task] = None
+        self.current: Optional[str] = None
+        self.processed = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def submit(self, kind: str, handler: Handler, coalesce_key: Optional[str] = None,
+               internal: bool = False) -> bool:
+        """提交命令，邮箱已满时返回False
+
+        Args:
+            kind: 命令名（日志和统计用）
+            handler: 无参数的协程函数
+            coalesce_key: 同键的命令只执行最新的一条
+            internal: 服务器内部产生的后续命令（如AI落子），不受邮箱容量限制
+        """
+        if not internal and self._mailbox.qsize() >= self.mailbox_size:
+            self.rejected += 1
+            return False
+        sequence = next(self._sequence)
+        if coalesce_key is not None:
+            self._latest[coalesce_key] = sequence
+        self._mailbox.put_nowait((sequence, kind, coalesce_key, handler))
+        return True
+
+    async def _run(self):
+        while True:
+            sequence, kind, coalesce_key, handler = await self._mailbox.get()
+            try:
+                if coalesce_key is not None and self._latest.get(coalesce_key) != sequence:
+                    self.coalesced += 1
+                    continue
+                self.current = kind
+                await handler()
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"会话命令执行失败: session_id={self.session_id}, command={kind}, error={e}")
+                if self.on_error is not None:
+                    try:
+                        await self.on_error(kind, e)
+                    except Exception:
+                        pass
+            finally:
+                self.current = None
+                self._mailbox.task_done()
+
+    async def join(self):
+        """等待邮箱中已有的命令全部执行完"""
+        await self._mailbox.join()
+
+    def close(self):
+        """停止执行器，未执行的命令丢弃"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "pending": self._mailbox.qsize(),
+            "current": self.current,
+            "processed": self.processed,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected
+        }
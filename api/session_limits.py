@@ -0,0 +1,86 @@
+import os
+import sys
+from typing import Dict, Optional
+
+# 同时存在的会话上限（含断开后仍在保留期内的会话）；每个会话有自己的KataGo引擎，因此也是引擎数上限
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", 16))
+# 已连接但长时间没有任何操作的会话在服务器满时可以被淘汰，超过该时间（秒）后由清理任务回收
+SESSION_IDLE_TIMEOUT = float(os.environ.get("SESSION_IDLE_TIMEOUT", 1800))
+# 单个会话的内存上限（MB），超出时清空该会话的分析缓存
+SESSION_MEMORY_LIMIT = int(os.environ.get("SESSION_MEMORY_LIMIT_MB", 64)) * 1024 * 1024
+
+# 参与内存估算的游戏属性：随对局长度或分析次数增长的部分
+MEMORY_FIELDS = ("moves", "board_history", "winrate_history", "analysis_cache", "policy_cache", "tree",
+                 "key_moments")
+
+
+class CapacityError(Exception):
+    """服务器会话数已满且没有可以淘汰的会话"""
+
+
+def _dict_items(mapping: dict) -> list:
+    """复制字典的条目；复制过程中被其他线程修改（如推荐选点线程写策略缓存）时重试，仍失败则跳过"""
+    for _ in range(3):
+        try:
+            return list(mapping.items())
+        except RuntimeError:
+            continue
+    return []
+
+
+def deep_sizeof(obj, seen: Optional[set] = None) -> int:
+    """估算对象占用的内存（容器元素、普通对象的属性和 __slots__），共享的对象只计一次
+
+    用显式栈遍历，变化树这类很深的父子链不会超出递归深度。
+    """
+    seen = set() if seen is None else seen
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item, 0)
+        if item is None or isinstance(item, (str, bytes, bytearray, int, float, bool)):
+            continue
+        if hasattr(item, "memory_items"):
+            # 分析缓存会被预读回调并发写入，由缓存在自己的锁内复制条目
+            stack.extend(item.memory_items())
+        elif isinstance(item, dict):
+            for key, value in _dict_items(item):
+                stack.append(key)
+                stack.append(value)
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(list(item))
+        else:
+            if hasattr(item, "__dict__"):
+                stack.append(vars(item))
+            for slot in getattr(type(item), "__slots__", ()):
+                if hasattr(item, slot):
+                    stack.append(getattr(item, slot))
+    return size
+
+
+def estimate_session_memory(game) -> Dict[str, int]:
+    """按属性估算一个游戏会话的内存（字节），total 为合计"""
+    seen: set = set()
+    usage = {field: deep_sizeof(getattr(game, field), seen) for field in MEMORY_FIELDS if hasattr(game, field)}
+    usage["total"] = sum(usage.values())
+    return usage
+
+
+def trim_session_memory(game, limit: int = SESSION_MEMORY_LIMIT) -> Optional[Dict[str, int]]:
+    """会话内存超过上限时清空可以重新计算的缓存（分析缓存、策略缓存）
+
+    Returns:
+        清理前的内存估算，没有超出上限时返回None
+    """
+    usage = estimate_session_memory(game)
+    if usage["total"] <= limit:
+        return None
+    if hasattr(game, "analysis_cache"):
+        game.analysis_cache.clear()
+    if hasattr(game, "policy_cache"):
+        game.policy_cache.clear()
+    return usage
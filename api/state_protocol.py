@@ -0,0 +1,147 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 客户端可以选择的 game_state 协议：full 为每次发送完整状态（旧客户端默认），delta 为版本化增量
+STATE_PROTOCOLS = ("full", "delta")
+
+# 增量中直接整体替换的标量字段
+SCALAR_FIELDS = ("current_player", "game_over", "move_count", "captured_black", "captured_white")
+
+
+def _list_delta(sent: List, current: Sequence) -> Optional[Tuple[int, List]]:
+    """比较已发送的列表与当前列表
+
+    通常只是末尾追加：上次最后一个元素仍在原位置（同一对象）时只比较这一个元素；
+    悔棋、跳转、切换分支等改写了历史时才逐项找公共前缀。
+
+    Returns:
+        (保留的前缀长度, 追加的元素)，没有变化时返回None
+    """
+    sent_len = len(sent)
+    if len(current) >= sent_len and (sent_len == 0 or current[sent_len - 1] is sent[-1]):
+        keep = sent_len
+    else:
+        keep = 0
+        limit = min(sent_len, len(current))
+        while keep < limit and current[keep] == sent[keep]:
+            keep += 1
+    appended = list(current[keep:])
+    if keep == sent_len and not appended:
+        return None
+    return keep, appended
+
+
+class StateTracker:
+    """记录某个连接上次收到的游戏状态，生成版本化的增量消息
+
+    增量消息只包含落子/提子改变的交叉点、追加的着法和胜率记录，
+    每手棋的消息大小和编码时间与对局长度无关。客户端发现 base_version 与本地版本不一致时
+    发送 resync 请求完整快照。
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._game = None
+        self._board: List[List[int]] = []
+        self._moves: List = []
+        self._winrates: List = []
+        self._fields: Dict = {}
+        self._tree: Optional[Dict] = None
+
+    def reset(self):
+        """下一次强制发送完整快照"""
+        self._game = None
+
+    def encode(self, game, force_full: bool = False) -> Optional[Dict]:
+        """生成下一条状态消息：首次、换了游戏实例或强制时为快照，否则为增量（没有变化返回None）"""
+        if force_full or self._game is not game:
+            return self.snapshot(game)
+        return self.delta(game)
+
+    def snapshot(self, game) -> Dict:
+        """完整状态，同时作为之后增量的基准"""
+        self.version += 1
+        self._game = game
+        self._board = [list(row) for row in game.board]
+        self._moves = list(game.moves)
+        self._winrates = list(game.winrate_history)
+        self._fields = {field: value for field, value in _scalar_fields(game)}
+        self._tree = game.get_variation_tree() if hasattr(game, "get_variation_tree") else None
+
+        data = {
+            "board": game.board,
+            "moves": game.moves,
+            **self._fields,
+            "winrate_history": game.winrate_history
+        }
+        if self._tree is not None:
+            data["variation_tree"] = self._tree
+        return {"type": "game_state", "version": self.version, "data": data}
+
+    def current(self) -> Optional[Dict]:
+        """上次发送后的完整状态（不改变版本号），中途加入的接收方以此作为之后增量的基准
+
+        返回的数据引用内部记录，会被下一次 delta 修改，需要立即编码；还没有发送过状态时返回None。
+        """
+        if self._game is None:
+            return None
+        data = {
+            "board": self._board,
+            "moves": self._moves,
+            **self._fields,
+            "winrate_history": self._winrates
+        }
+        if self._tree is not None:
+            data["variation_tree"] = self._tree
+        return {"type": "game_state", "version": self.version, "data": data}
+
+    def delta(self, game) -> Optional[Dict]:
+        """与上次发送的状态比较，只发送变化的部分"""
+        data: Dict = {}
+
+        changes = []
+        for row_index, (sent_row, row) in enumerate(zip(self._board, game.board)):
+            if sent_row != row:
+                for col_index, value in enumerate(row):
+                    if sent_row[col_index] != value:
+                        changes.append([row_index, col_index, value])
+                        sent_row[col_index] = value
+        if changes:
+            data["stones"] = changes
+
+        moves = _list_delta(self._moves, game.moves)
+        if moves is not None:
+            keep, appended = moves
+            del self._moves[keep:]
+            self._moves.extend(appended)
+            data["moves"] = {"truncate": keep, "append": appended}
+
+        winrates = _list_delta(self._winrates, game.winrate_history)
+        if winrates is not None:
+            keep, appended = winrates
+            del self._winrates[keep:]
+            self._winrates.extend(appended)
+            data["winrate_history"] = {"truncate": keep, "append": appended}
+
+        for field, value in _scalar_fields(game):
+            if self._fields.get(field) != value:
+                self._fields[field] = value
+                data[field] = value
+
+        if hasattr(game, "get_variation_tree"):
+            tree = game.get_variation_tree()
+            if tree != self._tree:
+                self._tree = tree
+                data["variation_tree"] = tree
+
+        if not data:
+            return None
+        self.version += 1
+        return {"type": "game_state_delta", "version": self.version, "base_version": self.version - 1, "data": data}
+
+
+def _scalar_fields(game):
+    for field in SCALAR_FIELDS:
+        if field == "move_count":
+            yield field, getattr(game, "move_count", len(game.moves))
+        else:
+            yield field, getattr(game, field)
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Optional
+
+# 实时推荐选点的默认最大帧率（KataGo每0.5秒报告一次）
+DEFAULT_SUGGESTION_FPS = 2.0
+
+
+class SuggestionStream:
+    """把KataGo工作线程的实时报告送进事件循环的“最新值”通道
+
+    publish() 可以在任意线程调用，只覆盖一个槽位：发送协程还没取走的旧报告直接丢弃。
+    同一时间最多只有一次发送在进行，发送慢（客户端网络差）时中间的报告被合并掉，
+    服务器端不会为慢客户端积压消息；max_fps 限制两次发送之间的最小间隔。
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, send: Callable[[Any], Awaitable[None]],
+                 max_fps: float = DEFAULT_SUGGESTION_FPS):
+        self._loop = loop
+        self._send = send
+        self._interval = 1.0 / max_fps if max_fps > 0 else 0
+        self._lock = threading.Lock()
+        self._latest: Any = None
+        self._pending = False
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.published = 0
+        self.sent = 0
+        self.dropped = 0
+
+    def start(self):
+        """在事件循环中启动发送协程"""
+        if self._task is None:
+            self._task = self._loop.create_task(self._run())
+
+    def publish(self, value: Any):
+        """工作线程调用：放入最新报告；槽位为空时才唤醒事件循环，回调队列不会随报告数增长"""
+        with self._lock:
+            self.published += 1
+            if self._pending:
+                self.dropped += 1
+            self._latest = value
+            wake = not self._pending
+            self._pending = True
+        if wake:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+
+    def _take(self):
+        with self._lock:
+            if not self._pending:
+                return False, None
+            value, self._latest, self._pending = self._latest, None, False
+            return True, value
+
+    async def _run(self):
+        last_sent = None
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if last_sent is not None and self._interval:
+                delay = last_sent + self._interval - self._loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            has_value, value = self._take()
+            if not has_value:
+                continue
+            try:
+                await self._send(value)
+                self.sent += 1
+            except Exception as e:
+                print(f"发送实时推荐失败: {e}")
+            last_sent = self._loop.time()
+
+    def close(self):
+        """停止发送协程，槽位中未发送的报告丢弃"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"published": self.published, "sent": self.sent, "dropped": self.dropped}
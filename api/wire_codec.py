@@ -0,0 +1,156 @@
+import json
+import math
+import struct
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from core.metrics import metrics
+from core.ownership import Ownership
+from core.rules import format_point, parse_point
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# WebSocket 帧编码：json 为文本帧（默认，自带的Web前端只使用JSON），
+# msgpack 为二进制帧，供其他客户端通过 ?codec=msgpack 或 set_codec 消息选用
+CODECS = ("json", "msgpack")
+
+# msgpack 扩展类型：棋盘为每点一字节，形势判断为 int8 量化值（见 Ownership.quantize），
+# 着法为 uint16 大端序（低15位为点的下标，pass 为 size*size，最高位表示白棋）
+EXT_BOARD = 1
+EXT_OWNERSHIP = 2
+EXT_MOVES = 3
+
+WHITE_BIT = 0x8000
+BOARD_SIZE = 19
+
+BOARD_KEYS = ("board",)
+OWNERSHIP_KEYS = ("ownership",)
+MOVE_KEYS = ("moves",)
+
+
+def available_codecs() -> List[str]:
+    return [codec for codec in CODECS if codec != "msgpack" or msgpack is not None]
+
+
+def _square_grid(value: Any) -> Optional[int]:
+    """value 是 size x size 的二维列表时返回 size"""
+    if not isinstance(value, list) or not value:
+        return None
+    size = len(value)
+    if all(isinstance(row, list) and len(row) == size for row in value):
+        return size
+    return None
+
+
+def _pack_board(board: List[List[int]]):
+    return msgpack.ExtType(EXT_BOARD, bytes(value for row in board for value in row))
+
+
+def _pack_ownership(rows: List[List[float]]):
+    return msgpack.ExtType(EXT_OWNERSHIP, Ownership.from_rows(rows).to_bytes())
+
+
+def _pack_moves(moves: List, size: int = BOARD_SIZE):
+    """着法列表压缩为整数，格式不符（如坐标无效）时返回None，保留原样"""
+    values = []
+    for item in moves:
+        if not isinstance(item, (list, tuple)) or len(item) != 2 or item[0] not in ("B", "W"):
+            return None
+        try:
+            point = parse_point(str(item[1]), size)
+        except ValueError:
+            return None
+        index = size * size if point is None else point[0] * size + point[1]
+        values.append(index | (WHITE_BIT if item[0] == "W" else 0))
+    return msgpack.ExtType(EXT_MOVES, struct.pack(f">{len(values)}H", *values))
+
+
+def _compact(value: Any) -> Any:
+    """把消息中的棋盘、形势判断和着法列表替换为紧凑的扩展类型
+
+    只沿字典向下查找这些字段，列表（胜率历史、推荐选点等）原样交给 msgpack，不逐项遍历。
+    """
+    if not isinstance(value, dict):
+        return value
+    result = {}
+    for key, item in value.items():
+        if isinstance(item, dict):
+            item = _compact(item)
+        elif isinstance(item, list) and item:
+            if key in BOARD_KEYS and _square_grid(item) and all(
+                    type(v) is int and 0 <= v <= 255 for row in item for v in row):
+                item = _pack_board(item)
+            elif key in OWNERSHIP_KEYS and _square_grid(item):
+                item = _pack_ownership(item)
+            elif key in MOVE_KEYS:
+                item = _pack_moves(item) or item
+        result[key] = item
+    return result
+
+
+def _ext_hook(code: int, data: bytes):
+    if code == EXT_BOARD:
+        size = math.isqrt(len(data))
+        return [list(data[row * size:(row + 1) * size]) for row in range(size)]
+    if code == EXT_OWNERSHIP:
+        return Ownership.from_quantized(data, math.isqrt(len(data))).to_rows(3)
+    if code == EXT_MOVES:
+        moves = []
+        for (value,) in struct.iter_unpack(">H", data):
+            index = value & ~WHITE_BIT
+            move = "pass" if index == BOARD_SIZE * BOARD_SIZE else format_point(index // BOARD_SIZE, index % BOARD_SIZE)
+            moves.append(["W" if value & WHITE_BIT else "B", move])
+        return moves
+    return msgpack.ExtType(code, data)
+
+
+def encode(message: Dict, codec: str = "json") -> Union[str, bytes]:
+    """编码一条发送给客户端的消息：json 返回文本，msgpack 返回二进制"""
+    if codec == "msgpack":
+        if msgpack is None:
+            raise ValueError("未安装 msgpack，无法使用二进制编码")
+        return msgpack.packb(_compact(message), use_bin_type=True)
+    return json.dumps(message)
+
+
+def decode(data: Union[str, bytes], codec: str = "json") -> Dict:
+    """encode 的逆过程（测试和基准使用；选用 msgpack 的客户端按同样的扩展类型解码）"""
+    if codec == "msgpack":
+        return msgpack.unpackb(data, raw=False, ext_hook=_ext_hook)
+    return json.loads(data)
+
+
+class WireSocket:
+    """按连接协商的编码发送消息的 WebSocket 包装
+
+    send_message 按当前编码选择文本帧或二进制帧；其他属性和方法（receive_text、send_text 等）
+    直接转发给原始 WebSocket。
+    """
+
+    def __init__(self, websocket, codec: str = "json"):
+        self.websocket = websocket
+        self.codec = "json"
+        # 每条发送的消息也交给 observer（观战广播转发对局者收到的分析帧）
+        self.observer: Optional[Callable[[Dict], None]] = None
+        self.set_codec(codec)
+
+    def set_codec(self, codec: str):
+        if codec not in available_codecs():
+            raise ValueError(f"不支持的编码: {codec}，可用: {', '.join(available_codecs())}")
+        self.codec = codec
+
+    async def send_message(self, message: Dict):
+        if self.observer is not None:
+            self.observer(message)
+        with metrics.span(f"ws.encode.{self.codec}"):
+            data = encode(message, self.codec)
+        with metrics.span("ws.send"):
+            if isinstance(data, bytes):
+                await self.websocket.send_bytes(data)
+            else:
+                await self.websocket.send_text(data)
+
+    def __getattr__(self, name):
+        return getattr(self.websocket, name)
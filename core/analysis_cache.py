@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .symmetry import canonicalize_moves, inverse_transform, transform_analysis
+
+
+class AnalysisCache:
+    """局面分析结果缓存（LRU）
+
+    以着法序列、贴目和规则为键缓存KataGo的最终分析结果。
+    着法序列先做对称规范化，旋转/翻转后相同的局面共用同一条缓存，
+    结果按规范方向保存，读取时再变换回查询的实际方向。
+    查询时只有当缓存结果的搜索量不少于请求的访问次数时才算命中，
+    因此低访问次数的胜率探测可以直接复用高访问次数的结果。
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, Tuple[Dict, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _canonical_key(moves: List, komi: float, rules: str) -> Tuple[Tuple, int]:
+        canonical_moves, transform = canonicalize_moves(moves)
+        key = (tuple((color, move) for color, move in canonical_moves), float(komi), rules)
+        return key, transform
+
+    @classmethod
+    def make_key(cls, moves: List, komi: float, rules: str = "chinese") -> Tuple:
+        """生成缓存键（对称规范化后的着法序列）"""
+        return cls._canonical_key(moves, komi, rules)[0]
+
+    def get(self, moves: List, komi: float, min_visits: int = 0,
+            rules: str = "chinese") -> Optional[Dict]:
+        """获取满足访问次数要求的缓存结果，未命中返回None"""
+        key, transform = self._canonical_key(moves, komi, rules)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] >= min_visits:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                return None
+        return transform_analysis(entry[0], inverse_transform(transform))
+
+    def put(self, moves: List, komi: float, response: Dict, budget: int = 0,
+            rules: str = "chinese"):
+        """写入分析结果
+
+        Args:
+            budget: 该结果对应的访问次数预算；正常完成的搜索按预算计，
+                被提前终止的搜索应传入实际访问次数
+        """
+        visits = response.get("rootInfo", {}).get("visits", 0)
+        strength = max(visits, budget)
+        key, transform = self._canonical_key(moves, komi, rules)
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None and existing[1] > strength:
+                self._entries.move_to_end(key)
+                return
+        canonical_response = transform_analysis(response, transform)
+        with self._lock:
+            # 变换期间其他线程可能写入了更强的结果，再检查一次
+            existing = self._entries.get(key)
+            if existing is not None and existing[1] > strength:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = (canonical_response, strength)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def memory_items(self) -> List[Tuple]:
+        """在锁内复制的 (键, (结果, 访问次数)) 列表，供内存估算遍历（预读回调可能同时写入）"""
+        with self._lock:
+            return list(self._entries.items())
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses
+            }
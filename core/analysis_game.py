@@ -1,5 +1,12 @@
 import json
+import time
 from .human_vs_katago import WeiQiGame
+from .game_tree import GameTree
+from .key_moments import KeyMomentDetector
+from .metrics import metrics
+from .ownership import Ownership
+from .rules import GoBoard
+from .sgf_utils import parse_sgf
 from storage.game_evolution_mongodb import GameEvolutionMongoDB
 try:
     from sgfmill import sgf
@@ -18,9 +25,17 @@ class AnalysisGame(WeiQiGame):
         self.game_mode = "analysis"
         # 在推演模式下，不限制玩家颜色
         self.player_color = "B"  # 默认黑棋开始，但可以随时切换
-        # 初始化局势演化存储系统
-        self.evolution_storage = GameEvolutionMongoDB(f"analysis_{self.game_id}")
+        # SGF批量导入时每手棋后的棋盘状态，以及导入主线上各回合对应的变化树节点
+        self.imported_boards = []
+        self.imported_nodes = []
+        # 变化树：回到前面的局面另下一手时新建分支，主线和已有的分析都保留
+        self.tree = GameTree()
         
+    def bind_evolution_storage(self):
+        """推演模式的局势演化数据与对弈模式分开保存"""
+        self.evolution_storage = GameEvolutionMongoDB(f"analysis_{self.game_id}")
+
+    @metrics.timed("analysis_game.make_move")
     def make_move(self, move):
         """
         推演模式下的落子方法
@@ -28,23 +43,29 @@ class AnalysisGame(WeiQiGame):
         """
         if move == "pass":
             # 处理过手
-            self.moves.append((self.current_player, "pass"))
+            self.moves.append([self.current_player, "pass"])
+            node = self._advance_tree(self.current_player, "pass")
             
-            # 添加胜率数据
+            # 添加胜率数据（变化树中已分析过的局面直接复用）
             try:
+                if node.analysis is not None:
+                    self._sync_winrate_line()
+                    self.current_player = "W" if self.current_player == "B" else "B"
+                    return True
                 if not self.katago_initialized:
                     self._start_katago()
                 analysis_result = self._send_analysis_request(max_visits=50)
                 if analysis_result and 'rootInfo' in analysis_result:
                     winrate = analysis_result['rootInfo'].get('winrate', 0.5)
                     scoreMean = analysis_result['rootInfo'].get('scoreMean', 0)
-                    self.winrate_history.append({
+                    node.analysis = {
                         'move_number': len(self.moves),
                         'player': self.current_player,
                         'move': move,
                         'winrate': winrate,
                         'score_mean': scoreMean
-                    })
+                    }
+                    self._sync_winrate_line()
                     
                     # 存储局势演化数据（过手）
                     try:
@@ -67,10 +88,8 @@ class AnalysisGame(WeiQiGame):
                                     'score_mean': move_info.get('scoreMean', 0)
                                 })
                         
-                        # 获取领地所有权数据
-                        from ai_handler import AIHandler
-                        ai_handler = AIHandler()
-                        territory_ownership = ai_handler.get_territory_ownership(self)
+                        # 获取领地所有权数据（直接使用本次分析结果）
+                        territory_ownership = Ownership.from_analysis(analysis_result)
                         
                         # 添加到局势演化存储
                         self.evolution_storage.add_move_data(
@@ -80,7 +99,9 @@ class AnalysisGame(WeiQiGame):
                             board=self.board,
                             winrate_data=winrate_data,
                             recommended_moves=recommended_moves,
-                            territory_ownership=territory_ownership
+                            territory_data=territory_ownership,
+                            node_id=node.node_id,
+                            komi=self.komi
                         )
                         
                         # 保存到文件
@@ -185,11 +206,17 @@ class AnalysisGame(WeiQiGame):
             self.board_history.pop(0)
               
         # 记录着法
-        self.moves.append((self.current_player, move))
+        self.moves.append([self.current_player, move])
+        node = self._advance_tree(self.current_player, move)
         
         # 切换玩家（推演模式下允许自由切换）
         self.current_player = "W" if self.current_player == "B" else "B"
         
+        # 变化树中已分析过的局面（例如切换回主线）直接复用，不再请求引擎
+        if node.analysis is not None:
+            self._sync_winrate_line()
+            return True
+        
         # 添加胜率数据（在切换玩家后计算，因为KataGo返回的是当前要下棋玩家的胜率）
         try:
             if not self.katago_initialized:
@@ -200,13 +227,14 @@ class AnalysisGame(WeiQiGame):
                 scoreLead = analysis_result['rootInfo'].get('scoreLead', 0)
                 # 转换为黑棋胜率（KataGo返回的是当前要下棋玩家的胜率）
                 black_winrate = winrate * 100 if self.current_player == "B" else (1 - winrate) * 100
-                self.winrate_history.append({
+                node.analysis = {
                     'move_number': len(self.moves),
                     'player': self.moves[-1][0] if self.moves else 'B',  # 记录刚才落子的玩家
                     'move': move,
                     'black_winrate': black_winrate,
                     'score_lead': scoreLead
-                })
+                }
+                self.winrate_history = self.tree.winrate_line()
                 
                 # 存储局势演化数据
                 try:
@@ -232,16 +260,7 @@ class AnalysisGame(WeiQiGame):
                     territory_ownership = None
                     try:
                         analysis_result = self._send_analysis_request(max_visits=50)
-                        if analysis_result and 'ownership' in analysis_result:
-                            ownership_1d = analysis_result['ownership']
-                            if len(ownership_1d) == 19 * 19:
-                                territory_ownership = []
-                                for row in range(19):
-                                    row_data = []
-                                    for col in range(19):
-                                        index = row * 19 + col
-                                        row_data.append(ownership_1d[index])
-                                    territory_ownership.append(row_data)
+                        territory_ownership = Ownership.from_analysis(analysis_result)
                     except Exception as e:
                         print(f"获取领地数据失败: {e}")
                     
@@ -253,8 +272,13 @@ class AnalysisGame(WeiQiGame):
                         board=self.board,
                         winrate_data=winrate_data,
                         recommended_moves=recommended_moves,
-                        territory_data=territory_ownership
+                        territory_data=territory_ownership,
+                        node_id=node.node_id,
+                        komi=self.komi
                     )
+                    node.recommendations = recommended_moves
+                    self.key_moments.record_recommendations(len(self.moves), recommended_moves)
+                    self.update_key_moments()
                     
                     # 保存到文件
                     self.evolution_storage.save_to_file()
@@ -295,6 +319,66 @@ class AnalysisGame(WeiQiGame):
                 'message': f'推演模式：AI分析错误 - {str(e)}'
             }
     
+    def _advance_tree(self, color, move, persist=True):
+        """在变化树中前进一手（已有相同着法的分支时直接进入），新节点写入局势演化存储"""
+        node, created = self.tree.play(color, move)
+        if created and persist:
+            self.evolution_storage.add_variation_nodes([node.to_doc()])
+        return node
+
+    def _sync_winrate_line(self, persist=True):
+        """胜率历史取当前变化上各节点缓存的分析结果（persist 为 False 时不写入关键时刻索引）"""
+        for node in self.tree.line():
+            if node.recommendations:
+                self.key_moments.record_recommendations(node.depth, node.recommendations)
+        self.winrate_history = self.tree.winrate_line()
+        self.update_key_moments(persist=persist)
+
+    def goto_move(self, move_index):
+        """沿当前变化跳到第 move_index 手之后的局面，后续着法保留在变化树中"""
+        node = self.tree.goto_depth(move_index)
+        if node is None:
+            return False
+        return self._load_node(node)
+
+    def goto_node(self, node_id):
+        """切换到变化树中的任意节点（包括其他分支）"""
+        if node_id not in self.tree.nodes:
+            return False
+        return self._load_node(self.tree.goto(node_id))
+
+    def _load_node(self, node):
+        """在本地按规则重放到指定节点，不请求任何分析"""
+        moves = self.tree.moves(node)
+        try:
+            go_board = GoBoard.from_moves(moves)
+        except ValueError as e:
+            print(f"重放变化失败: {e}")
+            return False
+        self.board = go_board.board
+        self.captured_black = go_board.captured_black
+        self.captured_white = go_board.captured_white
+        self.ko_position = go_board.ko_point
+        self.board_history = []
+        self.moves = moves
+        self.current_player = "W" if moves and moves[-1][0] == "B" else "B"
+        # 浏览变化树只读取已有的胜率，不写入存储
+        self._sync_winrate_line(persist=False)
+        return True
+
+    def get_variation_tree(self):
+        """变化树概要（当前变化、分支点）"""
+        return self.tree.summary()
+
+    def restore_variation_tree(self):
+        """从局势演化存储恢复变化树（节点结构；分析结果按需重新获取）"""
+        docs = self.evolution_storage.get_variation_nodes()
+        if not docs:
+            return False
+        self.tree = GameTree.from_docs(docs)
+        line = self.tree.line()
+        return self._load_node(self.tree.goto(line[-1].node_id if line else 0))
+
     def switch_current_player(self, color):
         """
         推演模式专用：手动切换当前玩家
@@ -563,14 +647,190 @@ class AnalysisGame(WeiQiGame):
             print(f"SGF解析失败: {e}")
             return False
     
-    def _sgf_make_move(self, move):
+    def replay_sgf(self, sgf_content: str):
+        """
+        在本地一次性重放SGF主分支，不请求任何分析
+        棋盘状态立即可用，胜率等数据随后由 analyze_imported_game 批量补齐
+        """
+        try:
+            game_info = parse_sgf(sgf_content)
+        except Exception as e:
+            print(f"SGF解析失败: {e}")
+            return False
+
+        if game_info["size"] != 19:
+            print(f"不支持的棋盘大小: {game_info['size']}x{game_info['size']}，仅支持19x19")
+            return False
+
+        self.reset_game()
+        if game_info["komi"] is not None:
+            self.komi = game_info["komi"]
+        if game_info["rules"]:
+            self.rules = game_info["rules"]
+
+        for color, move in game_info["moves"]:
+            self.current_player = color
+            if not self._sgf_make_move(move, analyze=False):
+                print(f"跳过无效的{'黑' if color == 'B' else '白'}棋着法: {move}")
+                continue
+            # 记录每手后的棋盘，批量分析结果到达时写入局势演化数据
+            self.imported_boards.append([row[:] for row in self.board])
+
+        # 批量分析结果按回合写回这些节点，与之后当前局面走到哪里无关
+        self.imported_nodes = [self.tree.root] + self.tree.path()
+        # 重放时不逐手写库，变化树节点一次写入
+        self.evolution_storage.add_variation_nodes([node.to_doc() for node in self.imported_nodes[1:]])
+        print(f"SGF文件重放完成，共 {len(self.moves)} 手棋")
+        return True
+
+    def iter_import_analysis(self, max_visits=50, timeout=None, cancel=None):
+        """
+        用一次 analyzeTurns 查询分析整局棋（含开局局面），按完成顺序产出 (回合, 引擎结果)
+        只写入分析缓存，不修改胜率历史和变化树，可以在工作线程中执行；
+        结果由 apply_import_results 在会话自己的命令中写入
+
+        Args:
+            max_visits: 每个回合的访问次数
+            timeout: 整体超时（秒），默认按手数估算
+            cancel: 本次导入的取消标记（threading.Event），设置后停止产出，剩余回合被终止
+        """
+        if not self.katago_initialized:
+            self._start_katago()
+
+        moves = [list(move) for move in self.moves]
+        req = self._build_analysis_request(
+            self.engine.next_request_id(f"import_{len(moves)}"), moves, max_visits
+        )
+        req["analyzeTurns"] = list(range(len(moves) + 1))
+        if timeout is None:
+            timeout = max(60.0, len(moves) * 2.0)
+
+        for msg in self.engine.analyze_turns(req, timeout=timeout, cancel=cancel):
+            turn = msg.get("turnNumber", 0)
+            self.analysis_cache.put(moves[:turn], self.komi, msg, budget=int(max_visits))
+            yield turn, msg
+        if cancel is not None and cancel.is_set():
+            print("SGF批量分析已取消")
+
+    def apply_import_results(self, moves, results):
+        """把一批 (回合, 引擎结果) 写入胜率历史、变化树和局势演化存储，返回各回合的胜率数据"""
+        return [self._record_imported_turn(turn, moves, msg) for turn, msg in results]
+
+    def finish_import_analysis(self):
+        """批量分析结束：整理局势演化数据的顺序，同步变化树主线的胜率"""
+        self.evolution_storage.sort_evolution_data()
+        self._sync_winrate_line()
+
+    def analyze_imported_game(self, max_visits=50, on_result=None, timeout=None, cancel=None):
+        """
+        在调用线程中完成整局批量分析并写入结果（命令行工具等单线程场景使用）
+
+        Args:
+            on_result: 每个回合完成时调用 on_result(winrate_data)
+
+        Returns:
+            完成分析的回合数
+        """
+        moves = [list(move) for move in self.moves]
+        self.winrate_history = []
+        completed = 0
+        started = time.time()
+        for turn, msg in self.iter_import_analysis(max_visits, timeout=timeout, cancel=cancel):
+            winrate_data = self._record_imported_turn(turn, moves, msg)
+            completed += 1
+            if on_result:
+                on_result(winrate_data)
+
+        self.finish_import_analysis()
+        print(f"SGF批量分析完成: {completed} 个回合，用时 {time.time() - started:.1f} 秒")
+        return completed
+
+    def load_from_sgf_batched(self, sgf_content: str, max_visits=50, on_result=None):
+        """
+        批量导入SGF：本地重放后用一次 analyzeTurns 查询分析全部回合
+        """
+        if not self.replay_sgf(sgf_content):
+            return False
+        try:
+            self.analyze_imported_game(max_visits=max_visits, on_result=on_result)
+        except Exception as e:
+            print(f"SGF批量分析失败: {e}")
+        return True
+
+    def _record_imported_turn(self, turn, moves, analysis_result):
+        """把批量分析中某一回合的结果写入胜率历史和局势演化存储"""
+        root_info = analysis_result.get('rootInfo', {})
+        winrate = root_info.get('winrate', 0.5)
+        score_lead = root_info.get('scoreLead', 0)
+
+        if turn == 0:
+            move, color = "开局", "B"
+            black_winrate = winrate * 100
+        else:
+            color, move = moves[turn - 1]
+            # 分析的是落子后的局面，轮到对方下棋，KataGo返回的是对方的胜率
+            black_winrate = (1 - winrate) * 100 if color == "B" else winrate * 100
+
+        winrate_data = {
+            "move_number": turn,
+            "move": move,
+            "color": color,
+            "black_winrate": round(black_winrate, 1),
+            "white_winrate": round(100 - black_winrate, 1),
+            "score_lead": round(score_lead, 1)
+        }
+        self.winrate_history.append(winrate_data)
+        node = self.imported_nodes[turn] if turn < len(self.imported_nodes) else None
+        if node is not None:
+            node.analysis = winrate_data
+        if turn == 0:
+            return winrate_data
+
+        try:
+            recommended_moves = []
+            for move_info in analysis_result.get('moveInfos', [])[:5]:
+                recommended_moves.append({
+                    'move': move_info.get('move', ''),
+                    'visits': move_info.get('visits', 0),
+                    'winrate': move_info.get('winrate', 0),
+                    'score_mean': move_info.get('scoreMean', 0)
+                })
+
+            territory_ownership = Ownership.from_analysis(analysis_result)
+
+            if node is not None:
+                node.recommendations = recommended_moves
+            self.key_moments.record_recommendations(turn, recommended_moves)
+            board = self.imported_boards[turn - 1] if turn <= len(self.imported_boards) else None
+            self.evolution_storage.add_move_data(
+                move_number=turn,
+                move=move,
+                color=color,
+                board=board,
+                winrate_data={
+                    'black_winrate': winrate_data['black_winrate'],
+                    'white_winrate': winrate_data['white_winrate'],
+                    'score_lead': winrate_data['score_lead']
+                },
+                recommended_moves=recommended_moves,
+                territory_data=territory_ownership,
+                node_id=node.node_id if node is not None else None,
+                komi=self.komi
+            )
+        except Exception as storage_error:
+            print(f"SGF批量导入局势演化数据存储失败: {storage_error}")
+        return winrate_data
+
+    def _sgf_make_move(self, move, analyze=True):
         """
         SGF导入专用的落子方法
         正确处理提子逻辑：先执行提子，再落子，最后检查自杀
+        analyze 为 False 时只更新棋盘，不请求胜率分析（批量导入时使用）
         """
         if move == "pass":
             # 处理过手
-            self.moves.append((self.current_player, "pass"))
+            self.moves.append([self.current_player, "pass"])
+            self._advance_tree(self.current_player, "pass", persist=analyze)
             self.current_player = "W" if self.current_player == "B" else "B"
             return True
             
@@ -659,11 +919,12 @@ class AnalysisGame(WeiQiGame):
             self.board_history.pop(0)
         
         # 记录着法
-        self.moves.append((self.current_player, move))
+        self.moves.append([self.current_player, move])
+        node = self._advance_tree(self.current_player, move, persist=analyze)
         
         # 记录胜率历史（在切换玩家之前获取当前局面的分析）
         try:
-            if hasattr(self, 'katago_initialized') and self.katago_initialized:
+            if analyze and hasattr(self, 'katago_initialized') and self.katago_initialized:
                 analysis_result = self._send_analysis_request(max_visits=50)  # 使用较少访问次数以提高速度
                 move_infos = analysis_result.get("moveInfos", [])
                 if move_infos:
@@ -692,6 +953,7 @@ class AnalysisGame(WeiQiGame):
                         "white_winrate": round(white_winrate, 1),
                         "score_lead": round(score_lead, 1)
                     }
+                    node.analysis = winrate_data
                     self.winrate_history.append(winrate_data)
                     print(f"SGF胜率记录: 黑棋{black_winrate:.1f}% 白棋{white_winrate:.1f}%")
         except Exception as e:
@@ -708,10 +970,10 @@ class AnalysisGame(WeiQiGame):
         将SGF坐标转换为我们的着法格式
         SGF使用aa-ss的格式或(x,y)元组格式，我们使用A1-T19的格式
         """
-        # 处理元组格式的坐标 (x, y)
+        # 处理元组格式的坐标 (row, col)
         if isinstance(sgf_coord, tuple) and len(sgf_coord) == 2:
-            col_index, row_index = sgf_coord
-            print(f"处理元组坐标: {sgf_coord} -> col_index={col_index}, row_index={row_index}")
+            row_index, col_index = sgf_coord
+            print(f"处理元组坐标: {sgf_coord} -> row_index={row_index}, col_index={col_index}")
             # 我们的列坐标从A开始（跳过I）
             our_cols = 'ABCDEFGHJKLMNOPQRST'
             
@@ -719,10 +981,9 @@ class AnalysisGame(WeiQiGame):
                 # 检查坐标范围：SGF坐标从0开始，19路棋盘范围是0-18
                 if 0 <= col_index < 19 and 0 <= row_index < 19:
                     our_col = our_cols[col_index]
-                    # SGF坐标系统：(0,0)是左上角，(18,18)是右下角
-                    # 我们的坐标系统：A1是左下角，T19是右上角
-                    # 所以行坐标需要翻转：SGF的row_index=0对应我们的19，row_index=18对应我们的1
-                    our_row = 19 - row_index
+                    # sgfmill 已把SGF坐标转换为 (行, 列)，行从棋盘下方数起，
+                    # 与我们的坐标系统（A1是左下角）一致，不需要再翻转
+                    our_row = row_index + 1
                     result = f"{our_col}{our_row}"
                     print(f"转换结果: {result}")
                     return result
@@ -784,6 +1045,12 @@ class AnalysisGame(WeiQiGame):
         self.captured_white = 0
         self.board_history = []
         self.winrate_history = []
+        self.imported_boards = []
+        self.imported_nodes = []
+        self.key_moments = KeyMomentDetector()
+        self.key_moments_unsaved = False
+        self.tree = GameTree()
+        self.evolution_storage.clear_variation_nodes()
         
         # 保持游戏设置不变（贴目、规则等）
         print("游戏状态已重置")
\ No newline at end of file
@@ -0,0 +1,443 @@
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .analysis_cache import AnalysisCache
+from .katago_engine import KataGoEngine
+
+# 引擎服务地址：unix:/tmp/weiqi-katago.sock 或 tcp:127.0.0.1:7790；
+# 未设置时每个游戏在本进程内启动自己的KataGo进程
+BROKER_ADDRESS = os.getenv("KATAGO_BROKER", "")
+DEFAULT_BROKER_ADDRESS = "unix:/tmp/weiqi-katago.sock"
+# 引擎服务共享的分析结果缓存条数
+BROKER_CACHE_SIZE = 4096
+# 检查引擎进程存活的间隔（秒），退出的引擎由服务自己重启
+ENGINE_CHECK_INTERVAL = 1.0
+# 客户端与引擎服务断开后重连的最小间隔（秒）
+RECONNECT_INTERVAL = 1.0
+
+# 影响分析结果内容的请求字段，不同取值的查询不共用缓存
+CACHE_KEY_FIELDS = ("rules", "boardXSize", "boardYSize", "includeOwnership", "includeOwnershipStdev",
+                    "includePolicy", "includeMovesOwnership")
+
+
+def parse_address(address: str) -> Tuple[int, object]:
+    """解析引擎服务地址，返回 (socket family, 地址)
+
+    Raises:
+        ValueError: 地址格式不正确
+    """
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    if address.startswith("tcp:"):
+        address = address[len("tcp:"):]
+    elif address.startswith("/"):
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"无效的引擎服务地址: {address}")
+    return socket.AF_INET, (host, int(port))
+
+
+def _encode_line(msg: Dict) -> bytes:
+    return (json.dumps(msg, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class _Connection:
+    """引擎服务上的一个客户端连接"""
+
+    def __init__(self, sock: socket.socket, conn_id: int):
+        self.sock = sock
+        self.conn_id = conn_id
+        # 客户端请求id -> (引擎序号, 发给引擎的请求id)
+        self.requests: Dict[str, Tuple[int, str]] = {}
+        # 被客户端终止的请求id，它们的结果可能只搜索了一部分，不写入缓存
+        self.terminated: Set[str] = set()
+        self.alive = True
+        self._write_lock = threading.Lock()
+
+    def send(self, msg: Dict):
+        if not self.alive:
+            return
+        try:
+            with self._write_lock:
+                self.sock.sendall(_encode_line(msg))
+        except OSError:
+            self.alive = False
+
+
+class EngineBroker:
+    """独立的引擎服务：持有KataGo进程、共享的分析缓存和调度
+
+    协议与KataGo analysis 引擎相同（每行一个JSON），走Unix socket或本机TCP。
+    查询的id加上连接前缀后转发给在途查询最少的引擎，响应换回原id发回对应连接；
+    另外支持 release（不再接收某个查询的响应）和 broker_stats 两个操作。
+    Web工作进程只是客户端，重启时不会带走引擎；引擎进程退出时由服务重启，
+    受影响的查询收到错误响应，连接保持不变。
+    """
+
+    def __init__(self, engine_factory: Callable[[], KataGoEngine], address: str = DEFAULT_BROKER_ADDRESS,
+                 engines: int = 1, cache_size: int = BROKER_CACHE_SIZE):
+        self.engine_factory = engine_factory
+        self.address = address
+        self.engines: List[Optional[KataGoEngine]] = [None] * max(1, engines)
+        self.inflight = [0] * len(self.engines)
+        self.cache = AnalysisCache(cache_size) if cache_size else None
+        self._connections: Dict[int, _Connection] = {}
+        self._conn_counter = 0
+        self._lock = threading.Lock()
+        self._server: Optional[socket.socket] = None
+        self._stopped = threading.Event()
+        self.requests = 0
+        self.cache_hits = 0
+        self.restarts = 0
+
+    def start(self):
+        """启动全部引擎并开始监听"""
+        for index in range(len(self.engines)):
+            engine = self.engine_factory()
+            engine.start()
+            self.engines[index] = engine
+
+        family, addr = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.unlink(addr)  # 上次退出时残留的socket文件
+        server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(addr)
+        server.listen(64)
+        self._server = server
+
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        threading.Thread(target=self._supervise, daemon=True).start()
+        print(f"引擎服务已启动: {self.address}，引擎数: {len(self.engines)}")
+
+    def serve_forever(self):
+        try:
+            while not self._stopped.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            print("\n引擎服务停止")
+        finally:
+            self.close()
+
+    def _accept_loop(self):
+        while not self._stopped.is_set():
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                break
+            with self._lock:
+                self._conn_counter += 1
+                conn = _Connection(sock, self._conn_counter)
+                self._connections[conn.conn_id] = conn
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn: _Connection):
+        try:
+            with conn.sock.makefile("r", encoding="utf-8") as reader:
+                for line in reader:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        req = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        conn.send({"error": f"Could not parse json: {e}"})
+                        continue
+                    self._handle(conn, req)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._drop_connection(conn)
+
+    def _handle(self, conn: _Connection, req: Dict):
+        action = req.get("action")
+        request_id = req.get("id")
+        if action == "release":
+            self._release(conn, request_id)
+            return
+        if action == "terminate":
+            self._terminate(conn, req.get("terminateId"))
+            conn.send({"id": request_id, "action": "terminate", "terminateId": req.get("terminateId")})
+            return
+        if action == "broker_stats":
+            conn.send({"id": request_id, "action": "broker_stats", **self.stats()})
+            return
+        if action is not None:
+            conn.send({"id": request_id, "error": f"引擎服务不支持的操作: {action}"})
+            return
+        if request_id is None or "moves" not in req:
+            conn.send({"id": request_id, "error": "Missing required field 'id' or 'moves'"})
+            return
+
+        with self._lock:
+            self.requests += 1
+        cache_rules = self._cache_rules(req)
+        if cache_rules is not None:
+            cached = self.cache.get(req["moves"], req.get("komi", 7.5), int(req["maxVisits"]), cache_rules)
+            if cached is not None:
+                with self._lock:
+                    self.cache_hits += 1
+                conn.send({**cached, "id": request_id})
+                return
+
+        with self._lock:
+            conn.terminated.discard(request_id)
+            index = self._pick_engine()
+            broker_id = f"{conn.conn_id}:{request_id}"
+            conn.requests[request_id] = (index, broker_id)
+            self.inflight[index] += 1
+            engine = self.engines[index]
+
+        def handler(msg: Dict):
+            if cache_rules is not None and "error" not in msg and not msg.get("isDuringSearch", False) \
+                    and not msg.get("terminated") and not msg.get("noResults") \
+                    and request_id not in conn.terminated:
+                # 受 maxTime 限制的搜索可能没有用满访问次数，按实际访问次数记录
+                budget = 0 if "maxTime" in req.get("overrideSettings", {}) else int(req["maxVisits"])
+                self.cache.put(req["moves"], req.get("komi", 7.5), msg, budget, cache_rules)
+            conn.send({**msg, "id": request_id})
+
+        try:
+            engine.submit({**req, "id": broker_id}, handler)
+        except RuntimeError as e:
+            self._release(conn, request_id)
+            conn.send({"id": request_id, "error": str(e)})
+
+    def _cache_rules(self, req: Dict) -> Optional[str]:
+        """可以共用缓存的查询返回缓存分区（规则和返回字段），否则返回None
+
+        批量回合分析、中间结果和初始棋子不缓存；缓存按19路对称规范化，其他大小也不缓存。
+        """
+        if self.cache is None or "maxVisits" not in req:
+            return None
+        if req.get("analyzeTurns") or req.get("reportDuringSearchEvery") or req.get("initialStones"):
+            return None
+        if set(req.get("overrideSettings") or {}) - {"maxTime"}:
+            return None
+        if req.get("boardXSize", 19) != 19 or req.get("boardYSize", 19) != 19:
+            return None
+        return "|".join(str(req.get(field)) for field in CACHE_KEY_FIELDS)
+
+    def _pick_engine(self) -> int:
+        """在途查询最少的存活引擎（调用方持有 self._lock）"""
+        alive = [index for index, engine in enumerate(self.engines) if engine is not None and engine.is_alive()]
+        return min(alive or range(len(self.engines)), key=lambda index: self.inflight[index])
+
+    def _release(self, conn: _Connection, request_id: str):
+        with self._lock:
+            conn.terminated.discard(request_id)
+            entry = conn.requests.pop(request_id, None)
+            if entry is not None:
+                self.inflight[entry[0]] -= 1
+        if entry is not None and self.engines[entry[0]] is not None:
+            self.engines[entry[0]].release(entry[1])
+
+    def _terminate(self, conn: _Connection, request_id: str):
+        with self._lock:
+            entry = conn.requests.get(request_id)
+            if entry is not None:
+                conn.terminated.add(request_id)
+        if entry is not None and self.engines[entry[0]] is not None:
+            self.engines[entry[0]].terminate(entry[1])
+
+    def _drop_connection(self, conn: _Connection):
+        """客户端断开：停止它在途的查询，释放路由"""
+        conn.alive = False
+        with self._lock:
+            self._connections.pop(conn.conn_id, None)
+            pending = list(conn.requests)
+        for request_id in pending:
+            self._terminate(conn, request_id)
+            self._release(conn, request_id)
+        try:
+            conn.sock.close()
+        except OSError:
+            pass
+
+    def _supervise(self):
+        while not self._stopped.wait(ENGINE_CHECK_INTERVAL):
+            for index, engine in enumerate(self.engines):
+                if self._stopped.is_set():
+                    return
+                if engine is None or not engine.is_alive():
+                    self._restart_engine(index)
+
+    def _restart_engine(self, index: int):
+        """重启退出的引擎；其上的在途查询返回错误，由客户端决定是否重发"""
+        with self._lock:
+            affected = []
+            for conn in self._connections.values():
+                for request_id, (engine_index, _) in list(conn.requests.items()):
+                    if engine_index == index:
+                        del conn.requests[request_id]
+                        affected.append((conn, request_id))
+            self.inflight[index] = 0
+        for conn, request_id in affected:
+            conn.send({"id": request_id, "error": "KataGo 引擎进程退出，已重启"})
+
+        old_engine = self.engines[index]
+        if old_engine is not None:
+            old_engine.close()
+        try:
+            engine = self.engine_factory()
+            engine.start()
+        except Exception as e:
+            print(f"重启 KataGo 引擎失败: {e}", file=sys.stderr)
+            self.engines[index] = None
+            return
+        self.engines[index] = engine
+        self.restarts += 1
+        print(f"KataGo 引擎 {index} 已重启")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "engines": len(self.engines),
+                "engines_alive": sum(1 for engine in self.engines if engine is not None and engine.is_alive()),
+                "inflight": list(self.inflight),
+                "connections": len(self._connections),
+                "requests": self.requests,
+                "cache_hits": self.cache_hits,
+                "restarts": self.restarts
+            }
+
+    def close(self):
+        self._stopped.set()
+        if self._server is not None:
+            try:
+                self._server.close()
+            except OSError:
+                pass
+            family, addr = parse_address(self.address)
+            if family == socket.AF_UNIX and os.path.exists(addr):
+                os.unlink(addr)
+        with self._lock:
+            connections = list(self._connections.values())
+        for conn in connections:
+            conn.alive = False
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for engine in self.engines:
+            if engine is not None:
+                engine.close()
+
+
+class BrokerEngine(KataGoEngine):
+    """引擎服务的客户端，接口与 KataGoEngine 相同
+
+    WeiQiGame、AI处理和复盘工作线程照常调用 query / analyze_turns / submit，
+    请求发给共享的引擎服务而不是本进程的KataGo。close() 只断开连接，不影响引擎；
+    连接断开时在途查询立即收到错误，之后的调用会自动重连。
+    """
+
+    def __init__(self, address: str, connect_timeout: float = 5.0):
+        super().__init__("", "", "", require_files=False, startup_wait=0)
+        self.address = address
+        self.connect_timeout = connect_timeout
+        self._sock: Optional[socket.socket] = None
+        self._connected = False
+        self._closed = False
+        self._last_connect = 0.0
+
+    def start(self):
+        """连接引擎服务
+
+        Raises:
+            RuntimeError: 引擎服务不可用
+        """
+        self._closed = False
+        self._connect()
+        print(f"已连接引擎服务: {self.address}")
+
+    def _connect(self):
+        family, addr = parse_address(self.address)
+        self._last_connect = time.monotonic()
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self.connect_timeout)
+        try:
+            sock.connect(addr)
+        except OSError as e:
+            sock.close()
+            raise RuntimeError(f"无法连接引擎服务 {self.address}: {e}")
+        sock.settimeout(None)
+        self._sock = sock
+        self._connected = True
+        threading.Thread(target=self._reader, args=(sock,), daemon=True).start()
+
+    def _reader(self, sock: socket.socket):
+        try:
+            with sock.makefile("r", encoding="utf-8") as reader:
+                for line in reader:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        msg = json.loads(line)
+                    except json.JSONDecodeError:
+                        print("Non-JSON:", line, file=sys.stderr)
+                        continue
+                    self._dispatch(msg)
+        except (OSError, ValueError):
+            pass
+        finally:
+            if sock is self._sock:
+                self._connected = False
+                self._fail_pending("与引擎服务的连接已断开")
+
+    def _fail_pending(self, error: str):
+        """连接断开时让等待中的查询立即失败，而不是等到超时"""
+        with self._routes_lock:
+            pending = list(self._routes.items())
+        for request_id, handler in pending:
+            try:
+                handler({"id": request_id, "error": error})
+            except Exception:
+                pass
+
+    def is_alive(self) -> bool:
+        if self._connected:
+            return True
+        if self._closed or time.monotonic() - self._last_connect < RECONNECT_INTERVAL:
+            return False
+        try:
+            self._connect()
+            print(f"已重新连接引擎服务: {self.address}")
+        except RuntimeError:
+            return False
+        return True
+
+    def _write(self, req: Dict):
+        try:
+            with self._write_lock:
+                self._sock.sendall(_encode_line(req))
+        except (OSError, AttributeError):
+            self._connected = False
+            raise RuntimeError("无法向引擎服务发送请求，连接可能已断开")
+
+    def release(self, request_id: str):
+        super().release(request_id)
+        if self._connected:
+            try:
+                self._write({"id": request_id, "action": "release"})
+            except RuntimeError:
+                pass
+
+    def close(self):
+        self._closed = True
+        self._connected = False
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._sock.close()
+            self._sock = None
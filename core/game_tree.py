@@ -0,0 +1,169 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class GameNode:
+    """变化树中的一个局面（某手棋之后）
+
+    analysis 缓存该局面的胜率记录（与 winrate_history 中的条目格式相同），recommendations 为推荐着法，
+    切换分支后回到已分析过的局面时直接复用，不再请求引擎。
+    """
+
+    __slots__ = ("node_id", "parent", "color", "move", "depth", "children", "selected", "analysis",
+                 "recommendations")
+
+    def __init__(self, node_id: int, parent: Optional["GameNode"], color: Optional[str], move: Optional[str]):
+        self.node_id = node_id
+        self.parent = parent
+        self.color = color
+        self.move = move
+        self.depth = parent.depth + 1 if parent else 0
+        self.children: List["GameNode"] = []
+        # 最近一次走过的子节点，决定“当前变化”在该节点之后如何延续
+        self.selected: Optional["GameNode"] = None
+        self.analysis: Optional[Dict] = None
+        self.recommendations: Optional[List[Dict]] = None
+
+    def child(self, color: str, move: str) -> Optional["GameNode"]:
+        for node in self.children:
+            if node.color == color and node.move == move:
+                return node
+        return None
+
+    def to_doc(self) -> Dict:
+        """持久化格式：只保存与父节点的差异（一手棋），共享的前缀不重复存储"""
+        return {
+            "id": self.node_id,
+            "parent": self.parent.node_id if self.parent else None,
+            "color": self.color,
+            "move": self.move
+        }
+
+
+class GameTree:
+    """推演模式的变化树
+
+    所有分支共享公共前缀，每个节点只记录一手棋。current 为棋盘所在的局面，
+    当前变化 = 根到 current 的路径 + 从 current 沿 selected 延续到末端，
+    回到前面的局面后另下一手会新建分支，原来的主线和分析结果都保留。
+    """
+
+    def __init__(self):
+        self.root = GameNode(0, None, None, None)
+        self.nodes: Dict[int, GameNode] = {0: self.root}
+        self.current = self.root
+        self._next_id = 1
+
+    def play(self, color: str, move: str) -> Tuple[GameNode, bool]:
+        """从当前局面下一手，已有相同着法的分支时直接进入
+
+        Returns:
+            (节点, 是否新建)
+        """
+        node = self.current.child(color, move)
+        created = node is None
+        if created:
+            node = GameNode(self._next_id, self.current, color, move)
+            self._next_id += 1
+            self.nodes[node.node_id] = node
+            self.current.children.append(node)
+        self.current.selected = node
+        self.current = node
+        return node, created
+
+    def path(self, node: Optional[GameNode] = None) -> List[GameNode]:
+        """从根（不含）到指定节点的路径"""
+        node = node or self.current
+        result = []
+        while node.parent is not None:
+            result.append(node)
+            node = node.parent
+        result.reverse()
+        return result
+
+    def moves(self, node: Optional[GameNode] = None) -> List[List[str]]:
+        return [[item.color, item.move] for item in self.path(node)]
+
+    def line(self) -> List[GameNode]:
+        """当前变化的全部节点（不含根）"""
+        result = self.path()
+        node = self.current.selected
+        while node is not None:
+            result.append(node)
+            node = node.selected
+        return result
+
+    def goto(self, node_id: int) -> GameNode:
+        """切换到任意节点，并把它设为沿途各节点的当前分支"""
+        node = self.nodes[node_id]
+        child = node
+        while child.parent is not None:
+            child.parent.selected = child
+            child = child.parent
+        self.current = node
+        return node
+
+    def goto_depth(self, depth: int) -> Optional[GameNode]:
+        """沿当前变化跳到第 depth 手之后的局面，超出范围返回None"""
+        if depth < 0:
+            return None
+        if depth == 0:
+            return self.goto(0)
+        line = self.line()
+        if depth > len(line):
+            return None
+        return self.goto(line[depth - 1].node_id)
+
+    def winrate_line(self) -> List[Dict]:
+        """当前变化上已分析局面的胜率记录（按手数排列）"""
+        nodes = [self.root] + self.line()
+        return [node.analysis for node in nodes if node.analysis is not None]
+
+    def variations(self) -> List[Dict]:
+        """分支点列表：在哪一手之后有哪些不同的下法"""
+        result = []
+        for node in self.nodes.values():
+            if len(node.children) > 1:
+                result.append({
+                    "node_id": node.node_id,
+                    "move_number": node.depth,
+                    "children": [
+                        {"node_id": child.node_id, "color": child.color, "move": child.move}
+                        for child in node.children
+                    ]
+                })
+        result.sort(key=lambda item: item["move_number"])
+        return result
+
+    def summary(self) -> Dict:
+        """发送给前端的变化树概要"""
+        line = self.line()
+        return {
+            "current_node": self.current.node_id,
+            "current_depth": self.current.depth,
+            "line": [[node.node_id, node.color, node.move] for node in line],
+            "variations": self.variations(),
+            "node_count": len(self.nodes) - 1
+        }
+
+    @classmethod
+    def from_moves(cls, moves: Iterable) -> "GameTree":
+        tree = cls()
+        for color, move in moves:
+            tree.play(color, move)
+        return tree
+
+    @classmethod
+    def from_docs(cls, docs: Iterable[Dict]) -> "GameTree":
+        """按 to_doc() 保存的节点重建（父节点必须先于子节点）"""
+        tree = cls()
+        for doc in sorted(docs, key=lambda item: item["id"]):
+            parent = tree.nodes.get(doc["parent"])
+            if parent is None or doc["id"] in tree.nodes:
+                continue
+            node = GameNode(doc["id"], parent, doc["color"], doc["move"])
+            tree.nodes[node.node_id] = node
+            parent.children.append(node)
+            if parent.selected is None:
+                parent.selected = node
+            tree._next_id = max(tree._next_id, node.node_id + 1)
+        return tree
@@ -1,10 +1,41 @@
 import json, subprocess, threading, queue, os, sys, time
+from collections import OrderedDict
 from storage.game_evolution_mongodb import GameEvolutionMongoDB
+from core.visit_budget import VisitBudgetController
+from core.katago_engine import KataGoEngine
+from core.engine_broker import BROKER_ADDRESS, BrokerEngine
+from core.analysis_cache import AnalysisCache
+from core.key_moments import KeyMomentDetector
+from core.metrics import metrics
+from core.opening_book import OpeningBook
+from core.ownership import Ownership, policy_heatmap
+from core.rules import GoBoard
+from core.tactics import DEFAULT_NODE_BUDGET, TacticalReader, describe_tactics
 from datetime import datetime
 
-MODEL = "/Volumes/exdata/katago/models/kata1-b28c512nbt-s10063600896-d5087116207.bin.gz"
-CFG   = "/Volumes/exdata/projects/weiqitest/analysis.cfg"
-KATAGO_BIN = "katago"
+# 引擎配置可通过环境变量覆盖；KATAGO_ENGINE=fake 时使用确定性的假引擎（无需GPU和模型），用于离线压测和测试
+KATAGO_ENGINE = os.getenv("KATAGO_ENGINE", "katago")
+FAKE_KATAGO_BIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils", "fake_katago.py")
+MODEL = os.getenv("KATAGO_MODEL", "/Volumes/exdata/katago/models/kata1-b28c512nbt-s10063600896-d5087116207.bin.gz")
+CFG   = os.getenv("KATAGO_CONFIG", "/Volumes/exdata/projects/weiqitest/analysis.cfg")
+KATAGO_BIN = os.getenv("KATAGO_BIN", FAKE_KATAGO_BIN if KATAGO_ENGINE == "fake" else "katago")
+# 每局保留的策略网络输出条数
+POLICY_CACHE_SIZE = 64
+
+
+def create_local_engine():
+    """按当前配置创建（未启动的）本进程KataGo引擎"""
+    is_fake = KATAGO_ENGINE == "fake" or KATAGO_BIN.endswith(".py")
+    return KataGoEngine(KATAGO_BIN, MODEL, CFG, require_files=not is_fake,
+                        startup_wait=0.2 if is_fake else 2.0)
+
+
+def create_engine():
+    """按当前配置创建（未启动的）KataGo引擎；设置了 KATAGO_BROKER 时作为共享引擎服务的客户端"""
+    if BROKER_ADDRESS:
+        return BrokerEngine(BROKER_ADDRESS)
+    return create_local_engine()
+
 
 class WeiQiGame:
     def __init__(self):
@@ -33,18 +64,44 @@ class WeiQiGame:
         
         # KataGo相关
         self.katago_initialized = False
+        self.engine = None
         self.out_q = None
         self.stderr_q = None
         
+        # 分析结果缓存（落子后的胜率探测、预读结果等复用同一局面的分析）
+        self.analysis_cache = AnalysisCache()
+        # 策略网络输出缓存（合法着点热力图），按着法序列
+        self.policy_cache = OrderedDict()
+        
+        # 开局定式库（布局阶段直接给出着法、胜率和推荐，不占用引擎）
+        self.opening_book = OpeningBook.get_shared()
+        
+        # 后台预读（ponder）：人类思考时预先分析对方最可能的几手应对
+        self.ponder_enabled = True
+        self.ponder_candidates = 3
+        self._ponder_inflight = {}  # 缓存键 -> (请求id, threading.Event, 搜索开始时间)
+        self._ponder_lock = threading.Lock()
+        
         # 实时分析相关
         self.realtime_analysis_active = False
         self.realtime_thread = None
         self.suggestion_ai_time_limit = 10  # 推荐选点AI的固定算力（秒）
         
+        # 自适应算力预算：把思考时间换算为实测的访问次数
+        self.visit_budget = VisitBudgetController()
+        
         # 胜率历史数据
         self.winrate_history = []  # 存储每步的胜率和目数信息
         
+        # 关键时刻（问题手）索引，随胜率历史增量更新
+        self.key_moments = KeyMomentDetector()
+        self.key_moments_unsaved = False  # 浏览历史时更新了索引但尚未写入存储
+        
         # 局势演化存储系统
+        self.bind_evolution_storage()
+
+    def bind_evolution_storage(self):
+        """按当前 game_id 创建局势演化存储（从快照恢复 game_id 后重新绑定）"""
         self.evolution_storage = GameEvolutionMongoDB(self.game_id)
 
     def _add_initial_winrate(self):
@@ -91,197 +148,250 @@ class WeiQiGame:
     def _start_katago(self):
         if self.katago_initialized:
             return
-            
-        if not os.path.exists(MODEL):
-            raise RuntimeError(f"模型文件不存在: {MODEL}")
-        if not os.path.exists(CFG):
-            raise RuntimeError(f"配置文件不存在: {CFG}")
-
-        print("正在启动 KataGo...")
-        print(f"模型文件: {MODEL}")
-        print(f"配置文件: {CFG}")
-        print(f"玩家颜色: {self.player_color}")
-
-        try:
-            version_result = subprocess.run(
-                [KATAGO_BIN, "version"],
-                capture_output=True, text=True, timeout=10
-            )
-            if version_result.returncode == 0:
-                print(f"KataGo 版本: {version_result.stdout.strip()}")
-            else:
-                print(f"KataGo 版本检查失败: {version_result.stderr}")
-        except Exception as e:
-            print(f"无法获取 KataGo 版本: {e}")
-
-        self.proc = subprocess.Popen(
-            [KATAGO_BIN, "analysis", "-model", MODEL, "-config", CFG],
-            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            text=True, bufsize=1
-        )
-
-        time.sleep(2)
-        if self.proc.poll() is not None:
-            stderr_output = self.proc.stderr.read()
-            raise RuntimeError(f"KataGo 启动失败，退出码: {self.proc.returncode}\n错误信息: {stderr_output}")
 
-        # 初始化队列和线程
-        self.out_q = queue.Queue()
-        self.stderr_q = queue.Queue()
-        threading.Thread(target=self._reader, daemon=True).start()
-        threading.Thread(target=self._stderr_reader, daemon=True).start()
+        print(f"玩家颜色: {self.player_color}")
+        self.engine = create_engine()
+        self.engine.start()
+        self.proc = self.engine.proc
+        self.stderr_q = self.engine.stderr_q
         
         self.katago_initialized = True
-        print("KataGo 启动成功！")
-
-    def _stderr_reader(self):
-        try:
-            for line in self.proc.stderr:
-                line = line.strip()
-                if line:
-                    if "Unexpected or unused field" not in line:
-                        print(f"KataGo stderr: {line}", file=sys.stderr)
-        except Exception as e:
-            print(f"读取 KataGo 错误输出时出错: {e}", file=sys.stderr)
 
     def _check_process_alive(self):
-        if self.proc is None or self.proc.poll() is not None:
-            if self.proc and self.proc.poll() is not None:
-                print(f"KataGo 进程已终止，退出码: {self.proc.poll()}")
-                while not self.stderr_q.empty():
-                    try:
-                        stderr_line = self.stderr_q.get_nowait()
-                        print(f"KataGo 错误: {stderr_line}")
-                    except queue.Empty:
-                        break
-            return False
-        return True
-
-    def _reader(self):
-        try:
-            for line in self.proc.stdout:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    self.out_q.put(json.loads(line))
-                except json.JSONDecodeError:
-                    print("Non-JSON:", line, file=sys.stderr)
-        except Exception as e:
-            print(f"读取 KataGo 输出时出错: {e}", file=sys.stderr)
-
-    def _send_analysis_request(self, max_visits=200):
-        if not self._check_process_alive():
-            raise RuntimeError("KataGo 进程已终止")
+        return self.engine is not None and self.engine.is_alive()
 
+    def _build_analysis_request(self, request_id, moves, max_visits, max_time=None):
+        """构造KataGo分析请求"""
         req = {
-            "id": f"move_{len(self.moves)}",
+            "id": request_id,
             "rules": "Chinese",
             "komi": self.komi,
             "boardXSize": self.board_size,
             "boardYSize": self.board_size,
-            "moves": self.moves.copy(),
+            "moves": [list(move) for move in moves],
             "maxVisits": int(max_visits),
             "includeOwnership": True
         }
+        if max_time is not None:
+            # 同时限制搜索时间，主机繁忙时不会超出预期的思考时间
+            req["overrideSettings"] = {"maxTime": max_time}
+        return req
 
-        try:
-            request_json = json.dumps(req)
-            print(f"发送分析请求: {request_json}")
-            self.proc.stdin.write(request_json + "\n")
-            self.proc.stdin.flush()
-        except BrokenPipeError:
-            raise RuntimeError("无法向 KataGo 发送请求，进程可能已终止")
-
-        timeout_count = 0
-        while timeout_count < 200:  # 最多等待20秒
-            try:
-                msg = self.out_q.get(timeout=0.1)
-                print(f"收到 KataGo 响应: {json.dumps(msg, ensure_ascii=False)}")
-                # KataGo 分析完成的标志是 isDuringSearch 为 false
-                if not msg.get("isDuringSearch", True):
-                    return msg
-            except queue.Empty:
-                timeout_count += 1
-                if timeout_count % 50 == 0:  # 每5秒打印一次等待信息
-                    print(f"等待 KataGo 响应中... ({timeout_count/10:.1f}秒)")
-                if not self._check_process_alive():
-                    raise RuntimeError("KataGo 进程在分析过程中终止")
-                continue
+    def _send_analysis_request(self, max_visits=200, max_time=None):
+        moves = [list(move) for move in self.moves]
+
+        # 布局阶段优先查开局定式库
+        if self.opening_book is not None:
+            book_result = self.opening_book.lookup_moves(moves, self.komi)
+            if book_result is not None:
+                print(f"开局定式库命中: 第{len(moves)}手局面")
+                return book_result
 
-        raise RuntimeError("KataGo 分析超时")
-    
-    def start_realtime_analysis(self, callback_func, max_visits=None):
-        """开始实时分析，持续获取推荐选点"""
         if not self._check_process_alive():
             raise RuntimeError("KataGo 进程已终止")
+
+        # 先查缓存（包括后台预读的结果），命中时无需再次搜索
+        cached = self.analysis_cache.get(moves, self.komi, int(max_visits))
+        if cached is None:
+            cached = self._wait_for_ponder(moves, int(max_visits), max_time)
+        if cached is not None:
+            print(f"分析缓存命中: 第{len(moves)}手局面")
+            return cached
+
+        req = self._build_analysis_request(
+            self.engine.next_request_id(f"move_{len(moves)}"), moves, max_visits, max_time
+        )
+        # 最多等待20秒，带时间限制的请求按时间上限放宽
+        timeout = 20.0 if max_time is None else max(20.0, max_time + 10)
+
+        with self.visit_budget.track_search() as search:
+            print(f"发送分析请求: {json.dumps(req)}")
+            msg = self.engine.query(req, timeout=timeout)
+            print(f"收到 KataGo 响应: {json.dumps(msg, ensure_ascii=False)}")
+            search["visits"] = msg.get("rootInfo", {}).get("visits", 0)
+
+        self.analysis_cache.put(moves, self.komi, msg, budget=int(max_visits))
+        return msg
+    
+    def start_pondering(self):
+        """人类思考期间，预先分析对方最可能的几手应对之后的局面
         
-        # 停止之前的分析
-        self.stop_realtime_analysis()
+        结果写入分析缓存；人类下出其中一手时，AI应手和胜率探测可以直接命中缓存。
+        """
+        if not self.ponder_enabled or self.game_over or not self._check_process_alive():
+            return
         
-        # 使用独立的推荐选点AI算力设置
-        if max_visits is None:
-            max_visits = max(1, int(self.suggestion_ai_time_limit * 100))  # 推荐选点专用算力，确保为正整数
+        self.stop_pondering()
+        try:
+            base_result = self._send_analysis_request(max_visits=50)
+        except Exception as e:
+            print(f"预读候选着法失败: {e}")
+            return
         
-        req = {
-            "id": f"realtime_{len(self.moves)}_{int(time.time())}",
-            "rules": "Chinese",
-            "komi": self.komi,
-            "boardXSize": self.board_size,
-            "boardYSize": self.board_size,
-            "moves": self.moves.copy(),
-            "maxVisits": int(max_visits),
-            "includeOwnership": True,
-            "reportDuringSearchEvery": 0.5  # 每0.5秒报告一次进度
-        }
+        base_moves = [list(move) for move in self.moves]
+        candidates = [mv["move"] for mv in sorted(
+            base_result.get("moveInfos", []), key=lambda mv: mv.get("order", 0)
+        )[:self.ponder_candidates]]
+        limits = self.visit_budget.query_limits(self.ai_time_limit)
         
-        try:
-            request_json = json.dumps(req)
-            print(f"发送实时分析请求: {request_json}")
-            self.proc.stdin.write(request_json + "\n")
-            self.proc.stdin.flush()
+        for candidate in candidates:
+            ponder_moves = base_moves + [[self.current_player, candidate]]
+            key = self.analysis_cache.make_key(ponder_moves, self.komi)
+            if self.analysis_cache.get(ponder_moves, self.komi, limits["maxVisits"]) is not None:
+                continue
+            with self._ponder_lock:
+                # 对称的候选着法落到同一个局面，只预读一次
+                if key in self._ponder_inflight:
+                    continue
             
-            # 启动实时分析线程
-            self.realtime_analysis_active = True
-            self.realtime_thread = threading.Thread(
-                target=self._realtime_analysis_worker, 
-                args=(callback_func, req["id"])
+            req = self._build_analysis_request(
+                self.engine.next_request_id(f"ponder_{len(ponder_moves)}"),
+                ponder_moves, limits["maxVisits"], limits["maxTime"]
             )
-            self.realtime_thread.daemon = True
-            self.realtime_thread.start()
+            req["priority"] = -10  # 正式查询优先于预读
+            done = threading.Event()
+            # 预读同样占用引擎，计入全机的搜索数，正式查询的思考时间随之缩短
+            started_at = self.visit_budget.begin_search()
+            with self._ponder_lock:
+                self._ponder_inflight[key] = (req["id"], done, started_at)
+            
+            def on_message(msg, ponder_moves=ponder_moves, key=key, req=req, done=done, started_at=started_at):
+                visits = 0
+                if "error" in msg:
+                    print(f"预读查询出错: {msg['error']}")
+                elif msg.get("isDuringSearch", True):
+                    return
+                else:
+                    # 被终止的查询只按实际访问次数计入缓存，也不参与速率估计
+                    budget = 0 if msg.get("terminated") else req["maxVisits"]
+                    self.analysis_cache.put(ponder_moves, self.komi, msg, budget=budget)
+                    if not msg.get("terminated"):
+                        visits = msg.get("rootInfo", {}).get("visits", 0)
+                self.engine.release(req["id"])
+                with self._ponder_lock:
+                    owned = self._ponder_inflight.get(key, (None,))[0] == req["id"]
+                    if owned:
+                        del self._ponder_inflight[key]
+                if owned:
+                    # 已被 stop_pondering 取消的预读由取消方登记结束
+                    self.visit_budget.end_search(started_at, visits)
+                done.set()
             
-        except BrokenPipeError:
-            raise RuntimeError("无法向 KataGo 发送实时分析请求，进程可能已终止")
+            try:
+                self.engine.submit(req, on_message)
+                print(f"预读候选着法: {candidate}")
+            except RuntimeError as e:
+                print(f"预读请求发送失败: {e}")
+                with self._ponder_lock:
+                    self._ponder_inflight.pop(key, None)
+                self.visit_budget.end_search(started_at)
+                done.set()
+    
+    def stop_pondering(self, keep_move=None):
+        """取消进行中的预读；keep_move 对应的预读保留，供随后的正式查询等待复用"""
+        keep_key = None
+        if keep_move is not None:
+            keep_moves = [list(move) for move in self.moves] + [[self.current_player, keep_move]]
+            keep_key = self.analysis_cache.make_key(keep_moves, self.komi)
+        
+        with self._ponder_lock:
+            cancelled = [(key, item) for key, item in self._ponder_inflight.items() if key != keep_key]
+            for key, _ in cancelled:
+                del self._ponder_inflight[key]
+        
+        for _, (request_id, done, started_at) in cancelled:
+            if self.engine is not None:
+                self.engine.terminate(request_id)
+                self.engine.release(request_id)
+            self.visit_budget.end_search(started_at)
+            done.set()
+    
+    def _wait_for_ponder(self, moves, min_visits, max_time=None):
+        """如果该局面正在预读，等待预读完成后从缓存读取"""
+        key = self.analysis_cache.make_key(moves, self.komi)
+        with self._ponder_lock:
+            pending = self._ponder_inflight.get(key)
+        if pending is None:
+            return None
+        
+        print(f"等待预读结果: 第{len(moves)}手局面")
+        pending[1].wait(timeout=20.0 if max_time is None else max_time + 10)
+        return self.analysis_cache.get(moves, self.komi, min_visits)
+    
+    def start_realtime_analysis(self, callback_func, max_visits=None):
+        """开始实时分析，持续获取推荐选点
+
+        开局定式库或分析缓存中已有当前局面时直接回调其推荐选点，不再提交引擎查询。
+        """
+        # 停止之前的分析
+        self.stop_realtime_analysis()
+        
+        # 使用独立的推荐选点AI算力设置，按实测速率换算思考时间
+        limits = self.visit_budget.query_limits(self.suggestion_ai_time_limit)
+        if max_visits is None:
+            max_visits = limits["maxVisits"]
+        
+        moves = [list(move) for move in self.moves]
+        known = self.opening_book.lookup_moves(moves, self.komi) if self.opening_book is not None else None
+        if known is None:
+            known = self.analysis_cache.get(moves, self.komi, int(max_visits))
+        if known is not None and known.get("moveInfos"):
+            print(f"实时推荐命中{'开局定式库' if known.get('fromOpeningBook') else '分析缓存'}: 第{len(moves)}手局面")
+            callback_func(self._realtime_suggestions(known["moveInfos"]))
+            return
+        
+        if not self._check_process_alive():
+            raise RuntimeError("KataGo 进程已终止")
+        
+        req = self._build_analysis_request(
+            self.engine.next_request_id(f"realtime_{len(self.moves)}"),
+            self.moves, max_visits, limits["maxTime"]
+        )
+        req["reportDuringSearchEvery"] = 0.5  # 每0.5秒报告一次进度
+        
+        print(f"发送实时分析请求: {json.dumps(req)}")
+        responses = queue.Queue()
+        self.engine.submit(req, responses.put)
+        
+        # 启动实时分析线程
+        self.realtime_analysis_active = True
+        self.realtime_request_id = req["id"]
+        self.realtime_thread = threading.Thread(
+            target=self._realtime_analysis_worker, 
+            args=(callback_func, req["id"], responses, self.visit_budget.begin_search())
+        )
+        self.realtime_thread.daemon = True
+        self.realtime_thread.start()
     
-    def _realtime_analysis_worker(self, callback_func, request_id):
+    @staticmethod
+    def _realtime_suggestions(move_infos):
+        """提取推荐选点数据（最多7个推荐）"""
+        return [{
+            "move": mv["move"],
+            "winrate": mv["winrate"],
+            "score_lead": mv.get("scoreLead", 0),
+            "visits": mv.get("visits", 0)
+        } for mv in move_infos[:7]]
+    
+    def _realtime_analysis_worker(self, callback_func, request_id, responses, search_started_at=None):
         """实时分析工作线程"""
+        final_visits = 0
         try:
             while self.realtime_analysis_active:
                 try:
-                    msg = self.out_q.get(timeout=0.1)
+                    msg = responses.get(timeout=0.1)
+                    
+                    move_infos = msg.get("moveInfos", [])
+                    if move_infos:
+                        # 调用回调函数更新前端
+                        callback_func(self._realtime_suggestions(move_infos))
                     
-                    # 检查是否是我们的请求的响应
-                    if msg.get("id") == request_id:
-                        move_infos = msg.get("moveInfos", [])
-                        if move_infos:
-                            # 提取推荐选点数据
-                            suggestions = []
-                            for mv in move_infos[:7]:  # 最多7个推荐
-                                suggestions.append({
-                                    "move": mv["move"],
-                                    "winrate": mv["winrate"],
-                                    "score_lead": mv.get("scoreLead", 0),
-                                    "visits": mv.get("visits", 0)
-                                })
-                            
-                            # 调用回调函数更新前端
-                            callback_func(suggestions)
+                    # 如果分析完成，停止实时分析
+                    if not msg.get("isDuringSearch", True):
+                        final_visits = msg.get("rootInfo", {}).get("visits", 0)
+                        print("实时分析完成")
+                        break
                         
-                        # 如果分析完成，停止实时分析
-                        if not msg.get("isDuringSearch", True):
-                            print("实时分析完成")
-                            break
-                            
                 except queue.Empty:
                     continue
                 except Exception as e:
@@ -292,10 +402,17 @@ class WeiQiGame:
             print(f"实时分析线程异常: {e}")
         finally:
             self.realtime_analysis_active = False
+            if self.engine is not None:
+                self.engine.release(request_id)
+            if search_started_at is not None:
+                self.visit_budget.end_search(search_started_at, final_visits)
     
     def stop_realtime_analysis(self):
         """停止实时分析"""
         if hasattr(self, 'realtime_analysis_active'):
+            if self.realtime_analysis_active and self.engine is not None:
+                # 让KataGo停止搜索，释放算力
+                self.engine.terminate(getattr(self, 'realtime_request_id', None))
             self.realtime_analysis_active = False
         if hasattr(self, 'realtime_thread') and self.realtime_thread and self.realtime_thread.is_alive():
             self.realtime_thread.join(timeout=1.0)
@@ -306,9 +423,9 @@ class WeiQiGame:
             self._start_katago()
             
         try:
-            # 对手AI使用用户设置的算力
-            max_visits = int(self.ai_time_limit * 100)  # 根据时间限制计算访问次数，确保为整数
-            result = self._send_analysis_request(max_visits=max_visits)
+            # 对手AI使用用户设置的思考时间，按引擎实测速率换算访问次数
+            limits = self.visit_budget.query_limits(self.ai_time_limit)
+            result = self._send_analysis_request(max_visits=limits["maxVisits"], max_time=limits["maxTime"])
             move_infos = result.get("moveInfos", [])
 
             if not move_infos:
@@ -434,51 +551,94 @@ class WeiQiGame:
         
         return captured_groups
     
+    def rules_board(self):
+        """当前局面的规则棋盘副本（含打劫状态），用于合法性判断和本地读棋"""
+        go_board = GoBoard(self.board_size, self.board)
+        go_board.ko_point = self.ko_position
+        go_board.captured_black = self.captured_black
+        go_board.captured_white = self.captured_white
+        return go_board
+
     def is_valid_move(self, row, col, color):
-        """检查着法是否合法（考虑提子逻辑）"""
-        print(f"is_valid_move调试: row={row}, col={col}, color={color}")
-        print(f"棋盘位置状态: self.board[{row}][{col}] = {self.board[row][col]}")
-        
-        # 创建棋盘副本进行模拟
-        board_copy = [row[:] for row in self.board]
-        
-        # 如果位置被占用，检查是否是同色棋子
-        if board_copy[row][col] != 0:
-            if board_copy[row][col] == color:
-                print(f"同色棋子重复着法，无效: {color}")
-                return False
-            print(f"位置被对方棋子占用: {board_copy[row][col]}，检查是否能通过提子解决")
-        
-        # 在副本上放置棋子
-        board_copy[row][col] = color
-        
-        # 检查并移除被提取的对方棋子
-        opponent_color = 3 - color  # 1->2, 2->1
-        captured_any = False
-        
-        neighbors = self.get_neighbors(row, col)
-        for nr, nc in neighbors:
-            if board_copy[nr][nc] == opponent_color:
-                group = self._get_group_on_board(board_copy, nr, nc)
-                liberties = self._get_liberties_on_board(board_copy, group)
-                print(f"对方棋子组 ({nr},{nc}): group={len(group)}, liberties={len(liberties)}")
-                if group and len(liberties) == 0:
-                    # 在副本上移除被提取的棋子
-                    for gr, gc in group:
-                        board_copy[gr][gc] = 0
-                    captured_any = True
-                    print(f"可以提取对方棋子组: {group}")
-        
-        # 检查自己的棋子组是否有气
-        own_group = self._get_group_on_board(board_copy, row, col)
-        own_liberties = self._get_liberties_on_board(board_copy, own_group)
-        own_liberties_count = len(own_liberties)
-        print(f"自己的棋子组: group={len(own_group)}, liberties={own_liberties_count}")
-        
-        result = own_liberties_count > 0
-        print(f"着法有效性结果: own_liberties={own_liberties_count}, result={result}")
-        
+        """检查着法是否合法（空点、非打劫禁着、非自杀）"""
+        return self.rules_board().is_legal(row, col, color)
+
+    def get_legal_moves(self, include_policy=False):
+        """当前轮到一方的整盘合法着点，可附带策略网络的落子概率热力图
+
+        前端据此在本地显示悬停提示，不必每次点击都向服务器试探。
+        """
+        mask = self.rules_board().legal_mask(self.current_player)
+        result = {
+            "player": self.current_player,
+            "move_number": len(self.moves),
+            "legal": mask,
+            "legal_count": sum(map(sum, mask))
+        }
+        if include_policy:
+            try:
+                heatmap = policy_heatmap(self._get_policy(), self.board_size)
+            except Exception as e:
+                print(f"获取策略热力图失败: {e}")
+                heatmap = None
+            if heatmap is not None:
+                result["policy"] = heatmap
+        return result
+
+    def read_tactics(self, kind="summary", point=None, point_b=None, attacker_first=True,
+                     node_budget=DEFAULT_NODE_BUDGET):
+        """本地战术读棋（不占用KataGo）
+
+        Args:
+            kind: summary（全盘气紧的棋块）、group、ladder、net 或 race
+            point: 目标棋块中的一子，如 "D4"；race 时为对杀的一方
+            point_b: race 时对杀的另一方
+        """
+        reader = TacticalReader(self.rules_board(), node_budget)
+        if kind == "summary":
+            items = reader.summary(self.current_player)
+            return {"kind": kind, "items": items, "description": describe_tactics(items)}
+        if not point:
+            raise ValueError("缺少读棋目标")
+        if kind == "group":
+            result = reader.group_status(point)
+        elif kind == "ladder":
+            result = reader.ladder(point, attacker_first)
+        elif kind == "net":
+            result = reader.net(point, attacker_first)
+        elif kind == "race":
+            if not point_b:
+                raise ValueError("对杀需要两块棋")
+            result = reader.liberty_race(point, point_b, self.current_player)
+        else:
+            raise ValueError(f"未知的读棋类型: {kind}")
+        result["kind"] = kind
         return result
+
+    def _get_policy(self):
+        """当前局面的策略网络输出（KataGo顺序），优先使用缓存"""
+        moves = [list(move) for move in self.moves]
+        cached = self.analysis_cache.get(moves, self.komi)
+        if cached and cached.get("policy"):
+            return cached["policy"]
+
+        key = tuple((color, move) for color, move in moves)
+        if key in self.policy_cache:
+            self.policy_cache.move_to_end(key)
+            return self.policy_cache[key]
+        if not self._check_process_alive():
+            return None
+
+        # 策略网络输出与搜索量无关，只需1次访问
+        req = self._build_analysis_request(self.engine.next_request_id(f"policy_{len(moves)}"), moves, 1)
+        req["includeOwnership"] = False
+        req["includePolicy"] = True
+        policy = self.engine.query(req, timeout=10.0).get("policy")
+        if policy:
+            self.policy_cache[key] = policy
+            while len(self.policy_cache) > POLICY_CACHE_SIZE:
+                self.policy_cache.popitem(last=False)
+        return policy
     
     def _get_group_on_board(self, board, row, col):
         """在指定棋盘上获取棋子组"""
@@ -510,6 +670,7 @@ class WeiQiGame:
                     liberties.add((nr, nc))
         return liberties
     
+    @metrics.timed("game.make_move")
     def make_move(self, move):
         if move == "pass":
             self.moves.append([self.current_player, move])
@@ -538,6 +699,8 @@ class WeiQiGame:
             return False
         
         color = 1 if self.current_player == "B" else 2
+        # 分阶段计时：规则检查、三次引擎查询、演化数据写入和统计回读
+        watch = metrics.stopwatch("game.make_move")
         
         # 检查打劫规则
         if self.ko_position and (row, col) == self.ko_position:
@@ -597,6 +760,8 @@ class WeiQiGame:
             if hasattr(self, 'move_count'):
                 self.move_count = len(self.moves)
         
+        watch.lap("rules")
+        
         # 记录胜率历史（在切换玩家之前获取当前局面的分析）
         # 在分支模式下跳过胜率分析以提高响应速度
         is_branch_mode = hasattr(self, 'move_count') and self.move_count < len(self.moves) - 1
@@ -640,11 +805,13 @@ class WeiQiGame:
                     "color": self.current_player,
                     "black_winrate": 50.0,  # 默认值
                     "white_winrate": 50.0,  # 默认值
-                    "score_lead": 0.0
+                    "score_lead": 0.0,
+                    "analyzed": False  # 占位数据，不参与问题手检测
                 }
                 self.winrate_history.append(winrate_data)
         except Exception as e:
             print(f"记录胜率历史失败: {e}")
+        watch.lap("winrate_query")
         
         # 存储局势演化数据
         try:
@@ -681,24 +848,17 @@ class WeiQiGame:
                         })
                 except Exception as e:
                     print(f"获取推荐着法失败: {e}")
+            watch.lap("recommend_query")
             
             # 获取领地所有权数据（如果可用）
             ownership_data = None
             if self.katago_initialized and not is_branch_mode:
                 try:
                     analysis_result = self._send_analysis_request(max_visits=50)
-                    if 'ownership' in analysis_result:
-                        ownership_1d = analysis_result['ownership']
-                        if len(ownership_1d) == 19 * 19:
-                            ownership_data = []
-                            for row in range(19):
-                                row_data = []
-                                for col in range(19):
-                                    index = row * 19 + col
-                                    row_data.append(ownership_1d[index])
-                                ownership_data.append(row_data)
+                    ownership_data = Ownership.from_analysis(analysis_result)
                 except Exception as e:
                     print(f"获取领地数据失败: {e}")
+            watch.lap("ownership_query")
             
             # 添加局势演化数据
             color_name = "black" if self.current_player == "B" else "white"
@@ -711,14 +871,21 @@ class WeiQiGame:
                 board=self.board,
                 winrate_data=current_winrate_data,
                 recommended_moves=recommended_moves,
-                territory_data=ownership_data
+                territory_data=ownership_data,
+                komi=self.komi
             )
             print(f"[DEBUG] 局势演化数据已添加")
+            watch.lap("evolution_push")
+            
+            self.key_moments.record_recommendations(len(self.moves), recommended_moves)
+            self.update_key_moments()
+            watch.lap("key_moments")
             
             # 保存到文件
             print(f"[DEBUG] 准备保存到文件: {self.evolution_storage.storage_path}")
             self.evolution_storage.save_to_file()
             print(f"[DEBUG] 文件保存完成")
+            watch.lap("stats_reread")
             
         except Exception as e:
             print(f"存储局势演化数据失败: {e}")
@@ -729,6 +896,22 @@ class WeiQiGame:
         
         return True
 
+    def update_key_moments(self, persist=True):
+        """增量更新关键时刻索引，有变化时写入局势演化存储
+
+        回溯、切换变化等浏览操作传 persist=False，只更新内存中的索引（不在事件循环上写数据库），
+        未写入的变化在下一次胜率历史改变时一并写入。
+        """
+        try:
+            changed = self.key_moments.update(self.winrate_history)
+            if not persist:
+                self.key_moments_unsaved = self.key_moments_unsaved or changed
+            elif changed or self.key_moments_unsaved:
+                self.evolution_storage.set_key_moments(self.key_moments.get_index())
+                self.key_moments_unsaved = False
+        except Exception as e:
+            print(f"更新关键时刻失败: {e}")
+
     def play(self):
         print("=== 围棋人机对弈 ===")
         print("输入格式: D4, Q16 等 (列用A-T，行用1-19)")
@@ -806,30 +989,28 @@ class WeiQiGame:
         return True
     
     def goto_move(self, move_index):
-        """回溯到指定着法，删除后续所有着法"""
+        """回溯到指定着法，删除后续所有着法（在本地按规则重放，不请求分析）"""
         if move_index < 0 or move_index > len(self.moves):
             return False
         
         try:
             # 保存要保留的着法
-            moves_to_keep = self.moves[:move_index]
-            
-            # 重置游戏状态
-            self.board = [[0 for _ in range(19)] for _ in range(19)]
-            self.current_player = "B"
-            self.captured_black = 0
-            self.captured_white = 0
-            self.moves = []
+            moves_to_keep = [list(move) for move in self.moves[:move_index]]
+            go_board = GoBoard.from_moves(moves_to_keep, self.board_size)
             
-            # 重新执行保留的着法
-            for move in moves_to_keep:
-                success = self.make_move(move[1])
-                if not success:
-                    return False
+            # 用重放结果替换游戏状态
+            self.board = go_board.board
+            self.captured_black = go_board.captured_black
+            self.captured_white = go_board.captured_white
+            self.ko_position = go_board.ko_point
+            self.board_history = []
+            self.moves = moves_to_keep
+            self.current_player = "W" if moves_to_keep and moves_to_keep[-1][0] == "B" else "B"
             
             # 清除胜率历史中超出当前手数的数据
             if hasattr(self, 'winrate_history'):
                 self.winrate_history = [wr for wr in self.winrate_history if wr.get('move_number', 0) <= move_index]
+                self.update_key_moments(persist=False)
             
             return True
         except Exception as e:
@@ -876,19 +1057,12 @@ class WeiQiGame:
         return False
 
     def cleanup(self):
-        # 停止实时分析
+        # 停止实时分析和后台预读
         self.stop_realtime_analysis()
+        self.stop_pondering()
         
-        if self.proc:
-            try:
-                self.proc.stdin.close()
-            except:
-                pass
-            try:
-                self.proc.terminate()
-                self.proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self.proc.kill()
+        if self.engine:
+            self.engine.close()
 
 if __name__ == "__main__":
     try:
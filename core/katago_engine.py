@@ -0,0 +1,237 @@
+import json, subprocess, threading, queue, os, sys, time
+from typing import Callable, Dict, Iterator, Optional
+
+
+class KataGoEngine:
+    """KataGo analysis 引擎进程封装
+
+    负责启动进程、读取输出，并按请求id把响应分发给对应的等待者，
+    这样同一个引擎可以同时处理多个查询（落子分析、实时推荐、后台预读）。
+    """
+
+    def __init__(self, katago_bin: str, model: str, config: str,
+                 require_files: bool = True, startup_wait: float = 2.0):
+        self.katago_bin = katago_bin
+        self.model = model
+        self.config = config
+        # 假引擎（utils/fake_katago.py）不需要模型和配置文件，启动也快得多
+        self.require_files = require_files
+        self.startup_wait = startup_wait
+        self.proc = None
+        self.stderr_q = queue.Queue()
+        self._routes: Dict[str, Callable[[Dict], None]] = {}
+        self._routes_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._request_counter = 0
+
+    def start(self):
+        """启动KataGo进程和输出读取线程"""
+        if self.require_files and not os.path.exists(self.model):
+            raise RuntimeError(f"模型文件不存在: {self.model}")
+        if self.require_files and not os.path.exists(self.config):
+            raise RuntimeError(f"配置文件不存在: {self.config}")
+
+        print("正在启动 KataGo...")
+        print(f"模型文件: {self.model}")
+        print(f"配置文件: {self.config}")
+
+        try:
+            version_result = subprocess.run(
+                self._command("version"),
+                capture_output=True, text=True, timeout=10
+            )
+            if version_result.returncode == 0:
+                print(f"KataGo 版本: {version_result.stdout.strip()}")
+            else:
+                print(f"KataGo 版本检查失败: {version_result.stderr}")
+        except Exception as e:
+            print(f"无法获取 KataGo 版本: {e}")
+
+        self.proc = subprocess.Popen(
+            self._command("analysis", "-model", self.model, "-config", self.config),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, bufsize=1
+        )
+
+        time.sleep(self.startup_wait)
+        if self.proc.poll() is not None:
+            stderr_output = self.proc.stderr.read()
+            raise RuntimeError(f"KataGo 启动失败，退出码: {self.proc.returncode}\n错误信息: {stderr_output}")
+
+        threading.Thread(target=self._reader, daemon=True).start()
+        threading.Thread(target=self._stderr_reader, daemon=True).start()
+        print("KataGo 启动成功！")
+
+    def _command(self, *args) -> list:
+        """引擎命令行；Python脚本形式的引擎（假引擎）用当前解释器启动"""
+        if self.katago_bin.endswith(".py"):
+            return [sys.executable, self.katago_bin, *args]
+        return [self.katago_bin, *args]
+
+    def _stderr_reader(self):
+        try:
+            for line in self.proc.stderr:
+                line = line.strip()
+                if line:
+                    if "Unexpected or unused field" not in line:
+                        print(f"KataGo stderr: {line}", file=sys.stderr)
+        except Exception as e:
+            print(f"读取 KataGo 错误输出时出错: {e}", file=sys.stderr)
+
+    def _reader(self):
+        try:
+            for line in self.proc.stdout:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    msg = json.loads(line)
+                except json.JSONDecodeError:
+                    print("Non-JSON:", line, file=sys.stderr)
+                    continue
+                self._dispatch(msg)
+        except Exception as e:
+            print(f"读取 KataGo 输出时出错: {e}", file=sys.stderr)
+
+    def _dispatch(self, msg: Dict):
+        """按请求id把响应交给对应的处理函数"""
+        request_id = msg.get("id")
+        with self._routes_lock:
+            handler = self._routes.get(request_id)
+        if handler is None:
+            if "error" in msg or "warning" in msg:
+                print(f"KataGo 消息: {json.dumps(msg, ensure_ascii=False)}", file=sys.stderr)
+            return
+        try:
+            handler(msg)
+        except Exception as e:
+            print(f"处理 KataGo 响应时出错: {e}", file=sys.stderr)
+
+    def is_alive(self) -> bool:
+        if self.proc is None or self.proc.poll() is not None:
+            if self.proc and self.proc.poll() is not None:
+                print(f"KataGo 进程已终止，退出码: {self.proc.poll()}")
+                while not self.stderr_q.empty():
+                    try:
+                        stderr_line = self.stderr_q.get_nowait()
+                        print(f"KataGo 错误: {stderr_line}")
+                    except queue.Empty:
+                        break
+            return False
+        return True
+
+    def next_request_id(self, prefix: str) -> str:
+        """生成唯一的请求id"""
+        with self._routes_lock:
+            self._request_counter += 1
+            return f"{prefix}_{self._request_counter}"
+
+    def _write(self, req: Dict):
+        try:
+            with self._write_lock:
+                self.proc.stdin.write(json.dumps(req) + "\n")
+                self.proc.stdin.flush()
+        except (BrokenPipeError, AttributeError, ValueError):
+            raise RuntimeError("无法向 KataGo 发送请求，进程可能已终止")
+
+    def submit(self, req: Dict, handler: Callable[[Dict], None]):
+        """发送查询，之后该id的每条响应都会回调handler（在读取线程中执行）"""
+        if not self.is_alive():
+            raise RuntimeError("KataGo 进程已终止")
+        with self._routes_lock:
+            self._routes[req["id"]] = handler
+        try:
+            self._write(req)
+        except RuntimeError:
+            self.release(req["id"])
+            raise
+
+    def release(self, request_id: str):
+        """不再接收该请求的后续响应"""
+        with self._routes_lock:
+            self._routes.pop(request_id, None)
+
+    def query(self, req: Dict, timeout: float = 20.0) -> Dict:
+        """发送查询并等待最终结果（isDuringSearch 为 false）"""
+        responses = queue.Queue()
+        self.submit(req, responses.put)
+        try:
+            deadline = time.monotonic() + timeout
+            waited_ticks = 0
+            while time.monotonic() < deadline:
+                try:
+                    msg = responses.get(timeout=0.1)
+                    if "error" in msg:
+                        raise RuntimeError(f"KataGo 返回错误: {msg['error']}")
+                    # KataGo 分析完成的标志是 isDuringSearch 为 false
+                    if not msg.get("isDuringSearch", True):
+                        return msg
+                except queue.Empty:
+                    waited_ticks += 1
+                    if waited_ticks % 50 == 0:  # 每5秒打印一次等待信息
+                        print(f"等待 KataGo 响应中... ({waited_ticks/10:.1f}秒)")
+                    if not self.is_alive():
+                        raise RuntimeError("KataGo 进程在分析过程中终止")
+            raise RuntimeError("KataGo 分析超时")
+        finally:
+            self.release(req["id"])
+
+    def analyze_turns(self, req: Dict, timeout: float = 120.0,
+                      cancel: Optional[threading.Event] = None) -> Iterator[Dict]:
+        """发送带 analyzeTurns 的查询，按完成顺序逐个产出每个回合的最终结果
+
+        结果可能乱序到达，调用方按 turnNumber 归位；
+        产出发生在调用方线程中，可以在这里做较慢的存储操作而不阻塞读取线程。
+        cancel 被设置后停止产出（等待结果期间同样检查），剩余回合由引擎终止。
+        """
+        turns = set(req.get("analyzeTurns") or [len(req["moves"])])
+        responses = queue.Queue()
+        self.submit(req, responses.put)
+        try:
+            deadline = time.monotonic() + timeout
+            while turns:
+                if cancel is not None and cancel.is_set():
+                    return
+                if time.monotonic() >= deadline:
+                    raise RuntimeError(f"KataGo 批量分析超时，剩余 {len(turns)} 个回合")
+                try:
+                    msg = responses.get(timeout=0.1)
+                except queue.Empty:
+                    if not self.is_alive():
+                        raise RuntimeError("KataGo 进程在分析过程中终止")
+                    continue
+                if "error" in msg:
+                    raise RuntimeError(f"KataGo 返回错误: {msg['error']}")
+                if msg.get("isDuringSearch", False):
+                    continue
+                turns.discard(msg.get("turnNumber"))
+                yield msg
+        finally:
+            self.release(req["id"])
+            if turns:
+                self.terminate(req["id"])
+
+    def terminate(self, request_id: str):
+        """请求KataGo停止某个查询"""
+        if not self.is_alive():
+            return
+        try:
+            self._write({
+                "id": f"terminate_{request_id}",
+                "action": "terminate",
+                "terminateId": request_id
+            })
+        except RuntimeError as e:
+            print(f"终止 KataGo 查询失败: {e}")
+
+    def close(self):
+        if self.proc:
+            try:
+                self.proc.stdin.close()
+            except:
+                pass
+            try:
+                self.proc.terminate()
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
@@ -0,0 +1,142 @@
+from typing import Dict, List, Optional
+
+# 按落子方胜率损失（百分点）分级，从重到轻
+WINRATE_LOSS_THRESHOLDS = [
+    (20.0, "blunder"),
+    (10.0, "mistake"),
+    (5.0, "inaccuracy")
+]
+
+# 按落子方目差损失（目）分级
+SCORE_LOSS_THRESHOLDS = [
+    (10.0, "blunder"),
+    (5.0, "mistake"),
+    (2.0, "inaccuracy")
+]
+
+LABEL_SEVERITY = {"inaccuracy": 1, "mistake": 2, "blunder": 3}
+
+
+def classify_loss(loss: float, thresholds=WINRATE_LOSS_THRESHOLDS) -> Optional[str]:
+    """按阈值给损失分级，未达到任何阈值返回None"""
+    for threshold, label in thresholds:
+        if loss >= threshold:
+            return label
+    return None
+
+
+def _entry_color(entry: Dict) -> Optional[str]:
+    color = entry.get("color") or entry.get("player")
+    if color in ("black", "white"):
+        color = "B" if color == "black" else "W"
+    return color
+
+
+class KeyMomentDetector:
+    """从胜率历史中增量找出问题手（关键时刻）
+
+    胜率历史的每条记录是某手棋之后的局面评估：black_winrate 为黑棋视角，
+    score_lead 为轮到下棋一方视角（KataGo原始值）。相邻两条记录的差值即该手棋的损失。
+    只处理新增或改变了的记录，悔棋/分支造成的截断会移除对应的关键时刻；
+    最佳替代着法取自落子前局面已缓存的推荐着法，不需要重新请求引擎。
+    """
+
+    def __init__(self, winrate_thresholds=WINRATE_LOSS_THRESHOLDS,
+                 score_thresholds=SCORE_LOSS_THRESHOLDS):
+        self.winrate_thresholds = winrate_thresholds
+        self.score_thresholds = score_thresholds
+        self.moments: Dict[int, Dict] = {}
+        self._processed: Dict[int, tuple] = {}
+        self._recommendations: Dict[int, List[Dict]] = {}
+
+    def record_recommendations(self, move_number: int, recommended_moves: List[Dict]):
+        """缓存某个局面（第move_number手之后）的推荐着法，用作下一手的最佳替代"""
+        if recommended_moves:
+            self._recommendations[move_number] = list(recommended_moves)
+
+    @staticmethod
+    def _signature(previous: Dict, entry: Dict) -> tuple:
+        return (entry.get("move"), entry.get("black_winrate"), entry.get("score_lead"),
+                previous.get("black_winrate"), previous.get("score_lead"))
+
+    def update(self, winrate_history: List[Dict]) -> bool:
+        """处理胜率历史中的新记录，返回关键时刻索引是否有变化"""
+        entries = {}
+        for entry in winrate_history:
+            if "black_winrate" in entry and entry.get("analyzed", True):
+                entries[entry.get("move_number", 0)] = entry
+
+        changed = False
+        for move_number in [n for n in self._processed if n not in entries or n - 1 not in entries]:
+            del self._processed[move_number]
+            if self.moments.pop(move_number, None) is not None:
+                changed = True
+
+        for move_number in sorted(entries):
+            if move_number == 0 or move_number - 1 not in entries:
+                continue
+            entry, previous = entries[move_number], entries[move_number - 1]
+            signature = self._signature(previous, entry)
+            if self._processed.get(move_number) == signature:
+                continue
+            self._processed[move_number] = signature
+
+            moment = self._evaluate(move_number, previous, entry)
+            if moment is None:
+                if self.moments.pop(move_number, None) is not None:
+                    changed = True
+            elif self.moments.get(move_number) != moment:
+                self.moments[move_number] = moment
+                changed = True
+        return changed
+
+    def _evaluate(self, move_number: int, previous: Dict, entry: Dict) -> Optional[Dict]:
+        color = _entry_color(entry)
+        if color not in ("B", "W") or entry.get("move") == "pass":
+            return None
+
+        def mover_winrate(record):
+            black = record["black_winrate"]
+            return black if color == "B" else 100 - black
+
+        winrate_before, winrate_after = mover_winrate(previous), mover_winrate(entry)
+        winrate_loss = winrate_before - winrate_after
+        # 落子前轮到落子方，落子后轮到对方，两条记录的 score_lead 视角相反
+        score_loss = previous.get("score_lead", 0) + entry.get("score_lead", 0)
+
+        labels = [label for label in (classify_loss(winrate_loss, self.winrate_thresholds),
+                                      classify_loss(score_loss, self.score_thresholds)) if label]
+        if not labels:
+            return None
+        label = max(labels, key=LABEL_SEVERITY.get)
+
+        moment = {
+            "move_number": move_number,
+            "move": entry.get("move"),
+            "color": color,
+            "label": label,
+            "winrate_before": round(winrate_before, 1),
+            "winrate_after": round(winrate_after, 1),
+            "winrate_loss": round(winrate_loss, 1),
+            "score_loss": round(score_loss, 1),
+            "best_move": None
+        }
+        recommendations = self._recommendations.get(move_number - 1)
+        if recommendations and recommendations[0].get("move") not in (None, "", entry.get("move")):
+            # 实际着法就是首选推荐时，损失来自搜索波动，不给出替代着法
+            moment["best_move"] = recommendations[0]["move"]
+            moment["best_move_winrate"] = recommendations[0].get("winrate")
+        return moment
+
+    def get_index(self, top: int = 5) -> Dict:
+        """关键时刻索引：按手数排序的全部问题手、双方分级统计、损失最大的转折点"""
+        moments = [self.moments[n] for n in sorted(self.moments)]
+        counts = {color: {label: 0 for label in LABEL_SEVERITY} for color in ("B", "W")}
+        for moment in moments:
+            counts[moment["color"]][moment["label"]] += 1
+        turning_points = sorted(moments, key=lambda m: (-m["winrate_loss"], m["move_number"]))[:top]
+        return {
+            "moments": moments,
+            "counts": counts,
+            "turning_points": [moment["move_number"] for moment in turning_points]
+        }
@@ -0,0 +1,190 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# 延迟直方图的桶上限（毫秒），最后一个桶之外计入 +Inf
+LATENCY_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+# 每个开启追踪的会话保留的最近span条数
+TRACE_BUFFER_SIZE = 512
+
+# 当前正在执行的命令所属的会话（asyncio 任务和 asyncio.to_thread 的工作线程都会继承）
+_current_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("metrics_session", default=None)
+
+
+class Histogram:
+    """固定桶的延迟直方图（累计计数在导出时计算）"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, q: float) -> float:
+        """按桶估计分位数（取所在桶的上限，最后一个桶取最大值）"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self) -> Dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max, 3),
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts) if count}
+        }
+
+
+class Metrics:
+    """进程内的分阶段耗时统计
+
+    每个span按名字汇总到直方图；正在执行的命令属于开启了追踪的会话时，
+    span 还会逐条记录到该会话的环形缓冲区并打印，用于定位单次慢操作的耗时分布。
+    """
+
+    def __init__(self, trace_buffer_size: int = TRACE_BUFFER_SIZE):
+        self.trace_buffer_size = trace_buffer_size
+        self._histograms: Dict[str, Histogram] = {}
+        self._traces: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def observe(self, name: str, ms: float):
+        """记录一次耗时；当前会话开启了追踪时同时写入追踪记录"""
+        session_id = _current_session.get()
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(ms)
+            trace = self._traces.get(session_id) if session_id is not None else None
+            if trace is not None:
+                trace.append({"name": name, "at": round(time.time(), 3), "ms": round(ms, 3)})
+        if trace is not None:
+            print(f"[trace {session_id}] {name}: {ms:.1f}ms")
+
+    @contextmanager
+    def span(self, name: str):
+        """计时一段代码（异常时同样记录）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def timed(self, name: str):
+        """装饰器：记录函数（同步或协程）每次调用的耗时"""
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def stopwatch(self, prefix: str) -> "Stopwatch":
+        return Stopwatch(self, prefix)
+
+    @contextmanager
+    def session(self, session_id: str):
+        """把其中执行的span归属到会话（追踪开启时记录明细）"""
+        token = _current_session.set(session_id)
+        try:
+            yield
+        finally:
+            _current_session.reset(token)
+
+    def enable_trace(self, session_id: str):
+        with self._lock:
+            if session_id not in self._traces:
+                self._traces[session_id] = deque(maxlen=self.trace_buffer_size)
+
+    def disable_trace(self, session_id: str) -> List[Dict]:
+        """关闭追踪，返回已记录的span"""
+        with self._lock:
+            return list(self._traces.pop(session_id, ()))
+
+    def is_tracing(self, session_id: str) -> bool:
+        return session_id in self._traces
+
+    def get_trace(self, session_id: str) -> Optional[List[Dict]]:
+        with self._lock:
+            trace = self._traces.get(session_id)
+            return list(trace) if trace is not None else None
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+                "spans": {name: histogram.summary() for name, histogram in sorted(self._histograms.items())},
+                "traced_sessions": sorted(self._traces)
+            }
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式：所有span共用一个直方图指标，按 span 标签区分（单位秒）"""
+        lines = ["# HELP weiqi_span_seconds Latency of instrumented stages",
+                 "# TYPE weiqi_span_seconds histogram"]
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'weiqi_span_seconds_bucket{{span="{name}",le="{bound / 1000:g}"}} {cumulative}')
+                lines.append(f'weiqi_span_seconds_bucket{{span="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'weiqi_span_seconds_sum{{span="{name}"}} {histogram.total / 1000:.6f}')
+                lines.append(f'weiqi_span_seconds_count{{span="{name}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+class Stopwatch:
+    """按顺序经过的各阶段计时：每次 lap(stage) 记录距上一次 lap 的耗时为 "<prefix>.<stage>"
+
+    适合在较长的函数里标出阶段边界，而不用把每一段都包进 with 语句。
+    """
+
+    def __init__(self, metrics: Metrics, prefix: str):
+        self.metrics = metrics
+        self.prefix = prefix
+        self._last = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self.metrics.observe(f"{self.prefix}.{stage}", (now - self._last) * 1000)
+        self._last = now
+
+
+metrics = Metrics()
@@ -0,0 +1,332 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .rules import GoBoard, color_value, BLACK
+from .symmetry import (
+    canonicalize_board, inverse_transform, transform_analysis, transform_move, transform_ownership
+)
+
+# 文件格式：头部 + 按键排序的索引 + JSON数据区
+#   头部: 魔数(8字节) 条目数(u32) 最大手数(u32)
+#   索引: 局面哈希(u64) 数据偏移(u32) 数据长度(u32)
+_MAGIC = b"WQBOOK01"
+_HEADER = struct.Struct("<8sII")
+_INDEX_RECORD = struct.Struct("<QII")
+
+DEFAULT_BOOK_PATH = os.getenv(
+    "OPENING_BOOK_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "opening_book.bin")
+)
+
+
+def position_key(board: List[List[int]], to_move, komi: float) -> Tuple[int, int]:
+    """计算对称规范化后的局面哈希，返回 (哈希, 当前局面到规范形式的变换)"""
+    canonical, transform = canonicalize_board(board)
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(canonical)
+    digest.update(bytes([color_value(to_move)]))
+    digest.update(f"{float(komi):.1f}".encode())
+    return struct.unpack("<Q", digest.digest())[0], transform
+
+
+def _entry_to_response(entry: Dict, transform: int, to_move: str, size: int = 19) -> Dict:
+    """把定式库中规范方向的条目还原为当前方向的KataGo格式响应"""
+    response = {
+        "id": "opening_book",
+        "isDuringSearch": False,
+        "moveInfos": entry.get("moveInfos", []),
+        "rootInfo": dict(entry.get("rootInfo", {}), currentPlayer=to_move),
+        "fromOpeningBook": True
+    }
+    quantized = entry.get("ownership")
+    if quantized and len(quantized) == size * size:
+        response["ownership"] = [value / 127.0 for value in quantized]
+    return transform_analysis(response, transform, size)
+
+
+class OpeningBook:
+    """开局定式库（只读，基于内存映射文件）
+
+    按对称规范化的局面哈希索引，查询时二分查找索引区，
+    只解析命中的那一条JSON数据，不需要把整个文件读入内存。
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.max_depth = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f"不是有效的定式库文件: {path}")
+        self._index_start = _HEADER.size
+
+    @classmethod
+    def get_shared(cls) -> Optional["OpeningBook"]:
+        """获取进程内共享的定式库实例，文件不存在时返回None"""
+        with cls._shared_lock:
+            if cls._shared is None and os.path.exists(DEFAULT_BOOK_PATH):
+                try:
+                    cls._shared = cls(DEFAULT_BOOK_PATH)
+                    print(f"📖 已加载开局定式库: {DEFAULT_BOOK_PATH}, {cls._shared.count} 个局面")
+                except Exception as e:
+                    print(f"加载开局定式库失败: {e}")
+            return cls._shared
+
+    def _find(self, key: int) -> Optional[Dict]:
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            record_key, offset, length = _INDEX_RECORD.unpack_from(
+                self._mmap, self._index_start + mid * _INDEX_RECORD.size
+            )
+            if record_key < key:
+                low = mid + 1
+            elif record_key > key:
+                high = mid
+            else:
+                return json.loads(self._mmap[offset:offset + length].decode("utf-8"))
+        return None
+
+    def lookup(self, board: List[List[int]], to_move, komi: float) -> Optional[Dict]:
+        """查询局面，命中时返回当前方向的KataGo格式响应"""
+        key, transform = position_key(board, to_move, komi)
+        entry = self._find(key)
+        if not entry or not entry.get("moveInfos"):
+            return None
+        player = "B" if color_value(to_move) == BLACK else "W"
+        return _entry_to_response(entry, inverse_transform(transform), player, len(board))
+
+    def lookup_moves(self, moves: List, komi: float) -> Optional[Dict]:
+        """按着法序列查询，超过定式库最大手数时直接返回None"""
+        if len(moves) > self.max_depth:
+            return None
+        try:
+            go_board = GoBoard.from_moves(moves)
+        except ValueError:
+            return None
+        to_move = "W" if moves and color_value(moves[-1][0]) == BLACK else "B"
+        return self.lookup(go_board.board, to_move, komi)
+
+    def entries(self):
+        """遍历全部条目（用于扩充定式库）"""
+        for i in range(self.count):
+            key, offset, length = _INDEX_RECORD.unpack_from(
+                self._mmap, self._index_start + i * _INDEX_RECORD.size
+            )
+            yield key, json.loads(self._mmap[offset:offset + length].decode("utf-8"))
+
+    def close(self):
+        try:
+            self._mmap.close()
+        except Exception:
+            pass
+        self._file.close()
+
+
+class OpeningBookBuilder:
+    """定式库构建器：从对局记录或引擎分析中收集开局局面并写出定式库文件"""
+
+    def __init__(self, max_depth: int = 30):
+        self.max_depth = max_depth
+        self.entries: Dict[int, Dict] = {}
+
+    def load(self, path: str):
+        """载入已有定式库，在其基础上扩充"""
+        book = OpeningBook(path)
+        try:
+            self.max_depth = max(self.max_depth, book.max_depth)
+            for key, entry in book.entries():
+                self.entries[key] = entry
+        finally:
+            book.close()
+
+    def add_position(self, moves: List, komi: float, response: Dict, count: int = 1) -> bool:
+        """加入一个局面的分析结果（KataGo响应格式，胜率为行棋方视角）"""
+        if len(moves) > self.max_depth or not response.get("moveInfos"):
+            return False
+        try:
+            go_board = GoBoard.from_moves(moves)
+        except ValueError:
+            return False
+        to_move = "W" if moves and color_value(moves[-1][0]) == BLACK else "B"
+        key, transform = position_key(go_board.board, to_move, komi)
+        entry = self._to_entry(moves, komi, response, transform)
+
+        existing = self.entries.get(key)
+        if existing is None:
+            entry["count"] = count
+            self.entries[key] = entry
+            return True
+        existing["count"] = existing.get("count", 1) + count
+        if entry["rootInfo"].get("visits", 0) > existing["rootInfo"].get("visits", 0):
+            entry["count"] = existing["count"]
+            self.entries[key] = entry
+        return True
+
+    def _to_entry(self, moves: List, komi: float, response: Dict, transform: int) -> Dict:
+        move_infos = []
+        for info in response.get("moveInfos", [])[:10]:
+            item = {
+                "move": transform_move(info["move"], transform),
+                "winrate": round(info.get("winrate", 0.5), 4),
+                "scoreLead": round(info.get("scoreLead", 0.0), 2),
+                "visits": info.get("visits", 0),
+                "order": info.get("order", len(move_infos))
+            }
+            if info.get("pv"):
+                item["pv"] = [transform_move(mv, transform) for mv in info["pv"][:10]]
+            move_infos.append(item)
+
+        root_info = response.get("rootInfo", {})
+        entry = {
+            "komi": float(komi),
+            "line": [[color, transform_move(move, transform)] for color, move in moves],
+            "moveInfos": move_infos,
+            "rootInfo": {
+                "winrate": round(root_info.get("winrate", move_infos[0]["winrate"]), 4),
+                "scoreLead": round(root_info.get("scoreLead", move_infos[0]["scoreLead"]), 2),
+                "visits": root_info.get("visits", sum(info["visits"] for info in move_infos))
+            }
+        }
+
+        ownership = response.get("ownership")
+        if ownership and len(ownership) == 19 * 19:
+            entry["ownership"] = [max(-127, min(127, int(round(value * 127))))
+                                  for value in transform_ownership(ownership, transform)]
+        return entry
+
+    def add_evolution_document(self, doc: Dict, komi: float = 6.5) -> int:
+        """从 game_evolution 集合的一局对局文档中收集开局局面，返回加入的局面数
+
+        贴目依次取每条记录的 komi、文档的 game_settings.komi，都没有时使用参数 komi。
+        """
+        added = 0
+        moves = []
+        doc_komi = (doc.get("game_settings") or {}).get("komi")
+        if doc_komi is None:
+            doc_komi = komi
+        for record in self._main_line_records(doc.get("evolution_data", [])):
+            move = record.get("move")
+            color = record.get("color")
+            if not move or not color:
+                break
+            moves.append(["B" if color_value(color) == BLACK else "W", move])
+            if len(moves) > self.max_depth:
+                break
+
+            recommended = record.get("recommended_moves") or []
+            if not recommended:
+                continue
+            winrate_data = record.get("winrate_data") or {}
+            to_move_black = moves[-1][0] == "W"
+            black_winrate = winrate_data.get("black_winrate", 50.0) / 100.0
+            response = {
+                "moveInfos": [
+                    {
+                        "move": item.get("move", ""),
+                        "winrate": item.get("winrate", 0.5),
+                        "scoreLead": item.get("score_lead", item.get("score_mean", 0.0)),
+                        "visits": item.get("visits", 0),
+                        "order": i
+                    }
+                    for i, item in enumerate(recommended) if item.get("move")
+                ],
+                "rootInfo": {
+                    "winrate": black_winrate if to_move_black else 1 - black_winrate,
+                    "scoreLead": winrate_data.get("score_lead", 0.0),
+                    "visits": sum(item.get("visits", 0) for item in recommended)
+                }
+            }
+            record_komi = record.get("komi")
+            if self.add_position(list(moves), doc_komi if record_komi is None else record_komi, response):
+                added += 1
+        return added
+
+    @staticmethod
+    def _main_line_records(records: List[Dict]) -> List[Dict]:
+        """按写入顺序重建最后走过的那条着法线
+
+        悔棋后重下、推演模式的变化分支都会留下同一手数的多条记录：
+        第n手的记录到来时，之前第n手及之后的记录属于被放弃的线，一并丢弃。
+        接不上当前线的记录（手数断档）跳过。
+        """
+        line = []
+        for record in records:
+            move_number = record.get("move_number", 0)
+            if move_number <= 0 or move_number > len(line) + 1:
+                continue
+            del line[move_number - 1:]
+            line.append(record)
+        return line
+
+    def add_from_mongodb(self, limit: int = 1000, komi: float = 6.5) -> int:
+        """从MongoDB的 game_evolution 集合批量收集开局局面（komi 用于没有记录贴目的旧对局）"""
+        from storage.mongodb_config import mongo_config
+        from storage.mongodb_schema import COLLECTION_NAMES
+
+        collection = mongo_config.get_collection(COLLECTION_NAMES["GAME_EVOLUTION"])
+        cursor = collection.find(
+            {"total_moves": {"$gt": 0}},
+            {"game_id": 1, "evolution_data": 1, "game_settings": 1}
+        ).sort("created_at", -1).limit(limit)
+
+        added = 0
+        for doc in cursor:
+            added += self.add_evolution_document(doc, komi)
+        return added
+
+    def analyze_with_engine(self, engine, max_visits: int = 400, komi: float = 6.5) -> int:
+        """用KataGo引擎重新分析定式库中访问次数不足的局面，并补充领地数据"""
+        analyzed = 0
+        for key, entry in list(self.entries.items()):
+            if entry.get("ownership") and entry["rootInfo"].get("visits", 0) >= max_visits:
+                continue
+            req = {
+                "id": engine.next_request_id("book"),
+                "rules": "Chinese",
+                "komi": entry.get("komi", komi),
+                "boardXSize": 19,
+                "boardYSize": 19,
+                "moves": entry["line"],
+                "maxVisits": int(max_visits),
+                "includeOwnership": True
+            }
+            try:
+                response = engine.query(req)
+            except RuntimeError as e:
+                print(f"定式库局面分析失败: {e}")
+                continue
+            # line 已经是规范方向，变换为恒等
+            new_entry = self._to_entry(entry["line"], entry.get("komi", komi), response, 0)
+            new_entry["count"] = entry.get("count", 1)
+            self.entries[key] = new_entry
+            analyzed += 1
+        return analyzed
+
+    def write(self, path: str):
+        """写出定式库文件"""
+        keys = sorted(self.entries)
+        payloads = [json.dumps(self.entries[key], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                    for key in keys]
+        offset = _HEADER.size + len(keys) * _INDEX_RECORD.size
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, len(keys), self.max_depth))
+            for key, payload in zip(keys, payloads):
+                f.write(_INDEX_RECORD.pack(key, offset, len(payload)))
+                offset += len(payload)
+            for payload in payloads:
+                f.write(payload)
+        os.replace(tmp_path, path)
+        print(f"📖 定式库已写出: {path}, {len(keys)} 个局面")
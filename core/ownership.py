@@ -0,0 +1,157 @@
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+# 领地判定阈值：|ownership| 超过该值算作一方领地，与局势演化存储原有的阈值一致
+TERRITORY_THRESHOLD = 0.6
+# int8 量化的比例，-1~1 映射为 -127~127
+QUANTIZE_SCALE = 127
+
+
+class Ownership:
+    """KataGo ownership 数据（黑棋视角，-1~1）
+
+    内部以 float32 的二维数组保存，方向与棋盘一致：values[row][col] 对应 board[row][col]，
+    row=0 为第1行。KataGo 的一维数组从第19行开始排列，构造时统一翻转，
+    阈值、计数、量化和差异都在数组上整体计算，不再逐点循环。
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, values: np.ndarray):
+        self.values = np.asarray(values, dtype=np.float32)
+
+    @classmethod
+    def from_katago(cls, ownership: Iterable[float], size: int = 19) -> Optional["Ownership"]:
+        """从KataGo返回的一维数组构造，长度不符时返回None"""
+        if ownership is None:
+            return None
+        values = np.asarray(ownership, dtype=np.float32)
+        if values.size != size * size:
+            return None
+        return cls(values.reshape(size, size)[::-1])
+
+    @classmethod
+    def from_analysis(cls, analysis_result: Optional[Dict], size: int = 19,
+                      to_move: Optional[str] = None) -> Optional["Ownership"]:
+        """从分析结果中取出ownership并转为黑棋视角，没有时返回None
+
+        Args:
+            to_move: 分析局面的行棋方，结果的 rootInfo 中没有 currentPlayer 时使用
+        """
+        if not analysis_result:
+            return None
+        return cls.from_katago(black_view(analysis_result, to_move), size)
+
+    @classmethod
+    def from_rows(cls, rows: List[List[float]]) -> "Ownership":
+        """从棋盘方向的二维列表构造"""
+        return cls(np.asarray(rows, dtype=np.float32))
+
+    @classmethod
+    def from_quantized(cls, data: Union[bytes, List[int], np.ndarray], size: int = 19) -> "Ownership":
+        """从 quantize()/to_bytes() 的结果还原"""
+        if isinstance(data, (bytes, bytearray)):
+            quantized = np.frombuffer(data, dtype=np.int8)
+        else:
+            quantized = np.asarray(data, dtype=np.int8)
+        return cls(quantized.reshape(size, size).astype(np.float32) / QUANTIZE_SCALE)
+
+    @property
+    def size(self) -> int:
+        return self.values.shape[0]
+
+    def __getitem__(self, point) -> float:
+        row, col = point
+        return float(self.values[row, col])
+
+    def to_rows(self, decimals: Optional[int] = None) -> List[List[float]]:
+        """棋盘方向的二维列表（用于JSON）"""
+        if decimals is None:
+            return self.values.tolist()
+        return np.round(self.values.astype(np.float64), decimals).tolist()
+
+    def to_katago(self) -> List[float]:
+        """还原为KataGo顺序的一维列表"""
+        return self.values[::-1].ravel().tolist()
+
+    def quantize(self) -> np.ndarray:
+        """int8 量化（棋盘方向），精度约0.008，体积为float列表的几十分之一"""
+        return np.clip(np.rint(self.values * QUANTIZE_SCALE), -QUANTIZE_SCALE, QUANTIZE_SCALE).astype(np.int8)
+
+    def to_bytes(self) -> bytes:
+        return self.quantize().tobytes()
+
+    def territory(self, threshold: float = TERRITORY_THRESHOLD) -> np.ndarray:
+        """领地归属：1 为黑棋，-1 为白棋，0 为中立"""
+        result = np.zeros(self.values.shape, dtype=np.int8)
+        result[self.values > threshold] = 1
+        result[self.values < -threshold] = -1
+        return result
+
+    def counts(self, threshold: float = TERRITORY_THRESHOLD) -> Dict[str, int]:
+        """双方领地点数（包括棋子所在的点）"""
+        black = int(np.count_nonzero(self.values > threshold))
+        white = int(np.count_nonzero(self.values < -threshold))
+        return {"black": black, "white": white, "neutral": self.values.size - black - white}
+
+    def territory_points(self, threshold: float = TERRITORY_THRESHOLD) -> Dict[str, List[List[int]]]:
+        """按归属列出坐标 [row, col]，格式与局势演化存储的 territory_prediction 一致"""
+        territory = self.territory(threshold)
+        return {
+            "black_territory": np.argwhere(territory == 1).tolist(),
+            "white_territory": np.argwhere(territory == -1).tolist(),
+            "neutral_points": np.argwhere(territory == 0).tolist()
+        }
+
+    def diff(self, previous: "Ownership", threshold: float = TERRITORY_THRESHOLD,
+             min_delta: float = 0.3) -> Dict:
+        """与之前局面比较：哪些点的归属发生了变化，以及黑棋的期望目数变化
+
+        Args:
+            previous: 之前局面的ownership
+            min_delta: 数值变化超过该值的点列入 swings（归属未变但把握明显变化）
+        """
+        delta = self.values - previous.values
+        before, after = previous.territory(threshold), self.territory(threshold)
+        changed = np.argwhere(before != after)
+        swings = np.argwhere(np.abs(delta) >= min_delta)
+        return {
+            "changed": [
+                {"position": [int(row), int(col)], "from": int(before[row, col]), "to": int(after[row, col])}
+                for row, col in changed
+            ],
+            "swings": swings.tolist(),
+            "black_gain": round(float(delta.sum()), 2),
+            "max_delta": round(float(np.abs(delta).max()), 2) if delta.size else 0.0
+        }
+
+
+def black_view(analysis_result: Optional[Dict], to_move: Optional[str] = None) -> Optional[List[float]]:
+    """分析结果中黑棋视角的ownership（KataGo顺序的一维列表）
+
+    KataGo 配置 reportAnalysisWinratesAs = SIDETOMOVE，ownership 与胜率一样是行棋方视角，
+    白棋行棋时取反。行棋方优先取 rootInfo.currentPlayer，没有时使用 to_move。
+    """
+    if not analysis_result or analysis_result.get("ownership") is None:
+        return None
+    ownership = analysis_result["ownership"]
+    player = (analysis_result.get("rootInfo") or {}).get("currentPlayer") or to_move or "B"
+    if player.upper().startswith("W"):
+        return [-value for value in ownership]
+    return list(ownership)
+
+
+def policy_heatmap(policy: Iterable[float], size: int = 19) -> Optional[Dict]:
+    """把KataGo的policy（与ownership同样的顺序，末尾一项为pass，非法点为-1）转换为棋盘方向的概率热力图"""
+    if policy is None:
+        return None
+    values = np.asarray(policy, dtype=np.float64)
+    if values.size != size * size + 1:
+        return None
+    heatmap = np.clip(values[:-1].reshape(size, size)[::-1], 0.0, None)
+    return {
+        "heatmap": np.round(heatmap, 4).tolist(),
+        "pass": round(max(float(values[-1]), 0.0), 4),
+        "max": round(float(heatmap.max()), 4)
+    }
@@ -0,0 +1,212 @@
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List
+
+from .key_moments import WINRATE_LOSS_THRESHOLDS, classify_loss
+from .ownership import black_view
+from .rules import GoBoard
+from .sgf_utils import parse_sgf
+
+# 每累计多少个回合结果写一次存储
+RESULT_FLUSH_SIZE = 16
+
+
+def build_turn_record(turn: int, moves: List, analysis_result: Dict) -> Dict:
+    """把一个回合的分析结果整理为复盘记录（胜率、目差和ownership统一为黑棋视角）"""
+    root_info = analysis_result.get("rootInfo", {})
+    winrate = root_info.get("winrate", 0.5)
+    score_lead = root_info.get("scoreLead", 0.0)
+    to_move = "B" if turn == 0 or moves[turn - 1][0] == "W" else "W"
+    if to_move == "B":
+        black_winrate, black_score = winrate * 100, score_lead
+    else:
+        black_winrate, black_score = (1 - winrate) * 100, -score_lead
+
+    record = {
+        "turn": turn,
+        "move": moves[turn - 1][1] if turn else None,
+        "color": moves[turn - 1][0] if turn else None,
+        "black_winrate": round(black_winrate, 2),
+        "white_winrate": round(100 - black_winrate, 2),
+        "score_lead": round(black_score, 2),
+        "visits": root_info.get("visits", 0),
+        "top_moves": [
+            {
+                "move": info.get("move", ""),
+                "visits": info.get("visits", 0),
+                "winrate": info.get("winrate", 0),
+                "score_lead": info.get("scoreLead", 0),
+                "pv": info.get("pv", [])[:8]
+            }
+            for info in analysis_result.get("moveInfos", [])[:5]
+        ]
+    }
+    if "ownership" in analysis_result:
+        record["ownership"] = [round(value, 2) for value in black_view(analysis_result, to_move)]
+    return record
+
+
+def summarize_review(results: Dict[int, Dict]) -> Dict:
+    """根据相邻回合的胜率变化标记问题手，并统计双方的问题手数量"""
+    mistakes = []
+    counts = {"B": {label: 0 for _, label in WINRATE_LOSS_THRESHOLDS},
+              "W": {label: 0 for _, label in WINRATE_LOSS_THRESHOLDS}}
+    for turn in sorted(results):
+        if turn == 0 or turn - 1 not in results:
+            continue
+        record, previous = results[turn], results[turn - 1]
+        if record["move"] is None:
+            continue
+        before = previous["black_winrate"] if record["color"] == "B" else previous["white_winrate"]
+        after = record["black_winrate"] if record["color"] == "B" else record["white_winrate"]
+        label = classify_loss(before - after)
+        if label:
+            counts[record["color"]][label] += 1
+            mistakes.append({
+                "turn": turn,
+                "move": record["move"],
+                "color": record["color"],
+                "winrate_loss": round(before - after, 2),
+                "label": label,
+                "best_move": previous["top_moves"][0]["move"] if previous.get("top_moves") else None
+            })
+    return {"turns": len(results), "mistakes": mistakes, "mistake_counts": counts}
+
+
+class ReviewWorkerPool:
+    """复盘任务工作线程池
+
+    多个工作线程共享同一个KataGo引擎，各自从任务存储领取任务，
+    每局棋用一次 analyzeTurns 查询分析缺失的回合，结果分批写回存储并续租。
+    任务中断（进程重启、工作线程异常）后可由任何工作线程接着完成剩余回合。
+    """
+
+    def __init__(self, store, engine_factory: Callable, workers: int = 2,
+                 lease_seconds: float = 120.0, poll_interval: float = 1.0):
+        self.store = store
+        self.engine_factory = engine_factory
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.engine = None
+        self._engine_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self.worker_prefix = f"worker_{uuid.uuid4().hex[:6]}"
+
+    def start(self):
+        """启动工作线程（重复调用安全）"""
+        if any(thread.is_alive() for thread in self._threads):
+            self._wakeup.set()
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run, args=(f"{self.worker_prefix}_{index}",), daemon=True)
+            for index in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        print(f"复盘任务工作线程已启动: {self.workers} 个")
+
+    def notify(self):
+        """有新任务提交时唤醒空闲的工作线程"""
+        self._wakeup.set()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+
+    def _get_engine(self):
+        with self._engine_lock:
+            if self.engine is None or not self.engine.is_alive():
+                engine = self.engine_factory()
+                engine.start()
+                self.engine = engine
+            return self.engine
+
+    def _run(self, worker_id: str):
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim(worker_id, self.lease_seconds)
+            except Exception as e:
+                print(f"领取复盘任务失败: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            try:
+                self.process_job(job)
+            except Exception as e:
+                print(f"复盘任务 {job['job_id']} 失败: {e}")
+                self.store.fail(job["job_id"], str(e))
+
+    def process_job(self, job: Dict):
+        """分析一局棋的全部缺失回合并写入结果"""
+        job_id = job["job_id"]
+        game_info = parse_sgf(job["sgf"])
+        if game_info["size"] != 19:
+            raise ValueError(f"不支持的棋盘大小: {game_info['size']}")
+        moves = game_info["moves"]
+        komi = game_info["komi"] if game_info["komi"] is not None else 6.5
+
+        # 本地重放校验着法合法性，避免把整个批量查询浪费在非法棋谱上
+        go_board = GoBoard()
+        for turn, (color, move) in enumerate(moves, 1):
+            try:
+                go_board.play(move, color)
+            except ValueError as e:
+                raise ValueError(f"第{turn}手着法非法: {color} {move} ({e})")
+
+        total_turns = len(moves) + 1
+        results = self.store.get_results(job_id)
+        missing = [turn for turn in range(total_turns) if turn not in results]
+        completed = total_turns - len(missing)
+        self.store.update_progress(job_id, completed, total_turns, self.lease_seconds)
+        print(f"开始复盘 {job_id}: {len(moves)} 手，待分析 {len(missing)} 个回合")
+
+        if missing:
+            engine = self._get_engine()
+            req = {
+                "id": engine.next_request_id(f"review_{job_id}"),
+                "moves": moves,
+                "rules": "Chinese" if (game_info["rules"] or "chinese") == "chinese" else "Japanese",
+                "komi": komi,
+                "boardXSize": 19,
+                "boardYSize": 19,
+                "maxVisits": int(job.get("max_visits") or 200),
+                "includeOwnership": True,
+                "analyzeTurns": missing
+            }
+            pending: Dict[int, Dict] = {}
+            started = time.time()
+            for msg in engine.analyze_turns(req, timeout=max(120.0, len(missing) * 5.0)):
+                if self._stop.is_set():
+                    break
+                turn = msg.get("turnNumber", 0)
+                record = build_turn_record(turn, moves, msg)
+                pending[turn] = record
+                results[turn] = record
+                completed += 1
+                if len(pending) >= RESULT_FLUSH_SIZE:
+                    self.store.save_results(job_id, pending)
+                    self.store.update_progress(job_id, completed, total_turns, self.lease_seconds)
+                    pending = {}
+            self.store.save_results(job_id, pending)
+            self.store.update_progress(job_id, completed, total_turns, self.lease_seconds)
+            if self._stop.is_set():
+                # 服务停止，剩余回合留给下次领取（租约到期后）
+                return
+            elapsed = time.time() - started
+            print(f"复盘 {job_id} 分析完成: {len(missing)} 个回合，{len(missing) / max(elapsed, 1e-6):.1f} 回合/秒")
+
+        summary = summarize_review(results)
+        summary.update({"moves": len(moves), "komi": komi, "rules": game_info["rules"] or "chinese"})
+        self.store.complete(job_id, summary)
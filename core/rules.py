@@ -0,0 +1,210 @@
+from typing import Iterable, List, Optional, Set, Tuple
+
+# 棋盘坐标：列用A-T（跳过I），行用1-19；内部坐标 board[row][col]，row=0 对应第1行
+COL_LETTERS = "ABCDEFGHJKLMNOPQRST"
+EMPTY, BLACK, WHITE = 0, 1, 2
+
+
+def color_value(color) -> int:
+    """把 "B"/"W"/"black"/"white"/1/2 统一转换为棋盘数值"""
+    if color in (BLACK, WHITE):
+        return color
+    if isinstance(color, str) and color[:1].upper() in ("B", "W"):
+        return BLACK if color[:1].upper() == "B" else WHITE
+    raise ValueError(f"无效的棋子颜色: {color}")
+
+
+def parse_point(move: str, size: int = 19) -> Optional[Tuple[int, int]]:
+    """把 "D4" 这样的着法转换为 (row, col)，pass 返回 None
+
+    Raises:
+        ValueError: 着法格式无效
+    """
+    move = move.strip().upper()
+    if move in ("PASS", ""):
+        return None
+    if len(move) < 2 or move[0] not in COL_LETTERS[:size]:
+        raise ValueError(f"无效的着法: {move}")
+    col = COL_LETTERS.index(move[0])
+    row = int(move[1:]) - 1
+    if not (0 <= row < size):
+        raise ValueError(f"无效的着法: {move}")
+    return row, col
+
+
+def format_point(row: int, col: int) -> str:
+    """把 (row, col) 转换为 "D4" 这样的着法"""
+    return f"{COL_LETTERS[col]}{row + 1}"
+
+
+def ownership_index(row: int, col: int, size: int = 19) -> int:
+    """棋盘坐标在KataGo一维数组（ownership/policy）中的下标
+
+    KataGo的数组从棋盘最上方一行（第19行）开始逐行排列。
+    """
+    return (size - 1 - row) * size + col
+
+
+class GoBoard:
+    """轻量的围棋规则引擎
+
+    不依赖KataGo和数据库，用于本地重放着法、合法性判断和离线工具。
+    提子、自杀和单劫规则与 WeiQiGame 保持一致。
+    """
+
+    def __init__(self, size: int = 19, board: List[List[int]] = None):
+        self.size = size
+        self.board = [row[:] for row in board] if board else [[EMPTY] * size for _ in range(size)]
+        self.ko_point: Optional[Tuple[int, int]] = None
+        self.captured_black = 0  # 被提取的黑子数
+        self.captured_white = 0  # 被提取的白子数
+
+    @classmethod
+    def from_moves(cls, moves: Iterable, size: int = 19) -> "GoBoard":
+        """按着法序列 [[颜色, 着法], ...] 重放得到局面，非法着法会抛出ValueError"""
+        go_board = cls(size)
+        for color, move in moves:
+            go_board.play(move, color)
+        return go_board
+
+    def copy(self) -> "GoBoard":
+        other = GoBoard(self.size, self.board)
+        other.ko_point = self.ko_point
+        other.captured_black = self.captured_black
+        other.captured_white = self.captured_white
+        return other
+
+    def neighbors(self, row: int, col: int) -> List[Tuple[int, int]]:
+        result = []
+        for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            nr, nc = row + dr, col + dc
+            if 0 <= nr < self.size and 0 <= nc < self.size:
+                result.append((nr, nc))
+        return result
+
+    def group_and_liberties(self, row: int, col: int) -> Tuple[Set[Tuple[int, int]], Set[Tuple[int, int]]]:
+        """获取 (row, col) 所在的棋子组及其气"""
+        color = self.board[row][col]
+        if color == EMPTY:
+            return set(), set()
+        group = {(row, col)}
+        liberties = set()
+        stack = [(row, col)]
+        while stack:
+            r, c = stack.pop()
+            for nr, nc in self.neighbors(r, c):
+                value = self.board[nr][nc]
+                if value == EMPTY:
+                    liberties.add((nr, nc))
+                elif value == color and (nr, nc) not in group:
+                    group.add((nr, nc))
+                    stack.append((nr, nc))
+        return group, liberties
+
+    def label_groups(self) -> Tuple[List[List[int]], List[int]]:
+        """一次遍历标记全部棋块
+
+        Returns:
+            (labels, liberty_counts)：labels[row][col] 为棋块编号（空点为-1），
+            liberty_counts[编号] 为该棋块的气数
+        """
+        size = self.size
+        labels = [[-1] * size for _ in range(size)]
+        liberty_counts: List[int] = []
+        for row in range(size):
+            for col in range(size):
+                color = self.board[row][col]
+                if color == EMPTY or labels[row][col] != -1:
+                    continue
+                label = len(liberty_counts)
+                labels[row][col] = label
+                liberties = set()
+                stack = [(row, col)]
+                while stack:
+                    r, c = stack.pop()
+                    for nr, nc in self.neighbors(r, c):
+                        value = self.board[nr][nc]
+                        if value == EMPTY:
+                            liberties.add((nr, nc))
+                        elif value == color and labels[nr][nc] == -1:
+                            labels[nr][nc] = label
+                            stack.append((nr, nc))
+                liberty_counts.append(len(liberties))
+        return labels, liberty_counts
+
+    def legal_mask(self, color) -> List[List[int]]:
+        """整盘的合法着点（1 合法，0 不合法），规则与 is_legal 相同
+
+        先一次性标记棋块和气数，每个空点只需查看四个相邻点，不用逐点模拟落子。
+        """
+        color = color_value(color)
+        opponent = 3 - color
+        labels, liberty_counts = self.label_groups()
+        mask = [[0] * self.size for _ in range(self.size)]
+        for row in range(self.size):
+            for col in range(self.size):
+                if self.board[row][col] != EMPTY or self.ko_point == (row, col):
+                    continue
+                for nr, nc in self.neighbors(row, col):
+                    value = self.board[nr][nc]
+                    if (value == EMPTY
+                            or (value == color and liberty_counts[labels[nr][nc]] > 1)
+                            or (value == opponent and liberty_counts[labels[nr][nc]] == 1)):
+                        mask[row][col] = 1
+                        break
+        return mask
+
+    def is_legal(self, row: int, col: int, color) -> bool:
+        """判断着法是否合法（空点、非打劫禁着、非自杀）"""
+        color = color_value(color)
+        if self.board[row][col] != EMPTY or self.ko_point == (row, col):
+            return False
+        opponent = 3 - color
+        for nr, nc in self.neighbors(row, col):
+            value = self.board[nr][nc]
+            if value == EMPTY:
+                return True
+            _, liberties = self.group_and_liberties(nr, nc)
+            if value == color and len(liberties) > 1:
+                return True
+            if value == opponent and len(liberties) == 1:
+                return True
+        return False
+
+    def play(self, move: str, color) -> List[Tuple[int, int]]:
+        """落子并提子，返回被提取的棋子坐标
+
+        Raises:
+            ValueError: 着法无效或不合法
+        """
+        color = color_value(color)
+        point = parse_point(move, self.size)
+        if point is None:
+            self.ko_point = None
+            return []
+        row, col = point
+        if not self.is_legal(row, col, color):
+            raise ValueError(f"不合法的着法: {move}")
+
+        self.board[row][col] = color
+        opponent = 3 - color
+        captured = []
+        for nr, nc in self.neighbors(row, col):
+            if self.board[nr][nc] == opponent:
+                group, liberties = self.group_and_liberties(nr, nc)
+                if not liberties:
+                    for gr, gc in group:
+                        self.board[gr][gc] = EMPTY
+                    captured.extend(group)
+        if opponent == BLACK:
+            self.captured_black += len(captured)
+        else:
+            self.captured_white += len(captured)
+
+        # 单子提单子且落子后只剩一口气时形成劫
+        self.ko_point = None
+        if len(captured) == 1:
+            group, liberties = self.group_and_liberties(row, col)
+            if len(group) == 1 and len(liberties) == 1:
+                self.ko_point = captured[0]
+        return captured
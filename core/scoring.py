@@ -0,0 +1,169 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .ownership import Ownership
+from .rules import BLACK, EMPTY, WHITE, GoBoard
+
+Point = Tuple[int, int]
+
+# 整块棋子的平均ownership偏向对方超过该值时判为死子
+DEAD_STONE_THRESHOLD = 0.5
+
+
+def find_dead_stones(board: List[List[int]], ownership: List[float],
+                     threshold: float = DEAD_STONE_THRESHOLD) -> Set[Point]:
+    """根据KataGo的ownership（KataGo顺序的一维数组）按块标记死子
+
+    以整块棋子的平均值判断，避免同一块棋一部分算活一部分算死。
+    """
+    size = len(board)
+    values = Ownership.from_katago(ownership, size)
+    if values is None:
+        return set()
+
+    go_board = GoBoard(size, board)
+    dead: Set[Point] = set()
+    visited: Set[Point] = set()
+    for row in range(size):
+        for col in range(size):
+            color = board[row][col]
+            if color == EMPTY or (row, col) in visited:
+                continue
+            group, _ = go_board.group_and_liberties(row, col)
+            visited |= group
+            rows, cols = zip(*group)
+            average = float(values.values[list(rows), list(cols)].mean())
+            # ownership 为黑棋视角：黑棋块偏负、白棋块偏正即为死子
+            if (color == BLACK and average < -threshold) or (color == WHITE and average > threshold):
+                dead |= group
+    return dead
+
+
+def _regions(board: List[List[int]]):
+    """对空点做一次洪水填充，产出 (区域点集, 接触到的棋子颜色集合)"""
+    size = len(board)
+    seen = [[False] * size for _ in range(size)]
+    for row in range(size):
+        for col in range(size):
+            if board[row][col] != EMPTY or seen[row][col]:
+                continue
+            region = []
+            borders = set()
+            stack = [(row, col)]
+            seen[row][col] = True
+            while stack:
+                r, c = stack.pop()
+                region.append((r, c))
+                for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                    if 0 <= nr < size and 0 <= nc < size:
+                        value = board[nr][nc]
+                        if value == EMPTY:
+                            if not seen[nr][nc]:
+                                seen[nr][nc] = True
+                                stack.append((nr, nc))
+                        else:
+                            borders.add(value)
+            yield region, borders
+
+
+def _territory(board: List[List[int]]) -> Tuple[List[List[str]], int, int]:
+    """按区域归属生成领地图（"B"/"W"/"?"，棋子所在点标为棋子颜色），返回 (领地图, 黑空, 白空)"""
+    territory_map = [["B" if v == BLACK else "W" if v == WHITE else "?" for v in row] for row in board]
+    black_territory = white_territory = 0
+    for region, borders in _regions(board):
+        if borders == {BLACK}:
+            owner = "B"
+            black_territory += len(region)
+        elif borders == {WHITE}:
+            owner = "W"
+            white_territory += len(region)
+        else:
+            continue
+        for r, c in region:
+            territory_map[r][c] = owner
+    return territory_map, black_territory, white_territory
+
+
+def _remove_dead(board: List[List[int]], dead_stones: Iterable[Point]) -> Tuple[List[List[int]], int, int]:
+    cleared = [row[:] for row in board]
+    dead_black = dead_white = 0
+    for r, c in dead_stones:
+        if cleared[r][c] == BLACK:
+            dead_black += 1
+        elif cleared[r][c] == WHITE:
+            dead_white += 1
+        cleared[r][c] = EMPTY
+    return cleared, dead_black, dead_white
+
+
+def score_area(board: List[List[int]], komi: float, dead_stones: Iterable[Point] = ()) -> Dict:
+    """数子法（Tromp-Taylor）：提掉死子后，盘上棋子 + 只与一方相邻的空点"""
+    cleared, dead_black, dead_white = _remove_dead(board, dead_stones)
+    territory_map, black_territory, white_territory = _territory(cleared)
+    black_stones = sum(row.count(BLACK) for row in cleared)
+    white_stones = sum(row.count(WHITE) for row in cleared)
+    black_score = black_stones + black_territory
+    white_score = white_stones + white_territory + komi
+    return {
+        "scoring": "area",
+        "black_stones": black_stones,
+        "white_stones": white_stones,
+        "black_territory": black_territory,
+        "white_territory": white_territory,
+        "dead_black": dead_black,
+        "dead_white": dead_white,
+        "black_score": black_score,
+        "white_score": white_score,
+        "territory_map": territory_map
+    }
+
+
+def score_territory(board: List[List[int]], komi: float, captured_black: int = 0,
+                    captured_white: int = 0, dead_stones: Iterable[Point] = ()) -> Dict:
+    """数目法（日本规则）：围住的空点 + 提子 + 死子
+
+    captured_black/captured_white 为对局中被提走的黑子/白子数（与 WeiQiGame 的计数一致）。
+    双活中的空点计为中立（与黑白双方都相邻），但双活棋块内部的眼位按简化处理算作领地。
+    """
+    cleared, dead_black, dead_white = _remove_dead(board, dead_stones)
+    territory_map, black_territory, white_territory = _territory(cleared)
+    # 黑棋的俘虏 = 提走的白子 + 盘上的白死子，白棋同理
+    black_prisoners = captured_white + dead_white
+    white_prisoners = captured_black + dead_black
+    return {
+        "scoring": "territory",
+        "black_territory": black_territory,
+        "white_territory": white_territory,
+        "black_prisoners": black_prisoners,
+        "white_prisoners": white_prisoners,
+        "dead_black": dead_black,
+        "dead_white": dead_white,
+        "black_score": black_territory + black_prisoners,
+        "white_score": white_territory + white_prisoners + komi,
+        "territory_map": territory_map
+    }
+
+
+def score_game(board: List[List[int]], komi: float, rules: str = "chinese",
+               captured_black: int = 0, captured_white: int = 0,
+               ownership: Optional[List[float]] = None) -> Dict:
+    """终局点目：按规则选择数子法或数目法，死子来自ownership（没有时视为全部活棋）"""
+    dead_stones = find_dead_stones(board, ownership) if ownership else set()
+    if rules == "japanese":
+        result = score_territory(board, komi, captured_black, captured_white, dead_stones)
+    else:
+        result = score_area(board, komi, dead_stones)
+
+    # 数子法不计提子，仍然带上提子数便于前端展示
+    result.setdefault("black_prisoners", captured_white)
+    result.setdefault("white_prisoners", captured_black)
+    difference = result["black_score"] - result["white_score"]
+    result.update({
+        "rules": rules,
+        "komi": komi,
+        "black_score": round(result["black_score"], 1),
+        "white_score": round(result["white_score"], 1),
+        "score_difference": round(abs(difference), 1),
+        "winner": "黑棋" if difference > 0 else "白棋" if difference < 0 else "和棋",
+        "dead_stones": sorted([r, c] for r, c in dead_stones)
+    })
+    return result
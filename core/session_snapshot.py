@@ -0,0 +1,93 @@
+from typing import Dict, List
+
+from .game_tree import GameTree
+from .rules import GoBoard
+
+# 快照格式版本，结构变化时递增
+SNAPSHOT_FORMAT = 1
+
+# 直接保存的游戏设置
+SETTING_FIELDS = ("game_id", "player_color", "ai_time_limit", "suggestion_ai_time_limit", "komi", "rules",
+                  "game_over", "current_player")
+
+
+def encode_moves(moves) -> str:
+    """着法序列压缩为 "BQ16 WD4 Bpass" 形式的字符串"""
+    return " ".join(f"{color}{move}" for color, move in moves)
+
+
+def decode_moves(text: str) -> List[List[str]]:
+    return [[item[0], item[1:]] for item in text.split()] if text else []
+
+
+def snapshot_game(game, session_active: bool = False) -> Dict:
+    """生成会话快照：着法、设置和胜率历史，棋盘等可以重放得到的状态不保存
+
+    推演模式额外保存变化树（每个节点只有父节点和一手棋）和各节点缓存的分析结果。
+    """
+    snapshot = {
+        "format": SNAPSHOT_FORMAT,
+        "mode": "analysis" if hasattr(game, "tree") else "human_vs_ai",
+        "session_active": bool(session_active),
+        "settings": {field: getattr(game, field) for field in SETTING_FIELDS if hasattr(game, field)},
+        "moves": encode_moves(game.moves)
+    }
+    if hasattr(game, "tree"):
+        tree = game.tree
+        line = tree.line()
+        snapshot["tree"] = {
+            "nodes": [[node.node_id, node.parent.node_id, node.color, node.move]
+                      for node in tree.nodes.values() if node.parent is not None],
+            "current": tree.current.node_id,
+            "line_end": line[-1].node_id if line else 0,
+            "analysis": {str(node.node_id): node.analysis for node in tree.nodes.values() if node.analysis}
+        }
+    else:
+        snapshot["winrate_history"] = game.winrate_history
+    return snapshot
+
+
+def apply_snapshot(game, snapshot: Dict) -> None:
+    """把快照恢复到新建的游戏实例上（在本地按规则重放，不请求分析）
+
+    Raises:
+        ValueError: 快照格式不支持或着法无法重放
+    """
+    if snapshot.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"不支持的会话快照格式: {snapshot.get('format')}")
+    settings = snapshot.get("settings", {})
+    for field in SETTING_FIELDS:
+        if field in settings and field != "current_player":
+            setattr(game, field, settings[field])
+    if "game_id" in settings and hasattr(game, "bind_evolution_storage"):
+        # 新建实例的局势演化存储按构造时生成的 game_id 创建，换成恢复的 game_id
+        game.bind_evolution_storage()
+
+    if "tree" in snapshot and hasattr(game, "tree"):
+        data = snapshot["tree"]
+        tree = GameTree.from_docs(
+            {"id": node_id, "parent": parent, "color": color, "move": move}
+            for node_id, parent, color, move in data["nodes"])
+        for node_id, analysis in data.get("analysis", {}).items():
+            if int(node_id) in tree.nodes:
+                tree.nodes[int(node_id)].analysis = analysis
+        if data.get("line_end") in tree.nodes:
+            tree.goto(data["line_end"])
+        game.tree = tree
+        if not game._load_node(tree.goto(data["current"] if data.get("current") in tree.nodes else 0)):
+            raise ValueError("变化树重放失败")
+    else:
+        moves = decode_moves(snapshot.get("moves", ""))
+        go_board = GoBoard.from_moves(moves, getattr(game, "board_size", 19))
+        game.board = go_board.board
+        game.captured_black = go_board.captured_black
+        game.captured_white = go_board.captured_white
+        game.ko_position = go_board.ko_point
+        game.board_history = []
+        game.moves = moves
+        game.winrate_history = list(snapshot.get("winrate_history", []))
+        if hasattr(game, "update_key_moments"):
+            game.update_key_moments(persist=False)
+    if "current_player" in settings:
+        # 推演模式可以手动切换轮到的一方，以保存的为准
+        game.current_player = settings["current_player"]
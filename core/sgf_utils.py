@@ -0,0 +1,67 @@
+from typing import Dict, List, Optional
+
+from .rules import format_point
+
+try:
+    from sgfmill import sgf
+except ImportError:
+    sgf = None
+
+
+def normalize_rules(rules: Optional[str]) -> Optional[str]:
+    """把SGF的RU属性映射为本项目的规则名，无法识别时返回None"""
+    if not rules:
+        return None
+    rules = rules.lower()
+    if 'chinese' in rules or 'cn' in rules:
+        return 'chinese'
+    if 'japanese' in rules or 'jp' in rules:
+        return 'japanese'
+    return None
+
+
+def parse_sgf(sgf_content) -> Dict:
+    """解析SGF主分支
+
+    Returns:
+        {"size": 棋盘大小, "komi": 贴目或None, "rules": 规则或None,
+         "moves": [["B", "Q16"], ["W", "pass"], ...]}
+
+    Raises:
+        RuntimeError: 未安装sgfmill
+        ValueError: SGF内容无法解析
+    """
+    if sgf is None:
+        raise RuntimeError("SGF库未安装，无法解析SGF文件")
+    if isinstance(sgf_content, bytes):
+        sgf_content = sgf_content.decode('utf-8', errors='replace')
+
+    game_tree = sgf.Sgf_game.from_string(sgf_content)
+    root_node = game_tree.get_root()
+
+    komi = None
+    try:
+        if root_node.has_property('KM'):
+            komi = float(root_node.get('KM'))
+    except (KeyError, ValueError):
+        pass
+
+    rules = None
+    if root_node.has_property('RU'):
+        rules = normalize_rules(root_node.get('RU'))
+
+    moves: List[List[str]] = []
+    for node in game_tree.get_main_sequence()[1:]:
+        color, point = node.get_move()
+        if color is None:
+            continue
+        # sgfmill 的坐标为 (行, 列)，行从棋盘下方数起，与本项目的 board[row][col] 一致
+        move = "pass" if point is None else format_point(point[0], point[1])
+        moves.append([color.upper(), move])
+
+    return {
+        "size": game_tree.get_size(),
+        "komi": komi,
+        "rules": rules,
+        "moves": moves
+    }
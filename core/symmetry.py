@@ -0,0 +1,142 @@
+"""
+棋盘八种对称变换（旋转/翻转）
+
+局面的对称形式在分析上完全等价（例如星位开局 Q16 与 D4），
+把局面映射到规范形式后再做缓存/定式库查询，命中率最多可提高8倍；
+查到的结果再用逆变换还原到实际方向。
+
+变换编号 0-7：bit2 表示先沿主对角线转置，bit0 上下翻转，bit1 左右翻转。
+"""
+
+from typing import Dict, List, Tuple
+
+from .rules import format_point, ownership_index, parse_point
+
+IDENTITY = 0
+TRANSFORMS = tuple(range(8))
+
+
+def transform_point(row: int, col: int, transform: int, size: int = 19) -> Tuple[int, int]:
+    """对棋盘坐标 (row, col) 做对称变换"""
+    n = size - 1
+    if transform & 4:
+        row, col = col, row
+    if transform & 1:
+        row = n - row
+    if transform & 2:
+        col = n - col
+    return row, col
+
+
+def inverse_transform(transform: int) -> int:
+    """对称变换的逆变换（含转置时两个翻转互换）"""
+    if transform & 4:
+        return 4 | ((transform & 1) << 1) | ((transform & 2) >> 1)
+    return transform
+
+
+def transform_move(move: str, transform: int, size: int = 19) -> str:
+    """变换 "D4" 格式的着法，pass 保持不变"""
+    if transform == IDENTITY:
+        return move
+    point = parse_point(move, size)
+    if point is None:
+        return move
+    return format_point(*transform_point(point[0], point[1], transform, size))
+
+
+def transform_moves(moves: List, transform: int, size: int = 19) -> List[List[str]]:
+    """变换着法序列 [[颜色, 着法], ...]"""
+    return [[color, transform_move(move, transform, size)] for color, move in moves]
+
+
+def canonicalize_moves(moves: List, size: int = 19) -> Tuple[List[List[str]], int]:
+    """把着法序列映射到规范形式
+
+    Returns:
+        (规范着法序列, 变换)，其中 规范序列 = transform_moves(moves, 变换)
+    """
+    points = []
+    for color, move in moves:
+        point = parse_point(move, size)
+        points.append((color, point))
+
+    def sort_key(transform):
+        key = []
+        for color, point in points:
+            if point is None:
+                key.append((color, -1))
+            else:
+                tr, tc = transform_point(point[0], point[1], transform, size)
+                key.append((color, tr * size + tc))
+        return tuple(key)
+
+    best_key, best_transform = None, IDENTITY
+    for transform in TRANSFORMS:
+        key = sort_key(transform)
+        if best_key is None or key < best_key:
+            best_key, best_transform = key, transform
+    return transform_moves(moves, best_transform, size), best_transform
+
+
+def transform_board(board: List[List[int]], transform: int) -> List[List[int]]:
+    """变换二维棋盘（或任意 size x size 网格）"""
+    size = len(board)
+    result = [[0] * size for _ in range(size)]
+    for row in range(size):
+        for col in range(size):
+            tr, tc = transform_point(row, col, transform, size)
+            result[tr][tc] = board[row][col]
+    return result
+
+
+def canonicalize_board(board: List[List[int]]) -> Tuple[bytes, int]:
+    """在8种对称形式中选字节序最小的一种，返回 (棋盘字节, 变换)"""
+    size = len(board)
+    best = None
+    for transform in TRANSFORMS:
+        grid = bytearray(size * size)
+        for row in range(size):
+            for col in range(size):
+                value = board[row][col]
+                if value:
+                    tr, tc = transform_point(row, col, transform, size)
+                    grid[tr * size + tc] = value
+        candidate = bytes(grid)
+        if best is None or candidate < best[0]:
+            best = (candidate, transform)
+    return best
+
+
+def transform_ownership(values: List, transform: int, size: int = 19) -> List:
+    """变换KataGo格式的一维数组（ownership，或带末尾pass项的policy）"""
+    if transform == IDENTITY or not values:
+        return list(values) if values else values
+    result = list(values)
+    for row in range(size):
+        for col in range(size):
+            tr, tc = transform_point(row, col, transform, size)
+            result[ownership_index(tr, tc, size)] = values[ownership_index(row, col, size)]
+    return result
+
+
+def transform_analysis(response: Dict, transform: int, size: int = 19) -> Dict:
+    """变换KataGo分析结果：moveInfos 的着法和变化图、ownership、policy"""
+    if transform == IDENTITY:
+        return response
+    result = dict(response)
+    if "moveInfos" in response:
+        move_infos = []
+        for info in response["moveInfos"]:
+            info = dict(info)
+            info["move"] = transform_move(info["move"], transform, size)
+            if "pv" in info:
+                info["pv"] = [transform_move(mv, transform, size) for mv in info["pv"]]
+            if info.get("ownership"):
+                info["ownership"] = transform_ownership(info["ownership"], transform, size)
+            move_infos.append(info)
+        result["moveInfos"] = move_infos
+    for field in ("ownership", "ownershipStdev", "policy"):
+        if response.get(field):
+            result[field] = transform_ownership(response[field], transform, size)
+    return result
@@ -0,0 +1,267 @@
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from .rules import BLACK, EMPTY, GoBoard, color_value, format_point, parse_point
+
+Point = Tuple[int, int]
+
+# 每次读棋的默认节点上限，超出时结果为 unknown
+DEFAULT_NODE_BUDGET = 5000
+# 棋块的气数达到该值即视为逃出（征子、枷吃都是紧气战）
+ESCAPE_LIBERTIES = 3
+# 最大读棋深度（手数），跨越整个棋盘的征子约需60手
+MAX_DEPTH = 80
+
+
+class _BudgetExceeded(Exception):
+    pass
+
+
+def _color_name(color: int) -> str:
+    return "B" if color == BLACK else "W"
+
+
+@lru_cache(maxsize=None)
+def _race_value(own: int, opp: int, shared: int, passes: int = 0) -> int:
+    """对杀的抽象计算（双方均无眼）：轮到己方时 own/opp 为双方的外气，shared 为公气
+
+    Returns:
+        1 己方胜，0 双活，-1 对方胜
+    """
+    if passes >= 2:
+        return 0
+    # 脱先
+    options = [-_race_value(opp, own, shared, passes + 1)]
+    if opp > 0:
+        # 紧对方外气
+        if opp - 1 + shared == 0:
+            return 1
+        options.append(-_race_value(opp - 1, own, shared, 0))
+    if shared > 0:
+        # 紧公气，同时减少自己的气；自己的气被紧完是自杀，不能下
+        if opp + shared - 1 == 0:
+            return 1
+        if own + shared - 1 > 0:
+            options.append(-_race_value(opp, own, shared - 1, 0))
+    return max(options)
+
+
+class TacticalReader:
+    """基于规则引擎的本地战术读棋（征子、枷吃、对杀数气），不需要KataGo
+
+    征子：攻方只在气上打吃，守方长出或提掉打吃的子；枷吃：攻方还可以下在气的外侧封锁。
+    所有搜索共享同一个节点上限，超出时返回 unknown 而不是无限读下去。
+    """
+
+    def __init__(self, go_board: GoBoard, node_budget: int = DEFAULT_NODE_BUDGET):
+        self.board = go_board
+        self.node_budget = node_budget
+        self.nodes = 0
+
+    def _visit(self):
+        self.nodes += 1
+        if self.nodes > self.node_budget:
+            raise _BudgetExceeded()
+
+    def _target(self, point) -> Point:
+        if isinstance(point, str):
+            point = parse_point(point, self.board.size)
+            if point is None:
+                raise ValueError("读棋目标不能是pass")
+        row, col = point
+        if self.board.board[row][col] == EMPTY:
+            raise ValueError(f"{format_point(row, col)} 没有棋子")
+        return row, col
+
+    def group_status(self, point) -> Dict:
+        """棋块的颜色、子数和气"""
+        row, col = self._target(point)
+        group, liberties = self.board.group_and_liberties(row, col)
+        return {
+            "color": _color_name(self.board.board[row][col]),
+            "stones": sorted(format_point(r, c) for r, c in group),
+            "liberties": sorted(format_point(r, c) for r, c in liberties),
+            "in_atari": len(liberties) == 1
+        }
+
+    # ---- 征子 / 枷吃 ----
+
+    def ladder(self, point, attacker_first: bool = True) -> Dict:
+        """判断征子是否成立
+
+        Args:
+            point: 被征棋块中的任意一子
+            attacker_first: True 为攻方先下（征子能否成立），False 为守方先下（被打吃后能否逃出）
+        """
+        return self._read(point, "ladder", attacker_first)
+
+    def net(self, point, attacker_first: bool = True) -> Dict:
+        """判断能否吃掉棋块（包括枷吃），攻方候选着法扩展到气外一路"""
+        return self._read(point, "net", attacker_first)
+
+    def _read(self, point, mode: str, attacker_first: bool) -> Dict:
+        target = self._target(point)
+        defender = self.board.board[target[0]][target[1]]
+        start_nodes = self.nodes
+        try:
+            if attacker_first:
+                captured, line = self._attack(self.board.copy(), target, mode, 0)
+            else:
+                escaped, line = self._defend(self.board.copy(), target, mode, 0)
+                captured = not escaped
+            status = "captured" if captured else "escapes"
+        except _BudgetExceeded:
+            status, line = "unknown", []
+        return {
+            "mode": mode,
+            "target": format_point(*target),
+            "defender": _color_name(defender),
+            "attacker": _color_name(3 - defender),
+            "status": status,
+            "sequence": [format_point(*move) for move in line],
+            "nodes": self.nodes - start_nodes
+        }
+
+    def _attack_moves(self, board: GoBoard, liberties, mode: str) -> List[Point]:
+        moves = sorted(liberties)
+        if mode == "net":
+            outer = set()
+            for r, c in liberties:
+                for nr, nc in board.neighbors(r, c):
+                    if board.board[nr][nc] == EMPTY and (nr, nc) not in liberties:
+                        outer.add((nr, nc))
+            moves.extend(sorted(outer))
+        return moves
+
+    def _attack(self, board: GoBoard, target: Point, mode: str, depth: int) -> Tuple[bool, List[Point]]:
+        """攻方落子，返回 (能否吃掉, 变化图)"""
+        self._visit()
+        group, liberties = board.group_and_liberties(*target)
+        if not group:
+            return True, []
+        attacker = 3 - board.board[target[0]][target[1]]
+        if len(liberties) == 1:
+            return True, [next(iter(liberties))]
+        if len(liberties) >= ESCAPE_LIBERTIES or depth >= MAX_DEPTH:
+            return False, []
+        for move in self._attack_moves(board, liberties, mode):
+            if not board.is_legal(move[0], move[1], attacker):
+                continue
+            child = board.copy()
+            child.play(format_point(*move), attacker)
+            if mode == "ladder" and len(child.group_and_liberties(*target)[1]) != 1:
+                continue
+            escaped, line = self._defend(child, target, mode, depth + 1)
+            if not escaped:
+                return True, [move] + line
+        return False, []
+
+    def _defend(self, board: GoBoard, target: Point, mode: str, depth: int) -> Tuple[bool, List[Point]]:
+        """守方落子，返回 (能否逃出, 变化图)"""
+        self._visit()
+        group, liberties = board.group_and_liberties(*target)
+        if not group:
+            return False, []
+        if len(liberties) >= ESCAPE_LIBERTIES or depth >= MAX_DEPTH:
+            return True, []
+        defender = board.board[target[0]][target[1]]
+
+        # 候选：长气，或提掉紧贴着的被打吃的攻方棋子
+        candidates = sorted(liberties)
+        checked = set()
+        for r, c in group:
+            for nr, nc in board.neighbors(r, c):
+                if board.board[nr][nc] == 3 - defender and (nr, nc) not in checked:
+                    attacker_group, attacker_liberties = board.group_and_liberties(nr, nc)
+                    checked |= attacker_group
+                    if len(attacker_liberties) == 1:
+                        candidates.extend(attacker_liberties - set(candidates))
+
+        best_line: List[Point] = []
+        for move in candidates:
+            if not board.is_legal(move[0], move[1], defender):
+                continue
+            child = board.copy()
+            child.play(format_point(*move), defender)
+            captured, line = self._attack(child, target, mode, depth + 1)
+            if not captured:
+                return True, [move] + line
+            if not best_line:
+                best_line = [move] + line
+        return False, best_line
+
+    # ---- 对杀 ----
+
+    def liberty_race(self, point_a, point_b, to_move) -> Dict:
+        """对杀数气：按外气和公气计算先手方的结果（不考虑眼位，眼按外气计）"""
+        a, b = self._target(point_a), self._target(point_b)
+        color_a, color_b = self.board.board[a[0]][a[1]], self.board.board[b[0]][b[1]]
+        if color_a == color_b:
+            raise ValueError("对杀的两块棋必须颜色不同")
+        _, liberties_a = self.board.group_and_liberties(*a)
+        _, liberties_b = self.board.group_and_liberties(*b)
+        shared = liberties_a & liberties_b
+        outside_a, outside_b = len(liberties_a - shared), len(liberties_b - shared)
+
+        to_move = color_value(to_move)
+        if to_move == color_a:
+            value = _race_value(outside_a, outside_b, len(shared))
+        else:
+            value = -_race_value(outside_b, outside_a, len(shared))
+        winner = None if value == 0 else _color_name(color_a if value > 0 else color_b)
+        return {
+            "a": {"color": _color_name(color_a), "outside_liberties": outside_a},
+            "b": {"color": _color_name(color_b), "outside_liberties": outside_b},
+            "shared_liberties": len(shared),
+            "to_move": _color_name(to_move),
+            "result": "seki" if value == 0 else ("a_wins" if value > 0 else "b_wins"),
+            "winner": winner
+        }
+
+    # ---- 局面概要 ----
+
+    def summary(self, to_move, max_items: int = 6) -> List[Dict]:
+        """找出全盘气紧的棋块并读出征子结果，供讲解和提示使用
+
+        被打吃的棋块按守方先下判断能否逃出；两口气的棋块按轮到的一方为攻方判断征子。
+        """
+        to_move = color_value(to_move)
+        items = []
+        seen = set()
+        for row in range(self.board.size):
+            for col in range(self.board.size):
+                if self.board.board[row][col] == EMPTY or (row, col) in seen:
+                    continue
+                group, liberties = self.board.group_and_liberties(row, col)
+                seen |= group
+                color = self.board.board[row][col]
+                if len(liberties) == 1:
+                    result = self.ladder((row, col), attacker_first=color != to_move)
+                elif len(liberties) == 2 and color != to_move:
+                    result = self.ladder((row, col), attacker_first=True)
+                else:
+                    continue
+                result["stones"] = len(group)
+                result["liberties"] = len(liberties)
+                items.append(result)
+        items.sort(key=lambda item: (item["liberties"], -item["stones"]))
+        return items[:max_items]
+
+
+def describe_tactics(items: List[Dict]) -> str:
+    """把 summary() 的结果整理为讲解用的文字"""
+    lines = []
+    for item in items:
+        side = "黑棋" if item["defender"] == "B" else "白棋"
+        where = f"{side}{item['target']}处{item['stones']}子"
+        if item["liberties"] == 1:
+            state = {"captured": "被打吃且无法逃出", "escapes": "被打吃但可以逃出",
+                     "unknown": "被打吃，结果未读清"}[item["status"]]
+        else:
+            state = {"captured": "只有两口气，征子成立", "escapes": "只有两口气，征子不成立",
+                     "unknown": "只有两口气，征子结果未读清"}[item["status"]]
+        line = f"{where}{state}"
+        if item["status"] == "captured" and item["sequence"]:
+            line += f"（{' '.join(item['sequence'][:6])}）"
+        lines.append(line)
+    return "；".join(lines) if lines else "暂无气紧的棋块"
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class VisitBudgetController:
+    """自适应算力预算控制器
+
+    把用户设置的思考时间（秒）换算为KataGo查询的 maxVisits / maxTime：
+    - 按引擎实测每秒访问次数（指数滑动平均），让"3秒"真正对应约3秒的搜索
+    - 统计本机同时进行中的搜索数量，负载高时按比例缩短思考时间，避免服务端积压
+    """
+
+    # 全机共享的搜索计数（所有引擎实例共用同一台主机的CPU/GPU）
+    _host_lock = threading.Lock()
+    _host_active_searches = 0
+
+    def __init__(self, initial_visits_per_second: float = 100.0,
+                 min_visits: int = 16, max_visits: int = 100000,
+                 smoothing: float = 0.3, host_slots: Optional[int] = None,
+                 min_load_factor: float = 0.25):
+        # 初始速率沿用原来的"秒数 * 100"换算，测得真实速率后自动修正
+        self.visits_per_second = float(initial_visits_per_second)
+        self.min_visits = min_visits
+        self.max_visits = max_visits
+        self.smoothing = smoothing
+        self.host_slots = host_slots or int(os.getenv("KATAGO_SEARCH_SLOTS", "2"))
+        self.min_load_factor = min_load_factor
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def host_active_searches(cls) -> int:
+        """当前主机上进行中的搜索数量"""
+        with cls._host_lock:
+            return cls._host_active_searches
+
+    def load_factor(self) -> float:
+        """负载系数：同时搜索数超过可用槽位时按比例缩短思考时间"""
+        active = self.host_active_searches()
+        if active <= self.host_slots:
+            return 1.0
+        return max(self.min_load_factor, self.host_slots / active)
+
+    def query_limits(self, seconds: float) -> Dict:
+        """把思考时间换算为KataGo查询限制
+
+        Args:
+            seconds: 用户设置的思考时间（秒）
+
+        Returns:
+            Dict: {"maxVisits": int, "maxTime": float}
+        """
+        effective_seconds = max(0.1, float(seconds)) * self.load_factor()
+        with self._lock:
+            visits = int(self.visits_per_second * effective_seconds)
+        visits = max(self.min_visits, min(self.max_visits, visits))
+        return {
+            "maxVisits": visits,
+            "maxTime": round(effective_seconds, 2)
+        }
+
+    def record(self, visits: int, elapsed: float):
+        """记录一次搜索的实测结果，更新每秒访问次数估计"""
+        # 过短的搜索主要是通信开销，测出的速率偏低，不参与估计
+        if not visits or elapsed < 0.2:
+            return
+        rate = visits / elapsed
+        with self._lock:
+            if self.samples == 0:
+                self.visits_per_second = rate
+            else:
+                self.visits_per_second += self.smoothing * (rate - self.visits_per_second)
+            self.samples += 1
+
+    def begin_search(self) -> float:
+        """登记一次搜索开始，返回开始时间"""
+        with VisitBudgetController._host_lock:
+            VisitBudgetController._host_active_searches += 1
+        return time.monotonic()
+
+    def end_search(self, started_at: float, visits: int = 0):
+        """登记一次搜索结束，并用实测访问次数更新速率"""
+        with VisitBudgetController._host_lock:
+            VisitBudgetController._host_active_searches = max(0, VisitBudgetController._host_active_searches - 1)
+        self.record(visits, time.monotonic() - started_at)
+
+    @contextmanager
+    def track_search(self):
+        """搜索计时上下文，结果字典中写入visits后退出时自动记录"""
+        result = {"visits": 0}
+        started_at = self.begin_search()
+        try:
+            yield result
+        finally:
+            self.end_search(started_at, result.get("visits", 0))
+
+    def get_stats(self) -> Dict:
+        """获取当前预算状态（用于调试和监控）"""
+        return {
+            "visits_per_second": round(self.visits_per_second, 1),
+            "samples": self.samples,
+            "host_active_searches": self.host_active_searches(),
+            "host_slots": self.host_slots,
+            "load_factor": round(self.load_factor(), 2)
+        }
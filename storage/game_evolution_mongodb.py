@@ -5,6 +5,8 @@ import copy
 from pymongo.errors import PyMongoError, DuplicateKeyError
 from .mongodb_config import mongo_config
 from .mongodb_schema import MongoDBSchema, COLLECTION_NAMES
+from core.metrics import metrics
+from core.ownership import Ownership
 
 class GameEvolutionMongoDB:
     """对局局势演化MongoDB存储系统
@@ -58,7 +60,8 @@ class GameEvolutionMongoDB:
             print(f"❌ 初始化游戏文档失败: {e}")
             raise
     
-    def analyze_stone_groups(self, board: List[List[int]]) -> List[Dict]:
+    @staticmethod
+    def analyze_stone_groups(board: List[List[int]]) -> List[Dict]:
         """分析棋盘上的棋块
         
         Args:
@@ -122,9 +125,72 @@ class GameEvolutionMongoDB:
         
         return groups
     
+    @classmethod
+    def build_move_data(cls, move_number: int, move: str, color: str, 
+                        winrate_data: Dict, board: List[List[int]] = None,
+                        territory_data: Dict = None, recommended_moves: List = None,
+                        node_id: int = None, komi: float = None) -> Dict:
+        """构建一步棋的演化数据文档（不写入数据库，也不需要数据库连接，可在子进程中调用）"""
+        # 分析棋块
+        stone_groups = cls.analyze_stone_groups(board) if board else []
+        
+        # 获取已落子位置
+        placed_stones = []
+        if board:
+            for i in range(19):
+                for j in range(19):
+                    if board[i][j] != 0:
+                        placed_stones.append({
+                            "position": [i, j],
+                            "color": "black" if board[i][j] == 1 else "white"
+                        })
+        
+        # 处理领地数据
+        territory_prediction = {
+            "black_territory": [],
+            "white_territory": [],
+            "neutral_points": []
+        }
+        
+        if territory_data is not None:
+            if isinstance(territory_data, Ownership):
+                territory_prediction = territory_data.territory_points()
+            elif isinstance(territory_data, list) and len(territory_data) == 19:
+                # 处理二维数组格式（棋盘方向）的ownership数据
+                territory_prediction = Ownership.from_rows(territory_data).territory_points()
+            elif isinstance(territory_data, dict):
+                # 处理字典格式的领地数据
+                territory_prediction = territory_data
+        
+        # 构建移动数据
+        move_data = {
+            "move_number": move_number,
+            "move": move,
+            "color": color,
+            "timestamp": datetime.now(),
+            "winrate_data": winrate_data or {
+                "black_winrate": 50.0,
+                "white_winrate": 50.0,
+                "score_lead": 0.0
+            },
+            "stone_groups": stone_groups,
+            "territory_prediction": territory_prediction,
+            "placed_stones": placed_stones,
+            "recommended_moves": recommended_moves or []
+        }
+        if node_id is not None:
+            # 推演模式的变化树节点，区分同一手数的不同分支
+            move_data["node_id"] = node_id
+        if komi is not None:
+            # 分析该局面时的贴目（对局中可以修改贴目，开局定式库按此归类）
+            move_data["komi"] = float(komi)
+        return move_data
+    
+    @metrics.timed("mongo.add_move_data")
     def add_move_data(self, move_number: int, move: str, color: str, 
                      winrate_data: Dict, board: List[List[int]] = None,
-                     territory_data: Dict = None, recommended_moves: List = None):
+                     territory_data: Dict = None, recommended_moves: List = None,
+                     node_id: int = None, komi: float = None):
         """添加一步棋的数据到MongoDB
         
         Args:
@@ -135,64 +201,17 @@ class GameEvolutionMongoDB:
             board: 棋盘状态
             territory_data: 领地数据
             recommended_moves: 推荐着法
+            node_id: 变化树节点编号（推演模式）
+            komi: 分析时的贴目
         """
         try:
             print(f"🔄 添加第{move_number}步数据到MongoDB: {move}")
             
-            # 分析棋块
-            stone_groups = self.analyze_stone_groups(board) if board else []
-            
-            # 获取已落子位置
-            placed_stones = []
-            if board:
-                for i in range(19):
-                    for j in range(19):
-                        if board[i][j] != 0:
-                            placed_stones.append({
-                                "position": [i, j],
-                                "color": "black" if board[i][j] == 1 else "white"
-                            })
-            
-            # 处理领地数据
-            territory_prediction = {
-                "black_territory": [],
-                "white_territory": [],
-                "neutral_points": []
-            }
-            
-            if territory_data:
-                if isinstance(territory_data, list) and len(territory_data) == 19:
-                    # 处理二维数组格式的ownership数据
-                    for row in range(19):
-                        for col in range(19):
-                            if row < len(territory_data) and col < len(territory_data[row]):
-                                ownership_value = territory_data[row][col]
-                                if ownership_value > 0.6:  # 黑棋领地
-                                    territory_prediction["black_territory"].append([row, col])
-                                elif ownership_value < -0.6:  # 白棋领地
-                                    territory_prediction["white_territory"].append([row, col])
-                                else:  # 中性点
-                                    territory_prediction["neutral_points"].append([row, col])
-                elif isinstance(territory_data, dict):
-                    # 处理字典格式的领地数据
-                    territory_prediction = territory_data
-            
-            # 构建移动数据
-            move_data = {
-                "move_number": move_number,
-                "move": move,
-                "color": color,
-                "timestamp": datetime.now(),
-                "winrate_data": winrate_data or {
-                    "black_winrate": 50.0,
-                    "white_winrate": 50.0,
-                    "score_lead": 0.0
-                },
-                "stone_groups": stone_groups,
-                "territory_prediction": territory_prediction,
-                "placed_stones": placed_stones,
-                "recommended_moves": recommended_moves or []
-            }
+            move_data = self.build_move_data(
+                move_number, move, color, winrate_data,
+                board=board, territory_data=territory_data, recommended_moves=recommended_moves,
+                node_id=node_id, komi=komi
+            )
             
             # 更新MongoDB文档
             result = self.collection.update_one(
@@ -216,6 +235,94 @@ class GameEvolutionMongoDB:
             import traceback
             traceback.print_exc()
     
+    @metrics.timed("mongo.add_moves_bulk")
+    def add_moves_bulk(self, moves_data: List[Dict]) -> bool:
+        """一次写入多步棋的演化数据（由 build_move_data 构建），按步数排序
+        
+        Returns:
+            bool: 是否写入成功
+        """
+        if not moves_data:
+            return True
+        try:
+            result = self.collection.update_one(
+                {"game_id": self.game_id},
+                {
+                    "$push": {"evolution_data": {"$each": moves_data, "$sort": {"move_number": 1}}},
+                    "$set": {
+                        "updated_at": datetime.now(),
+                        "total_moves": max(data["move_number"] for data in moves_data)
+                    }
+                }
+            )
+            return result.matched_count > 0
+        except Exception as e:
+            print(f"❌ 批量添加移动数据到MongoDB失败: {e}")
+            return False
+    
+    def sort_evolution_data(self):
+        """按步数重新排序演化数据（批量分析的结果按完成顺序写入，可能乱序）"""
+        try:
+            self.collection.update_one(
+                {"game_id": self.game_id},
+                {"$push": {"evolution_data": {"$each": [], "$sort": {"move_number": 1}}}}
+            )
+        except Exception as e:
+            print(f"❌ 排序演化数据失败: {e}")
+
+    @metrics.timed("mongo.set_key_moments")
+    def set_key_moments(self, key_moments: Dict):
+        """保存关键时刻（问题手）索引"""
+        try:
+            self.collection.update_one(
+                {"game_id": self.game_id},
+                {"$set": {"key_moments": key_moments, "updated_at": datetime.now()}}
+            )
+        except Exception as e:
+            print(f"❌ 保存关键时刻失败: {e}")
+    
+    @metrics.timed("mongo.add_variation_nodes")
+    def add_variation_nodes(self, node_docs: List[Dict]):
+        """追加变化树节点（每个节点只含父节点和一手棋，分支之间共享前缀）"""
+        if not node_docs:
+            return
+        try:
+            self.collection.update_one(
+                {"game_id": self.game_id},
+                {"$push": {"variation_nodes": {"$each": node_docs}}, "$set": {"updated_at": datetime.now()}}
+            )
+        except Exception as e:
+            print(f"❌ 保存变化树节点失败: {e}")
+    
+    def clear_variation_nodes(self):
+        """清空变化树（重新开始推演时）"""
+        try:
+            self.collection.update_one(
+                {"game_id": self.game_id},
+                {"$set": {"variation_nodes": [], "updated_at": datetime.now()}}
+            )
+        except Exception as e:
+            print(f"❌ 清空变化树失败: {e}")
+    
+    def get_variation_nodes(self) -> List[Dict]:
+        """获取变化树的全部节点"""
+        try:
+            doc = self.collection.find_one({"game_id": self.game_id}, {"variation_nodes": 1})
+            return doc.get("variation_nodes", []) if doc else []
+        except Exception as e:
+            print(f"❌ 获取变化树节点失败: {e}")
+            return []
+    
+    def get_key_moments(self) -> Optional[Dict]:
+        """获取关键时刻索引"""
+        try:
+            doc = self.collection.find_one({"game_id": self.game_id}, {"key_moments": 1})
+            return doc.get("key_moments") if doc else None
+        except Exception as e:
+            print(f"❌ 获取关键时刻失败: {e}")
+            return None
+    
+    @metrics.timed("mongo.get_game_data")
     def get_game_data(self) -> Optional[Dict]:
         """获取完整的游戏数据
         
@@ -233,6 +340,7 @@ class GameEvolutionMongoDB:
             print(f"❌ 获取游戏数据失败: {e}")
             return None
     
+    @metrics.timed("mongo.get_evolution_data")
     def get_evolution_data(self) -> List[Dict]:
         """获取局势演化数据
         
@@ -249,6 +357,7 @@ class GameEvolutionMongoDB:
             print(f"❌ 获取演化数据失败: {e}")
             return []
     
+    @metrics.timed("mongo.update_game_status")
     def update_game_status(self, status: str, final_result: Dict = None):
         """更新游戏状态
         
@@ -296,6 +405,7 @@ class GameEvolutionMongoDB:
             print(f"❌ 删除游戏数据失败: {e}")
             return False
     
+    @metrics.timed("mongo.get_game_statistics")
     def get_game_statistics(self) -> Dict:
         """获取游戏统计信息
         
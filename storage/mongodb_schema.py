@@ -11,6 +11,9 @@ class MongoDBSchema:
     # 集合名称
     GAME_EVOLUTION_COLLECTION = "game_evolution"
     GAME_METADATA_COLLECTION = "game_metadata"
+    REVIEW_JOBS_COLLECTION = "review_jobs"
+    REVIEW_RESULTS_COLLECTION = "review_results"
+    SESSIONS_COLLECTION = "sessions"  # 会话快照和工作进程租约（多进程/多机部署）
     
     @staticmethod
     def get_game_evolution_schema() -> Dict[str, Any]:
@@ -31,11 +34,20 @@ class MongoDBSchema:
                 "black": "string",  # 黑棋玩家
                 "white": "string"   # 白棋玩家
             },
+            "key_moments": {  # 关键时刻（问题手）索引
+                "moments": ["array of {move_number, move, color, label, winrate_loss, score_loss, best_move}"],
+                "counts": {"B": {"blunder": "int", "mistake": "int", "inaccuracy": "int"}, "W": "..."},
+                "turning_points": ["array of move_number"]
+            },
+            "variation_nodes": [  # 推演模式变化树节点，每个节点只记录父节点和一手棋
+                {"id": "int", "parent": "int", "color": "string", "move": "string"}
+            ],
             "evolution_data": [  # 局势演化数据数组
                 {
                     "move_number": "int",  # 步数
                     "move": "string",  # 着法，如"D4"或"game_start"
                     "color": "string",  # 棋子颜色: "black", "white", null
+                    "node_id": "int",  # 推演模式的变化树节点（可选）
                     "timestamp": "datetime",  # 时间戳
                     "winrate_data": {
                         "black_winrate": "float",  # 黑棋胜率
@@ -186,5 +198,8 @@ class MongoDBSchema:
 # 常量定义
 COLLECTION_NAMES = {
     "GAME_EVOLUTION": MongoDBSchema.GAME_EVOLUTION_COLLECTION,
-    "GAME_METADATA": MongoDBSchema.GAME_METADATA_COLLECTION
+    "GAME_METADATA": MongoDBSchema.GAME_METADATA_COLLECTION,
+    "REVIEW_JOBS": MongoDBSchema.REVIEW_JOBS_COLLECTION,
+    "REVIEW_RESULTS": MongoDBSchema.REVIEW_RESULTS_COLLECTION,
+    "SESSIONS": MongoDBSchema.SESSIONS_COLLECTION
 }
\ No newline at end of file
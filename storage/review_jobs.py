@@ -0,0 +1,315 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+# 任务状态
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+DEFAULT_SQLITE_PATH = os.getenv(
+    "REVIEW_JOBS_DB",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "review_jobs.sqlite3")
+)
+
+
+def _new_job(sgf: str, name: Optional[str], max_visits: int, max_attempts: int) -> Dict:
+    now = time.time()
+    return {
+        "job_id": f"review_{uuid.uuid4().hex[:12]}",
+        "name": name or "",
+        "sgf": sgf,
+        "status": STATUS_QUEUED,
+        "max_visits": int(max_visits),
+        "attempts": 0,
+        "max_attempts": int(max_attempts),
+        "completed_turns": 0,
+        "total_turns": 0,
+        "error": None,
+        "summary": None,
+        "lease_owner": None,
+        "lease_expires": 0.0,
+        "created_at": now,
+        "updated_at": now,
+        "finished_at": None
+    }
+
+
+class SQLiteReviewJobStore:
+    """复盘任务队列的本地SQLite实现（没有MongoDB时使用）
+
+    每个回合的分析结果单独成行，任务中断后重新领取时只需分析缺失的回合。
+    """
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS review_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    name TEXT,
+                    sgf TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    max_visits INTEGER,
+                    attempts INTEGER DEFAULT 0,
+                    max_attempts INTEGER DEFAULT 3,
+                    completed_turns INTEGER DEFAULT 0,
+                    total_turns INTEGER DEFAULT 0,
+                    error TEXT,
+                    summary TEXT,
+                    lease_owner TEXT,
+                    lease_expires REAL DEFAULT 0,
+                    created_at REAL,
+                    updated_at REAL,
+                    finished_at REAL
+                )""")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_review_jobs_status ON review_jobs (status, created_at)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS review_results (
+                    job_id TEXT NOT NULL,
+                    turn INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (job_id, turn)
+                )""")
+
+    @staticmethod
+    def _row_to_job(row, include_sgf: bool = False) -> Dict:
+        job = dict(row)
+        job["summary"] = json.loads(job["summary"]) if job.get("summary") else None
+        if not include_sgf:
+            job.pop("sgf", None)
+        return job
+
+    def submit(self, sgf: str, name: Optional[str] = None, max_visits: int = 200,
+               max_attempts: int = 3) -> str:
+        job = _new_job(sgf, name, max_visits, max_attempts)
+        columns = [key for key in job if key != "summary"]
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO review_jobs ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [job[key] for key in columns]
+            )
+        return job["job_id"]
+
+    def get(self, job_id: str, include_sgf: bool = False) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM review_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row, include_sgf) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        with self._lock:
+            if status:
+                rows = self._conn.execute(
+                    "SELECT * FROM review_jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?",
+                    (status, limit)).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT * FROM review_jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def claim(self, worker_id: str, lease_seconds: float = 120.0) -> Optional[Dict]:
+        """领取最早的待处理任务；租约过期的运行中任务（工作线程崩溃）也可被重新领取"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT job_id FROM review_jobs WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (STATUS_QUEUED, STATUS_RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE review_jobs SET status = ?, lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE job_id = ?",
+                (STATUS_RUNNING, worker_id, now + lease_seconds, now, row["job_id"]))
+            job = self._conn.execute("SELECT * FROM review_jobs WHERE job_id = ?", (row["job_id"],)).fetchone()
+        return self._row_to_job(job, include_sgf=True)
+
+    def update_progress(self, job_id: str, completed_turns: int, total_turns: int,
+                        lease_seconds: float = 120.0):
+        """更新进度并续租"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE review_jobs SET completed_turns = ?, total_turns = ?, lease_expires = ?, "
+                "updated_at = ? WHERE job_id = ?",
+                (completed_turns, total_turns, now + lease_seconds, now, job_id))
+
+    def save_results(self, job_id: str, results: Dict[int, Dict]):
+        """批量写入回合结果 {turn: data}"""
+        if not results:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO review_results (job_id, turn, data) VALUES (?, ?, ?)",
+                [(job_id, turn, json.dumps(data)) for turn, data in results.items()])
+
+    def get_results(self, job_id: str) -> Dict[int, Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT turn, data FROM review_results WHERE job_id = ? ORDER BY turn", (job_id,)).fetchall()
+        return {row["turn"]: json.loads(row["data"]) for row in rows}
+
+    def complete(self, job_id: str, summary: Dict):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE review_jobs SET status = ?, summary = ?, error = NULL, lease_owner = NULL, "
+                "updated_at = ?, finished_at = ? WHERE job_id = ?",
+                (STATUS_DONE, json.dumps(summary), now, now, job_id))
+
+    def fail(self, job_id: str, error: str):
+        """记录失败；未超过最大尝试次数时重新排队"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE review_jobs SET status = CASE WHEN attempts < max_attempts THEN ? ELSE ? END, "
+                "error = ?, lease_owner = NULL, lease_expires = 0, updated_at = ?, "
+                "finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE ? END WHERE job_id = ?",
+                (STATUS_QUEUED, STATUS_FAILED, error, now, now, job_id))
+
+    def retry(self, job_id: str) -> bool:
+        """手动重试失败的任务（已完成的回合结果保留）"""
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE review_jobs SET status = ?, attempts = 0, error = NULL, finished_at = NULL, "
+                "updated_at = ? WHERE job_id = ? AND status = ?",
+                (STATUS_QUEUED, now, job_id, STATUS_FAILED))
+        return cursor.rowcount > 0
+
+    def count_pending(self) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS n FROM review_jobs WHERE status IN (?, ?)",
+                (STATUS_QUEUED, STATUS_RUNNING)).fetchone()
+        return row["n"]
+
+
+class MongoReviewJobStore:
+    """复盘任务队列的MongoDB实现，接口与 SQLiteReviewJobStore 相同"""
+
+    def __init__(self):
+        from .mongodb_config import mongo_config
+        from .mongodb_schema import COLLECTION_NAMES
+
+        self.jobs = mongo_config.get_collection(COLLECTION_NAMES["REVIEW_JOBS"])
+        self.results = mongo_config.get_collection(COLLECTION_NAMES["REVIEW_RESULTS"])
+        self.jobs.create_index("job_id", unique=True)
+        self.jobs.create_index([("status", 1), ("created_at", 1)])
+        self.results.create_index([("job_id", 1), ("turn", 1)], unique=True)
+
+    @staticmethod
+    def _clean(doc, include_sgf: bool = False) -> Optional[Dict]:
+        if doc is None:
+            return None
+        doc.pop("_id", None)
+        if not include_sgf:
+            doc.pop("sgf", None)
+        return doc
+
+    def submit(self, sgf: str, name: Optional[str] = None, max_visits: int = 200,
+               max_attempts: int = 3) -> str:
+        job = _new_job(sgf, name, max_visits, max_attempts)
+        self.jobs.insert_one(dict(job))
+        return job["job_id"]
+
+    def get(self, job_id: str, include_sgf: bool = False) -> Optional[Dict]:
+        return self._clean(self.jobs.find_one({"job_id": job_id}), include_sgf)
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        query = {"status": status} if status else {}
+        cursor = self.jobs.find(query, {"sgf": 0}).sort("created_at", -1).limit(limit)
+        return [self._clean(doc) for doc in cursor]
+
+    def claim(self, worker_id: str, lease_seconds: float = 120.0) -> Optional[Dict]:
+        from pymongo import ReturnDocument
+
+        now = time.time()
+        doc = self.jobs.find_one_and_update(
+            {"$or": [{"status": STATUS_QUEUED},
+                     {"status": STATUS_RUNNING, "lease_expires": {"$lt": now}}]},
+            {"$set": {"status": STATUS_RUNNING, "lease_owner": worker_id,
+                      "lease_expires": now + lease_seconds, "updated_at": now},
+             "$inc": {"attempts": 1}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        return self._clean(doc, include_sgf=True)
+
+    def update_progress(self, job_id: str, completed_turns: int, total_turns: int,
+                        lease_seconds: float = 120.0):
+        now = time.time()
+        self.jobs.update_one({"job_id": job_id}, {"$set": {
+            "completed_turns": completed_turns, "total_turns": total_turns,
+            "lease_expires": now + lease_seconds, "updated_at": now}})
+
+    def save_results(self, job_id: str, results: Dict[int, Dict]):
+        from pymongo import ReplaceOne
+
+        if not results:
+            return
+        self.results.bulk_write([
+            ReplaceOne({"job_id": job_id, "turn": turn}, {"job_id": job_id, "turn": turn, "data": data},
+                       upsert=True)
+            for turn, data in results.items()
+        ], ordered=False)
+
+    def get_results(self, job_id: str) -> Dict[int, Dict]:
+        cursor = self.results.find({"job_id": job_id}).sort("turn", 1)
+        return {doc["turn"]: doc["data"] for doc in cursor}
+
+    def complete(self, job_id: str, summary: Dict):
+        now = time.time()
+        self.jobs.update_one({"job_id": job_id}, {"$set": {
+            "status": STATUS_DONE, "summary": summary, "error": None, "lease_owner": None,
+            "updated_at": now, "finished_at": now}})
+
+    def fail(self, job_id: str, error: str):
+        now = time.time()
+        job = self.jobs.find_one({"job_id": job_id}, {"attempts": 1, "max_attempts": 1})
+        if job is None:
+            return
+        exhausted = job.get("attempts", 0) >= job.get("max_attempts", 3)
+        self.jobs.update_one({"job_id": job_id}, {"$set": {
+            "status": STATUS_FAILED if exhausted else STATUS_QUEUED,
+            "error": error, "lease_owner": None, "lease_expires": 0.0, "updated_at": now,
+            "finished_at": now if exhausted else None}})
+
+    def retry(self, job_id: str) -> bool:
+        result = self.jobs.update_one(
+            {"job_id": job_id, "status": STATUS_FAILED},
+            {"$set": {"status": STATUS_QUEUED, "attempts": 0, "error": None,
+                      "finished_at": None, "updated_at": time.time()}})
+        return result.modified_count > 0
+
+    def count_pending(self) -> int:
+        return self.jobs.count_documents({"status": {"$in": [STATUS_QUEUED, STATUS_RUNNING]}})
+
+
+def create_review_job_store():
+    """按 REVIEW_JOBS_BACKEND（auto/mongodb/sqlite）创建任务存储，auto 时MongoDB不可用则退回SQLite"""
+    backend = os.getenv("REVIEW_JOBS_BACKEND", "auto").lower()
+    if backend in ("auto", "mongodb"):
+        try:
+            from .mongodb_config import mongo_config
+            if mongo_config.database is not None or mongo_config.connect():
+                return MongoReviewJobStore()
+        except Exception as e:
+            print(f"❌ MongoDB复盘任务存储不可用: {e}")
+        if backend == "mongodb":
+            raise ConnectionError("无法连接到MongoDB数据库")
+        print("⚠️ 使用本地SQLite存储复盘任务")
+    return SQLiteReviewJobStore()
@@ -0,0 +1,185 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+DEFAULT_SQLITE_PATH = os.getenv(
+    "SESSION_STORE_DB",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "sessions.sqlite3")
+)
+
+
+class SQLiteSessionStore:
+    """会话快照的本地SQLite实现（同一台机器上的多个uvicorn工作进程共享）
+
+    每个会话一行：最新快照 + 租约。持有租约的工作进程负责该会话（引擎、命令执行），
+    租约过期（进程退出或崩溃）后其他工作进程可以接管，从快照重放恢复。
+    """
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    snapshot TEXT,
+                    version INTEGER DEFAULT 0,
+                    owner TEXT,
+                    lease_expires REAL DEFAULT 0,
+                    updated_at REAL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at)")
+
+    def save(self, session_id: str, snapshot: Dict) -> int:
+        """写入最新快照，返回版本号"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, snapshot, version, updated_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET snapshot = excluded.snapshot, "
+                "version = version + 1, updated_at = excluded.updated_at",
+                (session_id, json.dumps(snapshot, separators=(",", ":")), now))
+            row = self._conn.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row["version"]
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT snapshot FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row["snapshot"]) if row and row["snapshot"] else None
+
+    def version(self, session_id: str) -> int:
+        """最新快照的版本号，没有快照时为0"""
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return (row["version"] or 0) if row else 0
+
+    def acquire(self, session_id: str, owner: str, lease_seconds: float = 90.0) -> bool:
+        """获取或续期会话租约；其他工作进程持有未过期的租约时返回False"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, updated_at) VALUES (?, ?)", (session_id, now))
+            cursor = self._conn.execute(
+                "UPDATE sessions SET owner = ?, lease_expires = ? "
+                "WHERE session_id = ? AND (owner IS NULL OR owner = ? OR lease_expires < ?)",
+                (owner, now + lease_seconds, session_id, owner, now))
+        return cursor.rowcount > 0
+
+    def release(self, session_id: str, owner: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE sessions SET owner = NULL, lease_expires = 0 WHERE session_id = ? AND owner = ?",
+                (session_id, owner))
+
+    def owner(self, session_id: str) -> Optional[str]:
+        """当前持有未过期租约的工作进程"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT owner FROM sessions WHERE session_id = ? AND lease_expires >= ?",
+                (session_id, time.time())).fetchone()
+        return row["owner"] if row else None
+
+    def delete(self, session_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def purge(self, max_age_seconds: float) -> int:
+        """删除长时间没有更新且没有租约的会话，返回删除数"""
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM sessions WHERE updated_at < ? AND lease_expires < ?", (now - max_age_seconds, now))
+        return cursor.rowcount
+
+
+class MongoSessionStore:
+    """会话快照的MongoDB实现（多台机器共享），接口与 SQLiteSessionStore 相同"""
+
+    def __init__(self):
+        from .mongodb_config import mongo_config
+        from .mongodb_schema import COLLECTION_NAMES
+
+        self.sessions = mongo_config.get_collection(COLLECTION_NAMES["SESSIONS"])
+        self.sessions.create_index("session_id", unique=True)
+        self.sessions.create_index("updated_at")
+
+    def save(self, session_id: str, snapshot: Dict) -> int:
+        from pymongo import ReturnDocument
+
+        doc = self.sessions.find_one_and_update(
+            {"session_id": session_id},
+            {"$set": {"snapshot": snapshot, "updated_at": time.time()}, "$inc": {"version": 1}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        return doc["version"]
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        doc = self.sessions.find_one({"session_id": session_id}, {"snapshot": 1})
+        return doc.get("snapshot") if doc else None
+
+    def version(self, session_id: str) -> int:
+        doc = self.sessions.find_one({"session_id": session_id}, {"version": 1})
+        return doc.get("version", 0) if doc else 0
+
+    def acquire(self, session_id: str, owner: str, lease_seconds: float = 90.0) -> bool:
+        from pymongo.errors import DuplicateKeyError
+
+        now = time.time()
+        try:
+            result = self.sessions.update_one(
+                {"session_id": session_id,
+                 "$or": [{"owner": None}, {"owner": owner}, {"lease_expires": {"$lt": now}}]},
+                {"$set": {"owner": owner, "lease_expires": now + lease_seconds},
+                 "$setOnInsert": {"updated_at": now, "version": 0}},
+                upsert=True)
+        except DuplicateKeyError:
+            # 会话存在但租约属于其他工作进程，upsert 插入新文档时与唯一索引冲突
+            return False
+        return result.matched_count > 0 or result.upserted_id is not None
+
+    def release(self, session_id: str, owner: str):
+        self.sessions.update_one({"session_id": session_id, "owner": owner},
+                                 {"$set": {"owner": None, "lease_expires": 0}})
+
+    def owner(self, session_id: str) -> Optional[str]:
+        doc = self.sessions.find_one({"session_id": session_id, "lease_expires": {"$gte": time.time()}},
+                                     {"owner": 1})
+        return doc.get("owner") if doc else None
+
+    def delete(self, session_id: str):
+        self.sessions.delete_one({"session_id": session_id})
+
+    def purge(self, max_age_seconds: float) -> int:
+        now = time.time()
+        result = self.sessions.delete_many({"updated_at": {"$lt": now - max_age_seconds},
+                                            "lease_expires": {"$lt": now}})
+        return result.deleted_count
+
+
+def create_session_store():
+    """按 SESSION_STORE（none/auto/mongodb/sqlite）创建会话快照存储
+
+    none（默认）不保存快照，只能单进程运行；auto 时MongoDB不可用则退回SQLite。
+    """
+    backend = os.getenv("SESSION_STORE", "none").lower()
+    if backend == "none":
+        return None
+    if backend in ("auto", "mongodb"):
+        try:
+            from .mongodb_config import mongo_config
+            if mongo_config.database is not None or mongo_config.connect():
+                return MongoSessionStore()
+        except Exception as e:
+            print(f"❌ MongoDB会话存储不可用: {e}")
+        if backend == "mongodb":
+            raise ConnectionError("无法连接到MongoDB数据库")
+        print("⚠️ 使用本地SQLite存储会话快照")
+    return SQLiteSessionStore()
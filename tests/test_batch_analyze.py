@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+测试批量分析工具的解析和结果整理阶段
+"""
+
+import json
+import os
+import tempfile
+
+from utils.batch_analyze import finalize_game, game_key, prepare_game
+
+
+def _write_sgf(directory, name, content):
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
+
+
+def test_prepare_game_validates_moves():
+    """合法棋谱返回着法序列，重复落子的棋谱返回错误"""
+    with tempfile.TemporaryDirectory() as directory:
+        good = prepare_game(_write_sgf(directory, "good.sgf", "(;GM[1]SZ[19];B[pd];W[dp])"))
+        assert good["moves"] == [["B", "Q16"], ["W", "D4"]] and good["komi"] == 6.5
+        bad = prepare_game(_write_sgf(directory, "bad.sgf", "(;GM[1]SZ[19];B[pd];W[pd])"))
+        assert "error" in bad
+        small = prepare_game(_write_sgf(directory, "small.sgf", "(;GM[1]SZ[9];B[cc])"))
+        assert "棋盘大小" in small["error"]
+    print("✅ 棋谱解析校验测试通过")
+
+
+def test_finalize_game_writes_file():
+    """整理结果写出JSON文件并附带问题手汇总"""
+    with tempfile.TemporaryDirectory() as directory:
+        game = prepare_game(_write_sgf(directory, "game.sgf", "(;GM[1]SZ[19]KM[7.5];B[pd];W[dp])"))
+        records = {
+            turn: {"turn": turn, "move": move, "color": color, "black_winrate": 50.0,
+                   "white_winrate": 50.0, "score_lead": 0.0, "top_moves": []}
+            for turn, (color, move) in enumerate([[None, None]] + game["moves"])
+        }
+        output_path = finalize_game(game, records, "files", directory)
+        with open(output_path, encoding="utf-8") as f:
+            data = json.load(f)
+        assert data["komi"] == 7.5
+        assert [turn["turn"] for turn in data["turns"]] == [0, 1, 2]
+        assert data["summary"]["mistakes"] == []
+    print("✅ 结果文件写出测试通过")
+
+
+def test_same_name_in_subdirectories():
+    """不同子目录下的同名棋谱按相对路径区分输出文件和存储ID"""
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "out")
+        paths = []
+        for sub in ("2023", "2024"):
+            os.makedirs(os.path.join(directory, "games", sub))
+            paths.append(_write_sgf(os.path.join(directory, "games", sub), "game1.sgf", "(;GM[1]SZ[19];B[pd])"))
+        root = os.path.join(directory, "games")
+        assert [game_key(path, root) for path in paths] == ["2023/game1", "2024/game1"]
+        assert game_key(paths[0]) == "game1"
+
+        outputs = set()
+        for path in paths:
+            game = prepare_game(path, root)
+            records = {0: {"turn": 0, "move": None, "color": None, "black_winrate": 50.0,
+                           "white_winrate": 50.0, "score_lead": 0.0, "top_moves": []}}
+            outputs.add(finalize_game(game, records, "files", output))
+            assert finalize_game(game, records, "mongodb", output)[0] == f"batch_{game['key']}"
+        assert len(outputs) == 2 and all(os.path.exists(path) for path in outputs)
+    print("✅ 同名棋谱按相对路径区分")
+
+
+if __name__ == "__main__":
+    test_prepare_game_validates_moves()
+    test_finalize_game_writes_file()
+    test_same_name_in_subdirectories()
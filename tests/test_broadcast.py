@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+测试观战广播：每帧只编码一次、慢观战者的背压处理、观战连接随会话结束
+"""
+
+import asyncio
+import json
+
+from api.backend import GameManager
+from api.broadcast import Broadcast, Spectator
+from api.wire_codec import decode
+from core.rules import GoBoard
+
+MOVES = [["B", "Q16"], ["W", "D4"], ["B", "Q4"], ["W", "D16"], ["B", "C3"], ["W", "R3"]]
+
+
+class FakeGame:
+    """观战广播用到的字段（真实游戏实例需要KataGo和数据库）"""
+
+    def __init__(self):
+        self.board = GoBoard().board
+        self.moves = []
+        self.current_player = "B"
+        self.player_color = "B"
+        self.game_over = False
+        self.captured_black = 0
+        self.captured_white = 0
+        self.winrate_history = []
+
+    def play(self, color, move):
+        self.moves.append([color, move])
+        self.board = GoBoard.from_moves(self.moves).board
+        self.current_player = "W" if color == "B" else "B"
+
+    def stop_realtime_analysis(self):
+        pass
+
+    def cleanup(self):
+        pass
+
+
+class FakeWebSocket:
+    def __init__(self, blocked=None):
+        self.frames = []
+        self.closed = None
+        self.blocked = blocked  # 设置后发送在此等待，模拟网络慢的客户端
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        if self.blocked is not None:
+            await self.blocked.wait()
+        self.frames.append(json.loads(data))
+
+    async def send_bytes(self, data):
+        self.frames.append(decode(data, "msgpack"))
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+def apply_frames(frames):
+    """按客户端的方式应用快照和增量，返回最终的着法和版本号"""
+    moves, version = None, None
+    for frame in frames:
+        if frame["type"] == "game_state":
+            moves, version = list(frame["data"]["moves"]), frame["version"]
+        elif frame["type"] == "game_state_delta":
+            assert frame["base_version"] == version, "增量与本地版本不连续"
+            if "moves" in frame["data"]:
+                del moves[frame["data"]["moves"]["truncate"]:]
+                moves.extend(frame["data"]["moves"]["append"])
+            version = frame["version"]
+    return moves, version
+
+
+def test_encode_once():
+    """每个状态增量按用到的编码各编码一次，所有观战者收到相同的内容"""
+    async def run():
+        game = FakeGame()
+        broadcast = Broadcast("s")
+        sockets = [FakeWebSocket() for _ in range(20)]
+        for index, websocket in enumerate(sockets):
+            broadcast.subscribe(Spectator(websocket, "msgpack" if index == 0 else "json"), game)
+        encodes = broadcast.encodes
+        for color, move in MOVES:
+            game.play(color, move)
+            broadcast.publish_state(game)
+        broadcast.publish({"type": "realtime_suggestions", "data": [{"move": "R16"}]})
+        await asyncio.sleep(0.05)
+        return sockets, broadcast.encodes - encodes
+
+    sockets, encodes = asyncio.run(run())
+    assert encodes == 2 * (len(MOVES) + 1)  # json 和 msgpack 各一次，与观战人数无关
+    for websocket in sockets:
+        assert apply_frames(websocket.frames)[0] == MOVES
+        assert websocket.frames[-1]["type"] == "realtime_suggestions"
+    print(f"✅ 每帧只编码一次: {len(sockets)} 个观战者，{encodes} 次编码")
+
+
+def test_slow_spectator_resync():
+    """慢观战者积压超过上限时丢弃积压，改收完整快照，之后的增量与快照版本连续；其他观战者不受影响"""
+    async def run():
+        game = FakeGame()
+        broadcast = Broadcast("s")
+        blocked = asyncio.Event()
+        slow, fast = FakeWebSocket(blocked), FakeWebSocket()
+        slow_spectator = Spectator(slow, queue_size=2)
+        broadcast.subscribe(slow_spectator, game)
+        broadcast.subscribe(Spectator(fast), game)
+        for color, move in MOVES[:4]:
+            game.play(color, move)
+            broadcast.publish_state(game)
+            await asyncio.sleep(0)
+        blocked.set()
+        for color, move in MOVES[4:]:
+            game.play(color, move)
+            broadcast.publish_state(game)
+        await asyncio.sleep(0.05)
+        return slow, fast, slow_spectator
+
+    slow, fast, slow_spectator = asyncio.run(run())
+    assert apply_frames(fast.frames)[0] == MOVES and len(fast.frames) == len(MOVES) + 1
+    assert apply_frames(slow.frames)[0] == MOVES
+    assert slow_spectator.dropped > 0 and slow_spectator.resyncs > 0
+    assert len(slow.frames) < len(fast.frames)
+    print(f"✅ 慢观战者改收快照: 丢弃 {slow_spectator.dropped} 帧，收到 {len(slow.frames)} 帧")
+
+
+def test_watch_session():
+    """观战连接收到对局者的分析帧，不存在的会话被拒绝，会话结束时观战连接关闭"""
+    async def run():
+        manager = GameManager()
+        manager.grace_period = 0
+        game = FakeGame()
+        manager.games["s"] = game
+
+        missing = FakeWebSocket()
+        assert await manager.watch(missing, "other") is None and missing.closed == 4004
+
+        owner = await manager.connect(FakeWebSocket(), "s")
+        watcher = FakeWebSocket()
+        spectator = await manager.watch(watcher, "s")
+        assert spectator is not None
+
+        game.play("B", "Q16")
+        await manager.send_game_state("s")
+        await owner.send_message({"type": "realtime_suggestions", "data": []})
+        await owner.send_message({"type": "legal_moves", "data": []})  # 只发给对局者
+        await asyncio.sleep(0.05)
+        types = [frame["type"] for frame in watcher.frames]
+
+        manager.disconnect("s", owner)
+        await asyncio.sleep(0.05)
+        return manager, watcher, types
+
+    manager, watcher, types = asyncio.run(run())
+    assert types == ["game_state", "game_state_delta", "realtime_suggestions"]
+    assert watcher.frames[-1]["type"] == "session_ended" and watcher.closed == 4000
+    assert not manager.broadcasts
+    print("✅ 观战连接跟随会话")
+
+
+if __name__ == "__main__":
+    test_encode_once()
+    test_slow_spectator_resync()
+    test_watch_session()
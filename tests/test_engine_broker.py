@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+测试引擎服务：客户端查询和批量回合分析、共享缓存、引擎退出后重启而客户端连接保持
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+from core.engine_broker import BrokerEngine, EngineBroker, parse_address
+from core.human_vs_katago import FAKE_KATAGO_BIN
+from core.katago_engine import KataGoEngine
+
+MOVES = [["B", "Q16"], ["W", "D4"], ["B", "Q4"]]
+
+
+def make_engine():
+    return KataGoEngine(FAKE_KATAGO_BIN, "", "", require_files=False, startup_wait=0.2)
+
+
+def make_request(engine, moves, **extra):
+    return {"id": engine.next_request_id("test"), "rules": "Chinese", "komi": 7.5,
+            "boardXSize": 19, "boardYSize": 19, "moves": moves, "maxVisits": 20, **extra}
+
+
+def start_broker(engines=1):
+    address = f"unix:{os.path.join(tempfile.mkdtemp(), 'katago.sock')}"
+    broker = EngineBroker(make_engine, address, engines=engines)
+    broker.start()
+    return broker
+
+
+def test_parse_address():
+    assert parse_address("unix:/tmp/a.sock")[1] == "/tmp/a.sock"
+    assert parse_address("/tmp/a.sock")[1] == "/tmp/a.sock"
+    assert parse_address("tcp:127.0.0.1:7790")[1] == ("127.0.0.1", 7790)
+    assert parse_address("localhost:7790")[1] == ("localhost", 7790)
+    print("✅ 地址解析")
+
+
+def test_clients_share_broker():
+    """两个客户端的同名请求id互不干扰，相同局面第二次直接命中服务端缓存"""
+    broker = start_broker(engines=2)
+    first, second = BrokerEngine(broker.address), BrokerEngine(broker.address)
+    try:
+        first.start()
+        second.start()
+        assert first.next_request_id("move") == second.next_request_id("move")
+
+        result = first.query(make_request(first, MOVES), timeout=10)
+        assert result["rootInfo"]["visits"] >= 20 and result["moveInfos"]
+        cached = second.query(make_request(second, MOVES), timeout=10)
+        assert cached["moveInfos"] == result["moveInfos"]
+        assert broker.stats()["cache_hits"] == 1
+
+        req = make_request(first, MOVES, analyzeTurns=[0, 1, 2, 3])
+        turns = sorted(msg["turnNumber"] for msg in first.analyze_turns(req, timeout=10))
+        assert turns == [0, 1, 2, 3]
+        for _ in range(50):  # release 异步到达服务端
+            if broker.stats()["inflight"] == [0, 0]:
+                break
+            time.sleep(0.01)
+        assert broker.stats()["inflight"] == [0, 0]
+    finally:
+        first.close()
+        second.close()
+        broker.close()
+    print(f"✅ 多个客户端共享引擎服务: {broker.stats()}")
+
+
+def test_terminated_query_not_cached():
+    """被终止的查询只搜索了一部分，结果不写入共享缓存"""
+    broker = start_broker()
+    client = BrokerEngine(broker.address)
+    try:
+        client.start()
+        req = make_request(client, MOVES, maxVisits=50000)
+        finished = threading.Event()
+        results = []
+
+        def on_message(msg):
+            if not msg.get("isDuringSearch", False):
+                results.append(msg)
+                finished.set()
+
+        client.submit(req, on_message)
+        time.sleep(0.2)
+        client.terminate(req["id"])
+        assert finished.wait(10)
+        client.release(req["id"])
+        assert results[0]["rootInfo"]["visits"] < 50000
+        assert broker.cache.get_stats()["entries"] == 0
+
+        # 同一局面再次查询，由引擎重新完整搜索
+        result = client.query(make_request(client, MOVES), timeout=10)
+        assert result["rootInfo"]["visits"] >= 20 and broker.stats()["cache_hits"] == 0
+    finally:
+        client.close()
+        broker.close()
+    print("✅ 被终止的查询不写入缓存")
+
+
+def test_engine_restart_keeps_clients():
+    """引擎进程退出后服务自动重启，客户端连接不断开，后续查询照常进行"""
+    broker = start_broker()
+    client = BrokerEngine(broker.address)
+    try:
+        client.start()
+        broker.engines[0].proc.kill()
+        for _ in range(100):
+            if broker.restarts:
+                break
+            time.sleep(0.05)
+        assert broker.restarts == 1 and client.is_alive()
+        result = client.query(make_request(client, MOVES[:1]), timeout=10)
+        assert result["moveInfos"]
+    finally:
+        client.close()
+        broker.close()
+    print("✅ 引擎重启不影响客户端")
+
+
+def test_broker_down_fails_fast():
+    """引擎服务停止时等待中的查询立即失败，而不是等到超时"""
+    broker = start_broker()
+    client = BrokerEngine(broker.address)
+    client.start()
+    errors = []
+
+    def run_query():
+        try:
+            client.query(make_request(client, MOVES, maxVisits=1000000), timeout=30)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    worker = threading.Thread(target=run_query)
+    worker.start()
+    time.sleep(0.3)
+    broker.close()
+    worker.join(timeout=5)
+    assert not worker.is_alive() and errors and not client.is_alive()
+    client.close()
+    print(f"✅ 引擎服务停止时查询立即失败: {errors[0]}")
+
+
+if __name__ == "__main__":
+    test_parse_address()
+    test_clients_share_broker()
+    test_terminated_query_not_cached()
+    test_engine_restart_keeps_clients()
+    test_broker_down_fails_fast()
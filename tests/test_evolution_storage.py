@@ -2,6 +2,7 @@
 
 import sys
 import os
+import tempfile
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from legacy.game_evolution_storage import GameEvolutionStorage
@@ -11,6 +12,8 @@ def test_evolution_storage():
     
     # 创建存储实例
     storage = GameEvolutionStorage("test_game")
+    # 写到临时目录，避免在仓库里留下测试输出
+    storage.storage_path = os.path.join(tempfile.mkdtemp(), os.path.basename(storage.storage_path))
     print(f"创建存储实例，游戏ID: {storage.game_id}")
     print(f"存储路径: {storage.storage_path}")
     
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+测试假KataGo引擎的协议兼容性（无需GPU和模型）
+"""
+
+import json
+import queue
+import time
+
+from core.human_vs_katago import FAKE_KATAGO_BIN
+from core.katago_engine import KataGoEngine
+from utils.fake_katago import FakeKataGo
+
+
+def _start_engine():
+    engine = KataGoEngine(FAKE_KATAGO_BIN, "", "", require_files=False, startup_wait=0.2)
+    engine.start()
+    return engine
+
+
+def test_query_returns_legal_moves():
+    """最终结果只包含合法着法，且同一局面结果确定"""
+    engine = _start_engine()
+    try:
+        moves = [["B", "D4"], ["W", "Q16"]]
+        request = {"id": engine.next_request_id("t"), "moves": moves, "rules": "chinese", "komi": 6.5,
+                   "boardXSize": 19, "boardYSize": 19, "maxVisits": 100,
+                   "includeOwnership": True, "includePolicy": True}
+        first = engine.query(request)
+        assert first["isDuringSearch"] is False
+        assert first["rootInfo"]["visits"] == 100
+        assert len(first["ownership"]) == 361 and len(first["policy"]) == 362
+        played = {move for _, move in moves}
+        assert all(info["move"] not in played for info in first["moveInfos"])
+
+        second = engine.query(dict(request, id=engine.next_request_id("t")))
+        assert [info["move"] for info in second["moveInfos"]] == [info["move"] for info in first["moveInfos"]]
+        print(f"✅ 假引擎推荐: {first['moveInfos'][0]['move']}")
+    finally:
+        engine.close()
+
+
+def test_streaming_and_terminate():
+    """reportDuringSearchEvery 产生中间结果，terminate 提前结束搜索"""
+    engine = _start_engine()
+    try:
+        responses = queue.Queue()
+        request_id = engine.next_request_id("stream")
+        engine.submit({"id": request_id, "moves": [], "rules": "chinese", "komi": 6.5,
+                       "boardXSize": 19, "boardYSize": 19, "maxVisits": 10000000,
+                       "reportDuringSearchEvery": 0.05}, responses.put)
+        partial = responses.get(timeout=5)
+        assert partial["isDuringSearch"] is True
+        engine.terminate(request_id)
+
+        deadline = time.monotonic() + 5
+        final = None
+        while time.monotonic() < deadline:
+            msg = responses.get(timeout=5)
+            if not msg["isDuringSearch"]:
+                final = msg
+                break
+        assert final is not None and final["rootInfo"]["visits"] < 10000000
+        engine.release(request_id)
+        print(f"✅ 流式结果与终止: {final['rootInfo']['visits']} 次访问后停止")
+    finally:
+        engine.close()
+
+
+def test_analyze_turns():
+    """analyzeTurns 为每个回合返回一条结果"""
+    engine = _start_engine()
+    try:
+        responses = queue.Queue()
+        request_id = engine.next_request_id("turns")
+        engine.submit({"id": request_id, "moves": [["B", "D4"], ["W", "Q16"], ["B", "Q4"]],
+                       "rules": "chinese", "komi": 6.5, "boardXSize": 19, "boardYSize": 19,
+                       "maxVisits": 20, "analyzeTurns": [0, 1, 2, 3]}, responses.put)
+        turns = sorted(responses.get(timeout=5)["turnNumber"] for _ in range(4))
+        engine.release(request_id)
+        assert turns == [0, 1, 2, 3]
+        print("✅ analyzeTurns 测试通过")
+    finally:
+        engine.close()
+
+
+def test_priority_and_terminated_pruning():
+    """排队的查询按优先级搜索；请求结束后终止记录被移除，长时间运行不会累积"""
+    fake = FakeKataGo(ms_per_visit=0.01, threads=1)
+    finished = []
+    fake.emit = lambda msg: finished.append(msg["id"]) if not msg.get("isDuringSearch", True) else None
+    query = {"moves": [], "komi": 6.5, "boardXSize": 19, "boardYSize": 19, "maxVisits": 20}
+    fake.handle_line(json.dumps(dict(query, id="busy", maxVisits=10000000)))
+    fake.handle_line(json.dumps(dict(query, id="low")))
+    fake.handle_line(json.dumps(dict(query, id="high", priority=5)))
+    time.sleep(0.1)
+    fake.handle_line(json.dumps({"id": "t1", "action": "terminate", "terminateId": "busy"}))
+    fake.handle_line(json.dumps({"id": "t2", "action": "terminate", "terminateId": "unknown"}))
+    fake.executor.shutdown(wait=True)
+    assert finished == ["busy", "high", "low"]
+    assert fake.terminated == set() and fake.active == {}
+    print("✅ 优先级排队与终止记录清理")
+
+
+if __name__ == "__main__":
+    test_query_returns_legal_moves()
+    test_streaming_and_terminate()
+    test_analyze_turns()
+    test_priority_and_terminated_pruning()
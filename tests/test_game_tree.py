@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+测试推演模式的变化树：分支保留主线、切换分支复用分析、持久化重建
+"""
+
+from api.state_protocol import StateTracker
+from core.analysis_game import AnalysisGame
+from core.game_tree import GameTree
+from core.key_moments import KeyMomentDetector
+from core.rules import GoBoard
+
+MAIN_LINE = [["B", "Q16"], ["W", "D4"], ["B", "Q4"], ["W", "D16"]]
+
+
+def _analyzed_tree():
+    tree = GameTree.from_moves(MAIN_LINE)
+    for node in tree.line():
+        node.analysis = {"move_number": node.depth, "move": node.move, "black_winrate": 50.0 + node.depth}
+    return tree
+
+
+def test_branch_keeps_main_line():
+    """回到第2手后另下一手，主线和分析都保留"""
+    tree = _analyzed_tree()
+    tree.goto_depth(2)
+    assert tree.moves() == MAIN_LINE[:2]
+    # 回退后当前变化仍延续到主线末端
+    assert [node.move for node in tree.line()] == ["Q16", "D4", "Q4", "D16"]
+
+    node, created = tree.play("B", "C3")
+    assert created and node.depth == 3 and node.analysis is None
+    assert [node.move for node in tree.line()] == ["Q16", "D4", "C3"]
+    assert [entry["move_number"] for entry in tree.winrate_line()] == [1, 2]
+
+    variations = tree.variations()
+    assert len(variations) == 1 and variations[0]["move_number"] == 2
+    assert [child["move"] for child in variations[0]["children"]] == ["Q4", "C3"]
+    print(f"✅ 分支点: {variations}")
+
+
+def test_switch_back_reuses_analysis():
+    """切换回主线节点时分析结果仍在，重新下出同一手进入已有节点"""
+    tree = _analyzed_tree()
+    main_end = tree.current.node_id
+    tree.goto_depth(2)
+    tree.play("B", "C3")
+
+    tree.goto(main_end)
+    assert tree.moves() == MAIN_LINE
+    assert [entry["move_number"] for entry in tree.winrate_line()] == [1, 2, 3, 4]
+
+    tree.goto_depth(2)
+    node, created = tree.play("B", "Q4")
+    assert not created and node.analysis["black_winrate"] == 53.0
+    assert len(tree.nodes) == 6  # 根 + 主线4手 + 分支1手
+    print("✅ 切换分支复用分析结果")
+
+
+def test_persist_and_restore():
+    """节点只保存父节点和一手棋，可以按文档重建"""
+    tree = _analyzed_tree()
+    tree.goto_depth(1)
+    tree.play("W", "R3")
+    docs = [node.to_doc() for node in tree.nodes.values() if node.parent is not None]
+    assert all(set(doc) == {"id", "parent", "color", "move"} for doc in docs)
+
+    restored = GameTree.from_docs(reversed(docs))
+    assert len(restored.nodes) == len(tree.nodes)
+    # 重建后默认沿第一个子节点（最早的主线）延续
+    assert [[node.color, node.move] for node in restored.line()] == MAIN_LINE
+    assert restored.play("B", "C3")[0].node_id == max(doc["id"] for doc in docs) + 1
+    print(f"✅ 变化树持久化: {len(docs)} 个节点")
+
+
+class FakeEvolutionStorage:
+    def __init__(self):
+        self.records = []
+
+    def add_move_data(self, **record):
+        self.records.append(record)
+
+
+class FakeImportGame:
+    """借用 AnalysisGame 写入批量分析结果的方法（真实游戏实例需要数据库）"""
+    apply_import_results = AnalysisGame.apply_import_results
+    _record_imported_turn = AnalysisGame._record_imported_turn
+
+    def __init__(self):
+        self.tree = GameTree.from_moves(MAIN_LINE)
+        self.imported_nodes = [self.tree.root] + self.tree.path()
+        self.imported_boards = []
+        self.komi = 7.5
+        self.winrate_history = []
+        self.key_moments = KeyMomentDetector()
+        self.evolution_storage = FakeEvolutionStorage()
+
+
+def test_import_results_follow_imported_line():
+    """批量分析结果写回导入的主线节点，即使用户已经切换到别的分支"""
+    game = FakeImportGame()
+    game.tree.goto_depth(2)
+    branch, _ = game.tree.play("B", "C3")
+    results = [(turn, {"rootInfo": {"winrate": 0.4}, "moveInfos": [{"move": "R3"}]}) for turn in (3, 4)]
+    updates = game.apply_import_results(MAIN_LINE, results)
+    assert [update["move"] for update in updates] == ["Q4", "D16"]
+    assert branch.analysis is None
+    main_line = game.imported_nodes
+    assert [node.analysis["move_number"] for node in main_line[3:]] == [3, 4]
+    assert [record["node_id"] for record in game.evolution_storage.records] == \
+        [node.node_id for node in main_line[3:]]
+    print("✅ 批量分析结果写回导入主线")
+
+
+class FakeNavigationGame:
+    """借用 AnalysisGame 的变化树导航（真实游戏实例需要KataGo和数据库）"""
+    goto_move = AnalysisGame.goto_move
+    _load_node = AnalysisGame._load_node
+    _sync_winrate_line = AnalysisGame._sync_winrate_line
+
+    def __init__(self):
+        self.tree = _analyzed_tree()
+        self.moves = [list(move) for move in MAIN_LINE]
+        self.board = GoBoard.from_moves(MAIN_LINE).board
+        self.current_player = "B"
+        self.game_over = False
+        self.captured_black = 0
+        self.captured_white = 0
+        self.winrate_history = []
+        self.key_moments = KeyMomentDetector()
+
+    def update_key_moments(self, persist=True):
+        pass
+
+
+def test_navigation_sends_suffix_delta():
+    """导航后的着法与落子路径一样是 [color, move] 列表，状态增量只发送变化的后缀"""
+    game = FakeNavigationGame()
+    tracker = StateTracker()
+    tracker.encode(game)
+    assert game.goto_move(2)
+    assert tracker.encode(game)["data"]["moves"] == {"truncate": 2, "append": []}
+    assert game.goto_move(4)
+    assert game.moves == MAIN_LINE
+    assert tracker.encode(game)["data"]["moves"] == {"truncate": 2, "append": MAIN_LINE[2:]}
+    print("✅ 导航只发送着法的后缀增量")
+
+
+if __name__ == "__main__":
+    test_branch_keeps_main_line()
+    test_switch_back_reuses_analysis()
+    test_persist_and_restore()
+    test_import_results_follow_imported_line()
+    test_navigation_sends_suffix_delta()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+测试问题手（关键时刻）增量检测
+"""
+
+from core.human_vs_katago import WeiQiGame
+from core.key_moments import KeyMomentDetector
+
+
+def _entry(move_number, move, color, black_winrate, score_lead=0.0, **extra):
+    entry = {"move_number": move_number, "move": move, "color": color,
+             "black_winrate": black_winrate, "white_winrate": 100 - black_winrate,
+             "score_lead": score_lead}
+    entry.update(extra)
+    return entry
+
+
+def test_detects_blunder_with_best_alternative():
+    """胜率大幅下降的着法被标记，并给出落子前局面的首选推荐"""
+    detector = KeyMomentDetector()
+    history = [_entry(0, "开局", "B", 50.0), _entry(1, "Q16", "B", 52.0), _entry(2, "D4", "W", 51.0)]
+    detector.record_recommendations(2, [{"move": "C3", "winrate": 0.6}])
+    assert detector.update(history) is False
+
+    history.append(_entry(3, "A1", "B", 20.0))
+    assert detector.update(history) is True
+    moment = detector.moments[3]
+    assert moment["label"] == "blunder" and moment["best_move"] == "C3"
+    assert moment["winrate_loss"] == 31.0
+    assert detector.get_index()["turning_points"] == [3]
+    print(f"✅ 检测到问题手: {moment}")
+
+
+def test_score_loss_and_truncation():
+    """目差损失按落子方视角计算；悔棋截断后对应的关键时刻被移除"""
+    detector = KeyMomentDetector()
+    # score_lead 为轮到下棋一方的视角：落子前白棋领先3目，落子后黑棋（对方）领先4目 → 白棋损失7目
+    history = [_entry(0, "开局", "B", 50.0, score_lead=-3.0), _entry(1, "Q16", "B", 50.0, score_lead=3.0),
+               _entry(2, "D4", "W", 52.0, score_lead=4.0)]
+    detector.update(history)
+    assert detector.moments[2]["label"] == "mistake"
+    assert detector.moments[2]["score_loss"] == 7.0
+
+    assert detector.update(history[:2]) is True
+    assert detector.moments == {}
+    print("✅ 目差损失与截断测试通过")
+
+
+def test_placeholder_entries_ignored():
+    """分支模式的占位胜率不参与检测"""
+    detector = KeyMomentDetector()
+    history = [_entry(0, "开局", "B", 80.0), _entry(1, "Q16", "B", 50.0, analyzed=False)]
+    assert detector.update(history) is False
+    print("✅ 占位数据忽略测试通过")
+
+
+class FakeStorage:
+    def __init__(self):
+        self.writes = []
+
+    def set_key_moments(self, index):
+        self.writes.append(index)
+
+
+class FakeGame:
+    """借用 WeiQiGame 的回溯和关键时刻更新（真实游戏实例需要KataGo和数据库）"""
+    goto_move = WeiQiGame.goto_move
+    update_key_moments = WeiQiGame.update_key_moments
+
+    def __init__(self):
+        self.board_size = 19
+        self.moves = [["B", "Q16"], ["W", "D4"], ["B", "A1"]]
+        self.winrate_history = [_entry(0, "开局", "B", 50.0), _entry(1, "Q16", "B", 52.0),
+                                _entry(2, "D4", "W", 51.0), _entry(3, "A1", "B", 20.0)]
+        self.key_moments = KeyMomentDetector()
+        self.key_moments_unsaved = False
+        self.evolution_storage = FakeStorage()
+
+
+def test_navigation_does_not_persist():
+    """回溯只更新内存中的索引，下一次胜率历史改变时再写入存储"""
+    game = FakeGame()
+    game.update_key_moments()
+    assert len(game.evolution_storage.writes) == 1
+
+    assert game.goto_move(2)
+    assert game.key_moments.moments == {} and len(game.evolution_storage.writes) == 1
+
+    # 之后的落子没有新的问题手，索引与回溯后相同，也要写入回溯造成的变化
+    game.winrate_history.append(_entry(3, "C3", "B", 50.0))
+    game.update_key_moments()
+    assert len(game.evolution_storage.writes) == 2
+    assert game.evolution_storage.writes[-1]["turning_points"] == []
+    game.update_key_moments()
+    assert len(game.evolution_storage.writes) == 2
+    print("✅ 浏览历史不写入关键时刻索引")
+
+
+if __name__ == "__main__":
+    test_detects_blunder_with_best_alternative()
+    test_score_loss_and_truncation()
+    test_placeholder_entries_ignored()
+    test_navigation_does_not_persist()
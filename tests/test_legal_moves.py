@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+测试整盘合法着点掩码和策略热力图
+"""
+
+import random
+
+from core.human_vs_katago import FAKE_KATAGO_BIN
+from core.katago_engine import KataGoEngine
+from core.ownership import policy_heatmap
+from core.rules import BLACK, WHITE, GoBoard, format_point, parse_point
+
+
+def _random_board(seed, plies=160):
+    rng = random.Random(seed)
+    go_board = GoBoard()
+    color = "B"
+    for _ in range(plies):
+        candidates = [(r, c) for r in range(19) for c in range(19) if go_board.is_legal(r, c, color)]
+        row, col = rng.choice(candidates)
+        go_board.play(format_point(row, col), color)
+        color = "W" if color == "B" else "B"
+    return go_board
+
+
+def test_mask_matches_is_legal():
+    """掩码与逐点判断结果一致"""
+    for seed in range(5):
+        go_board = _random_board(seed)
+        for color in (BLACK, WHITE):
+            mask = go_board.legal_mask(color)
+            for row in range(19):
+                for col in range(19):
+                    assert bool(mask[row][col]) == go_board.is_legal(row, col, color), (seed, row, col)
+    print("✅ 合法着点掩码与逐点判断一致")
+
+
+def test_suicide_and_ko():
+    """自杀点和打劫禁着点不合法"""
+    go_board = GoBoard()
+    for color, move in [("W", "A2"), ("B", "Q16"), ("W", "B1")]:
+        go_board.play(move, color)
+    row, col = parse_point("A1")
+    assert go_board.legal_mask("B")[row][col] == 0  # 黑棋下A1无气且不能提子，是自杀
+    assert go_board.legal_mask("W")[row][col] == 1  # 白棋下A1与自己有气的棋相连
+
+    ko = GoBoard()
+    for color, move in [("B", "D4"), ("W", "E4"), ("B", "C5"), ("W", "F5"),
+                        ("B", "D6"), ("W", "E6"), ("W", "D5"), ("B", "E5")]:
+        ko.play(move, color)
+    # 黑E5提白D5形成劫，白棋不能立即回提
+    assert ko.ko_point == parse_point("D5")
+    row, col = parse_point("D5")
+    assert ko.legal_mask("W")[row][col] == 0
+    print("✅ 自杀与打劫判断正确")
+
+
+def test_policy_heatmap_from_engine():
+    """策略网络输出转换为棋盘方向的热力图，已落子的点概率为0"""
+    engine = KataGoEngine(FAKE_KATAGO_BIN, "", "", require_files=False, startup_wait=0.2)
+    engine.start()
+    try:
+        moves = [["B", "Q16"], ["W", "D4"]]
+        msg = engine.query({"id": engine.next_request_id("policy"), "moves": moves, "rules": "Chinese",
+                            "komi": 7.5, "boardXSize": 19, "boardYSize": 19, "maxVisits": 1,
+                            "includePolicy": True})
+        heatmap = policy_heatmap(msg["policy"])
+        for _, move in moves:
+            row, col = parse_point(move)
+            assert heatmap["heatmap"][row][col] == 0
+        assert abs(sum(map(sum, heatmap["heatmap"])) + heatmap["pass"] - 1.0) < 0.01
+        assert policy_heatmap(msg["policy"][:100]) is None
+        print(f"✅ 策略热力图: 最大概率 {heatmap['max']}")
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    test_mask_matches_is_legal()
+    test_suicide_and_ko()
+    test_policy_heatmap_from_engine()
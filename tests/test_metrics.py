@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+测试分阶段耗时统计：直方图分位数、阶段计时、会话追踪（含工作线程）、落子流程的各阶段
+"""
+
+import asyncio
+import json
+import time
+
+from api.backend import GameManager
+from core.metrics import Histogram, Metrics, metrics
+from core.rules import GoBoard
+
+
+def test_histogram():
+    histogram = Histogram()
+    for ms in [0.2] * 90 + [40] * 9 + [1200]:
+        histogram.observe(ms)
+    summary = histogram.summary()
+    assert summary["count"] == 100 and summary["p50_ms"] == 0.5
+    assert summary["p95_ms"] == 50 and summary["p99_ms"] == 50 and summary["max_ms"] == 1200
+    print(f"✅ 直方图分位数: {summary}")
+
+
+def test_stopwatch_and_prometheus():
+    local = Metrics()
+
+    @local.timed("work")
+    def work():
+        watch = local.stopwatch("work")
+        time.sleep(0.002)
+        watch.lap("first")
+        watch.lap("second")
+
+    work()
+    spans = local.snapshot()["spans"]
+    assert set(spans) == {"work", "work.first", "work.second"}
+    assert spans["work.first"]["avg_ms"] >= 2 and spans["work.second"]["avg_ms"] < 2
+    text = local.render_prometheus()
+    assert 'weiqi_span_seconds_count{span="work.first"} 1' in text
+    assert 'weiqi_span_seconds_bucket{span="work",le="+Inf"} 1' in text
+    print("✅ 阶段计时与 Prometheus 输出")
+
+
+def test_session_trace():
+    """只有开启追踪的会话记录明细，asyncio.to_thread 中的span同样归属到会话"""
+    local = Metrics()
+    local.enable_trace("traced")
+
+    def engine_query():
+        with local.span("engine"):
+            pass
+
+    async def command(session_id):
+        with local.session(session_id):
+            with local.span("command"):
+                await asyncio.to_thread(engine_query)
+
+    async def run():
+        await asyncio.gather(command("traced"), command("other"))
+
+    asyncio.run(run())
+    assert [span["name"] for span in local.get_trace("traced")] == ["engine", "command"]
+    assert local.get_trace("other") is None
+    assert local.snapshot()["spans"]["command"]["count"] == 2
+    assert len(local.disable_trace("traced")) == 2 and not local.is_tracing("traced")
+    print("✅ 会话追踪")
+
+
+class FakeGame:
+    """推演模式落子流程用到的字段（真实游戏实例需要KataGo和数据库）"""
+
+    def __init__(self):
+        self.board = GoBoard().board
+        self.moves = []
+        self.current_player = "B"
+        self.player_color = "B"
+        self.game_over = False
+        self.captured_black = 0
+        self.captured_white = 0
+        self.winrate_history = []
+
+    def make_move(self, move):
+        self.moves.append([self.current_player, move])
+        self.board = GoBoard.from_moves(self.moves).board
+        self.current_player = "W" if self.current_player == "B" else "B"
+        return True
+
+    def _send_analysis_request(self):
+        with metrics.span("test.engine"):
+            return {"moveInfos": [{"move": "D4", "winrate": 0.5}]}
+
+    def stop_realtime_analysis(self):
+        pass
+
+    def cleanup(self):
+        pass
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        self.frames.append(json.loads(data))
+
+    async def close(self, code=1000):
+        pass
+
+
+def test_move_pipeline_spans():
+    """经过命令邮箱的落子：管理器、游戏、引擎、编码和发送各阶段都有记录，追踪只包含该会话"""
+    async def run():
+        manager = GameManager()
+        manager.games["s"] = FakeGame()
+        await manager.connect(FakeWebSocket(), "s")
+        metrics.enable_trace("s")
+        message = {"type": "make_move", "move": "Q16", "game_mode": "analysis"}
+        await manager.dispatch("s", message, lambda: manager.make_move("s", "Q16", "analysis"))
+        await manager.actors["s"].join()
+        trace = metrics.disable_trace("s")
+        manager.evict_session("s")
+        return trace
+
+    trace = asyncio.run(run())
+    names = [span["name"] for span in trace]
+    for name in ("manager.make_move", "manager.make_move.game", "manager.make_move.ai_analysis",
+                 "manager.send_game_state", "ws.encode.json", "ws.send", "test.engine"):
+        assert name in names, name
+    assert names[-1] == "manager.make_move"
+    assert metrics.snapshot()["spans"]["manager.make_move"]["count"] >= 1
+    print(f"✅ 落子流程各阶段: {len(trace)} 条span")
+
+
+def test_trace_endpoint_unknown_session():
+    """不存在的会话不能开启追踪（缓冲区只在会话清理时释放）"""
+    from fastapi import HTTPException
+    from api import backend
+
+    try:
+        asyncio.run(backend.set_session_trace("missing", {"enabled": True}))
+        assert False, "应当拒绝"
+    except HTTPException as e:
+        assert e.status_code == 404
+    assert not metrics.is_tracing("missing")
+
+    backend.manager.games["known"] = FakeGame()
+    try:
+        assert asyncio.run(backend.set_session_trace("known", {"enabled": True}))["tracing"]
+        assert asyncio.run(backend.set_session_trace("known", {"enabled": False}))["spans"] == []
+    finally:
+        backend.manager.games.pop("known", None)
+    print("✅ 拒绝为不存在的会话开启追踪")
+
+
+if __name__ == "__main__":
+    test_histogram()
+    test_stopwatch_and_prometheus()
+    test_session_trace()
+    test_move_pipeline_spans()
+    test_trace_endpoint_unknown_session()
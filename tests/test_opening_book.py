@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+测试开局定式库：写出与查询、对称方向的还原、从演化记录收集时的悔棋和变化处理、实时推荐选点命中
+"""
+
+import os
+import tempfile
+
+from core.analysis_cache import AnalysisCache
+from core.human_vs_katago import WeiQiGame
+from core.opening_book import OpeningBook, OpeningBookBuilder
+from core.symmetry import TRANSFORMS, transform_move
+from core.visit_budget import VisitBudgetController
+
+LINE = [["B", "Q16"], ["W", "D4"]]
+
+
+def engine_response(visits=100):
+    return {
+        "moveInfos": [
+            {"move": "Q4", "winrate": 0.46, "scoreLead": -0.5, "visits": visits, "pv": ["Q4", "D16"]},
+            {"move": "D16", "winrate": 0.45, "scoreLead": -0.7, "visits": visits // 2}
+        ],
+        "rootInfo": {"winrate": 0.46, "scoreLead": -0.5, "visits": visits + visits // 2}
+    }
+
+
+def write_book(builder):
+    path = os.path.join(tempfile.mkdtemp(), "book.bin")
+    builder.write(path)
+    return OpeningBook(path)
+
+
+def test_write_and_lookup():
+    builder = OpeningBookBuilder(max_depth=4)
+    assert builder.add_position(LINE, 7.5, engine_response())
+    assert not builder.add_position(LINE * 3, 7.5, engine_response())  # 超过最大手数
+    book = write_book(builder)
+    try:
+        assert book.count == 1 and book.max_depth == 4
+        response = book.lookup_moves(LINE, 7.5)
+        assert response["fromOpeningBook"] and response["rootInfo"]["visits"] == 150
+        assert [info["move"] for info in response["moveInfos"]] == ["Q4", "D16"]
+        assert response["moveInfos"][0]["pv"] == ["Q4", "D16"]
+        assert book.lookup_moves(LINE, 6.5) is None  # 贴目不同
+        assert book.lookup_moves(LINE[:1], 7.5) is None
+    finally:
+        book.close()
+    print("✅ 定式库写出与查询")
+
+
+def test_symmetric_lookup():
+    """任意对称方向的局面都命中同一条目，推荐点和主要变化还原到查询方向"""
+    builder = OpeningBookBuilder()
+    builder.add_position(LINE, 7.5, engine_response())
+    book = write_book(builder)
+    try:
+        for transform in TRANSFORMS:
+            moves = [[color, transform_move(move, transform)] for color, move in LINE]
+            response = book.lookup_moves(moves, 7.5)
+            assert response is not None, transform
+            expected = {transform_move("Q4", transform), transform_move("D16", transform)}
+            assert {info["move"] for info in response["moveInfos"]} == expected
+            best = response["moveInfos"][0]
+            assert best["pv"][0] == best["move"]
+    finally:
+        book.close()
+    print("✅ 对称局面命中并还原方向")
+
+
+def record(move_number, color, move):
+    return {
+        "move_number": move_number, "color": color, "move": move,
+        "winrate_data": {"black_winrate": 50.0, "score_lead": 0.0},
+        "recommended_moves": [{"move": "Q4", "winrate": 0.5, "visits": 10}]
+    }
+
+
+def test_evolution_document_with_undo():
+    """悔棋重下后，同一手数只采用最后走过的线，被放弃的后续记录不混入"""
+    doc = {"evolution_data": [
+        {"move_number": 0, "move": None, "color": None},
+        record(1, "black", "Q16"), record(2, "white", "D4"), record(3, "black", "Q4"),
+        # 悔棋两手后重下第2手
+        record(2, "white", "D16"),
+    ]}
+    assert OpeningBookBuilder._main_line_records(doc["evolution_data"])[-1]["move"] == "D16"
+    builder = OpeningBookBuilder()
+    assert builder.add_evolution_document(doc, komi=7.5) == 2
+    book = write_book(builder)
+    try:
+        assert book.lookup_moves([["B", "Q16"], ["W", "D16"]], 7.5) is not None
+        assert book.lookup_moves([["B", "Q16"], ["W", "D4"], ["B", "Q4"]], 7.5) is None
+    finally:
+        book.close()
+    print("✅ 演化记录的悔棋处理")
+
+
+def test_evolution_document_komi():
+    """局面按记录中的贴目归类：每手记录的贴目优先，其次是文档设置，最后才用参数"""
+    def line(**extra):
+        records = [record(1, "black", "Q16"), record(2, "white", "D4")]
+        for item in records:
+            item.update(extra)
+        return [{"move_number": 0, "move": None, "color": None}] + records
+
+    builder = OpeningBookBuilder()
+    assert builder.add_evolution_document({"evolution_data": line(komi=7.5)}, komi=6.5) == 2
+    book = write_book(builder)
+    try:
+        assert book.lookup_moves(LINE, 7.5) is not None and book.lookup_moves(LINE, 6.5) is None
+    finally:
+        book.close()
+
+    builder = OpeningBookBuilder()
+    builder.add_evolution_document({"evolution_data": line(), "game_settings": {"komi": 5.5}}, komi=6.5)
+    book = write_book(builder)
+    try:
+        assert book.lookup_moves(LINE, 5.5) is not None and book.lookup_moves(LINE, 6.5) is None
+    finally:
+        book.close()
+    print("✅ 按记录的贴目归类")
+
+
+class FakeRealtimeGame:
+    """借用 WeiQiGame 的实时推荐入口（真实游戏实例需要KataGo和数据库）"""
+    start_realtime_analysis = WeiQiGame.start_realtime_analysis
+    stop_realtime_analysis = WeiQiGame.stop_realtime_analysis
+    _realtime_suggestions = staticmethod(WeiQiGame._realtime_suggestions)
+
+    def __init__(self, book):
+        self.opening_book = book
+        self.analysis_cache = AnalysisCache()
+        self.visit_budget = VisitBudgetController()
+        self.suggestion_ai_time_limit = 3
+        self.moves = []
+        self.komi = 7.5
+        self.engine = None
+
+    def _check_process_alive(self):
+        return False  # 只有走到引擎查询时才会用到
+
+
+def test_realtime_suggestions_from_book():
+    """实时推荐选点先查定式库和缓存，命中时直接回调，不提交引擎查询"""
+    builder = OpeningBookBuilder()
+    builder.add_position(LINE, 7.5, engine_response())
+    book = write_book(builder)
+    try:
+        game = FakeRealtimeGame(book)
+        game.moves = [list(move) for move in LINE]
+        received = []
+        game.start_realtime_analysis(received.append)
+        assert [mv["move"] for mv in received[0]] == ["Q4", "D16"]
+
+        # 定式库之外的局面取缓存中的结果
+        game.moves = LINE + [["B", "Q4"]]
+        game.analysis_cache.put(game.moves, game.komi, engine_response(visits=100000), budget=100000)
+        game.start_realtime_analysis(received.append)
+        assert len(received) == 2 and received[1][0]["visits"] == 100000
+
+        game.moves = LINE + [["B", "C3"]]
+        try:
+            game.start_realtime_analysis(received.append)
+            assert False, "未命中时应当请求引擎"
+        except RuntimeError:
+            pass
+    finally:
+        book.close()
+    print("✅ 实时推荐命中定式库和缓存")
+
+
+if __name__ == "__main__":
+    test_write_and_lookup()
+    test_symmetric_lookup()
+    test_evolution_document_with_undo()
+    test_evolution_document_komi()
+    test_realtime_suggestions_from_book()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+测试NumPy版ownership：方向转换、阈值计数、量化与局面差异
+"""
+
+import numpy as np
+
+from core.ownership import Ownership
+from core.rules import ownership_index
+from storage.game_evolution_mongodb import GameEvolutionMongoDB
+
+
+def _katago_ownership(value_at):
+    """按棋盘坐标生成KataGo顺序的一维ownership"""
+    ownership = [0.0] * 361
+    for row in range(19):
+        for col in range(19):
+            ownership[ownership_index(row, col)] = value_at(row, col)
+    return ownership
+
+
+def test_orientation_matches_board():
+    """转换后 values[row][col] 对应 board[row][col]（row=0 为第1行）"""
+    raw = _katago_ownership(lambda row, col: 1.0 if (row, col) == (3, 15) else 0.0)
+    ownership = Ownership.from_katago(raw)
+    assert ownership[3, 15] == 1.0 and ownership.to_rows()[3][15] == 1.0
+    assert ownership.to_katago() == raw
+    assert Ownership.from_katago(raw[:100]) is None
+    print("✅ ownership方向与棋盘一致")
+
+
+def test_territory_counts_and_points():
+    """阈值判定与计数"""
+    ownership = Ownership.from_katago(_katago_ownership(lambda row, col: 0.9 if col < 8 else -0.9 if col > 10 else 0.1))
+    assert ownership.counts() == {"black": 19 * 8, "white": 19 * 8, "neutral": 19 * 3}
+    points = ownership.territory_points()
+    assert [0, 0] in points["black_territory"] and [18, 18] in points["white_territory"]
+    assert len(points["neutral_points"]) == 19 * 3
+
+    move_data = GameEvolutionMongoDB.build_move_data(1, "D4", "B", {}, territory_data=ownership)
+    assert move_data["territory_prediction"] == points
+    rows_data = GameEvolutionMongoDB.build_move_data(1, "D4", "B", {}, territory_data=ownership.to_rows())
+    assert rows_data["territory_prediction"] == points
+    print(f"✅ 领地计数: {ownership.counts()}")
+
+
+def test_quantize_roundtrip():
+    """int8量化可还原，误差不超过一个量化步长"""
+    rng = np.random.default_rng(7)
+    ownership = Ownership(rng.uniform(-1, 1, (19, 19)))
+    quantized = ownership.quantize()
+    assert quantized.dtype == np.int8 and len(ownership.to_bytes()) == 361
+    restored = Ownership.from_quantized(ownership.to_bytes())
+    assert np.abs(restored.values - ownership.values).max() <= 1 / 127
+    assert np.array_equal(Ownership.from_quantized(quantized.tolist()).quantize(), quantized)
+    print("✅ 量化往返测试通过")
+
+
+def test_diff_between_positions():
+    """局面差异：归属变化的点和黑棋期望目数变化"""
+    before = Ownership.from_katago(_katago_ownership(lambda row, col: 0.8 if col < 9 else -0.8))
+    after_values = before.values.copy()
+    after_values[3, 3] = -0.8
+    after_values[10, 12] = -0.2
+    after = Ownership(after_values)
+
+    diff = after.diff(before)
+    changed = {tuple(item["position"]): (item["from"], item["to"]) for item in diff["changed"]}
+    assert changed == {(3, 3): (1, -1), (10, 12): (-1, 0)}
+    assert diff["black_gain"] == round(-1.6 + 0.6, 2)
+    assert [3, 3] in diff["swings"]
+    print(f"✅ 局面差异: {diff['changed']}")
+
+
+if __name__ == "__main__":
+    test_orientation_matches_board()
+    test_territory_counts_and_points()
+    test_quantize_roundtrip()
+    test_diff_between_positions()
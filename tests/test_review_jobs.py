@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+测试离线复盘任务队列（SQLite存储 + 假KataGo引擎）
+"""
+
+import time
+
+from core.human_vs_katago import FAKE_KATAGO_BIN
+from core.katago_engine import KataGoEngine
+from core.review_worker import ReviewWorkerPool, summarize_review
+from storage.review_jobs import SQLiteReviewJobStore, STATUS_DONE, STATUS_FAILED, STATUS_QUEUED
+
+SAMPLE_SGF = "(;GM[1]FF[4]SZ[19]KM[6.5];B[pd];W[dp];B[pp];W[dd];B[fq];W[cn])"
+
+
+def _fake_engine():
+    return KataGoEngine(FAKE_KATAGO_BIN, "", "", require_files=False, startup_wait=0.2)
+
+
+def _wait_for(store, job_id, statuses, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = store.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"任务未在 {timeout} 秒内结束: {store.get(job_id)}")
+
+
+def test_claim_fail_and_retry():
+    """失败的任务在次数内重新排队，超过次数后可手动重试"""
+    store = SQLiteReviewJobStore(":memory:")
+    job_id = store.submit(SAMPLE_SGF, "club", max_visits=20, max_attempts=2)
+    assert store.claim("w1")["job_id"] == job_id
+    assert store.claim("w2") is None  # 租约有效期内不会被重复领取
+    store.fail(job_id, "boom")
+    assert store.get(job_id)["status"] == STATUS_QUEUED
+    store.claim("w1")
+    store.fail(job_id, "boom")
+    assert store.get(job_id)["status"] == STATUS_FAILED
+    assert store.retry(job_id)
+    assert store.get(job_id)["status"] == STATUS_QUEUED
+    # 租约过期的运行中任务可被其他工作线程接手
+    store.claim("w1", lease_seconds=-1)
+    assert store.claim("w2")["lease_owner"] == "w2"
+    print("✅ 任务领取/失败/重试测试通过")
+
+
+def test_worker_pool_resumes_partial_results():
+    """工作线程只分析缺失的回合，完成后生成问题手汇总"""
+    store = SQLiteReviewJobStore(":memory:")
+    job_id = store.submit(SAMPLE_SGF, max_visits=20)
+    # 模拟上次运行已完成的回合
+    store.save_results(job_id, {0: {"turn": 0, "move": None, "color": None, "black_winrate": 50.0,
+                                    "white_winrate": 50.0, "score_lead": 0.0, "top_moves": []}})
+
+    pool = ReviewWorkerPool(store, _fake_engine, workers=2, poll_interval=0.1)
+    pool.start()
+    try:
+        job = _wait_for(store, job_id, (STATUS_DONE, STATUS_FAILED))
+    finally:
+        pool.stop()
+    assert job["status"] == STATUS_DONE, job
+    results = store.get_results(job_id)
+    assert sorted(results) == list(range(7))
+    assert results[0]["black_winrate"] == 50.0  # 已有结果未被重新分析
+    assert len(results[3]["ownership"]) == 361
+    assert job["summary"]["turns"] == 7
+    print(f"✅ 复盘完成: 问题手 {len(job['summary']['mistakes'])} 个")
+
+
+def test_summarize_review_flags_mistakes():
+    """按落子方的胜率损失标记问题手"""
+    results = {
+        0: {"turn": 0, "move": None, "color": None, "black_winrate": 50.0, "white_winrate": 50.0,
+            "top_moves": [{"move": "Q16"}]},
+        1: {"turn": 1, "move": "A1", "color": "B", "black_winrate": 25.0, "white_winrate": 75.0,
+            "top_moves": [{"move": "D4"}]},
+        2: {"turn": 2, "move": "D4", "color": "W", "black_winrate": 27.0, "white_winrate": 73.0,
+            "top_moves": []}
+    }
+    summary = summarize_review(results)
+    assert [m["label"] for m in summary["mistakes"]] == ["blunder"]
+    assert summary["mistakes"][0]["best_move"] == "Q16"
+    assert summary["mistake_counts"]["B"]["blunder"] == 1
+    print("✅ 问题手标记测试通过")
+
+
+if __name__ == "__main__":
+    test_claim_fail_and_retry()
+    test_worker_pool_resumes_partial_results()
+    test_summarize_review_flags_mistakes()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+测试本地终局点目（数子法/数目法、死子判断）
+"""
+
+import asyncio
+
+from ai.ai_handler import AIHandler
+from core.analysis_cache import AnalysisCache
+from core.rules import BLACK, WHITE, ownership_index
+from core.scoring import find_dead_stones, score_area, score_game, score_territory
+
+
+def _split_board(size=19):
+    """黑棋占据第0-8列，白棋占据第10-18列，第9列为黑墙，第10列为白墙"""
+    board = [[0] * size for _ in range(size)]
+    for row in range(size):
+        board[row][9] = BLACK
+        board[row][10] = WHITE
+    return board
+
+
+def test_area_scoring():
+    """数子法：子数 + 只与一方相邻的空点"""
+    board = _split_board()
+    result = score_area(board, 7.5)
+    assert result["black_stones"] == 19 and result["black_territory"] == 19 * 9
+    assert result["white_stones"] == 19 and result["white_territory"] == 19 * 8
+    assert result["black_score"] == 190 and result["white_score"] == 171 + 7.5
+    assert result["territory_map"][0][0] == "B" and result["territory_map"][0][18] == "W"
+    print(f"✅ 数子法: 黑 {result['black_score']}，白 {result['white_score']}")
+
+
+def test_dead_stones_from_ownership():
+    """ownership判定的死子整块提掉，并计入对方的区域"""
+    board = _split_board()
+    board[3][3] = WHITE
+    board[3][4] = WHITE
+    ownership = [0.0] * 361
+    for row in range(19):
+        for col in range(19):
+            ownership[ownership_index(row, col)] = 0.9 if col <= 9 else -0.9
+    # 块内一子略低于阈值，按整块平均仍判为死子
+    ownership[ownership_index(3, 4)] = 0.4
+
+    dead = find_dead_stones(board, ownership)
+    assert dead == {(3, 3), (3, 4)}
+    result = score_game(board, 7.5, "chinese", ownership=ownership)
+    assert result["black_score"] == 190 and result["dead_stones"] == [[3, 3], [3, 4]]
+    assert result["winner"] == "黑棋" and result["score_difference"] == 11.5
+    print(f"✅ 死子判断: {result['dead_stones']}")
+
+
+def test_territory_scoring_with_prisoners_and_seki():
+    """数目法：领地 + 提子 + 死子；与双方都相邻的空点为中立"""
+    board = _split_board()
+    board[5][5] = WHITE
+    result = score_territory(board, 6.5, captured_black=2, captured_white=3, dead_stones={(5, 5)})
+    assert result["black_territory"] == 19 * 9 and result["black_prisoners"] == 4
+    assert result["white_territory"] == 19 * 8 and result["white_prisoners"] == 2
+    assert result["black_score"] == 175 and result["white_score"] == 154 + 6.5
+
+    board = _split_board()
+    board[0][9] = 0  # 黑墙留出一个同时与双方相邻的空点
+    result = score_territory(board, 6.5)
+    assert result["territory_map"][0][9] == "?"
+    print("✅ 数目法测试通过")
+
+
+class _FinishedGame:
+    def __init__(self):
+        self.board = _split_board()
+        self.komi = 7.5
+        self.rules = "chinese"
+        self.captured_black = 0
+        self.captured_white = 0
+        self.moves = [["B", "K10"], ["W", "pass"], ["B", "pass"]]
+        self.analysis_cache = AnalysisCache()
+        self.queries = 0
+
+    def _check_process_alive(self):
+        return False
+
+    def _send_analysis_request(self, max_visits=200, max_time=None):
+        self.queries += 1
+        return {}
+
+
+def test_handler_uses_cached_ownership():
+    """终局点目复用双方pass之前局面的缓存，不再请求引擎"""
+    game = _FinishedGame()
+    # 第1手后轮到白棋，缓存的ownership是白棋视角（SIDETOMOVE）
+    ownership = [-0.9 if index % 19 <= 9 else 0.9 for index in range(361)]
+    game.analysis_cache.put(game.moves[:1], game.komi,
+                            {"rootInfo": {"visits": 200}, "ownership": ownership,
+                             "moveInfos": [{"move": "pass", "scoreLead": 11.0}]})
+
+    result = asyncio.run(AIHandler().calculate_territory_score(game))
+    assert result["method"] == "ownership" and game.queries == 0
+    assert result["black_score"] == 190 and result["current_score_lead"] == 11.0
+
+    # 没有缓存且引擎不可用时，按全部活棋数子
+    game.analysis_cache.clear()
+    result = asyncio.run(AIHandler().calculate_territory_score(game))
+    assert result["method"] == "board" and result["winner"] == "黑棋"
+    print("✅ 终局点目复用缓存测试通过")
+
+
+def test_white_to_move_ownership():
+    """白棋行棋时KataGo的ownership为白棋视角，转为黑棋视角后再判断死子"""
+    board = _split_board()
+    board[3][3] = WHITE
+    black_view = [0.0] * 361
+    for row in range(19):
+        for col in range(19):
+            black_view[ownership_index(row, col)] = 0.9 if col <= 9 else -0.9
+    white_view = [-value for value in black_view]
+
+    game = _FinishedGame()
+    game.board = board
+    game.moves = [["B", "K10"]]
+    game._check_process_alive = lambda: True
+    game._send_analysis_request = lambda max_visits=200, max_time=None: {
+        "rootInfo": {"currentPlayer": "W", "visits": max_visits}, "ownership": white_view, "moveInfos": []
+    }
+    result = asyncio.run(AIHandler().calculate_territory_score(game))
+    assert result["dead_stones"] == [[3, 3]] and result["black_score"] == 190
+    assert AIHandler._get_final_analysis(game)["ownership"] == black_view
+
+    # 领地预览同样是黑棋视角
+    game.current_player = "W"
+    game.board_size = 19
+    territory = asyncio.run(AIHandler().get_territory_ownership(game))
+    assert territory["counts"] == {"black": 190, "white": 171, "neutral": 0}
+    assert territory["ownership"][0][0] > 0
+
+    # 缓存中的结果（没有 currentPlayer）按该局面的行棋方换算
+    game._check_process_alive = lambda: False
+    game.analysis_cache.put(game.moves, game.komi, {"rootInfo": {"visits": 200}, "ownership": white_view})
+    assert AIHandler._get_final_analysis(game)["ownership"] == black_view
+    print("✅ 白棋行棋时的ownership视角")
+
+
+if __name__ == "__main__":
+    test_area_scoring()
+    test_dead_stones_from_ownership()
+    test_territory_scoring_with_prisoners_and_seki()
+    test_handler_uses_cached_ownership()
+    test_white_to_move_ownership()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+测试会话命令执行器：按顺序执行、合并跳转命令、邮箱容量、异常不影响后续命令
+"""
+
+import asyncio
+
+from api.session_actor import SessionActor
+
+
+def test_commands_do_not_interleave():
+    """前一个命令在等待（如引擎计算）时，后一个命令不会开始"""
+    async def run():
+        actor = SessionActor("s")
+        actor.start()
+        log = []
+
+        def command(name):
+            async def handler():
+                log.append(f"{name}-start")
+                await asyncio.sleep(0.01)
+                log.append(f"{name}-end")
+            return handler
+
+        for name in ("move", "ai_move", "undo"):
+            actor.submit(name, command(name))
+        await actor.join()
+        actor.close()
+        return log
+
+    log = asyncio.run(run())
+    assert log == ["move-start", "move-end", "ai_move-start", "ai_move-end", "undo-start", "undo-end"]
+    print("✅ 命令按顺序执行，不交错")
+
+
+def test_coalesce_navigation():
+    """排队中的跳转命令只执行最后一次"""
+    async def run():
+        actor = SessionActor("s")
+        actor.start()
+        executed = []
+
+        async def slow():
+            await asyncio.sleep(0.02)
+
+        actor.submit("make_move", slow)
+        for index in range(10):
+            actor.submit("goto_move", lambda index=index: asyncio.sleep(0, executed.append(index)), "navigate")
+        await actor.join()
+        actor.close()
+        return executed, actor.stats()
+
+    executed, stats = asyncio.run(run())
+    assert executed == [9]
+    assert stats["coalesced"] == 9 and stats["processed"] == 2
+    print(f"✅ 连续跳转合并: {stats}")
+
+
+def test_mailbox_bound_and_errors():
+    """邮箱满时拒绝客户端命令，内部命令仍然排队；命令出错后继续执行"""
+    async def run():
+        errors = []
+
+        async def on_error(kind, error):
+            errors.append((kind, str(error)))
+
+        actor = SessionActor("s", mailbox_size=2, on_error=on_error)
+        executed = []
+
+        async def fail():
+            raise ValueError("boom")
+
+        assert actor.submit("bad", fail)
+        assert actor.submit("a", lambda: asyncio.sleep(0, executed.append("a")))
+        assert not actor.submit("b", lambda: asyncio.sleep(0, executed.append("b")))
+        assert actor.submit("ai_move", lambda: asyncio.sleep(0, executed.append("ai")), internal=True)
+        actor.start()
+        await actor.join()
+        actor.close()
+        return executed, errors, actor.stats()
+
+    executed, errors, stats = asyncio.run(run())
+    assert executed == ["a", "ai"] and errors == [("bad", "boom")]
+    assert stats["rejected"] == 1
+    print(f"✅ 邮箱容量与异常处理: {stats}")
+
+
+if __name__ == "__main__":
+    test_commands_do_not_interleave()
+    test_coalesce_navigation()
+    test_mailbox_bound_and_errors()
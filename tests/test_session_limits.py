@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+测试会话准入控制：会话上限、淘汰顺序、内存估算和统计
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+from api.backend import GameManager
+from api.session_limits import CapacityError, deep_sizeof, estimate_session_memory, trim_session_memory
+from core.analysis_cache import AnalysisCache
+from core.game_tree import GameTree
+from core.rules import GoBoard
+
+
+class FakeGame:
+    """只包含会话管理用到的字段（真实游戏实例需要KataGo和数据库）"""
+
+    def __init__(self, moves=0):
+        self.board = GoBoard().board
+        self.moves = [["B" if i % 2 == 0 else "W", "pass"] for i in range(moves)]
+        self.current_player = "B"
+        self.player_color = "B"
+        self.game_over = False
+        self.captured_black = 0
+        self.captured_white = 0
+        self.winrate_history = [{"move_number": i, "black_winrate": 50.0} for i in range(moves)]
+        self.board_history = []
+        self.analysis_cache = AnalysisCache()
+        self.policy_cache = {}
+        self.katago_initialized = True
+        self.cleaned = False
+
+    def stop_realtime_analysis(self):
+        pass
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+        self.closed = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        self.frames.append(json.loads(data))
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+def _manager(max_sessions=2):
+    manager = GameManager()
+    manager.max_sessions = max_sessions
+    sockets = {}
+    for session_id in ("a", "b")[:max_sessions]:
+        manager.games[session_id] = FakeGame()
+        sockets[session_id] = FakeWebSocket()
+        asyncio.run(manager.connect(sockets[session_id], session_id))
+    return manager, sockets
+
+
+def test_reject_when_full():
+    """会话都在使用中时拒绝新会话"""
+    manager, _ = _manager()
+    rejected = FakeWebSocket()
+    assert asyncio.run(manager.connect(rejected, "c")) is None
+    assert rejected.frames[-1]["code"] == "server_at_capacity" and rejected.closed == 1013
+    assert set(manager.games) == {"a", "b"} and manager.rejected_sessions == 1
+    print(f"✅ 服务器已满: {rejected.frames[-1]['message']}")
+
+
+def test_eviction_order():
+    """先淘汰断开的会话，再淘汰空闲超时的已连接会话"""
+    manager, sockets = _manager()
+    manager.disconnect("a", manager.connections["a"])
+    asyncio.run(manager._admit("c"))
+    assert "a" not in manager.games and "b" in manager.games
+
+    manager.games["c"] = FakeGame()
+    manager.last_activity["b"] = time.monotonic() - manager.idle_timeout - 1
+    asyncio.run(manager._admit("d"))
+    assert "b" not in manager.games and sockets["b"].frames[-1]["type"] == "session_expired"
+
+    manager.games["d"] = FakeGame()
+    manager.touch("c")
+    manager.touch("d")
+    try:
+        asyncio.run(manager._admit("e"))
+        assert False, "没有可以淘汰的会话时应当报错"
+    except CapacityError:
+        pass
+    print("✅ 淘汰顺序正确")
+
+
+def test_memory_estimate_and_trim():
+    """内存估算随对局增长，深的变化树不会超出递归深度，超限时清空分析缓存"""
+    small, large = FakeGame(10), FakeGame(300)
+    assert estimate_session_memory(large)["winrate_history"] > estimate_session_memory(small)["winrate_history"]
+
+    tree = GameTree.from_moves([["B" if i % 2 == 0 else "W", "pass"] for i in range(3000)])
+    assert deep_sizeof(tree) > 3000 * 50
+
+    empty_cache = estimate_session_memory(large)["analysis_cache"]
+    large.analysis_cache.put([["B", "Q16"]], 7.5, {"rootInfo": {"visits": 10}, "ownership": [0.5] * 361})
+    assert estimate_session_memory(large)["analysis_cache"] > empty_cache + 361 * 8
+    assert trim_session_memory(large, limit=1) is not None
+    assert large.analysis_cache.get([["B", "Q16"]], 7.5) is None
+    assert trim_session_memory(small, limit=10 ** 9) is None
+    print(f"✅ 内存估算: {estimate_session_memory(large)}")
+
+
+def test_memory_estimate_during_cache_writes():
+    """工作线程写入分析缓存的同时估算内存，不会因为遍历中的修改出错"""
+    game = FakeGame(10)
+    stop = threading.Event()
+
+    def writer():
+        index = 0
+        while not stop.is_set():
+            game.analysis_cache.put([["B", "pass"]] * (index % 30), 7.5, {"rootInfo": {"visits": 1}})
+            index += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(20):
+            assert estimate_session_memory(game)["analysis_cache"] > 0
+    finally:
+        stop.set()
+        thread.join()
+    print("✅ 并发写入时的内存估算")
+
+
+def test_session_stats():
+    manager, _ = _manager()
+    manager.disconnect("b", manager.connections["b"])
+    stats = manager.session_stats()
+    assert stats["sessions"] == 2 and stats["connected"] == 1 and stats["detached"] == 1
+    assert stats["engines_running"] == 2 and stats["memory_bytes"] > 0
+    print(f"✅ 会话统计: {dict((k, v) for k, v in stats.items() if k != 'session_details')}")
+
+
+if __name__ == "__main__":
+    test_reject_when_full()
+    test_eviction_order()
+    test_memory_estimate_and_trim()
+    test_memory_estimate_during_cache_writes()
+    test_session_stats()
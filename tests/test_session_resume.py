@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+测试断线重连：保留期内恢复会话、旧连接的断开不影响新连接、超时后清理引擎（不阻塞事件循环）
+"""
+
+import asyncio
+import json
+import time
+
+from api.backend import GameManager
+from core.rules import GoBoard
+
+
+class FakeGame:
+    """只包含会话管理用到的字段（真实游戏实例需要KataGo和数据库）"""
+
+    def __init__(self):
+        self.board = GoBoard().board
+        self.moves = [["B", "Q16"]]
+        self.current_player = "W"
+        self.player_color = "B"
+        self.game_over = False
+        self.captured_black = 0
+        self.captured_white = 0
+        self.winrate_history = []
+        self.cleaned = False
+
+    def stop_realtime_analysis(self):
+        pass
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+        self.closed = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        self.frames.append(json.loads(data))
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+def test_resume_within_grace_period():
+    """断开后游戏保留，同一 session_id 重连收到完整快照"""
+    manager = GameManager()
+    game = FakeGame()
+    manager.games["s1"] = game
+
+    first = FakeWebSocket()
+    connection = asyncio.run(manager.connect(first, "s1"))
+    manager.disconnect("s1", connection)
+    assert "s1" in manager.games and "s1" in manager.detached and not game.cleaned
+
+    second = FakeWebSocket()
+    asyncio.run(manager.connect(second, "s1"))
+    assert "s1" not in manager.detached
+    assert [frame["type"] for frame in second.frames] == ["session_resumed", "game_state"]
+    assert second.frames[1]["data"]["moves"] == game.moves
+
+    # 旧连接迟到的断开事件不影响新连接
+    manager.disconnect("s1", connection)
+    assert "s1" in manager.connections and "s1" not in manager.detached
+    print("✅ 保留期内重连恢复会话")
+
+
+def test_reaper_evicts_expired_sessions():
+    """超过保留期未重连的会话被清理，引擎关闭"""
+    manager = GameManager()
+    game = FakeGame()
+    manager.games["s2"] = game
+    connection = asyncio.run(manager.connect(FakeWebSocket(), "s2"))
+    manager.disconnect("s2", connection)
+
+    assert manager.reap_detached(time.monotonic() + 1) == []
+    assert manager.reap_detached(time.monotonic() + manager.grace_period) == ["s2"]
+    assert "s2" not in manager.games
+    cleanup = manager.pending_cleanups.get("s2")
+    if cleanup is not None:
+        cleanup.result(timeout=5)
+    assert game.cleaned
+    print("✅ 超时会话被清理")
+
+
+def test_replaced_connection_is_closed():
+    """同一会话的新连接会关闭仍然挂着的旧连接"""
+    manager = GameManager()
+    manager.games["s3"] = FakeGame()
+    old = FakeWebSocket()
+    asyncio.run(manager.connect(old, "s3"))
+    asyncio.run(manager.connect(FakeWebSocket(), "s3"))
+    assert old.closed == 4001
+    print("✅ 旧连接已关闭")
+
+
+class SlowCleanupGame(FakeGame):
+    def cleanup(self):
+        time.sleep(0.3)  # 关闭引擎需要等待
+        self.cleaned = True
+
+
+def test_eviction_does_not_block_loop():
+    """清理在工作线程中进行，事件循环照常运行；同一会话重连前等待清理完成"""
+    async def run():
+        manager = GameManager()
+        manager.grace_period = 0
+        game = SlowCleanupGame()
+        manager.games["s4"] = game
+        connection = await manager.connect(FakeWebSocket(), "s4")
+        started = time.monotonic()
+        manager.disconnect("s4", connection)
+        evict_time = time.monotonic() - started
+        cleaned_before = game.cleaned
+        manager.games["s4"] = FakeGame()
+        await manager.connect(FakeWebSocket(), "s4")
+        return evict_time, cleaned_before, game.cleaned
+
+    evict_time, cleaned_before, cleaned_after = asyncio.run(run())
+    assert evict_time < 0.1 and not cleaned_before and cleaned_after
+    print(f"✅ 清理不阻塞事件循环: {evict_time * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    test_resume_within_grace_period()
+    test_reaper_evicts_expired_sessions()
+    test_replaced_connection_is_closed()
+    test_eviction_does_not_block_loop()
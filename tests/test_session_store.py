@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+测试会话快照和多进程租约：快照往返、变化树恢复、租约互斥、另一个工作进程接管
+"""
+
+import asyncio
+import json
+import time
+
+from api.backend import GameManager
+from core.analysis_game import AnalysisGame
+from core.game_tree import GameTree
+from core.key_moments import KeyMomentDetector
+from core.rules import GoBoard
+from core.session_snapshot import apply_snapshot, decode_moves, encode_moves, snapshot_game
+from storage.session_store import SQLiteSessionStore
+
+MOVES = [["B", "Q16"], ["W", "D4"], ["B", "pass"], ["W", "Q4"]]
+
+
+class FakeGame:
+    """对弈模式会话快照用到的字段（真实游戏实例需要KataGo和数据库）"""
+
+    def __init__(self):
+        self.game_id = "game_test"
+        self.board = GoBoard().board
+        self.moves = []
+        self.current_player = "B"
+        self.player_color = "B"
+        self.ai_time_limit = 3
+        self.komi = 6.5
+        self.rules = "chinese"
+        self.game_over = False
+        self.captured_black = 0
+        self.captured_white = 0
+        self.winrate_history = []
+        self.key_moments = KeyMomentDetector()
+
+    def update_key_moments(self, persist=True):
+        pass
+
+    def bind_evolution_storage(self):
+        self.evolution_storage_id = self.game_id
+
+    def stop_realtime_analysis(self):
+        pass
+
+    def cleanup(self):
+        pass
+
+
+class FakeAnalysisGame(FakeGame):
+    """借用推演模式的重放逻辑"""
+    _load_node = AnalysisGame._load_node
+    _sync_winrate_line = AnalysisGame._sync_winrate_line
+
+    def __init__(self):
+        super().__init__()
+        self.tree = GameTree()
+
+
+def test_snapshot_round_trip():
+    """对弈模式：着法、设置和胜率历史恢复后重放得到相同的棋盘"""
+    game = FakeGame()
+    go_board = GoBoard.from_moves(MOVES)
+    game.board, game.moves, game.current_player = go_board.board, [list(m) for m in MOVES], "B"
+    game.komi, game.player_color = 7.5, "W"
+    game.winrate_history = [{"move_number": i, "black_winrate": 50.0 + i} for i in range(5)]
+
+    snapshot = json.loads(json.dumps(snapshot_game(game, session_active=True)))
+    assert snapshot["moves"] == "BQ16 WD4 Bpass WQ4"
+    assert decode_moves(encode_moves(MOVES)) == MOVES
+
+    restored = FakeGame()
+    restored.game_id = "game_new"
+    apply_snapshot(restored, snapshot)
+    assert restored.game_id == "game_test" and restored.evolution_storage_id == "game_test"
+    assert restored.board == game.board and restored.moves == game.moves
+    assert restored.komi == 7.5 and restored.player_color == "W" and restored.current_player == "B"
+    assert restored.winrate_history == game.winrate_history
+    print(f"✅ 对弈快照往返: {len(json.dumps(snapshot))} 字节")
+
+
+def test_variation_tree_round_trip():
+    """推演模式：分支、当前节点和各节点的分析结果都恢复"""
+    game = FakeAnalysisGame()
+    game.tree = GameTree.from_moves(MOVES)
+    for node in game.tree.line():
+        node.analysis = {"move_number": node.depth, "black_winrate": 50.0 + node.depth}
+    game.tree.goto_depth(2)
+    game.tree.play("B", "C3")
+    game.tree.goto_depth(1)
+    game._load_node(game.tree.current)
+
+    restored = FakeAnalysisGame()
+    apply_snapshot(restored, json.loads(json.dumps(snapshot_game(game))))
+    assert len(restored.tree.nodes) == len(game.tree.nodes)
+    assert restored.tree.current.node_id == game.tree.current.node_id
+    assert [node.move for node in restored.tree.line()] == ["Q16", "D4", "C3"]
+    assert restored.moves == [["B", "Q16"]] and restored.winrate_history == game.winrate_history
+    print("✅ 变化树快照往返")
+
+
+def test_lease_exclusive():
+    """同一会话同时只有一个工作进程持有租约，过期或释放后可以接管"""
+    store = SQLiteSessionStore(":memory:")
+    assert store.acquire("s", "worker-a", lease_seconds=60)
+    assert not store.acquire("s", "worker-b", lease_seconds=60)
+    assert store.owner("s") == "worker-a"
+    store.release("s", "worker-a")
+    assert store.acquire("s", "worker-b", lease_seconds=-1)  # 立即过期
+    assert store.acquire("s", "worker-a", lease_seconds=60)
+
+    assert store.save("s", {"moves": ""}) == 1 and store.save("s", {"moves": "BQ16"}) == 2
+    assert store.load("s") == {"moves": "BQ16"}
+    assert store.purge(0) == 0  # 仍持有租约
+    print("✅ 租约互斥")
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+        self.closed = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        self.frames.append(json.loads(data))
+
+    async def close(self, code=1000):
+        self.closed = code
+
+
+def test_worker_takeover():
+    """断开后快照写入存储并释放租约，另一个工作进程重连时接管；原进程的本地副本被丢弃"""
+    store = SQLiteSessionStore(":memory:")
+
+    def make_manager(worker_id):
+        manager = GameManager()
+        manager.session_store, manager.worker_id = store, worker_id
+        return manager
+
+    async def run():
+        worker_a, worker_b = make_manager("a"), make_manager("b")
+        game = FakeGame()
+        game.moves, game.board = [list(m) for m in MOVES], GoBoard.from_moves(MOVES).board
+        worker_a.games["s"] = game
+        connection = await worker_a.connect(FakeWebSocket(), "s")
+        assert store.owner("s") == "a"
+
+        # 连接仍在 a 上时路由到 b 被拒绝
+        rejected = FakeWebSocket()
+        assert await worker_b.connect(rejected, "s") is None and rejected.closed == 4003
+
+        worker_a.disconnect("s", connection)
+        for _ in range(50):
+            if store.owner("s") is None:
+                break
+            await asyncio.sleep(0.01)
+        assert store.owner("s") is None and store.load("s")["moves"] == "BQ16 WD4 Bpass WQ4"
+
+        # b 从快照恢复（新建游戏实例需要数据库，这里直接放入恢复后的实例）
+        resumed = FakeGame()
+        apply_snapshot(resumed, store.load("s"))
+        assert store.acquire("s", "b", 60)
+        worker_b.games["s"] = resumed
+        worker_b.snapshot_versions["s"] = store.version("s")
+        client = FakeWebSocket()
+        await worker_b.connect(client, "s")
+        assert client.frames[1]["data"]["moves"] == game.moves
+
+        # 客户端又回到 a：本地副本已过期，被丢弃并拒绝
+        back = FakeWebSocket()
+        assert await worker_a.connect(back, "s") is None and "s" not in worker_a.games
+
+    asyncio.run(run())
+    print("✅ 工作进程接管会话")
+
+
+def test_stale_local_copy_after_takeover():
+    """断开期间另一个工作进程接管并写入了新快照，租约释放后客户端回到原进程：本地副本按版本判断为过期"""
+    store = SQLiteSessionStore(":memory:")
+    manager = GameManager()
+    manager.session_store, manager.worker_id = store, "a"
+
+    async def run():
+        game = FakeGame()
+        manager.games["s"] = game
+        connection = await manager.connect(FakeWebSocket(), "s")
+        manager.disconnect("s", connection)
+        for _ in range(50):
+            if store.owner("s") is None:
+                break
+            await asyncio.sleep(0.01)
+        assert manager.snapshot_versions["s"] == store.version("s") == 1
+
+        # 另一个工作进程接管、落子、写快照后释放
+        assert store.acquire("s", "b", 60)
+        store.save("s", dict(store.load("s"), moves="BQ16"))
+        store.release("s", "b")
+
+        valid = await manager._local_copy_current("s")
+        manager.evict_session("s")
+        return valid
+
+    assert asyncio.run(run()) is False
+    print("✅ 快照版本更新后丢弃本地副本")
+
+
+def test_lost_lease_closes_session():
+    """续期失败（租约已被其他工作进程持有）时关闭本地会话"""
+    store = SQLiteSessionStore(":memory:")
+    manager = GameManager()
+    manager.session_store, manager.worker_id = store, "a"
+
+    async def run():
+        manager.games["s"] = FakeGame()
+        client = FakeWebSocket()
+        await manager.connect(client, "s")
+        with store._lock, store._conn:
+            store._conn.execute("UPDATE sessions SET lease_expires = 0 WHERE session_id = 's'")
+        assert store.acquire("s", "b", 60)
+        await manager.renew_leases()
+        return client
+
+    client = asyncio.run(run())
+    assert "s" not in manager.games and "s" not in manager.connections
+    assert client.closed == 4003 and client.frames[-1]["code"] == "session_owned_elsewhere"
+    assert store.owner("s") == "b"
+    print("✅ 租约丢失后关闭本地会话")
+
+
+if __name__ == "__main__":
+    test_snapshot_round_trip()
+    test_variation_tree_round_trip()
+    test_lease_exclusive()
+    test_worker_takeover()
+    test_stale_local_copy_after_takeover()
+    test_lost_lease_closes_session()
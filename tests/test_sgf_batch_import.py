@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+测试SGF解析和 analyzeTurns 批量分析（使用假KataGo引擎），以及导入后的后台分析推送
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+from api.backend import GameManager
+from core.human_vs_katago import FAKE_KATAGO_BIN
+from core.katago_engine import KataGoEngine
+from core.rules import GoBoard
+from core.sgf_utils import parse_sgf
+
+SAMPLE_SGF = "(;GM[1]FF[4]SZ[19]KM[7.5]RU[Chinese];B[pd];W[dp];B[pp];W[dd];B[];W[qc])"
+
+
+def test_parse_sgf():
+    """SGF坐标按左下角为A1转换，过手保留"""
+    game_info = parse_sgf(SAMPLE_SGF)
+    assert game_info["komi"] == 7.5
+    assert game_info["rules"] == "chinese"
+    assert game_info["moves"] == [["B", "Q16"], ["W", "D4"], ["B", "Q4"], ["W", "D16"],
+                                  ["B", "pass"], ["W", "R17"]]
+    print(f"✅ SGF解析: {game_info['moves']}")
+
+
+def test_analyze_turns_batch():
+    """一次查询返回全部回合的最终结果"""
+    moves = parse_sgf(SAMPLE_SGF)["moves"]
+    engine = KataGoEngine(FAKE_KATAGO_BIN, "", "", require_files=False, startup_wait=0.2)
+    engine.start()
+    try:
+        req = {"id": engine.next_request_id("import"), "moves": moves, "rules": "Chinese",
+               "komi": 7.5, "boardXSize": 19, "boardYSize": 19, "maxVisits": 50,
+               "includeOwnership": True, "analyzeTurns": list(range(len(moves) + 1))}
+        results = {msg["turnNumber"]: msg for msg in engine.analyze_turns(req, timeout=10)}
+        assert sorted(results) == list(range(len(moves) + 1))
+        assert all(len(msg["ownership"]) == 361 for msg in results.values())
+        # 第1手后轮到白棋
+        assert results[1]["rootInfo"]["currentPlayer"] == "W"
+        print(f"✅ 批量分析: {len(results)} 个回合")
+    finally:
+        engine.close()
+
+
+def test_analyze_turns_cancel():
+    """取消标记在等待结果期间同样生效，剩余回合被终止"""
+    moves = parse_sgf(SAMPLE_SGF)["moves"]
+    engine = KataGoEngine(FAKE_KATAGO_BIN, "", "", require_files=False, startup_wait=0.2)
+    engine.start()
+    try:
+        req = {"id": engine.next_request_id("import"), "moves": moves, "rules": "Chinese",
+               "komi": 7.5, "boardXSize": 19, "boardYSize": 19, "maxVisits": 50,
+               "analyzeTurns": list(range(len(moves) + 1))}
+        cancel = threading.Event()
+        cancel.set()
+        started = time.monotonic()
+        assert list(engine.analyze_turns(req, timeout=10, cancel=cancel)) == []
+        assert time.monotonic() - started < 1.0
+        print("✅ 批量分析取消")
+    finally:
+        engine.close()
+
+
+class FakeImportGame:
+    """导入后台分析用到的字段（真实游戏实例需要KataGo和数据库）"""
+
+    def __init__(self, manager, turns=20):
+        self.manager = manager
+        self.turns = turns
+        self.board = GoBoard().board
+        self.moves = [["B", "Q16"]] * (turns - 1)
+        self.current_player = "B"
+        self.player_color = "B"
+        self.game_over = False
+        self.captured_black = 0
+        self.captured_white = 0
+        self.winrate_history = []
+        self.applied = []
+        self.applied_in = set()
+        self.finished = False
+
+    def iter_import_analysis(self, cancel=None):
+        for turn in range(self.turns):
+            if cancel is not None and cancel.is_set():
+                return
+            time.sleep(0.01)
+            yield turn, {"turnNumber": turn}
+
+    def apply_import_results(self, moves, results):
+        # 记录写入发生在哪个会话命令中
+        self.applied_in.add(self.manager.actors["s"].current)
+        self.applied.extend(turn for turn, _ in results)
+        self.winrate_history.extend({"move_number": turn, "black_winrate": 50.0} for turn, _ in results)
+        return [{"move_number": turn} for turn, _ in results]
+
+    def finish_import_analysis(self):
+        self.finished = True
+
+    def stop_realtime_analysis(self):
+        pass
+
+    def cleanup(self):
+        pass
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        self.frames.append(json.loads(data))
+
+    async def close(self, code=1000):
+        pass
+
+
+def start_import(manager, game):
+    cancel = threading.Event()
+    task = asyncio.ensure_future(manager._stream_sgf_analysis("s", game, 50, True, cancel))
+    manager.import_tasks["s"] = (task, cancel)
+    return task
+
+
+def test_import_results_through_actor():
+    """后台分析的结果作为会话命令写入并逐批推送状态，全部回合完成后推送完成消息"""
+    async def run():
+        manager = GameManager()
+        game = FakeImportGame(manager)
+        manager.games["s"] = game
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, "s")
+        await start_import(manager, game)
+        await manager.actors["s"].join()
+        manager.evict_session("s")
+        return game, websocket
+
+    game, websocket = asyncio.run(run())
+    assert sorted(game.applied) == list(range(game.turns)) and game.finished
+    assert game.applied_in == {"sgf_import_progress"}
+    progress = [frame for frame in websocket.frames if frame["type"] == "sgf_import_progress"]
+    assert progress[-1]["data"]["completed"] == game.turns
+    # 每批结果写入后先推送状态，界面不必等到导入结束
+    types = [frame["type"] for frame in websocket.frames]
+    for index, frame_type in enumerate(types):
+        if frame_type == "sgf_import_progress":
+            assert types[index - 1] in ("game_state", "game_state_delta")
+    assert websocket.frames[-1]["type"] == "sgf_analysis_complete"
+    print(f"✅ 导入结果经会话命令写入: {len(progress)} 帧")
+
+
+def test_cancelled_import_skips_queued_results():
+    """取消后，已经排队的结果不再写入，也不发送完成消息"""
+    async def run():
+        manager = GameManager()
+        game = FakeImportGame(manager, turns=200)
+        manager.games["s"] = game
+        websocket = FakeWebSocket()
+        await manager.connect(websocket, "s")
+        task = start_import(manager, game)
+        while not game.applied:
+            await asyncio.sleep(0.01)
+        manager._cancel_sgf_import("s")
+        applied = len(game.applied)
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0.1)
+        await manager.actors["s"].join()
+        manager.evict_session("s")
+        return game, websocket, applied
+
+    game, websocket, applied = asyncio.run(run())
+    assert len(game.applied) == applied < game.turns and not game.finished
+    assert all(frame["type"] != "sgf_analysis_complete" for frame in websocket.frames)
+    print(f"✅ 取消导入: 已写入 {applied} 个回合后停止")
+
+
+if __name__ == "__main__":
+    test_parse_sgf()
+    test_analyze_turns_batch()
+    test_analyze_turns_cancel()
+    test_import_results_through_actor()
+    test_cancelled_import_skips_queued_results()
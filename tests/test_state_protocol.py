@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+测试 game_state 增量协议：快照、增量、重复发送去重、悔棋截断、换局重发快照
+"""
+
+import json
+
+from api.state_protocol import StateTracker
+from core.rules import GoBoard
+
+
+class FakeGame:
+    """只包含 send_game_state 读取的字段（真实游戏实例需要连接数据库）"""
+
+    def __init__(self):
+        self.go_board = GoBoard()
+        self.board = self.go_board.board
+        self.moves = []
+        self.current_player = "B"
+        self.game_over = False
+        self.captured_black = 0
+        self.captured_white = 0
+        self.winrate_history = []
+
+    def play(self, move):
+        self.go_board.play(move, self.current_player)
+        self.moves.append([self.current_player, move])
+        self.winrate_history.append({"move_number": len(self.moves), "black_winrate": 50.0})
+        self.current_player = "W" if self.current_player == "B" else "B"
+
+
+def _apply(state, message):
+    """与前端 applyStateDelta 相同的合并逻辑"""
+    if message["type"] == "game_state":
+        return json.loads(json.dumps(message["data"]))
+    delta = json.loads(json.dumps(message["data"]))
+    for row, col, value in delta.get("stones", []):
+        state["board"][row][col] = value
+    for key in ("moves", "winrate_history"):
+        if key in delta:
+            state[key] = state[key][:delta[key]["truncate"]] + delta[key]["append"]
+    for key in ("current_player", "game_over", "move_count", "captured_black", "captured_white"):
+        if key in delta:
+            state[key] = delta[key]
+    return state
+
+
+def test_delta_matches_full_state():
+    """逐手应用增量后与完整状态一致，且重复发送时没有消息"""
+    game = FakeGame()
+    tracker = StateTracker()
+    first = tracker.encode(game)
+    assert first["type"] == "game_state" and first["version"] == 1
+    state = _apply(None, first)
+
+    # 黑棋提掉A1的白子
+    for move in ["B1", "A1", "Q16", "D4", "A2"]:
+        game.play(move)
+        message = tracker.encode(game)
+        assert message["type"] == "game_state_delta"
+        assert message["base_version"] == message["version"] - 1
+        assert len(message["data"]["moves"]["append"]) == 1
+        state = _apply(state, message)
+        assert tracker.encode(game) is None
+
+    assert state["board"] == game.board and state["moves"] == game.moves
+    assert state["winrate_history"] == game.winrate_history
+    assert [1, 0, 1] in message["data"]["stones"] and [0, 0, 0] in message["data"]["stones"]
+    print(f"✅ 增量合并结果与完整状态一致: {message['data']['stones']}")
+
+
+def test_payload_is_constant_per_move():
+    """每手棋的增量大小与对局长度无关"""
+    game = FakeGame()
+    tracker = StateTracker()
+    tracker.encode(game)
+    sizes = []
+    for row in range(1, 19, 2):
+        for col in "ABCDEFGHJ":
+            game.play(f"{col}{row}")
+            sizes.append(len(json.dumps(tracker.encode(game))))
+    assert max(sizes) - min(sizes) < 40
+    full = len(json.dumps(StateTracker().encode(game)))
+    assert sizes[-1] * 10 < full
+    print(f"✅ 每手增量约 {sizes[-1]} 字节，完整状态 {full} 字节")
+
+
+def test_truncate_and_new_game():
+    """悔棋后发送截断位置，换了游戏实例或强制时发送快照"""
+    game = FakeGame()
+    tracker = StateTracker()
+    tracker.encode(game)
+    for move in ["Q16", "D4", "Q4"]:
+        game.play(move)
+    state = _apply(None, tracker.encode(game, force_full=True))
+
+    # 模拟悔棋：重新生成棋盘和着法列表
+    game.moves = [list(move) for move in game.moves[:2]]
+    game.winrate_history = game.winrate_history[:2]
+    game.go_board = GoBoard()
+    for color, move in game.moves:
+        game.go_board.play(move, color)
+    game.board = game.go_board.board
+    game.current_player = "B"
+    message = tracker.encode(game)
+    assert message["data"]["moves"] == {"truncate": 2, "append": []}
+    state = _apply(state, message)
+    assert state["moves"] == game.moves and state["board"] == game.board
+
+    assert tracker.encode(FakeGame())["type"] == "game_state"
+    print("✅ 悔棋截断与换局快照正确")
+
+
+if __name__ == "__main__":
+    test_delta_matches_full_state()
+    test_payload_is_constant_per_move()
+    test_truncate_and_new_game()
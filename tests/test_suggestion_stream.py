@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+测试实时推荐选点的最新值通道：跨线程投递、慢客户端合并、最大帧率
+"""
+
+import asyncio
+import threading
+import time
+
+from api.suggestion_stream import SuggestionStream
+
+
+async def _run_stream(reports, send_delay, max_fps, publish_interval=0.0):
+    loop = asyncio.get_running_loop()
+    received = []
+
+    async def send(value):
+        received.append((loop.time(), value))
+        await asyncio.sleep(send_delay)
+
+    stream = SuggestionStream(loop, send, max_fps)
+    stream.start()
+
+    def worker():
+        for value in range(reports):
+            stream.publish(value)
+            if publish_interval:
+                time.sleep(publish_interval)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    await asyncio.to_thread(thread.join)
+    await asyncio.sleep(send_delay + (1.0 / max_fps if max_fps else 0) + 0.05)
+    stream.close()
+    return stream, received
+
+
+def test_slow_client_drops_intermediate_reports():
+    """发送慢时只发送最新报告，最后一份一定送达"""
+    stream, received = asyncio.run(_run_stream(reports=2000, send_delay=0.02, max_fps=0))
+    values = [value for _, value in received]
+    assert values[-1] == 1999
+    assert values == sorted(values)
+    assert len(values) < 2000 and stream.dropped > 0
+    assert stream.sent + stream.dropped <= stream.published
+    print(f"✅ 慢客户端合并报告: {stream.stats()}")
+
+
+def test_max_fps():
+    """两次发送之间的间隔不小于 1/max_fps"""
+    stream, received = asyncio.run(_run_stream(reports=40, send_delay=0, max_fps=20, publish_interval=0.005))
+    gaps = [b[0] - a[0] for a, b in zip(received, received[1:])]
+    assert received[-1][1] == 39
+    assert gaps and min(gaps) >= 0.05 - 0.005
+    print(f"✅ 最大帧率: 发送 {len(received)} 帧，最小间隔 {min(gaps):.3f}s")
+
+
+if __name__ == "__main__":
+    test_slow_client_drops_intermediate_reports()
+    test_max_fps()
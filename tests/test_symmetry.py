@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+测试棋盘对称规范化和分析缓存的对称命中
+"""
+
+from core.symmetry import (
+    canonicalize_moves, inverse_transform, transform_analysis, transform_move,
+    transform_ownership, TRANSFORMS
+)
+from core.rules import ownership_index
+from core import analysis_cache
+from core.analysis_cache import AnalysisCache
+
+
+def test_inverse_transform():
+    """每种变换与其逆变换组合后回到原位置"""
+    for transform in TRANSFORMS:
+        inverse = inverse_transform(transform)
+        for move in ["D4", "Q16", "C17", "K10", "T1"]:
+            assert transform_move(transform_move(move, transform), inverse) == move
+    print("✅ 逆变换测试通过")
+
+
+def test_symmetric_openings_share_canonical_form():
+    """星位开局的8种对称形式规范化后相同"""
+    canonical_forms = set()
+    for transform in TRANSFORMS:
+        moves = [["B", transform_move("Q16", transform)], ["W", transform_move("D4", transform)]]
+        canonical, used = canonicalize_moves(moves)
+        canonical_forms.add(tuple(tuple(move) for move in canonical))
+        # 规范序列 = 原序列按返回的变换变换
+        assert [[c, transform_move(m, used)] for c, m in moves] == canonical
+    assert len(canonical_forms) == 1
+    print(f"✅ 对称开局规范形式: {canonical_forms.pop()}")
+
+
+def test_ownership_round_trip():
+    """ownership数组变换后再逆变换保持不变，且与着法变换一致"""
+    ownership = [0.0] * 361
+    ownership[ownership_index(15, 15)] = 1.0  # Q16
+    for transform in TRANSFORMS:
+        moved = transform_ownership(ownership, transform)
+        target = transform_move("Q16", transform)
+        target_row, target_col = int(target[1:]) - 1, "ABCDEFGHJKLMNOPQRST".index(target[0])
+        assert moved[ownership_index(target_row, target_col)] == 1.0
+        assert transform_ownership(moved, inverse_transform(transform)) == ownership
+    print("✅ ownership变换测试通过")
+
+
+def test_cache_hit_for_rotated_position():
+    """缓存以规范形式存储，旋转后的局面命中并还原到实际方向"""
+    cache = AnalysisCache()
+    response = {
+        "moveInfos": [{"move": "D16", "winrate": 0.48, "visits": 100, "pv": ["D16", "R4"]}],
+        "rootInfo": {"visits": 100},
+        "ownership": [0.0] * 361
+    }
+    cache.put([["B", "Q16"]], 6.5, response, budget=100)
+
+    result = cache.get([["B", "D4"]], 6.5, min_visits=50)
+    assert result is not None
+    assert cache.make_key([["B", "D4"]], 6.5) == cache.make_key([["B", "Q16"]], 6.5)
+    # Q16 到 D4 有两种变换（旋转180度、沿副对角线翻转），命中结果与其中一种一致，
+    # 具体是哪一种由两个局面各自的规范变换决定
+    _, put_transform = canonicalize_moves([["B", "Q16"]])
+    _, get_transform = canonicalize_moves([["B", "D4"]])
+    canonical = transform_analysis(response, put_transform)
+    expected = transform_analysis(canonical, inverse_transform(get_transform))["moveInfos"][0]
+    assert result["moveInfos"][0]["move"] == expected["move"]
+    assert result["moveInfos"][0]["pv"] == expected["pv"]
+    candidates = {transform_move("D16", transform) for transform in TRANSFORMS
+                  if transform_move("Q16", transform) == "D4"}
+    assert len(candidates) == 2 and result["moveInfos"][0]["move"] in candidates
+    assert cache.get([["B", "D4"]], 6.5, min_visits=200) is None
+    assert cache.get([["B", "D4"]], 7.5) is None
+    print(f"✅ 对称缓存命中: {result['moveInfos'][0]['move']}")
+
+
+def test_weaker_put_does_not_overwrite_concurrent_stronger():
+    """较弱的结果在变换期间被其他线程写入更强的结果时，不覆盖它"""
+    cache = AnalysisCache()
+    moves = [["B", "Q16"]]
+    weak = {"moveInfos": [{"move": "D4"}], "rootInfo": {"visits": 10}}
+    strong = {"moveInfos": [{"move": "D16"}], "rootInfo": {"visits": 1000}}
+    original = analysis_cache.transform_analysis
+
+    def racing_transform(response, transform):
+        if response is weak:
+            cache.put(moves, 6.5, strong, budget=1000)  # 模拟另一个线程在两次加锁之间写入
+        return original(response, transform)
+
+    analysis_cache.transform_analysis = racing_transform
+    try:
+        cache.put(moves, 6.5, weak, budget=10)
+    finally:
+        analysis_cache.transform_analysis = original
+    assert cache.get(moves, 6.5, min_visits=1000) is not None
+    print("✅ 并发写入保留较强的结果")
+
+
+if __name__ == "__main__":
+    test_inverse_transform()
+    test_symmetric_openings_share_canonical_form()
+    test_ownership_round_trip()
+    test_cache_hit_for_rotated_position()
+    test_weaker_put_does_not_overwrite_concurrent_stronger()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+测试本地战术读棋：征子、引征、节点上限、对杀数气
+"""
+
+from core.rules import GoBoard
+from core.tactics import TacticalReader, _race_value, describe_tactics
+
+
+def _board(moves):
+    go_board = GoBoard()
+    for color, move in moves:
+        go_board.play(move, color)
+    return go_board
+
+
+# 白D4两口气，黑C4、D5、E3包围，黑先可以征吃
+LADDER = [("W", "D4"), ("B", "C4"), ("B", "D5"), ("B", "E3")]
+
+
+def test_ladder_works():
+    """征子成立时给出吃子的变化图"""
+    result = TacticalReader(_board(LADDER)).ladder("D4")
+    assert result["status"] == "captured" and result["attacker"] == "B"
+    assert len(result["sequence"]) > 10
+    print(f"✅ 征子成立: {' '.join(result['sequence'][:8])} ...")
+
+
+def test_ladder_breakers():
+    """两个方向都有引征子时征子不成立"""
+    go_board = _board(LADDER + [("W", "Q16"), ("W", "B2")])
+    result = TacticalReader(go_board).ladder("D4")
+    assert result["status"] == "escapes"
+    # 守方先下（已被打吃）同样可以逃出
+    go_board.play("D3", "B")
+    assert TacticalReader(go_board).ladder("D4", attacker_first=False)["status"] == "escapes"
+    print("✅ 引征判断正确")
+
+
+def test_node_budget():
+    """超出节点上限时返回 unknown"""
+    result = TacticalReader(_board(LADDER), node_budget=10).ladder("D4")
+    assert result["status"] == "unknown"
+    print("✅ 节点上限生效")
+
+
+def test_liberty_race():
+    """对杀数气：外气多的一方获胜，无外气且有两口公气为双活"""
+    assert _race_value(3, 2, 0) == 1 and _race_value(2, 3, 0) == -1
+    assert _race_value(2, 2, 0) == 1  # 气数相同先手胜
+    assert _race_value(0, 0, 2) == 0
+
+    # 黑B1-B3与白C1-C3贴边并排，白A1紧掉黑一口气：黑3气对白4气，黑先也差一气
+    go_board = _board([("B", "B1"), ("B", "B2"), ("B", "B3"),
+                       ("W", "C1"), ("W", "C2"), ("W", "C3"), ("W", "A1")])
+    result = TacticalReader(go_board).liberty_race("B1", "C1", "B")
+    assert result["a"]["outside_liberties"] == 3 and result["b"]["outside_liberties"] == 4
+    assert result["shared_liberties"] == 0
+    assert result["result"] == "b_wins" and result["winner"] == "W"
+    print(f"✅ 对杀数气: {result}")
+
+
+def test_summary_description():
+    """全盘概要列出气紧的棋块"""
+    items = TacticalReader(_board(LADDER)).summary("B")
+    assert items and items[0]["target"] == "D4"
+    text = describe_tactics(items)
+    assert "征子成立" in text
+    print(f"✅ 战术概要: {text}")
+
+
+if __name__ == "__main__":
+    test_ladder_works()
+    test_ladder_breakers()
+    test_node_budget()
+    test_liberty_race()
+    test_summary_description()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+测试自适应算力预算：速率的滑动平均、全机负载系数、访问次数上下限、预读计入负载
+"""
+
+import threading
+import time
+
+from core.analysis_cache import AnalysisCache
+from core.human_vs_katago import FAKE_KATAGO_BIN, WeiQiGame
+from core.katago_engine import KataGoEngine
+from core.visit_budget import VisitBudgetController
+
+
+def test_rate_ema():
+    """首个样本直接采用，之后按平滑系数靠近新速率；过短的搜索不参与估计"""
+    budget = VisitBudgetController(initial_visits_per_second=100, smoothing=0.5)
+    budget.record(1000, 2.0)
+    assert budget.visits_per_second == 500 and budget.samples == 1
+    budget.record(300, 1.0)
+    assert budget.visits_per_second == 400 and budget.samples == 2
+    budget.record(10000, 0.1)  # 通信开销为主，忽略
+    budget.record(0, 1.0)
+    assert budget.visits_per_second == 400 and budget.samples == 2
+    print("✅ 速率滑动平均")
+
+
+def test_load_factor():
+    """同时搜索数超过槽位时按比例缩短思考时间，不低于下限"""
+    budget = VisitBudgetController(host_slots=2, min_load_factor=0.25)
+    started = [budget.begin_search() for _ in range(4)]
+    try:
+        assert VisitBudgetController.host_active_searches() == 4
+        assert budget.load_factor() == 0.5
+        assert budget.query_limits(4)["maxTime"] == 2.0
+        started += [budget.begin_search() for _ in range(8)]
+        assert budget.load_factor() == 0.25
+    finally:
+        for started_at in started:
+            budget.end_search(started_at)
+    assert VisitBudgetController.host_active_searches() == 0 and budget.load_factor() == 1.0
+    print("✅ 负载系数")
+
+
+def test_visit_clamping():
+    budget = VisitBudgetController(initial_visits_per_second=100, min_visits=16, max_visits=1000)
+    assert budget.query_limits(3) == {"maxVisits": 300, "maxTime": 3.0}
+    assert budget.query_limits(0.01)["maxVisits"] == 16  # 思考时间下限0.1秒，访问次数不低于下限
+    assert budget.query_limits(60)["maxVisits"] == 1000
+    print("✅ 访问次数上下限")
+
+
+class FakePonderGame:
+    """借用 WeiQiGame 的预读逻辑（真实游戏实例需要数据库）"""
+    start_pondering = WeiQiGame.start_pondering
+    stop_pondering = WeiQiGame.stop_pondering
+    _build_analysis_request = WeiQiGame._build_analysis_request
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.moves = [["B", "Q16"]]
+        self.current_player = "W"
+        self.komi = 7.5
+        self.board_size = 19
+        self.game_over = False
+        self.ai_time_limit = 30
+        self.ponder_enabled = True
+        self.ponder_candidates = 3
+        self._ponder_inflight = {}
+        self._ponder_lock = threading.Lock()
+        self.analysis_cache = AnalysisCache()
+        # 访问次数很大，预读在取消前一直进行
+        self.visit_budget = VisitBudgetController(initial_visits_per_second=100000)
+
+    def _check_process_alive(self):
+        return self.engine.is_alive()
+
+    def _send_analysis_request(self, max_visits=200, max_time=None):
+        return {"moveInfos": [{"move": move, "order": order} for order, move in enumerate(["D4", "Q4", "D16"])]}
+
+
+def test_ponder_counts_as_load():
+    """预读进行中计入全机搜索数，取消后归还"""
+    engine = KataGoEngine(FAKE_KATAGO_BIN, "", "", require_files=False, startup_wait=0.2)
+    engine.start()
+    try:
+        game = FakePonderGame(engine)
+        game.start_pondering()
+        # Q16之后 Q4 与 D16 对称，只预读 D4 和 Q4 两个局面
+        assert len(game._ponder_inflight) == 2
+        assert VisitBudgetController.host_active_searches() == 2
+        game.stop_pondering(keep_move="D4")
+        assert VisitBudgetController.host_active_searches() == 1
+        game.stop_pondering()
+        assert VisitBudgetController.host_active_searches() == 0
+        time.sleep(0.2)  # 被终止查询的最终响应不会再次登记结束
+        assert VisitBudgetController.host_active_searches() == 0
+    finally:
+        engine.close()
+    print("✅ 预读计入全机负载")
+
+
+if __name__ == "__main__":
+    test_rate_ema()
+    test_load_factor()
+    test_visit_clamping()
+    test_ponder_counts_as_load()
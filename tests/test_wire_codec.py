@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+测试WebSocket帧编码：msgpack 往返、紧凑字段、按连接切换文本/二进制帧
+"""
+
+import asyncio
+
+from api.wire_codec import WireSocket, available_codecs, decode, encode, msgpack
+from core.rules import GoBoard
+
+MOVES = [["B", "Q16"], ["W", "D4"], ["B", "pass"], ["W", "T19"], ["B", "A1"]]
+
+
+def _game_state():
+    go_board = GoBoard()
+    for color, move in MOVES:
+        go_board.play(move, color)
+    return {"type": "game_state", "version": 3, "data": {
+        "board": go_board.board,
+        "moves": MOVES,
+        "winrate_history": [{"move_number": 1, "black_winrate": 51.2, "moves": "not-a-move-list"}]
+    }}
+
+
+def test_msgpack_round_trip():
+    """棋盘和着法无损往返，形势判断误差在量化精度内"""
+    if msgpack is None:
+        print("⚠️ 未安装 msgpack，跳过")
+        return
+    message = _game_state()
+    data = encode(message, "msgpack")
+    assert isinstance(data, bytes)
+    assert decode(data, "msgpack") == message
+    assert len(data) < len(encode(message, "json")) / 2
+
+    ownership = [[(row - col) / 18 for col in range(19)] for row in range(19)]
+    decoded = decode(encode({"type": "territory_preview", "data": {"ownership": ownership}}, "msgpack"), "msgpack")
+    error = max(abs(a - b) for row_a, row_b in zip(ownership, decoded["data"]["ownership"])
+                for a, b in zip(row_a, row_b))
+    assert error <= 1 / 127
+    print(f"✅ msgpack 往返: {len(data)} 字节，形势判断误差 {error:.4f}")
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, data):
+        self.frames.append(data)
+
+    async def send_bytes(self, data):
+        self.frames.append(data)
+
+
+def test_wire_socket_codec():
+    """默认发送文本帧，切换后发送二进制帧，不支持的编码报错"""
+    raw = FakeWebSocket()
+    websocket = WireSocket(raw)
+    asyncio.run(websocket.send_message({"type": "ping"}))
+    assert raw.frames[-1] == '{"type": "ping"}'
+
+    if "msgpack" in available_codecs():
+        websocket.set_codec("msgpack")
+        asyncio.run(websocket.send_message({"type": "ping"}))
+        assert decode(raw.frames[-1], "msgpack") == {"type": "ping"}
+
+    try:
+        websocket.set_codec("cbor")
+        assert False, "应当拒绝不支持的编码"
+    except ValueError:
+        pass
+    print("✅ 按连接切换帧编码")
+
+
+if __name__ == "__main__":
+    test_msgpack_round_trip()
+    test_wire_socket_codec()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SGF批量分析工具
+
+流水线:
+1. 进程池并行解析SGF并在本地重放规则，过滤非法棋谱
+2. 一个或多个KataGo引擎，每局棋用一次 analyzeTurns 查询分析全部回合
+3. 进程池并行整理结果（棋块、领地、问题手），批量写入局势演化存储或JSON文件
+
+用法:
+    python utils/batch_analyze.py games/ --output results/
+    python utils/batch_analyze.py games/ --store mongodb --engines 2 --visits 400
+    KATAGO_ENGINE=fake python utils/batch_analyze.py games/ --output /tmp/out
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.ownership import Ownership
+from core.review_worker import build_turn_record, summarize_review
+from core.rules import GoBoard
+from core.sgf_utils import parse_sgf
+
+
+def game_key(path: str, root: str = None) -> str:
+    """棋谱相对输入目录的路径（不含扩展名），作为输出文件名和存储ID
+
+    不同子目录下的同名棋谱不会互相覆盖；root 为空时使用文件所在目录。
+    """
+    path = Path(path)
+    relative = path.relative_to(root) if root is not None else Path(path.name)
+    return relative.with_suffix("").as_posix()
+
+
+def prepare_game(path: str, root: str = None) -> dict:
+    """子进程：解析SGF并重放校验，返回着法序列"""
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            game_info = parse_sgf(f.read())
+        if game_info["size"] != 19:
+            return {"path": path, "error": f"不支持的棋盘大小: {game_info['size']}"}
+        go_board = GoBoard()
+        for turn, (color, move) in enumerate(game_info["moves"], 1):
+            go_board.play(move, color)
+    except Exception as e:
+        return {"path": path, "error": str(e)}
+    game_info["path"] = path
+    game_info["key"] = game_key(path, root)
+    if game_info["komi"] is None:
+        game_info["komi"] = 6.5
+    return game_info
+
+
+def finalize_game(game: dict, records: dict, store: str, output_dir: str):
+    """子进程：整理一局棋的分析结果
+
+    store 为 files 时直接写出JSON文件并返回文件路径；
+    为 mongodb 时返回 (game_id, 演化数据文档列表)，由主进程批量写入。
+    """
+    summary = summarize_review(records)
+    if store == "files":
+        output_path = os.path.join(output_dir, game["key"] + ".json")
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "source": game["path"],
+                "komi": game["komi"],
+                "rules": game["rules"] or "chinese",
+                "moves": game["moves"],
+                "summary": summary,
+                "turns": [records[turn] for turn in sorted(records)]
+            }, f, ensure_ascii=False)
+        os.replace(output_path + ".tmp", output_path)
+        return output_path
+
+    from storage.game_evolution_mongodb import GameEvolutionMongoDB
+
+    moves_data = []
+    go_board = GoBoard()
+    for turn, (color, move) in enumerate(game["moves"], 1):
+        go_board.play(move, color)
+        record = records.get(turn)
+        if record is None:
+            continue
+        territory = Ownership.from_katago(record.get("ownership"))
+        moves_data.append(GameEvolutionMongoDB.build_move_data(
+            move_number=turn,
+            move=move,
+            color=color,
+            winrate_data={
+                "black_winrate": record["black_winrate"],
+                "white_winrate": record["white_winrate"],
+                "score_lead": record["score_lead"]
+            },
+            board=[row[:] for row in go_board.board],
+            territory_data=territory,
+            recommended_moves=[
+                {"move": info["move"], "visits": info["visits"], "winrate": info["winrate"],
+                 "score_mean": info["score_lead"]}
+                for info in record["top_moves"]
+            ],
+            komi=game["komi"]
+        ))
+    return f"batch_{game['key']}", moves_data
+
+
+class BatchStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.games = 0
+        self.positions = 0
+        self.failed = 0
+        self.skipped = 0
+
+    def add(self, games=0, positions=0, failed=0, skipped=0):
+        with self.lock:
+            self.games += games
+            self.positions += positions
+            self.failed += failed
+            self.skipped += skipped
+
+    def report(self, prefix="进度"):
+        with self.lock:
+            elapsed = max(time.time() - self.started, 1e-6)
+            print(f"{prefix}: {self.games} 局 / {self.positions} 个局面，失败 {self.failed}，跳过 {self.skipped}，"
+                  f"用时 {elapsed:.1f} 秒，{self.games / elapsed:.2f} 局/秒，{self.positions / elapsed:.1f} 局面/秒",
+                  flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并行批量分析SGF棋谱")
+    parser.add_argument("input", help="SGF文件或目录（递归查找 *.sgf）")
+    parser.add_argument("--output", default="batch_results", help="--store files 时的输出目录")
+    parser.add_argument("--store", choices=["files", "mongodb"], default="files", help="结果写入位置")
+    parser.add_argument("--visits", type=int, default=200, help="每个回合的访问次数")
+    parser.add_argument("--engines", type=int, default=1, help="KataGo引擎进程数")
+    parser.add_argument("--games-per-engine", type=int, default=4, help="每个引擎同时分析的棋局数")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="解析/整理结果的进程数")
+    parser.add_argument("--overwrite", action="store_true", help="重新分析已有输出文件的棋局")
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    paths = sorted(str(p) for p in input_path.rglob("*.sgf")) if input_path.is_dir() else [str(input_path)]
+    root = str(input_path) if input_path.is_dir() else str(input_path.parent)
+    stats = BatchStats()
+    if args.store == "files":
+        os.makedirs(args.output, exist_ok=True)
+        if not args.overwrite:
+            pending = [p for p in paths
+                       if not os.path.exists(os.path.join(args.output, game_key(p, root) + ".json"))]
+            stats.add(skipped=len(paths) - len(pending))
+            paths = pending
+    print(f"待分析 {len(paths)} 局棋，{args.workers} 个进程，{args.engines} 个引擎")
+    if not paths:
+        return
+
+    from core.human_vs_katago import create_engine
+
+    engines = []
+    for _ in range(args.engines):
+        engine = create_engine()
+        engine.start()
+        engines.append(engine)
+
+    in_flight = threading.BoundedSemaphore(args.engines * args.games_per_engine * 2)
+    store_lock = threading.Lock()
+
+    def analyze(index, game, process_pool):
+        try:
+            engine = engines[index % len(engines)]
+            moves = game["moves"]
+            req = {
+                "id": engine.next_request_id(f"batch_{index}"),
+                "moves": moves,
+                "rules": "Japanese" if game["rules"] == "japanese" else "Chinese",
+                "komi": game["komi"],
+                "boardXSize": 19,
+                "boardYSize": 19,
+                "maxVisits": args.visits,
+                "includeOwnership": True,
+                "analyzeTurns": list(range(len(moves) + 1))
+            }
+            records = {}
+            for msg in engine.analyze_turns(req, timeout=max(120.0, len(moves) * 5.0)):
+                records[msg.get("turnNumber", 0)] = build_turn_record(msg.get("turnNumber", 0), moves, msg)
+
+            result = process_pool.submit(finalize_game, game, records, args.store, args.output).result()
+            if args.store == "mongodb":
+                from storage.game_evolution_mongodb import GameEvolutionMongoDB
+
+                game_id, moves_data = result
+                with store_lock:
+                    if not GameEvolutionMongoDB(game_id).add_moves_bulk(moves_data):
+                        raise RuntimeError("写入MongoDB失败")
+            stats.add(games=1, positions=len(records))
+        except Exception as e:
+            print(f"分析失败 {game['path']}: {e}", file=sys.stderr)
+            stats.add(failed=1)
+        finally:
+            in_flight.release()
+
+    stop_reporting = threading.Event()
+
+    def reporter():
+        while not stop_reporting.wait(10):
+            stats.report()
+
+    threading.Thread(target=reporter, daemon=True).start()
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as process_pool, \
+                ThreadPoolExecutor(max_workers=args.engines * args.games_per_engine) as analyzers:
+            for index, game in enumerate(process_pool.map(prepare_game, paths, [root] * len(paths), chunksize=8)):
+                if game.get("error"):
+                    print(f"跳过 {game['path']}: {game['error']}", file=sys.stderr)
+                    stats.add(failed=1)
+                    continue
+                in_flight.acquire()
+                analyzers.submit(analyze, index, game, process_pool)
+    finally:
+        stop_reporting.set()
+        for engine in engines:
+            engine.close()
+    stats.report("完成")
+
+
+if __name__ == "__main__":
+    main()
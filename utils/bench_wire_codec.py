@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WebSocket 帧编码基准：比较 JSON 与 msgpack 的编码/解码耗时和帧大小
+
+帧类型:
+- game_state: 完整快照（棋盘 + 着法 + 胜率历史），随对局长度增长
+- game_state_delta: 每手棋的增量
+- territory: 形势判断（19x19 归属度）
+- realtime_suggestions: 实时推荐选点（每0.5秒一帧）
+
+用法:
+    python utils/bench_wire_codec.py
+    python utils/bench_wire_codec.py --moves 250 --iterations 2000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.state_protocol import StateTracker
+from api.wire_codec import available_codecs, decode, encode
+from core.rules import GoBoard, format_point
+
+
+class _BenchGame:
+    def __init__(self):
+        self.board = GoBoard().board
+        self.moves = []
+        self.current_player = "B"
+        self.game_over = False
+        self.captured_black = 0
+        self.captured_white = 0
+        self.winrate_history = []
+
+
+def build_frames(move_count: int, seed: int = 1) -> dict:
+    """随机对局生成各类典型帧"""
+    rng = random.Random(seed)
+    go_board = GoBoard()
+    game = _BenchGame()
+    tracker = StateTracker()
+    tracker.encode(game)
+    delta = None
+    color = "B"
+    for number in range(1, move_count + 1):
+        candidates = [(r, c) for r in range(19) for c in range(19) if go_board.is_legal(r, c, color)]
+        move = format_point(*rng.choice(candidates))
+        go_board.play(move, color)
+        game.board = go_board.board
+        game.moves.append([color, move])
+        game.winrate_history.append({
+            "move_number": number,
+            "black_winrate": round(rng.uniform(20, 80), 1),
+            "white_winrate": 0.0,
+            "black_score": round(rng.uniform(-10, 10), 1),
+            "player": color
+        })
+        color = "W" if color == "B" else "B"
+        game.current_player = color
+        delta = tracker.encode(game)
+
+    ownership = [[round(rng.uniform(-1, 1), 3) for _ in range(19)] for _ in range(19)]
+    suggestions = [{
+        "move": format_point(rng.randrange(19), rng.randrange(19)),
+        "winrate": rng.random(),
+        "score_lead": rng.uniform(-5, 5),
+        "visits": rng.randrange(1, 2000)
+    } for _ in range(7)]
+    return {
+        "game_state": StateTracker().encode(game),
+        "game_state_delta": delta,
+        "territory": {"type": "territory_preview", "data": {"ownership": ownership, "black_territory": 80,
+                                                            "white_territory": 75}},
+        "realtime_suggestions": {"type": "realtime_suggestions", "data": suggestions},
+    }
+
+
+def bench(message: dict, codec: str, iterations: int) -> dict:
+    data = encode(message, codec)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        encode(message, codec)
+    encode_us = (time.perf_counter() - started) / iterations * 1e6
+    started = time.perf_counter()
+    for _ in range(iterations):
+        decode(data, codec)
+    decode_us = (time.perf_counter() - started) / iterations * 1e6
+    size = len(data.encode("utf-8")) if isinstance(data, str) else len(data)
+    return {"bytes": size, "encode_us": encode_us, "decode_us": decode_us}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较WebSocket帧的JSON与msgpack编码")
+    parser.add_argument("--moves", type=int, default=200, help="模拟对局的手数")
+    parser.add_argument("--iterations", type=int, default=1000, help="每种帧的编码/解码次数")
+    args = parser.parse_args()
+
+    codecs = available_codecs()
+    if "msgpack" not in codecs:
+        print("未安装 msgpack，只测试JSON（pip install msgpack）")
+    frames = build_frames(args.moves)
+    print(f"模拟 {args.moves} 手对局，每种帧编码/解码 {args.iterations} 次")
+    print(f"{'帧类型':<22}{'编码':<10}{'字节':>8}{'编码(us)':>12}{'解码(us)':>12}")
+    for name, message in frames.items():
+        for codec in codecs:
+            result = bench(message, codec, args.iterations)
+            print(f"{name:<24}{codec:<10}{result['bytes']:>8}{result['encode_us']:>12.1f}{result['decode_us']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+开局定式库构建工具
+
+从MongoDB的 game_evolution 集合收集对局的开局局面，写出内存映射格式的定式库文件；
+可选地用KataGo引擎批量补充分析（更多访问次数和领地数据）。
+
+用法:
+    python utils/build_opening_book.py --limit 500
+    python utils/build_opening_book.py --extend --engine-visits 800
+"""
+
+import argparse
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.opening_book import OpeningBookBuilder, DEFAULT_BOOK_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description="构建/扩充开局定式库")
+    parser.add_argument("--output", default=DEFAULT_BOOK_PATH, help="定式库文件路径")
+    parser.add_argument("--extend", action="store_true", help="在已有定式库基础上扩充")
+    parser.add_argument("--limit", type=int, default=1000, help="最多读取的对局数")
+    parser.add_argument("--max-depth", type=int, default=30, help="收录的最大手数")
+    parser.add_argument("--komi", type=float, default=6.5,
+                        help="对局记录中没有贴目时使用的贴目（新记录按每手记录的贴目归类）")
+    parser.add_argument("--engine-visits", type=int, default=0,
+                        help="大于0时用KataGo按该访问次数重新分析定式库局面")
+    args = parser.parse_args()
+
+    builder = OpeningBookBuilder(max_depth=args.max_depth)
+    if args.extend and os.path.exists(args.output):
+        builder.load(args.output)
+        print(f"已载入现有定式库: {len(builder.entries)} 个局面")
+
+    started = time.time()
+    added = builder.add_from_mongodb(limit=args.limit, komi=args.komi)
+    print(f"从对局记录收集了 {added} 个局面，用时 {time.time() - started:.1f} 秒")
+
+    if args.engine_visits > 0:
+        from core.human_vs_katago import create_engine
+
+        engine = create_engine()
+        engine.start()
+        try:
+            started = time.time()
+            analyzed = builder.analyze_with_engine(engine, max_visits=args.engine_visits, komi=args.komi)
+            print(f"引擎分析了 {analyzed} 个局面，用时 {time.time() - started:.1f} 秒")
+        finally:
+            engine.close()
+
+    builder.write(args.output)
+
+
+if __name__ == "__main__":
+    main()
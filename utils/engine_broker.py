@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+独立的KataGo引擎服务
+
+持有一个或多个KataGo进程和共享的分析缓存，Web工作进程、复盘和批量分析作为客户端连接，
+引擎数量与Web工作进程数量可以分别调整，Web进程重启也不会重启引擎。
+
+用法:
+    python utils/engine_broker.py --engines 2
+    python utils/engine_broker.py --address tcp:127.0.0.1:7790
+    KATAGO_BROKER=unix:/tmp/weiqi-katago.sock uvicorn api.backend:app --port 8001
+"""
+
+import argparse
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.engine_broker import BROKER_ADDRESS, BROKER_CACHE_SIZE, DEFAULT_BROKER_ADDRESS, EngineBroker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共享的KataGo引擎服务")
+    parser.add_argument("--address", default=BROKER_ADDRESS or DEFAULT_BROKER_ADDRESS,
+                        help="监听地址，unix:/path 或 tcp:host:port（默认取 KATAGO_BROKER）")
+    parser.add_argument("--engines", type=int, default=1, help="KataGo引擎进程数")
+    parser.add_argument("--cache-size", type=int, default=BROKER_CACHE_SIZE, help="共享分析缓存条数，0 表示不缓存")
+    args = parser.parse_args()
+
+    from core.human_vs_katago import create_local_engine
+
+    broker = EngineBroker(create_local_engine, args.address, engines=args.engines, cache_size=args.cache_size)
+    try:
+        broker.start()
+    except RuntimeError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    broker.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
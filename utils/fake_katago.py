@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+确定性的假KataGo引擎（用于离线压测和测试）
+
+在 stdin/stdout 上实现KataGo analysis 引擎的JSON协议，不需要GPU和模型文件：
+- 按局面的合法着法生成 moveInfos / ownership / policy，同一局面结果固定
+- 支持 reportDuringSearchEvery 中间结果、analyzeTurns、priority/priorities（排队时优先级高的先搜索）、terminate
+- 每次访问的耗时可配置，模拟不同算力
+
+用法（与真实KataGo的命令行兼容）:
+    python utils/fake_katago.py analysis -model x -config y [--ms-per-visit 0.5]
+    KATAGO_ENGINE=fake python api/backend.py
+    KATAGO_BIN=utils/fake_katago.py python api/backend.py
+
+环境变量:
+    FAKE_KATAGO_MS_PER_VISIT   每次访问耗时（毫秒），默认 0.05
+    FAKE_KATAGO_THREADS        并行搜索线程数，默认 4
+"""
+
+import argparse
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.rules import GoBoard, format_point, ownership_index
+
+VERSION = "1.15.3-fake"
+
+
+class FakeKataGo:
+    """假引擎：每个查询在线程池中"搜索"，按访问次数和耗时配置模拟进度
+
+    待搜索的回合放在按优先级排序的队列中，线程空闲时取优先级最高的（相同时先到先得）。
+    """
+
+    def __init__(self, ms_per_visit: float = 0.05, threads: int = 4):
+        self.ms_per_visit = ms_per_visit
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.output_lock = threading.Lock()
+        self.pending = []  # (-priority, 序号, query, turn)
+        self.sequence = itertools.count()
+        self.active = {}  # 请求id -> 尚未结束的回合数
+        self.terminated = set()  # 只包含仍有回合未结束的请求，结束后移除
+        self.lock = threading.Lock()
+
+    def emit(self, msg: dict):
+        with self.output_lock:
+            sys.stdout.write(json.dumps(msg) + "\n")
+            sys.stdout.flush()
+
+    def handle_line(self, line: str):
+        try:
+            query = json.loads(line)
+        except json.JSONDecodeError as e:
+            self.emit({"error": f"Could not parse json: {e}"})
+            return
+
+        if query.get("action") == "terminate":
+            with self.lock:
+                # 已经结束的请求无需终止
+                if query.get("terminateId") in self.active:
+                    self.terminated.add(query.get("terminateId"))
+            self.emit({"id": query.get("id"), "action": "terminate", "terminateId": query.get("terminateId")})
+            return
+        if query.get("action") == "query_version":
+            self.emit({"id": query.get("id"), "action": "query_version", "version": VERSION})
+            return
+        if "id" not in query or "moves" not in query:
+            self.emit({"id": query.get("id"), "error": "Missing required field 'id' or 'moves'"})
+            return
+
+        turns = query.get("analyzeTurns") or [len(query["moves"])]
+        priorities = query.get("priorities")
+        if not priorities or len(priorities) != len(turns):
+            priorities = [query.get("priority", 0)] * len(turns)
+        with self.lock:
+            self.active[query["id"]] = self.active.get(query["id"], 0) + len(turns)
+            for turn, priority in zip(turns, priorities):
+                heapq.heappush(self.pending, (-int(priority), next(self.sequence), query, turn))
+        for _ in turns:
+            self.executor.submit(self.run_next)
+
+    def run_next(self):
+        """搜索队列中优先级最高的回合（每个提交到线程池的任务对应一个回合）"""
+        with self.lock:
+            _, _, query, turn = heapq.heappop(self.pending)
+        try:
+            self.search(query, turn)
+        finally:
+            with self.lock:
+                self.active[query["id"]] -= 1
+                if not self.active[query["id"]]:
+                    del self.active[query["id"]]
+                    self.terminated.discard(query["id"])
+
+    def is_terminated(self, request_id: str) -> bool:
+        with self.lock:
+            return request_id in self.terminated
+
+    def search(self, query: dict, turn: int):
+        try:
+            moves = query["moves"][:turn]
+            try:
+                go_board = GoBoard.from_moves(moves, query.get("boardXSize", 19))
+            except ValueError as e:
+                self.emit({"id": query["id"], "turnNumber": turn, "error": f"Illegal move: {e}"})
+                return
+
+            to_move = "W" if moves and moves[-1][0].upper().startswith("B") else "B"
+            max_visits = int(query.get("maxVisits", 100))
+            max_time = (query.get("overrideSettings") or {}).get("maxTime")
+            report_every = query.get("reportDuringSearchEvery")
+            seed = hashlib.md5(json.dumps([moves, query.get("komi")]).encode()).hexdigest()
+
+            started = time.monotonic()
+            last_report = started
+            visits = 0
+            batch = max(1, min(max_visits, 16))
+            while visits < max_visits:
+                if self.is_terminated(query["id"]):
+                    break
+                if max_time is not None and time.monotonic() - started >= max_time:
+                    break
+                step = min(batch, max_visits - visits)
+                time.sleep(step * self.ms_per_visit / 1000.0)
+                visits += step
+                if report_every and time.monotonic() - last_report >= report_every and visits < max_visits:
+                    last_report = time.monotonic()
+                    self.emit(self.build_response(query, turn, go_board, to_move, visits, seed, True))
+
+            self.emit(self.build_response(query, turn, go_board, to_move, max(visits, 1), seed, False))
+        except Exception as e:
+            self.emit({"id": query.get("id"), "error": f"Internal error: {e}"})
+
+    def build_response(self, query: dict, turn: int, go_board: GoBoard, to_move: str,
+                       visits: int, seed: str, during_search: bool) -> dict:
+        rng = random.Random(seed)
+        size = go_board.size
+
+        legal = [(row, col) for row in range(size) for col in range(size)
+                 if go_board.is_legal(row, col, to_move)]
+        weights = {point: rng.random() ** 3 for point in legal}
+        total_weight = sum(weights.values()) or 1.0
+
+        policy = [-1.0] * (size * size + 1)
+        for (row, col), weight in weights.items():
+            policy[ownership_index(row, col, size)] = weight / total_weight
+        policy[-1] = 0.0
+
+        root_winrate = 0.35 + 0.3 * rng.random()
+        root_score = (root_winrate - 0.5) * 20
+        candidates = sorted(legal, key=lambda point: -weights[point])[:10]
+        move_infos = []
+        remaining = visits
+        for order, (row, col) in enumerate(candidates):
+            move_visits = max(1, remaining // 2) if order < len(candidates) - 1 else max(1, remaining)
+            remaining = max(0, remaining - move_visits)
+            winrate = max(0.0, min(1.0, root_winrate - 0.01 * order + 0.005 * rng.random()))
+            move = format_point(row, col)
+            move_infos.append({
+                "move": move,
+                "order": order,
+                "visits": move_visits,
+                "winrate": round(winrate, 6),
+                "scoreLead": round(root_score - 0.3 * order, 3),
+                "scoreMean": round(root_score - 0.3 * order, 3),
+                "prior": round(weights[(row, col)] / total_weight, 6),
+                "lcb": round(winrate - 0.02, 6),
+                "utility": round(winrate * 2 - 1, 6),
+                "pv": [move]
+            })
+        if not move_infos:
+            move_infos.append({"move": "pass", "order": 0, "visits": visits, "winrate": root_winrate,
+                               "scoreLead": root_score, "scoreMean": root_score, "prior": 1.0, "pv": ["pass"]})
+
+        response = {
+            "id": query["id"],
+            "isDuringSearch": during_search,
+            "turnNumber": turn,
+            "moveInfos": move_infos,
+            "rootInfo": {
+                "currentPlayer": to_move,
+                "visits": visits,
+                "winrate": round(root_winrate, 6),
+                "scoreLead": round(root_score, 3),
+                "scoreSelfplay": round(root_score, 3),
+                "utility": round(root_winrate * 2 - 1, 6)
+            }
+        }
+        if query.get("includeOwnership"):
+            ownership = [0.0] * (size * size)
+            for row in range(size):
+                for col in range(size):
+                    stone = go_board.board[row][col]
+                    if stone:
+                        value = 0.9 if stone == 1 else -0.9
+                    else:
+                        value = rng.uniform(-1.0, 1.0) * 0.8
+                    ownership[ownership_index(row, col, size)] = round(value, 4)
+            if to_move == "W":
+                # 与 reportAnalysisWinratesAs = SIDETOMOVE 一致：行棋方视角
+                ownership = [-value for value in ownership]
+            response["ownership"] = ownership
+        if query.get("includePolicy"):
+            response["policy"] = policy
+        return response
+
+    def run(self):
+        for line in sys.stdin:
+            line = line.strip()
+            if line:
+                self.handle_line(line)
+        self.executor.shutdown(wait=True)
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "version":
+        print(f"KataGo v{VERSION}")
+        return
+
+    parser = argparse.ArgumentParser(description="确定性的假KataGo analysis引擎")
+    parser.add_argument("command", nargs="?", default="analysis")
+    parser.add_argument("-model", default=None, help="忽略，仅为兼容KataGo命令行")
+    parser.add_argument("-config", default=None, help="忽略，仅为兼容KataGo命令行")
+    parser.add_argument("--ms-per-visit", type=float,
+                        default=float(os.getenv("FAKE_KATAGO_MS_PER_VISIT", "0.05")))
+    parser.add_argument("--threads", type=int, default=int(os.getenv("FAKE_KATAGO_THREADS", "4")))
+    args = parser.parse_args()
+
+    print("Started, ready to begin handling requests", file=sys.stderr, flush=True)
+    FakeKataGo(ms_per_visit=args.ms_per_visit, threads=args.threads).run()
+
+
+if __name__ == "__main__":
+    main()